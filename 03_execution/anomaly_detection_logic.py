@@ -8,8 +8,25 @@ SensorData / PerformanceData / BuildingComponent，對應 TIAA 的 Trigger + Iss
 
 設計：
 - 以「規則」替代 ML（符合你目前論文的 demo/原型階段）
-- 允許使用 config 內的 threshold 規則
-- 輸出偵測 log（t_trigger, t_detected, t_task_created 可於後續流程補齊）
+- 允許使用 config 內的 threshold 規則：anomaly_rules 為多條規則（metric × component_type × upper/lower，
+  見 utils/rule_engine.py），每頁讀值一次向量化比對全部規則，命中標記 rule_id / severity
+- 輸出偵測 log（t_trigger, t_detected, t_task_created 可於後續流程補齊）；每個新 Anomaly 一筆 DETECTION_ANOMALY
+  事件（anomaly_id / performance_id / rule_id / t_trigger / t_detected），供 04_validation 的 compute_metrics.py
+  以 anomaly_id 與 WORKFLOW_DISPATCH 的 anomaly_ids 串接計算 L1–L4 / TTA
+- 冪等：anomaly_id = sha1(performance_id | rule_id | rule_version)，寫入前先查詢已存在的 id 並略過，
+  重跑同一批讀值不會產生新的 Anomaly / 關係；log 記錄 new 與 suppressed 數量。Anomaly 節點與其
+  GENERATES / HAS_ANOMALY 關係在同一個 transaction 寫入，中途當機不會留下「已存在但沒有關係」的節點
+- 串流視窗規則（utils/window_rules.py）：Rapid_Temperature_Rise（最近 3 筆上升 > 3）與
+  Energy_Efficiency_Degradation（> 7 筆移動平均 × 1.2）以每個 sensor 的 ring buffer 逐筆 O(1) 判斷，
+  buffer 與 watermark 一起存檔，不再每次對全部歷史排序（config anomaly_window_rules）
+- 複合規則（utils/composite_rules.py）：Composite_Temp_Energy_Overload 以 (component, 對齊時間 slot)
+  hash join 溫度與能耗讀值（可設定 tolerance），取代逐 component 的 Cartesian product
+  （config anomaly_composite_rules）
+- 增量（watermark）：只讀取 ingest_seq 大於上次 watermark 的 PerformanceData，依 ingest_seq 排序分頁
+  （anomaly_detection.page_size，預設沿用 anomaly_query_limit=5000）直到追上最新資料；每頁寫入異常後
+  才推進 watermark 並存檔（anomaly_detection.watermark_path，預設 <output_dir>/anomaly_watermarks.json，
+  依規則涵蓋的 metric 集合記錄，並保存視窗規則 buffer 與 join bucket），中斷重跑最多重讀一頁，不會漏讀
+- --reset-watermark：從頭重新掃描（既有 PerformanceData 若沒有 ingest_seq，重新匯入不會補上序號，請先刪除再以 ETL --full 匯入）
 
 Usage:
     python 03_execution/anomaly_detection_logic.py --config config/pdm_demo.yaml --demo ahu12
@@ -17,23 +34,267 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import hashlib
 import time
-import uuid
 from datetime import datetime, timezone
-from typing import Dict, Any, List
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Tuple
 
+from utils.composite_rules import CompositeJoin
 from utils.config_loader import load_config
+from utils.graph_memory import register_statement
 from utils.logger import RunLogger
-from utils.neo4j_helper import Neo4jHelper, neo4j_available
+from utils.neo4j_helper import Neo4jHelper, backend_available, merge_nodes_cypher, merge_rels_cypher
+from utils.query_stats import report_query_stats
+from utils.rule_engine import ANY_METRIC, RuleEngine, metric_selected, severity_of
+from utils.state_store import JsonStateStore
+from utils.window_rules import WindowDetector
 
 
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
+# We assume PerformanceData has properties: performance_id, metric, value, timestamp, component_id,
+# plus ingest_seq / ts_ms stamped by the ETL. Readings are consumed in ingest order after a watermark.
+Q_READINGS_AFTER = """
+MATCH (pd:PerformanceData)
+WHERE pd.ingest_seq > $after
+  AND ($any_metric OR toLower(trim(pd.metric)) IN $metrics)
+  AND pd.value IS NOT NULL
+WITH pd
+ORDER BY pd.ingest_seq
+LIMIT $page_size
+OPTIONAL MATCH (c:BuildingComponent {component_id: pd.component_id})
+RETURN pd.performance_id AS performance_id,
+       pd.timestamp AS timestamp,
+       pd.ts_ms AS ts_ms,
+       pd.metric AS metric,
+       pd.value AS value,
+       pd.sensor_id AS sensor_id,
+       pd.component_id AS component_id,
+       c.type AS component_type,
+       pd.ingest_seq AS ingest_seq
+ORDER BY ingest_seq
+"""
+
+@register_statement(Q_READINGS_AFTER)
+def _q_readings_after_mem(g, params, m):
+    metrics = set(params["metrics"])
+    out = []
+    for nid in g.iter_after("PerformanceData", "ingest_seq", params["after"]):
+        p = g.props(nid)
+        if p.get("value") is None or not (params["any_metric"] or metric_selected(p.get("metric"), metrics)):
+            continue
+        c = g.find_one("BuildingComponent", "component_id", p.get("component_id"))
+        out.append({"performance_id": p.get("performance_id"), "timestamp": p.get("timestamp"),
+                    "ts_ms": p.get("ts_ms"), "metric": p.get("metric"), "value": p.get("value"),
+                    "sensor_id": p.get("sensor_id"), "component_id": p.get("component_id"),
+                    "component_type": None if c is None else g.get(c, "type"),
+                    "ingest_seq": p.get("ingest_seq")})
+        if len(out) >= int(params["page_size"]):
+            break
+    return out
+
+Q_EXISTING_ANOMALIES = """
+UNWIND $ids AS id
+MATCH (a:Anomaly {anomaly_id: id})
+RETURN a.anomaly_id AS anomaly_id
+"""
+
+@register_statement(Q_EXISTING_ANOMALIES)
+def _q_existing_anomalies_mem(g, params, m):
+    return [{"anomaly_id": i} for i in params["ids"] if g.find_one("Anomaly", "anomaly_id", i) is not None]
+
+Q_MERGE_ANOMALIES = merge_nodes_cypher("Anomaly", "anomaly_id")
+Q_MERGE_GENERATES = merge_rels_cypher("PerformanceData", "performance_id", "Anomaly", "anomaly_id", "GENERATES")
+Q_MERGE_HAS_ANOMALY = merge_rels_cypher("BuildingComponent", "component_id", "Anomaly", "anomaly_id", "HAS_ANOMALY")
+
+def anomaly_id_for(performance_id, rule_id: str, rule_version: str, paired_performance_id=None) -> str:
+    """Deterministic id: the same reading, rule and rule version always map to the same Anomaly."""
+    key = f"{performance_id}|{rule_id}|{rule_version}"
+    if paired_performance_id is not None:
+        key += f"|{paired_performance_id}"
+    return "anom_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+def iter_pages(neo: Neo4jHelper, metrics: List[str], after: int, page_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Yield reading pages in ingest order until caught up with the graph."""
+    while True:
+        rows = neo.query(Q_READINGS_AFTER, {"metrics": metrics, "any_metric": ANY_METRIC in metrics,
+                                            "after": after, "page_size": page_size})
+        if not rows:
+            return
+        yield rows
+        after = rows[-1]["ingest_seq"]
+        if len(rows) < page_size:
+            return
+
+def evaluate_rules(engine: RuleEngine, rows: List[Dict[str, Any]], t_trigger: str, t_detected: str) -> List[Dict[str, Any]]:
+    anomalies = []
+    for i, rule, direction, v in engine.evaluate(rows):
+        r = rows[i]
+        anomalies.append({
+            "anomaly_id": anomaly_id_for(r.get("performance_id"), rule.rule_id, rule.version),
+            "type": "RuleBasedThreshold",
+            "rule_id": rule.rule_id,
+            "rule_version": rule.version,
+            "severity": severity_of(rule, direction),
+            "metric": r.get("metric"),
+            "value": v,
+            "threshold": rule.upper if direction == "upper" else rule.lower,
+            "timestamp": r.get("timestamp"),
+            "ts_ms": r.get("ts_ms"),
+            "sensor_id": r.get("sensor_id"),
+            "t_trigger": t_trigger,
+            "t_detected": t_detected,
+            "performance_id": r.get("performance_id"),
+            "component_id": r.get("component_id"),
+        })
+    return anomalies
+
+def evaluate_windows(detector: WindowDetector, rows: List[Dict[str, Any]], t_trigger: str,
+                     t_detected: str) -> List[Dict[str, Any]]:
+    anomalies = []
+    for i, rule, v, score, threshold in detector.process(rows):
+        r = rows[i]
+        anomalies.append({
+            "anomaly_id": anomaly_id_for(r.get("performance_id"), rule.rule_id, rule.version),
+            "type": rule.anomaly_type,
+            "rule_id": rule.rule_id,
+            "rule_version": rule.version,
+            "severity": rule.severity,
+            "score": score,
+            "metric": r.get("metric"),
+            "value": v,
+            "threshold": threshold,
+            "timestamp": r.get("timestamp"),
+            "ts_ms": r.get("ts_ms"),
+            "sensor_id": r.get("sensor_id"),
+            "t_trigger": t_trigger,
+            "t_detected": t_detected,
+            "performance_id": r.get("performance_id"),
+            "component_id": r.get("component_id"),
+        })
+    return anomalies
+
+def evaluate_composites(join: CompositeJoin, rows: List[Dict[str, Any]], t_trigger: str,
+                        t_detected: str) -> List[Dict[str, Any]]:
+    anomalies = []
+    for i, rule, left, right in join.process(rows):
+        anomalies.append({
+            "anomaly_id": anomaly_id_for(left[0], rule.rule_id, rule.version, right[0]),
+            "type": rule.anomaly_type,
+            "rule_id": rule.rule_id,
+            "rule_version": rule.version,
+            "severity": rule.severity,
+            "score": left[3] + right[3],
+            "metric": f"{rule.left_metric}+{rule.right_metric}",
+            "value": left[2],
+            "paired_value": right[2],
+            "timestamp": left[4],
+            "ts_ms": left[1],
+            "sensor_id": rows[i].get("sensor_id"),
+            "t_trigger": t_trigger,
+            "t_detected": t_detected,
+            "performance_id": left[0],
+            "paired_performance_id": right[0],
+            "component_id": rows[i].get("component_id"),
+        })
+    return anomalies
+
+def build_detectors(cfg: Dict[str, Any]) -> Tuple[RuleEngine, WindowDetector, CompositeJoin, List[str]]:
+    """Threshold / window / composite detectors from config, plus the metrics they read (ANY_METRIC = all)."""
+    # Threshold rules (configurable; legacy default_metric/upper/lower form still accepted)
+    engine = RuleEngine.from_config(cfg.get("anomaly_rules", {
+        "default_metric": "temperature",
+        "upper": 30.0,
+        "lower": None
+    }))
+    windows = WindowDetector.from_config(cfg.get("anomaly_window_rules"))
+    composites = CompositeJoin.from_config(cfg.get("anomaly_composite_rules"))
+    metrics = sorted(set(engine.metrics) | set(windows.metrics) | set(composites.metrics))
+    return engine, windows, composites, metrics
+
+def detect_page(engine: RuleEngine, windows: WindowDetector, composites: CompositeJoin,
+                page: List[Dict[str, Any]], t_trigger: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Run every detector over one page of readings (in ingest order); returns (t_detected, anomalies)."""
+    t_detected = utc_now_iso()
+    found = evaluate_rules(engine, page, t_trigger, t_detected)
+    found += evaluate_windows(windows, page, t_trigger, t_detected)
+    found += evaluate_composites(composites, page, t_trigger, t_detected)
+    return t_detected, found
+
+def detect_and_write(neo: Neo4jHelper, engine: RuleEngine, windows: WindowDetector, composites: CompositeJoin,
+                     page: List[Dict[str, Any]], t_trigger: str) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    detect_page + write_anomalies as one retryable step: if the write fails, window buffers and join buckets
+    are rolled back so the same page can be detected again. Returns (t_detected, found, new).
+    """
+    snapshot = (windows.to_state(), composites.to_state())
+    try:
+        t_detected, found = detect_page(engine, windows, composites, page, t_trigger)
+        return t_detected, found, write_anomalies(neo, found)
+    except Exception:
+        windows.load_state(snapshot[0])
+        composites.load_state(snapshot[1])
+        raise
+
+def load_progress(state: JsonStateStore, metrics: List[str], windows: WindowDetector, composites: CompositeJoin,
+                  reset: bool = False) -> Tuple[Dict[str, Any], str, int]:
+    """Restore the watermark and detector buffers for this metric set; returns (saved, key, after)."""
+    saved = {} if reset else state.load()
+    wm_key = ",".join(metrics)
+    progress = saved.get(wm_key, {})
+    windows.load_state(progress.get("windows", {}))
+    composites.load_state(progress.get("composites", {}))
+    return saved, wm_key, int(progress.get("after", 0))
+
+def save_progress(state: JsonStateStore, saved: Dict[str, Any], wm_key: str, after: int,
+                  windows: WindowDetector, composites: CompositeJoin):
+    # Window buffers / join buckets are checkpointed with the watermark so all describe the same point
+    saved[wm_key] = {"after": after, "windows": windows.to_state(), "composites": composites.to_state()}
+    state.save(saved)
+
+def write_anomalies(neo: Neo4jHelper, anomalies: List[Dict[str, Any]], batch_size: int = 1000) -> List[Dict[str, Any]]:
+    """
+    Write only anomalies not already in the graph (ids are deterministic, so a rerun over the same
+    readings finds them all); returns the new ones. Each batch's Anomaly nodes and their GENERATES /
+    HAS_ANOMALY edges commit in one transaction, so an id found by the existence check always has its edges.
+    """
+    if not anomalies:
+        return []
+    unique = list({a["anomaly_id"]: a for a in anomalies}.values())
+    existing = {r["anomaly_id"] for r in neo.query(Q_EXISTING_ANOMALIES, {"ids": [a["anomaly_id"] for a in unique]})}
+    anomalies = [a for a in unique if a["anomaly_id"] not in existing]
+    for i in range(0, len(anomalies), max(int(batch_size), 1)):
+        batch = anomalies[i:i + batch_size]
+        nodes = [{k: v for k, v in a.items() if k not in ("performance_id", "paired_performance_id", "component_id")}
+                 for a in batch]
+        # Connect: PerformanceData -[:GENERATES]-> Anomaly, Component -[:HAS_ANOMALY]-> Anomaly
+        rel_pd = [(a["performance_id"], a["anomaly_id"]) for a in batch if a.get("performance_id")]
+        rel_pd += [(a["paired_performance_id"], a["anomaly_id"]) for a in batch if a.get("paired_performance_id")]
+        rel_c = [(a["component_id"], a["anomaly_id"]) for a in batch if a.get("component_id")]
+        statements = [(Q_MERGE_ANOMALIES, {"rows": nodes})]
+        if rel_pd:
+            statements.append((Q_MERGE_GENERATES, {"pairs": rel_pd}))
+        if rel_c:
+            statements.append((Q_MERGE_HAS_ANOMALY, {"pairs": rel_c}))
+        neo.run_batch(statements)
+    return anomalies
+
+def log_detections(logger: RunLogger, anomalies: List[Dict[str, Any]]):
+    """One DETECTION_ANOMALY event per new anomaly: the join key for trigger -> detect -> action latency."""
+    for a in anomalies:
+        logger.log_event("DETECTION_ANOMALY", details={"anomaly_id": a["anomaly_id"],
+                                                       "performance_id": a.get("performance_id"),
+                                                       "rule_id": a.get("rule_id"), "severity": a.get("severity"),
+                                                       "t_trigger": a.get("t_trigger"),
+                                                       "t_detected": a.get("t_detected")})
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True)
     ap.add_argument("--demo", default="ahu12", help="demo target (e.g., ahu12)")
+    ap.add_argument("--reset-watermark", action="store_true", help="re-scan all readings from the beginning")
     args = ap.parse_args()
 
     cfg = load_config(args.config)
@@ -41,11 +302,12 @@ def main():
     mode = cfg.get("mode", "sam")
 
     out_dir = cfg.get("output_dir", "./logs")
-    logger = RunLogger(out_dir=out_dir, scenario=scenario, mode=mode, component="anomaly_detection")
+    logger = RunLogger.from_config(cfg.get("logging", {}), out_dir=out_dir, scenario=scenario, mode=mode,
+                                   component="anomaly_detection")
 
     logger.log_event("START", details={"demo": args.demo})
 
-    if not neo4j_available():
+    if not backend_available(cfg.get("neo4j", {})):
         logger.log_event("NEO4J_NOT_AVAILABLE", level="WARN")
         logger.write_csv()
         print("Neo4j driver not available. Dry-run only.")
@@ -53,80 +315,45 @@ def main():
 
     neo = Neo4jHelper.from_config(cfg.get("neo4j", {}))
 
-    # Threshold rule (configurable)
-    rules = cfg.get("anomaly_rules", {
-        "default_metric": "temperature",
-        "upper": 30.0,
-        "lower": None
-    })
-
-    metric = rules.get("default_metric", "temperature")
-    upper = rules.get("upper", None)
-    lower = rules.get("lower", None)
-
-    # Query candidate PerformanceData
-    # We assume PerformanceData has properties: performance_id, metric, value, timestamp, component_id
-    q = """
-    MATCH (pd:PerformanceData)
-    WHERE ($metric IS NULL OR pd.metric = $metric)
-      AND pd.value IS NOT NULL
-    RETURN pd.performance_id AS performance_id,
-           pd.timestamp AS timestamp,
-           pd.metric AS metric,
-           toFloat(pd.value) AS value,
-           pd.component_id AS component_id
-    LIMIT $limit
-    """
-    limit = int(cfg.get("anomaly_query_limit", 5000))
+    engine, windows, composites, metrics = build_detectors(cfg)
+
+    # Page through readings ingested after the watermark (anomaly_query_limit = page size)
+    det_cfg = cfg.get("anomaly_detection", {})
+    page_size = int(det_cfg.get("page_size", cfg.get("anomaly_query_limit", 5000)))
+    state = JsonStateStore(det_cfg.get("watermark_path", str(Path(out_dir) / "anomaly_watermarks.json")), neo.target)
+    saved, wm_key, after = load_progress(state, metrics, windows, composites, reset=args.reset_watermark)
 
     t_trigger = utc_now_iso()  # treat this run as trigger emit time (for controlled replay)
     logger.log_event("TRIGGER_EMIT", details={"t_trigger": t_trigger})
+    logger.log_event("DETECTION_START", details={"rules": len(engine.rules), "window_rules": len(windows.rules),
+                                                 "composite_rules": len(composites.rules),
+                                                 "metrics": metrics,
+                                                 "watermark": after, "page_size": page_size})
 
-    rows = neo.query(q, {"metric": metric, "limit": limit})
-    t_detected = utc_now_iso()
-    logger.log_event("DETECTION_START", details={"candidates": len(rows), "t_detected": t_detected})
-
-    anomalies = []
-    for r in rows:
-        v = r.get("value", None)
-        if v is None:
-            continue
-        is_anom = False
-        if upper is not None and v > float(upper):
-            is_anom = True
-        if lower is not None and v < float(lower):
-            is_anom = True
-        if not is_anom:
-            continue
-
-        anomaly_id = f"anom_{uuid.uuid4().hex[:12]}"
-        anomalies.append({
-            "anomaly_id": anomaly_id,
-            "type": "RuleBasedThreshold",
-            "severity": "HIGH" if upper is not None and v > float(upper) else "MEDIUM",
-            "metric": r.get("metric"),
-            "value": v,
-            "timestamp": r.get("timestamp"),
-            "t_trigger": t_trigger,
-            "t_detected": t_detected,
-            "performance_id": r.get("performance_id"),
-            "component_id": r.get("component_id"),
-        })
-
-    # Write anomalies into Neo4j
-    if anomalies:
-        neo.merge_nodes("Anomaly", "anomaly_id", [
-            {k:v for k,v in a.items() if k not in ("performance_id","component_id")}
-            for a in anomalies
-        ])
-
-        # Connect: PerformanceData -[:GENERATES]-> Anomaly, Component -[:HAS_ANOMALY]-> Anomaly
-        rel_pd = [(a["performance_id"], a["anomaly_id"]) for a in anomalies if a.get("performance_id")]
-        rel_c  = [(a["component_id"], a["anomaly_id"]) for a in anomalies if a.get("component_id")]
-        neo.merge_rels("PerformanceData", "performance_id", "Anomaly", "anomaly_id", rel_pd, rel_type="GENERATES")
-        neo.merge_rels("BuildingComponent", "component_id", "Anomaly", "anomaly_id", rel_c, rel_type="HAS_ANOMALY")
+    anomalies, scanned, suppressed = [], 0, 0
+    for page in iter_pages(neo, metrics, after, page_size):
+        t_detected, found, new = detect_and_write(neo, engine, windows, composites, page, t_trigger)
+        log_detections(logger, new)
+        # Advance only after the page's anomalies are written: a crash re-reads at most one page
+        after = page[-1]["ingest_seq"]
+        save_progress(state, saved, wm_key, after, windows, composites)
+        scanned += len(page)
+        suppressed += len(found) - len(new)
+        anomalies += new
+        logger.log_event("DETECTION_PAGE", details={"candidates": len(page), "anomalies": len(found),
+                                                    "new": len(new), "suppressed": len(found) - len(new),
+                                                    "watermark": after, "t_detected": t_detected})
 
-    logger.log_event("DETECTION_DONE", details={"anomaly_count": len(anomalies), "upper": upper, "lower": lower})
+    report_query_stats(neo, logger)
+    neo.close()
+    by_rule: Dict[str, int] = {}
+    for a in anomalies:
+        by_rule[a["rule_id"]] = by_rule.get(a["rule_id"], 0) + 1
+    logger.log_event("DETECTION_DONE", details={"anomaly_count": len(anomalies), "suppressed": suppressed,
+                                                "scanned": scanned,
+                                                "watermark": after, "by_rule": by_rule,
+                                                "late_readings": windows.late,
+                                                "composite_skipped": composites.skipped})
     logger.log_event("DONE")
     logger.write_csv()
     print("Anomaly detection complete. Logs:", logger.default_csv_name())
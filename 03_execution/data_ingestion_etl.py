@@ -13,6 +13,37 @@ data_ingestion_etl.py — PdM Execution (ETL)
 
 Usage:
     python 03_execution/data_ingestion_etl.py --config config/pdm_demo.yaml
+    python 03_execution/data_ingestion_etl.py --config config/pdm_demo.yaml --stream --chunk-size 50000
+
+串流模式（--stream 或 config etl.stream=true）：
+- 每個 CSV 以 chunk 方式讀取（etl.chunk_size，預設 50000 列）
+- 每個 chunk 對映後直接送入 Neo4j batch writer，記憶體上限由 chunk 大小決定而非檔案大小
+- 每個 chunk 於 log 記錄 IMPORT_CHUNK（label/type、chunk 序號、列數、累計列數）
+
+增量匯入（預設開啟，config etl.incremental=false 可關閉）：
+- 輸入檔 sha256 與每列內容指紋寫入 manifest（etl.manifest_path，預設 <output_dir>/etl_manifest.sqlite）
+- 檔案與其對映（spec + mapping，column_mapping.spec_digest）皆未變更 → 整檔略過（IMPORT_SKIP）；
+  否則只 MERGE 新列或內容變更的列（指紋以對映後的欄位計算，改 mapping 時受影響的列會重送）
+- 關係只記錄兩端節點都存在、實際寫入的 pair；端點尚不存在的 pair（unmatched）不記入 manifest，
+  所在檔案也不標記為已匯入，補上節點後重跑即會寫入
+- --full：清空 manifest 後完整重匯（例如目標資料庫被重建時）
+
+平行匯入：各 label 的節點匯入彼此獨立，以 DAG（utils/load_scheduler.py）在 worker pool 上
+同時執行（etl.workers，預設 4）；關係匯入（MAPS_SENSOR_DATA / GENERATES）待其兩端 label
+完成後才開始。每個 stage 的 wall time 記錄為 STAGE_DONE，critical path 記錄為 LOAD_CRITICAL_PATH。
+
+Ingest 序號：PerformanceData 每列於寫入時加上單調遞增的 `ingest_seq` 與解析後的 `ts_ms`（UTC epoch 毫秒），
+並建立 ingest_seq 索引；異常偵測以此作為 watermark，每次只讀取上次處理位置之後的新資料。
+序號取自圖譜內的 durable counter `(:IngestSequence {name: 'PerformanceData'})`，在同一個寫入 transaction
+中配發（Neo4jHelper.merge_nodes(seq_property=...)）：counter 節點鎖到 commit 為止，多個寫入端（ETL、
+pipeline_daemon）依序號順序 commit，不受時鐘調整影響，也不會有低於 watermark 的序號晚於其後的序號出現。
+counter 從圖譜內既有的最大序號往上接。序號只配發給新建立的節點：已存在的列（ETL 重跑、pipeline 重試）
+再次 MERGE 時保留原序號、不消耗 counter，偵測不會把同一筆讀值讀兩次。
+Bulk export 不連線圖譜，序號仍以 ns 時鐘配發（reserve_ingest_seq）；之後的 Bolt 匯入會從其最大值往上接。
+
+Bulk import（--bulk-export DIR 或 config etl.bulk_export_dir）：
+- 不經 Bolt，將對映後的 PdM（或 Carbon_SIDCM graph CSV）寫成帶型別 header 的 nodes_*/rels_* 檔案
+- 另產生 import.sh（neo4j-admin database import full，全新資料庫）與 load_csv.cypher（既有資料庫）
 
 輸出：
 - logs/etl_import_log.csv（可選，依 config）
@@ -22,14 +53,26 @@ from __future__ import annotations
 import argparse
 import hashlib
 import os
+import threading
+import time
+from functools import partial
 from pathlib import Path
-from typing import Dict, Any, List, Tuple
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
 
+import numpy as np
 import pandas as pd
 
+from utils.bulk_export import BulkExporter
+from utils.column_mapping import (
+    GRAPH_CSV_SPECS, PDM_NODE_SPECS, PDM_REL_SPECS, GraphCsvSpec, NodeSpec, RelSpec,
+    map_nodes, map_rels, map_str, node_params, rel_params, spec_digest,
+)
 from utils.config_loader import load_config
+from utils.etl_manifest import EtlManifest, row_fingerprints
+from utils.load_scheduler import Stage, run_stages
 from utils.logger import RunLogger
-from utils.neo4j_helper import Neo4jHelper, neo4j_available
+from utils.neo4j_helper import Neo4jHelper, WriteSummary, backend_available
+from utils.query_stats import report_query_stats
 
 
 # -----------------------------
@@ -45,75 +88,248 @@ def file_sha256(path: Path) -> str:
 def _ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
-def _read_csv(path: Path) -> pd.DataFrame:
-    if not path.exists():
-        return pd.DataFrame()
-    return pd.read_csv(path)
-
 def _normalize_cols(df: pd.DataFrame) -> pd.DataFrame:
     df.columns = [c.strip() for c in df.columns]
     return df
 
+def iter_csv(path: Path, chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Yield the CSV as normalized frames: one frame when chunk_size is None,
+    otherwise consecutive chunks (the row index keeps counting across chunks,
+    so fallback ids such as sd_{i} are identical in both modes).
+    """
+    if not path.exists():
+        return
+    if chunk_size is None:
+        df = pd.read_csv(path)
+        if not df.empty:
+            yield _normalize_cols(df)
+        return
+    with pd.read_csv(path, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            if not chunk.empty:
+                yield _normalize_cols(chunk)
+
+INGEST_SEQ = "ingest_seq"
+INGEST_SEQ_SCHEMA = [
+    ("CREATE CONSTRAINT IF NOT EXISTS FOR (s:IngestSequence) REQUIRE s.name IS UNIQUE", None),
+    ("CREATE INDEX IF NOT EXISTS FOR (pd:PerformanceData) ON (pd.ingest_seq)", None),
+]
+
+_SEQ_LOCK = threading.Lock()
+_SEQ_LAST = 0
+
+def reserve_ingest_seq(n: int) -> int:
+    """
+    Reserve n consecutive ingest sequence numbers and return the first one (bulk export only: Bolt
+    writes number their rows from the graph's counter, see Neo4jHelper.merge_nodes). Numbers are
+    strictly increasing within the process and, being based on time.time_ns(), across runs.
+    """
+    global _SEQ_LAST
+    with _SEQ_LOCK:
+        start = max(_SEQ_LAST + 1, time.time_ns())
+        _SEQ_LAST = start + max(n, 1) - 1
+        return start
+
+def stamp_ingest_seq(spec: NodeSpec, frame: pd.DataFrame) -> pd.DataFrame:
+    """Clock-based ingest_seq for files written without a graph (bulk export)."""
+    if not spec.sequenced or frame.empty:
+        return frame
+    start = reserve_ingest_seq(len(frame))
+    return frame.assign(ingest_seq=range(start, start + len(frame)))
+
+def _filter_changed(manifest: Optional[EtlManifest], ns: str, frame: pd.DataFrame, keys: pd.Series):
+    """Drop rows already in the manifest with the same fingerprint; returns (frame, keys, fps, skipped)."""
+    if manifest is None:
+        return frame, keys, None, 0
+    fps = row_fingerprints(frame)
+    keep = manifest.changed_mask(ns, keys, fps)
+    return frame[keep], keys[keep], fps[keep], int((~keep).sum())
+
+def load_nodes(neo: Neo4jHelper, logger: RunLogger, spec: NodeSpec, path: Path,
+               mapping: Dict[str, Any], chunk_size: Optional[int] = None,
+               manifest: Optional[EtlManifest] = None, file_sha: Optional[str] = None) -> int:
+    """Map and MERGE one node file; returns the number of rows written."""
+    manifest_name = f"{spec.label}/{path.name}"
+    version = f"{file_sha}/{spec_digest(spec, mapping)}" if file_sha else None     # content + effective mapping
+    if manifest is not None and version and manifest.file_unchanged(manifest_name, version):
+        logger.log_event("IMPORT_SKIP", details={"label": spec.label, "file": path.name, "reason": "unchanged"})
+        return 0
+    total, skipped, chunks = 0, 0, 0
+    write = WriteSummary(target=spec.label)
+    for i, df in enumerate(iter_csv(path, chunk_size)):
+        chunks += 1
+        frame = map_nodes(df, spec, mapping)
+        frame, keys, fps, n_skip = _filter_changed(manifest, spec.label, frame, frame[spec.key])
+        rows = node_params(frame)
+        write.merge(neo.merge_nodes(spec.label, spec.key, rows, seq_property=INGEST_SEQ if spec.sequenced else None))
+        if manifest is not None:
+            manifest.record_rows(spec.label, keys, fps)
+        total += len(rows)
+        skipped += n_skip
+        if chunk_size is not None:
+            logger.log_event("IMPORT_CHUNK", details={"label": spec.label, "chunk": i, "count": len(rows),
+                                                      "unchanged": n_skip, "total": total})
+    if chunks:
+        logger.log_event("IMPORT_NODE", details={"label": spec.label, "count": total, "unchanged": skipped,
+                                                 "write": write.as_dict()})
+    if manifest is not None and version:
+        manifest.record_file(manifest_name, version)
+    return total
+
+def load_rels(neo: Neo4jHelper, logger: RunLogger, spec: RelSpec, path: Path,
+              mapping: Dict[str, Any], chunk_size: Optional[int] = None,
+              manifest: Optional[EtlManifest] = None, file_sha: Optional[str] = None) -> int:
+    """Map and MERGE one edge file; returns the number of pairs written."""
+    rel_type = spec.resolved_type(mapping)
+    ns = f"rel:{spec.src_label}-{rel_type}->{spec.tgt_label}"
+    manifest_name = f"{ns}/{path.name}"
+    version = f"{file_sha}/{spec_digest(spec, mapping)}" if file_sha else None     # content + effective mapping
+    if manifest is not None and version and manifest.file_unchanged(manifest_name, version):
+        logger.log_event("IMPORT_SKIP", details={"type": rel_type, "file": path.name, "reason": "unchanged"})
+        return 0
+    total, skipped, unmatched, chunks = 0, 0, 0, 0
+    write = WriteSummary(target=rel_type)
+    for i, df in enumerate(iter_csv(path, chunk_size)):
+        chunks += 1
+        frame = map_rels(df, spec, mapping)
+        frame, keys, fps, n_skip = _filter_changed(manifest, ns, frame, frame["src"] + "\x1f" + frame["tgt"])
+        pairs = rel_params(frame)
+        written: Set[Tuple[str, str]] = set()
+        write.merge(neo.merge_rels(spec.src_label, spec.src_key, spec.tgt_label, spec.tgt_key, pairs,
+                                   rel_type=rel_type, written=written))
+        # A pair whose endpoint is not in the graph (yet) wrote nothing: leave it out of the manifest
+        ok = np.array([(s, t) in written for s, t in pairs], dtype=bool)
+        if manifest is not None:
+            manifest.record_rows(ns, keys[ok], fps[ok])
+        n_unmatched = int((~ok).sum())
+        total += len(pairs) - n_unmatched
+        skipped += n_skip
+        unmatched += n_unmatched
+        if chunk_size is not None:
+            logger.log_event("IMPORT_CHUNK", details={"type": rel_type, "chunk": i, "count": len(pairs) - n_unmatched,
+                                                      "unchanged": n_skip, "unmatched": n_unmatched, "total": total})
+    if chunks:
+        logger.log_event("IMPORT_REL", details={"type": rel_type, "count": total, "unchanged": skipped,
+                                                "unmatched": unmatched, "write": write.as_dict()})
+    if manifest is not None and version and not unmatched:
+        manifest.record_file(manifest_name, version)
+    return total
+
+def export_bulk(exporter: BulkExporter, node_inputs, rel_inputs, mapping: Dict[str, Any],
+                chunk_size: Optional[int] = None):
+    """Write mapped PdM nodes/relationships as neo4j-admin import files."""
+    for spec, path in node_inputs:
+        for df in iter_csv(path, chunk_size):
+            exporter.add_nodes(spec.label, spec.key, stamp_ingest_seq(spec, map_nodes(df, spec, mapping)))
+    for spec, path in rel_inputs:
+        rel_type = spec.resolved_type(mapping)
+        for df in iter_csv(path, chunk_size):
+            exporter.add_rels(rel_type, spec.src_label, spec.src_key, spec.tgt_label, spec.tgt_key,
+                              map_rels(df, spec, mapping))
+
+def export_bulk_graph_csv(exporter: BulkExporter, gspec: GraphCsvSpec, nodes_path: Path, rels_path: Path,
+                          chunk_size: Optional[int] = None) -> int:
+    """
+    Write a pre-modelled graph CSV pair (e.g. Carbon_SIDCM) as import files: nodes split by their
+    label column, relationships split by (type, source label, target label). Returns the number of
+    relationships dropped because an endpoint id is not in the node file.
+    """
+    sp = gspec.id_space
+    labels: Dict[str, str] = {}
+    for df in iter_csv(nodes_path, chunk_size):
+        df = df.copy()
+        df[gspec.node_id_col] = map_str(df[gspec.node_id_col]).str.strip()
+        df = df[df[gspec.node_id_col] != ""]
+        labels.update(zip(df[gspec.node_id_col], df[gspec.node_label_col]))
+        for label, part in df.groupby(gspec.node_label_col, sort=False):
+            props = part.drop(columns=[gspec.node_label_col])
+            exporter.add_nodes(str(label), gspec.node_id_col, props.astype(object).where(props.notna(), None), sp)
+    dropped = 0
+    for df in iter_csv(rels_path, chunk_size):
+        df = df.rename(columns={gspec.src_col: "src", gspec.tgt_col: "tgt"})
+        df["src"] = map_str(df["src"]).str.strip()
+        df["tgt"] = map_str(df["tgt"]).str.strip()
+        df["_src_label"] = df["src"].map(labels)
+        df["_tgt_label"] = df["tgt"].map(labels)
+        ok = df["_src_label"].notna() & df["_tgt_label"].notna()
+        dropped += int((~ok).sum())
+        for (rtype, sl, tl), part in df[ok].groupby([gspec.type_col, "_src_label", "_tgt_label"], sort=False):
+            rels = part.drop(columns=[gspec.type_col, "_src_label", "_tgt_label"])
+            exporter.add_rels(str(rtype), str(sl), gspec.node_id_col, str(tl), gspec.node_id_col, rels, sp, sp)
+    return dropped
+
 # -----------------------------
 # Main ETL
 # -----------------------------
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True, help="YAML/JSON config path")
+    ap.add_argument("--stream", action="store_true", help="read inputs in chunks (bounded memory)")
+    ap.add_argument("--chunk-size", type=int, default=None, help="rows per chunk in stream mode")
+    ap.add_argument("--full", action="store_true", help="ignore the incremental manifest and re-import everything")
+    ap.add_argument("--bulk-export", default=None, metavar="DIR",
+                    help="write neo4j-admin import files + LOAD CSV script to DIR instead of writing through Bolt")
     args = ap.parse_args()
 
     cfg = load_config(args.config)
     scenario = cfg.get("scenario", "PdM_HVAC")
     mode = cfg.get("mode", "sam")
+    etl_cfg = cfg.get("etl", {})
+    stream = args.stream or bool(etl_cfg.get("stream", False))
+    chunk_size = int(args.chunk_size or etl_cfg.get("chunk_size", 50000)) if stream else None
 
     # Paths
     root = Path(cfg.get("data_root", "../../02_data")).resolve()
     dataset = cfg.get("dataset", "PdM_HVAC")
     ds = (root / dataset).resolve()
 
-    raw_dir = ds / "raw"
-    processed_dir = ds / "processed"
-    edges_dir = ds / "edges"
-    tasks_dir = ds / "tasks"
-    actors_dir = ds / "actors"
-
     # Logs
     out_dir = Path(cfg.get("output_dir", "./logs")).resolve()
     _ensure_dir(out_dir)
-    logger = RunLogger(out_dir=out_dir, scenario=scenario, mode=mode, component="etl")
+    logger = RunLogger.from_config(cfg.get("logging", {}), out_dir=out_dir, scenario=scenario, mode=mode,
+                                   component="etl")
 
-    logger.log_event("START", details={"dataset_path": str(ds)})
+    logger.log_event("START", details={"dataset_path": str(ds), "stream": stream, "chunk_size": chunk_size})
 
     # Read inputs (expected names, can be overridden in config)
     files = cfg.get("files", {})
-    f_assets = raw_dir / files.get("assets", "BuildingComponent_Dataset.csv")
-    f_sensor = raw_dir / files.get("sensor", "Sensor_Data_300.csv")
-    f_perf = processed_dir / files.get("performance", "Performance_Data_300.csv")
-    f_anom = processed_dir / files.get("anomaly", "Anomaly_Data_300.csv")
-    f_edge_maps = edges_dir / files.get("edge_maps", "Edge_MAPS_SENSOR_DATA.csv")
-    f_edge_gen = edges_dir / files.get("edge_generates", "Edge_GENERATES.csv")
-    f_tasks = tasks_dir / files.get("tasks", "MaintenanceTasks_Generated.csv")
-    f_actors = actors_dir / files.get("actors", "Actors.csv")
+    node_inputs = [(spec, ds / spec.subdir / files.get(spec.file_key, spec.default_file)) for spec in PDM_NODE_SPECS]
+    rel_inputs = [(spec, ds / spec.subdir / files.get(spec.file_key, spec.default_file)) for spec in PDM_REL_SPECS]
+    gspec = GRAPH_CSV_SPECS.get(dataset)
+    graph_inputs = []
+    if gspec is not None:
+        graph_inputs = [ds / gspec.subdir / files.get(gspec.nodes_file_key, gspec.nodes_default_file),
+                        ds / gspec.subdir / files.get(gspec.rels_file_key, gspec.rels_default_file)]
 
     # Hash inputs for provenance (optional)
     input_hashes = {}
-    for p in [f_assets, f_sensor, f_perf, f_anom, f_edge_maps, f_edge_gen, f_tasks, f_actors]:
+    for p in [p for _, p in node_inputs + rel_inputs] + graph_inputs:
         if p.exists():
             input_hashes[p.name] = file_sha256(p)
     logger.log_event("INPUT_HASH", details=input_hashes)
 
-    # Load data
-    assets_df = _normalize_cols(_read_csv(f_assets))
-    sensor_df = _normalize_cols(_read_csv(f_sensor))
-    perf_df = _normalize_cols(_read_csv(f_perf))
-    anom_df = _normalize_cols(_read_csv(f_anom))
-    edge_maps_df = _normalize_cols(_read_csv(f_edge_maps))
-    edge_gen_df = _normalize_cols(_read_csv(f_edge_gen))
-    tasks_df = _normalize_cols(_read_csv(f_tasks))
-    actors_df = _normalize_cols(_read_csv(f_actors))
+    # Bulk-import artifacts (fresh database builds): no Bolt round-trips at all
+    bulk_dir = args.bulk_export or etl_cfg.get("bulk_export_dir")
+    if bulk_dir:
+        exporter = BulkExporter(bulk_dir)
+        m = cfg.get("mapping", {})
+        dropped = 0
+        if gspec is not None:
+            dropped = export_bulk_graph_csv(exporter, gspec, graph_inputs[0], graph_inputs[1], chunk_size)
+        else:
+            export_bulk(exporter, node_inputs, rel_inputs, m, chunk_size)
+        summary = exporter.finish(database=cfg.get("neo4j", {}).get("database") or "neo4j",
+                                  batch_rows=int(etl_cfg.get("load_csv_batch_rows", 10000)))
+        summary["dropped_relationships"] = dropped
+        logger.log_event("BULK_EXPORT", details=summary)
+        logger.log_event("DONE")
+        logger.write_csv()
+        print("Bulk import files written to:", bulk_dir)
+        return
 
     # If no Neo4j, we still write a dry-run report
-    if not neo4j_available():
+    if not backend_available(cfg.get("neo4j", {})):
         logger.log_event("NEO4J_NOT_AVAILABLE", level="WARN", details={"hint": "pip install neo4j"})
         logger.write_csv()
         print("Neo4j driver not available. Dry-run only. Logs written to:", out_dir)
@@ -122,166 +338,46 @@ def main():
     neo = Neo4jHelper.from_config(cfg.get("neo4j", {}))
 
     # Create minimal constraints/indexes (safe to run multiple times)
-    with neo.session() as s:
-        s.run("CREATE CONSTRAINT IF NOT EXISTS FOR (c:BuildingComponent) REQUIRE c.component_id IS UNIQUE")
-        s.run("CREATE CONSTRAINT IF NOT EXISTS FOR (sd:SensorData) REQUIRE sd.sensor_data_id IS UNIQUE")
-        s.run("CREATE CONSTRAINT IF NOT EXISTS FOR (pd:PerformanceData) REQUIRE pd.performance_id IS UNIQUE")
-        s.run("CREATE CONSTRAINT IF NOT EXISTS FOR (a:Anomaly) REQUIRE a.anomaly_id IS UNIQUE")
-        s.run("CREATE CONSTRAINT IF NOT EXISTS FOR (t:MaintenanceTask) REQUIRE t.task_id IS UNIQUE")
-        s.run("CREATE CONSTRAINT IF NOT EXISTS FOR (p:Person) REQUIRE p.person_id IS UNIQUE")
+    # Schema commands cannot share a transaction with writes -> one session, auto-commit each
+    neo.run_batch([
+        ("CREATE CONSTRAINT IF NOT EXISTS FOR (c:BuildingComponent) REQUIRE c.component_id IS UNIQUE", None),
+        ("CREATE CONSTRAINT IF NOT EXISTS FOR (sd:SensorData) REQUIRE sd.sensor_data_id IS UNIQUE", None),
+        ("CREATE CONSTRAINT IF NOT EXISTS FOR (pd:PerformanceData) REQUIRE pd.performance_id IS UNIQUE", None),
+        ("CREATE CONSTRAINT IF NOT EXISTS FOR (a:Anomaly) REQUIRE a.anomaly_id IS UNIQUE", None),
+        ("CREATE CONSTRAINT IF NOT EXISTS FOR (t:MaintenanceTask) REQUIRE t.task_id IS UNIQUE", None),
+        ("CREATE CONSTRAINT IF NOT EXISTS FOR (p:Person) REQUIRE p.person_id IS UNIQUE", None),
+        *INGEST_SEQ_SCHEMA,
+    ], transactional=False)
 
     # Mapping (allow user override)
     m = cfg.get("mapping", {})
 
-    def col(df, key, fallback):
-        return m.get(key, fallback) if key in m else fallback
-
-    # ---- Nodes: BuildingComponent
-    if not assets_df.empty:
-        cid = col(assets_df, "component_id", "ComponentId")
-        cname = col(assets_df, "component_name", "Name")
-        ctype = col(assets_df, "component_type", "Type")
-        rows = []
-        for _, r in assets_df.iterrows():
-            comp_id = str(r.get(cid, "")).strip()
-            if not comp_id:
-                continue
-            rows.append({
-                "component_id": comp_id,
-                "name": str(r.get(cname, "")),
-                "type": str(r.get(ctype, "")),
-            })
-        neo.merge_nodes("BuildingComponent", "component_id", rows)
-        logger.log_event("IMPORT_NODE", details={"label": "BuildingComponent", "count": len(rows)})
-
-    # ---- Nodes: SensorData (raw sensor stream)
-    if not sensor_df.empty:
-        sid = col(sensor_df, "sensor_data_id", "SensorDataId")
-        ts = col(sensor_df, "sensor_timestamp", "Timestamp")
-        val = col(sensor_df, "sensor_value", "Value")
-        sensor_id = col(sensor_df, "sensor_id", "SensorId")
-        rows = []
-        for i, r in sensor_df.iterrows():
-            sdata_id = str(r.get(sid, f"sd_{i}")).strip()
-            rows.append({
-                "sensor_data_id": sdata_id,
-                "sensor_id": str(r.get(sensor_id, "")),
-                "timestamp": str(r.get(ts, "")),
-                "value": r.get(val, None),
-            })
-        neo.merge_nodes("SensorData", "sensor_data_id", rows)
-        logger.log_event("IMPORT_NODE", details={"label": "SensorData", "count": len(rows)})
-
-    # ---- Nodes: PerformanceData (processed)
-    if not perf_df.empty:
-        pid = col(perf_df, "performance_id", "PerformanceId")
-        ts = col(perf_df, "performance_timestamp", "Timestamp")
-        metric = col(perf_df, "performance_metric", "Metric")
-        val = col(perf_df, "performance_value", "Value")
-        sensor_id = col(perf_df, "sensor_id", "SensorId")
-        component_id = col(perf_df, "component_id", "ComponentId")
-        rows = []
-        for i, r in perf_df.iterrows():
-            perf_id = str(r.get(pid, f"pd_{i}")).strip()
-            rows.append({
-                "performance_id": perf_id,
-                "sensor_id": str(r.get(sensor_id, "")),
-                "component_id": str(r.get(component_id, "")),
-                "timestamp": str(r.get(ts, "")),
-                "metric": str(r.get(metric, "")),
-                "value": r.get(val, None),
-            })
-        neo.merge_nodes("PerformanceData", "performance_id", rows)
-        logger.log_event("IMPORT_NODE", details={"label": "PerformanceData", "count": len(rows)})
-
-    # ---- Nodes: Anomaly (optional seed from processed anomaly file)
-    if not anom_df.empty:
-        aid = col(anom_df, "anomaly_id", "AnomalyId")
-        ts = col(anom_df, "anomaly_timestamp", "Timestamp")
-        atype = col(anom_df, "anomaly_type", "Type")
-        severity = col(anom_df, "anomaly_severity", "Severity")
-        component_id = col(anom_df, "component_id", "ComponentId")
-        rows = []
-        for i, r in anom_df.iterrows():
-            an_id = str(r.get(aid, f"a_{i}")).strip()
-            rows.append({
-                "anomaly_id": an_id,
-                "timestamp": str(r.get(ts, "")),
-                "type": str(r.get(atype, "")),
-                "severity": str(r.get(severity, "")),
-                "component_id": str(r.get(component_id, "")),
-            })
-        neo.merge_nodes("Anomaly", "anomaly_id", rows)
-        logger.log_event("IMPORT_NODE", details={"label": "Anomaly", "count": len(rows)})
-
-    # ---- Nodes: MaintenanceTask
-    if not tasks_df.empty:
-        tid = col(tasks_df, "task_id", "TaskId")
-        ttype = col(tasks_df, "task_type", "TaskType")
-        priority = col(tasks_df, "task_priority", "Priority")
-        component_id = col(tasks_df, "component_id", "ComponentId")
-        rows = []
-        for i, r in tasks_df.iterrows():
-            task_id = str(r.get(tid, f"t_{i}")).strip()
-            rows.append({
-                "task_id": task_id,
-                "type": str(r.get(ttype, "")),
-                "priority": str(r.get(priority, "")),
-                "component_id": str(r.get(component_id, "")),
-            })
-        neo.merge_nodes("MaintenanceTask", "task_id", rows)
-        logger.log_event("IMPORT_NODE", details={"label": "MaintenanceTask", "count": len(rows)})
-
-    # ---- Nodes: Person (Actor)
-    if not actors_df.empty:
-        pid = col(actors_df, "person_id", "ActorId")
-        name = col(actors_df, "person_name", "Name")
-        role = col(actors_df, "person_role", "Role")
-        rows = []
-        for i, r in actors_df.iterrows():
-            person_id = str(r.get(pid, f"p_{i}")).strip()
-            rows.append({
-                "person_id": person_id,
-                "name": str(r.get(name, "")),
-                "role": str(r.get(role, "")),
-            })
-        neo.merge_nodes("Person", "person_id", rows)
-        logger.log_event("IMPORT_NODE", details={"label": "Person", "count": len(rows)})
-
-    # ---- Relationships (edges CSV)
-    # Edge_MAPS_SENSOR_DATA: (BuildingComponent)-[:MAPS_SENSOR_DATA]->(SensorData) or similar
-    if not edge_maps_df.empty:
-        src = col(edge_maps_df, "src_component_id", "ComponentId")
-        tgt = col(edge_maps_df, "tgt_sensor_data_id", "SensorDataId")
-        rel = col(edge_maps_df, "rel_type", "REL")
-        rel_type = "MAPS_SENSOR_DATA"
-        rows = []
-        for _, r in edge_maps_df.iterrows():
-            c_id = str(r.get(src, "")).strip()
-            sd_id = str(r.get(tgt, "")).strip()
-            if not c_id or not sd_id:
-                continue
-            rows.append((c_id, sd_id, rel_type))
-        neo.merge_rels("BuildingComponent", "component_id", "SensorData", "sensor_data_id",
-                       rows, rel_type=rel_type)
-        logger.log_event("IMPORT_REL", details={"type": rel_type, "count": len(rows)})
-
-    # Edge_GENERATES: (PerformanceData)-[:GENERATES]->(Anomaly) or (SensorData)->(PerformanceData)
-    if not edge_gen_df.empty:
-        src = col(edge_gen_df, "src_id", "SRC")
-        tgt = col(edge_gen_df, "tgt_id", "TGT")
-        rel_type = col(edge_gen_df, "rel_type", "GENERATES")
-        rows = []
-        for _, r in edge_gen_df.iterrows():
-            s_id = str(r.get(src, "")).strip()
-            t_id = str(r.get(tgt, "")).strip()
-            if not s_id or not t_id:
-                continue
-            rows.append((s_id, t_id, rel_type))
-        # We don't know labels; attempt common pattern: PerformanceData -> Anomaly
-        neo.merge_rels("PerformanceData", "performance_id", "Anomaly", "anomaly_id",
-                       [(a,b,rel_type) for a,b,_ in rows], rel_type=rel_type)
-        logger.log_event("IMPORT_REL", details={"type": rel_type, "count": len(rows)})
+    # Incremental manifest (file hashes + row fingerprints), bound to the target database
+    manifest = None
+    if bool(etl_cfg.get("incremental", True)):
+        manifest = EtlManifest(etl_cfg.get("manifest_path", str(out_dir / "etl_manifest.sqlite")), neo.target)
+        if args.full:
+            manifest.reset()
+
+    # ---- Load DAG: node labels are independent; each relationship stage waits for its endpoint labels
+    stages = [
+        Stage(spec.label, partial(load_nodes, neo, logger, spec, p, m, chunk_size, manifest, input_hashes.get(p.name)))
+        for spec, p in node_inputs
+    ]
+    stages += [
+        Stage(spec.resolved_type(m),
+              partial(load_rels, neo, logger, spec, p, m, chunk_size, manifest, input_hashes.get(p.name)),
+              deps=tuple(dict.fromkeys((spec.src_label, spec.tgt_label))))
+        for spec, p in rel_inputs
+    ]
+    workers = int(etl_cfg.get("workers", 4))
+    try:
+        run_stages(stages, max_workers=workers, logger=logger)
+    finally:
+        if manifest is not None:
+            manifest.close()
+        report_query_stats(neo, logger)
+        neo.close()
 
     logger.log_event("DONE")
     logger.write_csv()
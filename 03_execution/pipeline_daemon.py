@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pipeline_daemon.py — PdM Execution (Ingest → Detect → Dispatch, long-running)
+
+把 data_ingestion_etl.py / anomaly_detection_logic.py / workflow_trigger_api.py 三個 CLI 串成同一個行程內的
+串流 pipeline（utils/pipeline.py）：設定、pandas、Neo4j driver 與 HTTP 連線池只載入一次，新讀值寫入圖譜後
+直接以記憶體傳給偵測與派發，通常不必再回頭查詢圖譜找上一個 stage 的輸出。
+
+    inbox/*.csv ─▶ [ingest] ─(queue)─▶ [detect] ─(queue)─▶ [dispatch]
+    ingest  ：讀取 inbox 目錄中新出現的 PerformanceData CSV（以 chunk 讀取），欄位對映同 ETL
+              （mapping / column_mapping.py），MERGE 時由圖譜的 counter 配發 ingest_seq（同 ETL），轉成讀值傳給 detect
+    detect  ：threshold / 視窗 / 複合規則（同 anomaly_detection_logic.py），寫入 Anomaly 後推進 watermark
+              （與 CLI 共用 anomaly_watermarks.json，兩者可交替使用）；watermark 之後的序號全屬於這個 chunk 時
+              直接偵測記憶體中的讀值，否則（ETL CLI 在其間寫入、序號不連續）改由圖譜自 watermark 分頁讀取
+    dispatch：合併為 MaintenanceTask、寫入 outbox 並派發（同 workflow_trigger_api.py）；合併群組跨批次保持開啟
+              （workflow.coalesce.max_hold_s），閒置時釋出已結束的群組並重送到期的失敗項目，結束時釋出全部
+- stage 之間為有界 queue（daemon.queue_size，預設 8 批）：下游跟不上時上游阻塞（backpressure），不丟資料
+- 任一 stage 處理失敗時以指數退避重試同一批（daemon.stage_retries，預設 3）；仍失敗則整個 pipeline 停止
+  （STAGE_FAILED）：失敗的 chunk 所在檔案不會搬到 processed/，watermark 停在失敗的批次之前，修正後重新啟動
+  即從該處繼續
+- 啟動時先補齊 watermark 之後尚未偵測的讀值，並把圖譜中尚未派發的 Anomaly 交給 outbox
+- 每 daemon.stats_interval_s 秒記錄 PIPELINE_STATS（各 queue 深度、各 stage 批數 / 筆數 / 忙碌與阻塞時間、
+  queue 等待與處理時間 p50/p95、讀值進入 pipeline 到派發完成的 end-to-end latency），並寫入
+  daemon.status_path（預設 <output_dir>/pipeline_status.json，原子覆寫，可供外部監控讀取）
+- 檔案放入 inbox 時請先寫成其他副檔名再 rename 為 .csv；處理完的檔案移到 inbox/processed/
+- SIGINT / SIGTERM：停止讀取新檔，處理完 queue 中的資料後結束；--once：處理完 inbox 現有檔案即結束
+
+Config（daemon，皆可省略）：
+    inbox_dir: <output_dir>/inbox
+    chunk_size: 5000
+    queue_size: 8
+    poll_s: 1.0
+    stats_interval_s: 10
+    component_refresh_s: 300     # BuildingComponent.type 快取的更新間隔（component_type 規則用）
+    stage_retries: 3
+    retry_backoff_s: 0.5         # 第 n 次重試前等待 retry_backoff_s × 2^(n-1)，上限 retry_max_s
+    retry_max_s: 30
+
+Usage:
+    python 03_execution/pipeline_daemon.py --config config/pdm_demo.yaml
+    python 03_execution/pipeline_daemon.py --config config/pdm_demo.yaml --once
+
+Outputs:
+- logs/pipeline_daemon_<run_id>.csv (by RunLogger)
+- logs/pipeline_status.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from anomaly_detection_logic import (
+    build_detectors, detect_and_write, iter_pages, load_progress, log_detections, save_progress,
+)
+from data_ingestion_etl import INGEST_SEQ, INGEST_SEQ_SCHEMA, iter_csv
+from utils.buffered_writer import BufferedWriter
+from utils.column_mapping import PDM_NODE_SPECS, map_nodes, node_params
+from utils.config_loader import load_config
+from utils.graph_memory import register_statement
+from utils.logger import RunLogger
+from utils.neo4j_helper import Neo4jHelper, backend_available
+from utils.outbox import Outbox
+from utils.pipeline import Batch, PipelineStage
+from utils.query_stats import report_query_stats
+from utils.rate_limit import RateLimiters
+from utils.rule_engine import metric_selected
+from utils.state_store import JsonStateStore
+from utils.task_coalescing import TaskCoalescer
+from workflow_trigger_api import (
+    Q_TASK_CREATE, Q_WORKORDER_DISPATCHED, build_client, drain_outbox, enqueue_anomalies, enqueue_pending,
+    write_error_logger,
+)
+
+
+def utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+Q_COMPONENT_TYPES = """
+MATCH (c:BuildingComponent)
+RETURN c.component_id AS component_id, c.type AS type
+"""
+
+@register_statement(Q_COMPONENT_TYPES)
+def _q_component_types_mem(g, params, m):
+    return [{"component_id": g.get(n, "component_id"), "type": g.get(n, "type")} for n in g.nodes("BuildingComponent")]
+
+PERFORMANCE_SPEC = next(s for s in PDM_NODE_SPECS if s.label == "PerformanceData")
+
+def ingest_chunk(neo: Neo4jHelper, chunk: pd.DataFrame, mapping: Dict[str, Any], metrics: Set[str],
+                 types: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Map and MERGE one PerformanceData chunk (ingest_seq from the graph's counter); returns the detected metrics' readings."""
+    spec = PERFORMANCE_SPEC
+    rows = node_params(map_nodes(chunk, spec, mapping))
+    neo.merge_nodes(spec.label, spec.key, rows, seq_property=INGEST_SEQ)
+    t_ingest = utc_now_iso()
+    chunk_seqs = frozenset(r[INGEST_SEQ] for r in rows)     # every row, detected metric or not (see detect_pages)
+    readings = []
+    for r in rows:
+        if r.get("value") is None or not metric_selected(r.get("metric"), metrics):
+            continue
+        readings.append({"performance_id": r.get("performance_id"), "timestamp": r.get("timestamp"),
+                         "ts_ms": r.get("ts_ms"), "metric": r.get("metric"), "value": r.get("value"),
+                         "sensor_id": r.get("sensor_id"), "component_id": r.get("component_id"),
+                         "component_type": types.get(r.get("component_id")),
+                         "ingest_seq": r.get("ingest_seq"), "chunk_seqs": chunk_seqs, "t_ingest": t_ingest})
+    return readings
+
+def detect_pages(neo: Neo4jHelper, metrics: List[str], readings: List[Dict[str, Any]], after: int,
+                 page_size: int) -> Iterator[Tuple[List[Dict[str, Any]], int]]:
+    """
+    (page, watermark after it) to detect for one ingested chunk. The chunk's own readings are used when its rows
+    hold every number after the watermark; when another writer (the ETL CLI shares the counter) numbered
+    readings in between, or the numbers are not contiguous, the pages are read from the graph instead.
+    """
+    seqs = {s for s in readings[0]["chunk_seqs"] if s > after}
+    if not seqs:
+        return                                  # only re-merged rows, already detected
+    top = max(seqs)
+    if len(seqs) == top - after:
+        yield sorted((r for r in readings if r["ingest_seq"] > after), key=lambda r: r["ingest_seq"]), top
+        return
+    for page in iter_pages(neo, metrics, after, page_size):
+        yield page, page[-1]["ingest_seq"]
+
+class InboxSource:
+    """Chunks of new PerformanceData CSV files dropped into the inbox, mapped, numbered and written."""
+
+    def __init__(self, neo: Neo4jHelper, inbox: Path, mapping: Dict[str, Any], metrics: List[str],
+                 chunk_size: int, component_refresh_s: float, logger: RunLogger):
+        self.neo = neo
+        self.inbox = inbox
+        self.done_dir = inbox / "processed"
+        self.mapping = mapping
+        self.metrics = set(metrics)
+        self.chunk_size = max(int(chunk_size), 1)
+        self.component_refresh_s = float(component_refresh_s)
+        self.logger = logger
+        self._chunks: Optional[Iterator[pd.DataFrame]] = None
+        self._file: Optional[Path] = None
+        self._chunk: Optional[pd.DataFrame] = None      # current chunk, kept until it is written
+        self._types: Dict[str, Any] = {}
+        self._types_at = 0.0
+        self.done_dir.mkdir(parents=True, exist_ok=True)
+
+    def _component_types(self) -> Dict[str, Any]:
+        if time.monotonic() - self._types_at >= self.component_refresh_s:
+            self._types = {r["component_id"]: r["type"] for r in self.neo.query(Q_COMPONENT_TYPES)}
+            self._types_at = time.monotonic()
+        return self._types
+
+    def _next_chunk(self) -> Optional[pd.DataFrame]:
+        while True:
+            if self._chunks is None:
+                files = sorted(self.inbox.glob("*.csv"), key=lambda p: (p.stat().st_mtime, p.name))
+                if not files:
+                    return None
+                self._file = files[0]
+                self._chunks = iter_csv(self._file, self.chunk_size)
+            try:
+                chunk = next(self._chunks, None)
+            except Exception:
+                # A broken reader cannot resume mid-file: reopen it on the retry (MERGE is idempotent)
+                self._chunks, self._file = None, None
+                raise
+            if chunk is not None:
+                # Fallback ids (pd_<index>) must not collide across inbox files
+                chunk.index = self._file.stem + "_" + chunk.index.astype(str)
+                return chunk
+            os.replace(self._file, self.done_dir / self._file.name)
+            self.logger.log_event("INBOX_FILE_DONE", details={"file": self._file.name})
+            self._chunks, self._file = None, None
+
+    def __call__(self, _items: Optional[List[Any]]) -> Optional[List[Dict[str, Any]]]:
+        # A chunk whose write failed is retried as is; the file only moves to processed/ once every
+        # chunk of it has been written
+        if self._chunk is None:
+            self._chunk = self._next_chunk()
+        if self._chunk is None:
+            return None
+        readings = ingest_chunk(self.neo, self._chunk, self.mapping, self.metrics, self._component_types())
+        self._chunk = None
+        # An all-filtered chunk still counts as progress (the source keeps reading without waiting)
+        return readings or [None]
+
+def to_pending(a: Dict[str, Any]) -> Dict[str, Any]:
+    """Detected anomaly -> the shape Q_PENDING_ANOMALIES returns (input of enqueue_anomalies)."""
+    return {"anomaly_id": a["anomaly_id"], "type": a.get("type"), "severity": a.get("severity"),
+            "metric": a.get("metric"), "value": a.get("value"), "ts": a.get("timestamp"),
+            "ts_ms": a.get("ts_ms"), "sensor_id": a.get("sensor_id"),
+            "t_trigger": a.get("t_trigger"), "t_detected": a.get("t_detected"),
+            "component_id": a.get("component_id")}
+
+def write_status(path: Path, status: Dict[str, Any]):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(status, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+    os.replace(tmp, path)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--config", required=True)
+    ap.add_argument("--once", action="store_true", help="process the files currently in the inbox, then exit")
+    ap.add_argument("--max-runtime-s", type=float, default=None, help="stop after this many seconds")
+    args = ap.parse_args()
+
+    cfg = load_config(args.config)
+    scenario = cfg.get("scenario", "PdM_HVAC")
+    mode = cfg.get("mode", "sam")
+    out_dir = Path(cfg.get("output_dir", "./logs")).resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    logger = RunLogger.from_config(cfg.get("logging", {}), out_dir=str(out_dir), scenario=scenario, mode=mode,
+                                   component="pipeline_daemon")
+
+    if not backend_available(cfg.get("neo4j", {})):
+        logger.log_event("NEO4J_NOT_AVAILABLE", level="WARN")
+        logger.write_csv()
+        print("Neo4j driver not available. Dry-run only.")
+        return
+
+    d_cfg = cfg.get("daemon", {})
+    inbox = Path(d_cfg.get("inbox_dir", str(out_dir / "inbox"))).resolve()
+    inbox.mkdir(parents=True, exist_ok=True)
+    queue_size = max(int(d_cfg.get("queue_size", 8)), 1)
+    poll_s = float(d_cfg.get("poll_s", 1.0))
+    stats_interval_s = float(d_cfg.get("stats_interval_s", 10.0))
+    status_path = Path(d_cfg.get("status_path", str(out_dir / "pipeline_status.json")))
+
+    neo = Neo4jHelper.from_config(cfg.get("neo4j", {}))
+    neo.run_batch(INGEST_SEQ_SCHEMA, transactional=False)
+
+    # ---- Detection state (shared with anomaly_detection_logic.py)
+    engine, windows, composites, metrics = build_detectors(cfg)
+    det_cfg = cfg.get("anomaly_detection", {})
+    state = JsonStateStore(det_cfg.get("watermark_path", str(out_dir / "anomaly_watermarks.json")), neo.target)
+    saved, wm_key, after = load_progress(state, metrics, windows, composites)
+    progress = {"after": after}
+
+    # ---- Dispatch state (shared with workflow_trigger_api.py)
+    wf = cfg.get("workflow", {})
+    concurrency = max(int(wf.get("concurrency", 8)), 1)
+    limiters = RateLimiters(wf.get("rate_limit"))
+    client = build_client(wf, concurrency, logger)
+    outbox = Outbox.from_config(wf.get("outbox", {}), default_path=str(out_dir / "workflow_outbox.sqlite"),
+                                target=neo.target)
+    coalescer = TaskCoalescer.from_config(wf.get("coalesce", {}))
+    wb = wf.get("write_buffer", {})
+    on_write_error = write_error_logger(logger)
+    created = BufferedWriter(neo, Q_TASK_CREATE, "task_create", int(wb.get("max_rows", 2000)),
+                             float(wb.get("max_delay_s", 0.5)), on_error=on_write_error)
+    updated = BufferedWriter(neo, Q_WORKORDER_DISPATCHED, "workorder_dispatched", int(wb.get("max_rows", 2000)),
+                             float(wb.get("max_delay_s", 0.5)), depends_on=created,
+                             on_error=on_write_error)
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="dispatch")
+    settled = {"done": 0, "pending": 0, "dead": 0, "deferred": 0}
+    counts = {"detected": 0, "suppressed": 0}
+
+    page_size = int(det_cfg.get("page_size", cfg.get("anomaly_query_limit", 5000)))
+
+    def detect_page_and_save(page: List[Dict[str, Any]], watermark: int, t_trigger: str) -> List[Dict[str, Any]]:
+        # A failed write rolls the detectors back and raises: the stage retries this batch, and the watermark
+        # only moves once its anomalies are in the graph (same rule as the CLI)
+        found, new = [], []
+        if page:
+            _, found, new = detect_and_write(neo, engine, windows, composites, page, t_trigger)
+            log_detections(logger, new)
+        progress["after"] = watermark
+        save_progress(state, saved, wm_key, watermark, windows, composites)
+        counts["detected"] += len(new)
+        counts["suppressed"] += len(found) - len(new)
+        return new
+
+    def detect(readings: List[Optional[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        readings = [r for r in readings if r is not None]
+        if not readings:
+            return []
+        new = []
+        for page, watermark in detect_pages(neo, metrics, readings, progress["after"], page_size):
+            new += detect_page_and_save(page, watermark, readings[0]["t_ingest"])
+        return [to_pending(a) for a in new]
+
+    def drain():
+        if coalescer.held:
+            # Release the coalescing groups that closed while no new anomalies arrived
+            enqueue_anomalies(neo, outbox, created, coalescer, [], scenario, mode, flush=False)
+        drain_outbox(outbox, pool, concurrency, limiters, client, wf, updated, logger, settled)
+
+    def dispatch(anomalies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        enq = enqueue_anomalies(neo, outbox, created, coalescer, anomalies, scenario, mode, flush=False)
+        drain()
+        return [enq]
+
+    logger.log_event("START", details={"inbox": str(inbox), "metrics": metrics, "watermark": after,
+                                       "queue_size": queue_size, "concurrency": concurrency, "once": args.once})
+
+    # ---- Catch up: readings ingested after the watermark (e.g. by the ETL CLI) + undispatched anomalies
+    t_catchup = utc_now_iso()
+    caught_up = 0
+    for page in iter_pages(neo, metrics, after, page_size):
+        detect_page_and_save(page, page[-1]["ingest_seq"], t_catchup)
+        caught_up += len(page)
+    enq = enqueue_pending(neo, outbox, created, coalescer, int(cfg.get("workflow_query_limit", 200)), scenario, mode)
+    drain()
+    logger.log_event("CATCH_UP", details={"readings": caught_up, "watermark": progress["after"], **enq})
+
+    # ---- Stages
+    stop = threading.Event()
+    q_detect: "queue.Queue[Batch]" = queue.Queue(maxsize=queue_size)
+    q_dispatch: "queue.Queue[Batch]" = queue.Queue(maxsize=queue_size)
+
+    def on_error(stage: str, e: BaseException):
+        logger.log_event("STAGE_ERROR", level="ERROR", details={"stage": stage, "error": repr(e)})
+
+    retry = {"retries": int(d_cfg.get("stage_retries", 3)), "retry_backoff_s": float(d_cfg.get("retry_backoff_s", 0.5)),
+             "retry_max_s": float(d_cfg.get("retry_max_s", 30.0))}
+    source = InboxSource(neo, inbox, cfg.get("mapping", {}), metrics, int(d_cfg.get("chunk_size", 5000)),
+                         float(d_cfg.get("component_refresh_s", 300.0)), logger)
+    s_ingest = PipelineStage("ingest", source, stop, outbox=q_detect, idle_s=poll_s, on_error=on_error,
+                             finite=args.once, **retry)
+    s_detect = PipelineStage("detect", detect, stop, inbox=q_detect, outbox=q_dispatch, upstream=s_ingest,
+                             idle_s=poll_s, on_error=on_error, **retry)
+    s_dispatch = PipelineStage("dispatch", dispatch, stop, inbox=q_dispatch, upstream=s_detect, idle_s=poll_s,
+                               on_idle=drain, on_error=on_error, **retry)
+    stages = [s_ingest, s_detect, s_dispatch]
+    queues = {"detect": q_detect, "dispatch": q_dispatch}
+
+    def status() -> Dict[str, Any]:
+        return {"run_id": logger.run_id, "t": utc_now_iso(), "watermark": progress["after"],
+                "queues": {k: {"depth": q.qsize(), "capacity": queue_size} for k, q in queues.items()},
+                "stages": [s.metrics.snapshot() for s in stages],
+                "anomalies": dict(counts), "dispatch": dict(settled), "outbox": outbox.counts()}
+
+    def request_stop(signum=None, frame=None):
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    t0 = time.perf_counter()
+    for s in stages:
+        s.start()
+    try:
+        while not s_dispatch.finished.is_set():
+            s_dispatch.finished.wait(stats_interval_s)
+            if args.once and s_ingest.finished.is_set():
+                stop.set()
+            if args.max_runtime_s is not None and time.perf_counter() - t0 >= args.max_runtime_s:
+                stop.set()
+            st = status()
+            logger.log_event("PIPELINE_STATS", details=st)
+            write_status(status_path, st)
+            logger.write_csv()
+    finally:
+        stop.set()
+        for s in stages:
+            s.join()
+            if s.failed is not None:
+                logger.log_event("STAGE_FAILED", level="ERROR",
+                                 details={"stage": s.stage_name, "error": repr(s.failed),
+                                          "skipped_batches": s.metrics.skipped, "watermark": progress["after"]})
+        if coalescer.held:
+            try:
+                enq = enqueue_anomalies(neo, outbox, created, coalescer, [], scenario, mode)
+                drain_outbox(outbox, pool, concurrency, limiters, client, wf, updated, logger, settled)
+                logger.log_event("COALESCE_FLUSH", details=enq)
+            except Exception as e:
+                # Still undispatched in the graph and not in the outbox: the next start's catch-up queues them
+                logger.log_event("COALESCE_FLUSH_FAILED", level="ERROR", details={"error": repr(e)})
+        pool.shutdown(wait=True)
+        # Each close runs even if an earlier one raises (reverse order of registration)
+        with ExitStack() as closing:
+            if client is not None:
+                closing.callback(client.close)
+            closing.callback(neo.close)
+            closing.callback(report_query_stats, neo, logger)
+            closing.callback(created.close)
+            closing.callback(updated.close)
+
+    with ExitStack() as closing:
+        closing.callback(logger.close)
+        closing.callback(outbox.close)
+        st = status()
+        write_status(status_path, st)
+        logger.log_event("PIPELINE_SUMMARY", details={**st, "wall_s": round(time.perf_counter() - t0, 6),
+                                                      "writes": [created.stats(), updated.stats()]})
+        if client is not None:
+            for ep, est in client.stats().items():
+                logger.log_event("HTTP_ENDPOINT_STATS", details={"endpoint": ep, **est})
+        logger.log_event("DONE")
+        logger.write_csv()
+    print("Pipeline daemon stopped. Logs:", logger.default_csv_name())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+replay_benchmark.py — PdM Execution (Event-density replay / saturation benchmark)
+
+以受控的事件密度（event_density_hz）把 Sensor_Data_300.csv（或更大的資料集）重播進與 pipeline_daemon.py
+相同的 ingest → detect → dispatch 串流 pipeline，量測每個密度下的實際吞吐量、L1–L4 latency 百分位與遺失率，
+找出 saturation point（系統開始跟不上的密度）。
+
+    emitter ─(ingress queue，有界)─▶ [ingest] ─(queue)─▶ [detect] ─(queue)─▶ [dispatch]
+- emitter：依 pattern 排程每筆事件的送出時間；送出時改寫 id（加上 run / 密度後綴，資料集不足時循環重播）
+  與 timestamp（排程時間）。ingress queue 滿時事件直接丟棄，計為遺失（模擬 gateway buffer 溢位）
+    constant：等間隔 1/rate
+    poisson ：指數分布間隔（平均 rate；seed 固定，可重現）
+    burst   ：每 burst_size 筆同時送出，平均密度仍為 rate
+- ingest 每次取出 ingress 中現有的事件（最多 chunk_size 筆，不等待湊滿），之後與 daemon 共用同一組函式
+  （ingest_chunk / detect_and_write / enqueue_anomalies / drain_outbox）
+- latency 一律由「排程送出時間」起算，emitter 落後時不會少算（避免 coordinated omission）
+- 每個密度使用全新的圖譜（預設 memory backend）、outbox 與偵測狀態（暫存目錄）；workflow 固定為 mock，
+  派發 log 仍照常產生（計入成本），寫在暫存目錄，結束後捨棄
+- 各層定義（對應 04_validation/RESULTS/Latency_Decomposition_L1_L4）：
+    L1_detect  ：事件送出 → 所在批次完成偵測並寫入 Anomaly
+    L2_reason  ：偵測完成 → 合併為 MaintenanceTask 並寫入 outbox（t_task_created）
+    L3_dispatch：task 建立 → 派發開始（outbox 等待 + 限流，t_action_start）
+    L4_execute ：派發開始 → workflow 回應（t_action_end）
+    tta        ：事件送出 → 派發開始（= L1 + L2 + L3）
+- 完成：沒有產生異常的事件於偵測完成時、產生異常的事件於派發成功時算完成；送出結束後持續處理到 drain_timeout_s
+  （包含釋出仍開啟的合併群組、重送失敗的派發），屆時仍未完成（含 ingress 丟棄）即為遺失，
+  loss_rate = lost_events / events_emitted
+- achieved_hz = 完成事件數 / max(最後完成 − 第一筆送出, duration_s)；backlog_s = 最後完成 − 最後送出（跟不上時隨時間增長）
+- saturated：achieved_hz < 目標密度 × (1 − saturation_tolerance)、loss_rate > max_loss_rate，或 TTA p95 超過
+  slo_tta_ms（有設定時）。saturation point 為第一個 saturated 的密度；連續 stop_after_saturated 個密度
+  saturated 後停止加壓。duration_s 應遠大於單筆 latency，否則尾端 latency 會壓低 achieved_hz
+
+Config（benchmark，皆可省略；anomaly_rules / mapping / workflow.coalesce / workflow.rate_limit 沿用主設定）：
+    dataset: <data_root>/<dataset>/raw/Sensor_Data_300.csv
+    densities_hz: [10, 50, 100, 200, 500, 1000]
+    pattern: constant          # constant / poisson / burst
+    burst_size: 50
+    seed: 42
+    duration_s: 10             # 每個密度的送出時間
+    drain_timeout_s: 10
+    ingress_queue: 10000
+    chunk_size: 500
+    queue_size: 8
+    mock_sleep_ms: <workflow.mock_sleep_ms>
+    saturation_tolerance: 0.05
+    max_loss_rate: 0.0
+    slo_tta_ms: null
+    stop_after_saturated: 1
+    neo4j: {backend: memory}
+    output_dir: <output_dir>/benchmark
+
+資料集欄位依 mapping 對映為 PerformanceData（同 ETL / daemon，例如 performance_id: event_id、
+performance_metric: MetricName、performance_value: Value、performance_timestamp: Timestamp）。
+
+Usage:
+    python 03_execution/replay_benchmark.py --config config/pdm_demo.yaml
+    python 03_execution/replay_benchmark.py --config config/pdm_demo.yaml --densities 50,200,1000 --pattern burst
+
+Outputs:
+- benchmark/replay_events_<run_id>.csv   （產生異常且完成的事件：TTA 與 L1–L4，欄位同 RESULTS/TTA、Latency_Decomposition）
+- benchmark/replay_summary_<run_id>.csv  （每個密度：吞吐量、遺失率、各層百分位、saturated）
+- logs/replay_benchmark_<run_id>.csv (by RunLogger)
+"""
+from __future__ import annotations
+
+import argparse
+import queue
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from itertools import cycle
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from anomaly_detection_logic import (
+    build_detectors, detect_and_write, load_progress, log_detections, save_progress,
+)
+from data_ingestion_etl import INGEST_SEQ_SCHEMA, iter_csv
+from pipeline_daemon import ingest_chunk, to_pending
+from utils.buffered_writer import BufferedWriter
+from utils.config_loader import load_config
+from utils.logger import RunLogger
+from utils.neo4j_helper import Neo4jHelper, backend_available
+from utils.outbox import Outbox, OutboxEntry
+from utils.pipeline import Batch, PipelineStage
+from utils.rate_limit import RateLimiters
+from utils.state_store import JsonStateStore
+from utils.task_coalescing import TaskCoalescer
+from workflow_trigger_api import (
+    Q_TASK_CREATE, Q_WORKORDER_DISPATCHED, drain_outbox, enqueue_anomalies, member_ids, write_error_logger,
+)
+
+PATTERNS = ("constant", "poisson", "burst")
+LAYERS = ("L1_detect_ms", "L2_reason_ms", "L3_dispatch_ms", "L4_execute_ms", "tta_ms")
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def iso_to_ns(value: str) -> int:
+    """Epoch ns of an ISO timestamp (microsecond precision, as written by utc_now_iso)."""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - EPOCH) // timedelta(microseconds=1) * 1000
+
+def ns_to_iso(ns: int) -> str:
+    return (EPOCH + timedelta(microseconds=ns // 1000)).isoformat()
+
+def arrival_offsets(pattern: str, rate_hz: float, n: int, burst_size: int, seed: int) -> Iterator[float]:
+    """Scheduled send time of each event, in seconds from the start of the level."""
+    if pattern == "constant":
+        for i in range(n):
+            yield i / rate_hz
+    elif pattern == "poisson":
+        rnd = random.Random(seed)
+        t = 0.0
+        for _ in range(n):
+            yield t
+            t += rnd.expovariate(rate_hz)
+    elif pattern == "burst":
+        size = max(int(burst_size), 1)
+        for i in range(n):
+            yield (i // size) * size / rate_hz
+    else:
+        raise ValueError(f"unknown pattern: {pattern}")
+
+class EventTracker:
+    """Wall-clock ns per replayed event: scheduled emit, detection done, first successful action."""
+
+    def __init__(self):
+        self.emit: Dict[str, int] = {}
+        self.detected: Dict[str, int] = {}
+        self.sources: Dict[str, List[str]] = {}                 # anomaly_id -> performance ids
+        self.actions: Dict[str, Tuple[int, int, int]] = {}      # performance id -> (task, start, end)
+        self.dropped = 0
+        self.tasks_done = 0
+        self._lock = threading.Lock()
+
+    def on_detected(self, readings: List[Dict[str, Any]], anomalies: List[Dict[str, Any]]):
+        t = time.time_ns()
+        for r in readings:
+            self.detected[r["performance_id"]] = t
+        for a in anomalies:
+            self.sources[a["anomaly_id"]] = [p for p in (a.get("performance_id"), a.get("paired_performance_id")) if p]
+
+    def on_settled(self, entry: OutboxEntry, outcome: Dict[str, Any], state: str):
+        """drain_outbox observer: the first successful action of each source event counts."""
+        if state != "done":
+            return
+        t = (iso_to_ns(entry.t_task_created), iso_to_ns(outcome["t_action_start"]), iso_to_ns(outcome["t_action_end"]))
+        with self._lock:
+            self.tasks_done += 1
+            for aid in member_ids(entry.payload):
+                for pid in self.sources.get(aid, []):
+                    if pid not in self.actions or t[1] < self.actions[pid][1]:
+                        self.actions[pid] = t
+
+def load_rows(path: Path, id_col: str) -> List[Dict[str, Any]]:
+    frame = next(iter_csv(path), None)
+    if frame is None:
+        raise SystemExit(f"Replay dataset is missing or empty: {path}")
+    if id_col not in frame.columns:
+        raise SystemExit(f"Replay dataset has no '{id_col}' column (mapping.performance_id): {path}")
+    return frame.to_dict("records")
+
+def emit_events(rows: List[Dict[str, Any]], offsets: Iterator[float], ingress: "queue.Queue[Dict[str, Any]]",
+                tracker: EventTracker, suffix: str, id_col: str, ts_col: str, abort: threading.Event):
+    """Send each row at its scheduled time (new id + timestamp); a full ingress drops the event."""
+    t0_mono = time.monotonic_ns()
+    t0_wall = time.time_ns()
+    for i, (off, row) in enumerate(zip(offsets, cycle(rows))):
+        due = t0_mono + int(off * 1e9)
+        delay = (due - time.monotonic_ns()) / 1e9
+        if delay > 0 and abort.wait(delay):
+            return
+        t_emit = t0_wall + (due - t0_mono)
+        ev = dict(row)
+        ev[id_col] = f"{row[id_col]}-{suffix}-{i}"
+        ev[ts_col] = ns_to_iso(t_emit)
+        tracker.emit[ev[id_col]] = t_emit
+        try:
+            ingress.put_nowait(ev)
+        except queue.Full:
+            tracker.dropped += 1
+
+def pct(series: pd.Series, p: float) -> Optional[float]:
+    return None if series.empty else round(float(series.quantile(p)), 3)
+
+def summarize_level(tracker: EventTracker, rate_hz: float, t_deadline: int, b: Dict[str, Any],
+                    framework: str, experiment_id: str, pattern: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    actionable = {p for ps in tracker.sources.values() for p in ps}
+    events, done_at = [], []
+    for pid, t_emit in tracker.emit.items():
+        if pid in actionable:
+            act = tracker.actions.get(pid)
+            if act is None or act[2] > t_deadline:
+                continue
+            t_det = tracker.detected[pid]
+            done_at.append(act[2])
+            events.append({
+                "experiment_id": experiment_id, "framework": framework, "event_id": pid,
+                "event_density_hz": rate_hz, "pattern": pattern,
+                "trigger_emit_time": ns_to_iso(t_emit), "action_start_time": ns_to_iso(act[1]),
+                "L1_detect_ms": round((t_det - t_emit) / 1e6, 3), "L2_reason_ms": round((act[0] - t_det) / 1e6, 3),
+                "L3_dispatch_ms": round((act[1] - act[0]) / 1e6, 3), "L4_execute_ms": round((act[2] - act[1]) / 1e6, 3),
+                "tta_ms": round((act[1] - t_emit) / 1e6, 3),
+            })
+        elif pid in tracker.detected and tracker.detected[pid] <= t_deadline:
+            done_at.append(tracker.detected[pid])
+
+    emitted = len(tracker.emit)
+    completed = len(done_at)
+    t_first = min(tracker.emit.values()) if tracker.emit else 0
+    t_last_emit = max(tracker.emit.values()) if tracker.emit else 0
+    span_s = max((max(done_at) - t_first) / 1e9, float(b.get("duration_s", 10.0))) if done_at else 0.0
+    achieved = completed / span_s if span_s > 0 else 0.0
+    loss_rate = (emitted - completed) / emitted if emitted else 0.0
+    df = pd.DataFrame(events, columns=["tta_ms", *LAYERS[:4]])
+
+    row: Dict[str, Any] = {
+        "experiment_id": experiment_id, "framework": framework, "event_density_hz": rate_hz, "pattern": pattern,
+        "events_emitted": emitted, "events_dropped": tracker.dropped, "events_ingested": len(tracker.detected),
+        "events_detected": len(actionable), "actions_executed": len(events), "lost_events": emitted - completed,
+        "loss_rate": round(loss_rate, 6), "achieved_hz": round(achieved, 3),
+        "throughput_tasks_per_min": round(tracker.tasks_done / span_s * 60, 3) if span_s > 0 else 0.0,
+        "backlog_s": round((max(done_at) - t_last_emit) / 1e9, 6) if done_at else None,
+    }
+    for col in LAYERS:
+        for p in (0.50, 0.95, 0.99):
+            row[f"{col[:-3]}_p{int(p * 100)}_ms"] = pct(df[col], p)
+    slo = b.get("slo_tta_ms")
+    row["saturated"] = bool(
+        achieved < rate_hz * (1 - float(b.get("saturation_tolerance", 0.05)))
+        or loss_rate > float(b.get("max_loss_rate", 0.0))
+        or (slo is not None and row["tta_p95_ms"] is not None and row["tta_p95_ms"] > float(slo))
+    )
+    return row, events
+
+def run_level(cfg: Dict[str, Any], b: Dict[str, Any], rows: List[Dict[str, Any]], rate_hz: float, pattern: str,
+              suffix: str, logger: RunLogger) -> Tuple[EventTracker, int, Dict[str, Any]]:
+    """Replay one density through a fresh pipeline; returns (tracker, completion deadline ns, stage stats)."""
+    scenario = cfg.get("scenario", "PdM_HVAC")
+    mode = cfg.get("mode", "sam")
+    mapping = cfg.get("mapping", {})
+    id_col = mapping.get("performance_id", "PerformanceId")
+    ts_col = mapping.get("performance_timestamp", "Timestamp")
+    duration_s = float(b.get("duration_s", 10.0))
+    drain_timeout_s = float(b.get("drain_timeout_s", 10.0))
+    chunk_size = max(int(b.get("chunk_size", 500)), 1)
+    queue_size = max(int(b.get("queue_size", 8)), 1)
+
+    wf = dict(cfg.get("workflow", {}))
+    wf["mock"] = True
+    wf["mock_sleep_ms"] = int(b.get("mock_sleep_ms", wf.get("mock_sleep_ms", 120)))
+    concurrency = max(int(wf.get("concurrency", 8)), 1)
+
+    with tempfile.TemporaryDirectory(prefix="replay_") as tmp:
+        scratch = RunLogger.from_config(cfg.get("logging", {}), out_dir=tmp, scenario=scenario, mode=mode,
+                                        component="replay_dispatch")
+        neo = Neo4jHelper.from_config(b.get("neo4j", {"backend": "memory"}))
+        neo.run_batch(INGEST_SEQ_SCHEMA, transactional=False)
+        engine, windows, composites, metrics = build_detectors(cfg)
+        state = JsonStateStore(str(Path(tmp) / "watermarks.json"), neo.target)
+        saved, wm_key, _ = load_progress(state, metrics, windows, composites, reset=True)
+        outbox = Outbox.from_config({**wf.get("outbox", {}), "path": str(Path(tmp) / "outbox.sqlite")},
+                                    default_path="", target=neo.target)
+        coalescer = TaskCoalescer.from_config(wf.get("coalesce", {}))
+        limiters = RateLimiters(wf.get("rate_limit"))
+        wb = wf.get("write_buffer", {})
+        on_write_error = write_error_logger(scratch)
+        created = BufferedWriter(neo, Q_TASK_CREATE, "task_create", int(wb.get("max_rows", 2000)),
+                                 float(wb.get("max_delay_s", 0.5)), on_error=on_write_error)
+        updated = BufferedWriter(neo, Q_WORKORDER_DISPATCHED, "workorder_dispatched", int(wb.get("max_rows", 2000)),
+                                 float(wb.get("max_delay_s", 0.5)), depends_on=created,
+                                 on_error=on_write_error)
+        pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="dispatch")
+        settled = {"done": 0, "pending": 0, "dead": 0, "deferred": 0}
+        tracker = EventTracker()
+        ingress: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max(int(b.get("ingress_queue", 10000)), 1))
+        metric_set = set(metrics)
+
+        held: List[Dict[str, Any]] = []           # events taken off the ingress, kept until written
+
+        def ingest(_items: Optional[List[Any]]) -> Optional[List[Any]]:
+            if not held:
+                try:
+                    held.append(ingress.get(timeout=0.05))
+                except queue.Empty:
+                    return None
+                while len(held) < chunk_size:
+                    try:
+                        held.append(ingress.get_nowait())
+                    except queue.Empty:
+                        break
+            events = list(held)
+            readings = ingest_chunk(neo, pd.DataFrame(events), mapping, metric_set, {})
+            held.clear()
+            # Rows of metrics no rule reads are complete once written
+            t = time.time_ns()
+            kept = {r["performance_id"] for r in readings}
+            for ev in events:
+                if ev[id_col] not in kept:
+                    tracker.detected[ev[id_col]] = t
+            return readings or [None]
+
+        def detect(readings: List[Optional[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+            readings = [r for r in readings if r is not None]
+            if not readings:
+                return []
+            _, found, new = detect_and_write(neo, engine, windows, composites, readings, readings[0]["t_ingest"])
+            log_detections(scratch, new)
+            save_progress(state, saved, wm_key, readings[-1]["ingest_seq"], windows, composites)
+            tracker.on_detected(readings, new)
+            return [to_pending(a) for a in new]
+
+        def drain():
+            if coalescer.held:
+                enqueue_anomalies(neo, outbox, created, coalescer, [], scenario, mode, flush=False)
+            drain_outbox(outbox, pool, concurrency, limiters, None, wf, updated, scratch, settled,
+                         observer=tracker.on_settled)
+
+        def dispatch(anomalies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            enq = enqueue_anomalies(neo, outbox, created, coalescer, anomalies, scenario, mode, flush=False)
+            drain()
+            return [enq]
+
+        def on_error(stage: str, e: BaseException):
+            logger.log_event("STAGE_ERROR", level="ERROR", details={"stage": stage, "error": repr(e)})
+
+        stop, abort = threading.Event(), threading.Event()
+        q_detect: "queue.Queue[Batch]" = queue.Queue(maxsize=queue_size)
+        q_dispatch: "queue.Queue[Batch]" = queue.Queue(maxsize=queue_size)
+        s_ingest = PipelineStage("ingest", ingest, stop, outbox=q_detect, idle_s=0.0, on_error=on_error)
+        s_detect = PipelineStage("detect", detect, stop, inbox=q_detect, outbox=q_dispatch, upstream=s_ingest,
+                                 idle_s=0.2, on_error=on_error)
+        s_dispatch = PipelineStage("dispatch", dispatch, stop, inbox=q_dispatch, upstream=s_detect, idle_s=0.2,
+                                   on_idle=drain, on_error=on_error)
+        stages = [s_ingest, s_detect, s_dispatch]
+        n = max(int(round(rate_hz * duration_s)), 1)
+        offsets = arrival_offsets(pattern, rate_hz, n, int(b.get("burst_size", 50)), int(b.get("seed", 42)))
+        emitter = threading.Thread(target=emit_events, name="emitter", daemon=True,
+                                   args=(rows, offsets, ingress, tracker, suffix, id_col, ts_col, abort))
+        # Provisional (sending is scheduled to end after duration_s); set again once the emitter is done
+        t_deadline = time.time_ns() + int((duration_s + drain_timeout_s) * 1e9)
+        try:
+            for s in stages:
+                s.start()
+            emitter.start()
+            emitter.join()
+            t_deadline = time.time_ns() + int(drain_timeout_s * 1e9)
+            deadline = time.perf_counter() + drain_timeout_s
+            # Let the source empty the ingress (events still there at the deadline are lost) and the stages
+            # finish their queues, then keep dispatching - open coalescing groups and retries included -
+            # until everything is settled or the deadline passes
+            while not ingress.empty() and time.perf_counter() < deadline:
+                time.sleep(0.01)
+            stop.set()
+            if s_dispatch.finished.wait(max(deadline - time.perf_counter(), 0.0)) and s_dispatch.failed is None:
+                enqueue_anomalies(neo, outbox, created, coalescer, [], scenario, mode)
+                drain_outbox(outbox, pool, concurrency, limiters, None, wf, updated, scratch, settled,
+                             compensate=True, deadline=deadline, observer=tracker.on_settled)
+        finally:
+            abort.set()
+            stop.set()
+            for s in stages:
+                s.join()
+            pool.shutdown(wait=True)
+            # Each close runs even if an earlier one raises (reverse order of registration)
+            with ExitStack() as closing:
+                closing.callback(scratch.close)
+                closing.callback(outbox.close)
+                closing.callback(neo.close)
+                closing.callback(created.close)
+                closing.callback(updated.close)
+    stats = {"stages": [s.metrics.snapshot() for s in stages], "dispatch": settled,
+             "writes": [created.stats(), updated.stats()],
+             "queries": [{k: q[k] for k in ("fingerprint", "op", "calls", "client_ms_total", "client_ms_p95")}
+                         for q in neo.query_stats.summary(top=5)]}
+    return tracker, t_deadline, stats
+
+def parse_densities(value: str) -> List[float]:
+    return [float(v) for v in value.split(",") if v.strip()]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--config", required=True)
+    ap.add_argument("--densities", type=parse_densities, default=None, help="comma-separated event densities (Hz)")
+    ap.add_argument("--pattern", choices=PATTERNS, default=None)
+    ap.add_argument("--duration-s", type=float, default=None, help="send time per density")
+    ap.add_argument("--dataset", default=None, help="CSV to replay (default: Sensor_Data_300.csv)")
+    args = ap.parse_args()
+
+    cfg = load_config(args.config)
+    scenario = cfg.get("scenario", "PdM_HVAC")
+    mode = cfg.get("mode", "sam")
+    out_dir = Path(cfg.get("output_dir", "./logs")).resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    logger = RunLogger.from_config(cfg.get("logging", {}), out_dir=str(out_dir), scenario=scenario, mode=mode,
+                                   component="replay_benchmark")
+
+    b = dict(cfg.get("benchmark", {}))
+    if args.duration_s is not None:
+        b["duration_s"] = args.duration_s
+    if not backend_available(b.get("neo4j", {"backend": "memory"})):
+        logger.log_event("NEO4J_NOT_AVAILABLE", level="WARN")
+        logger.write_csv()
+        print("Neo4j driver not available. Dry-run only.")
+        return
+
+    data_root = Path(cfg.get("data_root", "02_data"))
+    dataset = Path(args.dataset or b.get("dataset", data_root / cfg.get("dataset", "PdM_HVAC") / "raw" / "Sensor_Data_300.csv"))
+    densities = args.densities or [float(d) for d in b.get("densities_hz", [10, 50, 100, 200, 500, 1000])]
+    pattern = args.pattern or b.get("pattern", "constant")
+    if pattern not in PATTERNS:
+        raise SystemExit(f"benchmark.pattern must be one of {PATTERNS}, got {pattern!r}")
+    framework = b.get("framework", "SAM" if mode == "sam" else "Baseline")
+    bench_dir = Path(b.get("output_dir", str(out_dir / "benchmark")))
+    bench_dir.mkdir(parents=True, exist_ok=True)
+    stop_after = max(int(b.get("stop_after_saturated", 1)), 1)
+
+    rows = load_rows(dataset, cfg.get("mapping", {}).get("performance_id", "PerformanceId"))
+    logger.log_event("START", details={"dataset": str(dataset), "rows": len(rows), "densities_hz": densities,
+                                       "pattern": pattern, "duration_s": float(b.get("duration_s", 10.0))})
+
+    summary, events = [], []
+    saturation_point, streak = None, 0
+    for rate in densities:
+        experiment_id = f"{logger.run_id}_{rate:g}hz"
+        tracker, t_deadline, stats = run_level(cfg, b, rows, rate, pattern, f"{logger.run_id}-{rate:g}", logger)
+        row, evs = summarize_level(tracker, rate, t_deadline, b, framework, experiment_id, pattern)
+        summary.append(row)
+        events.extend(evs)
+        logger.log_event("LEVEL_RESULT", level="WARN" if row["saturated"] else "INFO", details={**row, **stats})
+        print(f"{rate:>8g} Hz  achieved {row['achieved_hz']:>9.2f} Hz  loss {row['loss_rate']:.4f}  "
+              f"tta p50/p95 {row['tta_p50_ms']}/{row['tta_p95_ms']} ms  backlog {row['backlog_s']} s"
+              + ("  SATURATED" if row["saturated"] else ""))
+        if row["saturated"]:
+            saturation_point = rate if saturation_point is None else saturation_point
+            streak += 1
+            if streak >= stop_after:
+                break
+        else:
+            streak = 0
+
+    sustained = [r["event_density_hz"] for r in summary if not r["saturated"]]
+    logger.log_event("SATURATION", details={"saturation_point_hz": saturation_point,
+                                            "max_sustained_hz": max(sustained) if sustained else None})
+    summary_path = bench_dir / f"replay_summary_{logger.run_id}.csv"
+    events_path = bench_dir / f"replay_events_{logger.run_id}.csv"
+    pd.DataFrame(summary).to_csv(summary_path, index=False, encoding="utf-8-sig")
+    pd.DataFrame(events).to_csv(events_path, index=False, encoding="utf-8-sig")
+    logger.log_event("DONE", details={"summary": str(summary_path), "events": str(events_path)})
+    logger.write_csv()
+    print("Saturation point:", f"{saturation_point:g} Hz" if saturation_point is not None else "not reached",
+          "| Summary:", summary_path)
+
+if __name__ == "__main__":
+    main()
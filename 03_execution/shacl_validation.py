@@ -12,6 +12,12 @@ shacl_validation.py — Lightweight semantic consistency checks (PdM)
 - PerformanceData 必須有 performance_id + value
 - 重要關係存在性（如 Component 有連到 SensorData / Anomaly）
 
+檢查以 shape 描述（utils/shape_validation.py，config shacl.shapes；省略時用 DEFAULT_SHAPES）：
+- 依 label 分組，同一 label 的全部 property / relationship 檢查合成一個 statement，只掃描該 label 一次
+- label 群組以 thread pool 並行（shacl.concurrency，預設 4）
+- 每個檢查回傳違規數與最多 shacl.sample_size（預設 10）個違規節點 id；每個 label 記一筆 VALIDATION_LABEL
+  （scanned、elapsed_ms），違規時 VALIDATION_FAIL 帶各檢查的 violations 與 sample
+
 Usage:
     python 03_execution/shacl_validation.py --config config/pdm_demo.yaml
 """
@@ -19,11 +25,12 @@ from __future__ import annotations
 
 import argparse
 from datetime import datetime, timezone
-from typing import Dict, Any, List
 
 from utils.config_loader import load_config
 from utils.logger import RunLogger
-from utils.neo4j_helper import Neo4jHelper, neo4j_available
+from utils.neo4j_helper import Neo4jHelper, backend_available
+from utils.query_stats import report_query_stats
+from utils.shape_validation import ShapeValidator
 
 
 def utc_now_iso() -> str:
@@ -38,32 +45,27 @@ def main():
     scenario = cfg.get("scenario", "PdM_HVAC")
     mode = cfg.get("mode", "sam")
     out_dir = cfg.get("output_dir", "./logs")
-    logger = RunLogger(out_dir=out_dir, scenario=scenario, mode=mode, component="shacl_validation")
+    logger = RunLogger.from_config(cfg.get("logging", {}), out_dir=out_dir, scenario=scenario, mode=mode,
+                                   component="shacl_validation")
 
     logger.log_event("START", details={"t": utc_now_iso()})
 
-    if not neo4j_available():
+    if not backend_available(cfg.get("neo4j", {})):
         logger.log_event("NEO4J_NOT_AVAILABLE", level="WARN")
         logger.write_csv()
         print("Neo4j driver not available. Dry-run only.")
         return
 
     neo = Neo4jHelper.from_config(cfg.get("neo4j", {}))
-
-    checks = [
-        ("BuildingComponent has component_id", "MATCH (c:BuildingComponent) WHERE c.component_id IS NULL RETURN count(c) AS n"),
-        ("SensorData has sensor_data_id", "MATCH (s:SensorData) WHERE s.sensor_data_id IS NULL RETURN count(s) AS n"),
-        ("PerformanceData has performance_id", "MATCH (p:PerformanceData) WHERE p.performance_id IS NULL RETURN count(p) AS n"),
-        ("PerformanceData has value", "MATCH (p:PerformanceData) WHERE p.value IS NULL RETURN count(p) AS n"),
-        ("Component maps sensor data", "MATCH (c:BuildingComponent) WHERE NOT (c)-[:MAPS_SENSOR_DATA]->(:SensorData) RETURN count(c) AS n"),
-    ]
+    validator = ShapeValidator.from_config(cfg.get("shacl", {}))
 
     violations = []
-    for name, q in checks:
-        r = neo.query(q, {})
-        n = int(r[0]["n"]) if r else 0
-        if n > 0:
-            violations.append({"check": name, "violations": n})
+    for report in validator.validate(neo):
+        logger.log_event("VALIDATION_LABEL", details={k: v for k, v in report.items() if k != "results"})
+        violations += [r for r in report["results"] if r["violations"] > 0]
+
+    report_query_stats(neo, logger)
+    neo.close()
 
     if violations:
         logger.log_event("VALIDATION_FAIL", level="WARN", details={"violations": violations})
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""pytest 共用設定：讓測試能以腳本相同的方式 `from utils.x import ...`（03_execution 加入 sys.path）。"""
+import sys
+from pathlib import Path
+
+EXEC_DIR = Path(__file__).resolve().parents[1]
+if str(EXEC_DIR) not in sys.path:
+    sys.path.insert(0, str(EXEC_DIR))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from anomaly_detection_logic import (
+    Q_MERGE_ANOMALIES, Q_MERGE_GENERATES, Q_MERGE_HAS_ANOMALY, build_detectors, detect_and_write, write_anomalies,
+)
+from utils.neo4j_helper import Neo4jHelper
+
+
+@pytest.fixture
+def neo():
+    h = Neo4jHelper.from_config({"backend": "memory"})
+    h.merge_nodes("PerformanceData", "performance_id",
+                  [{"performance_id": f"p{i}", "component_id": "c1", "sensor_id": "s1"} for i in range(1, 4)])
+    h.merge_nodes("BuildingComponent", "component_id", [{"component_id": "c1", "type": "AHU"}])
+    yield h
+    h.close()
+
+
+def _anomaly(aid, pid):
+    return {"anomaly_id": aid, "type": "RuleBasedThreshold", "rule_id": "r", "severity": "HIGH",
+            "performance_id": pid, "component_id": "c1"}
+
+
+def _edges(neo, aid):
+    g = neo._driver().graph
+    nid = g.find_one("Anomaly", "anomaly_id", aid)
+    return sorted(g.get(n, "performance_id") or g.get(n, "component_id") for n in
+                  g.inc(nid, "GENERATES") + g.inc(nid, "HAS_ANOMALY"))
+
+
+def test_nodes_and_edges_commit_in_one_transaction(neo):
+    calls = []
+    real = neo.run_batch
+
+    def spy(statements, transactional=True):
+        statements = list(statements)
+        calls.append(([q for q, _ in statements], transactional))
+        return real(statements, transactional)
+
+    neo.run_batch = spy
+    new = write_anomalies(neo, [_anomaly("a1", "p1"), _anomaly("a2", "p2")])
+    assert [a["anomaly_id"] for a in new] == ["a1", "a2"]
+    assert calls == [([Q_MERGE_ANOMALIES, Q_MERGE_GENERATES, Q_MERGE_HAS_ANOMALY], True)]
+    assert _edges(neo, "a1") == ["c1", "p1"]
+
+
+def test_failed_write_leaves_nothing_to_suppress_on_rerun(neo):
+    real = neo.run_batch
+
+    def crash(statements, transactional=True):
+        raise RuntimeError("connection lost before commit")
+
+    neo.run_batch = crash
+    with pytest.raises(RuntimeError):
+        write_anomalies(neo, [_anomaly("a1", "p1")])
+    neo.run_batch = real
+    new = write_anomalies(neo, [_anomaly("a1", "p1")])
+    assert [a["anomaly_id"] for a in new] == ["a1"]
+    assert _edges(neo, "a1") == ["c1", "p1"]
+    assert write_anomalies(neo, [_anomaly("a1", "p1")]) == []      # rerun: suppressed
+
+
+def test_detect_and_write_rolls_back_window_state_on_failure(neo):
+    cfg = {"anomaly_rules": {"default_metric": "temperature", "upper": 100.0},
+           "anomaly_window_rules": [{"id": "roc", "kind": "rate_of_change", "metric": "temperature",
+                                     "window": 2, "min_rise": 3.0}],
+           "anomaly_composite_rules": []}
+    engine, windows, composites, _ = build_detectors(cfg)
+    page = [{"performance_id": f"p{i}", "metric": "temperature", "value": v, "sensor_id": "s1",
+             "component_id": "c1", "ts_ms": i, "ingest_seq": i} for i, v in ((1, 20.0), (2, 20.0), (3, 30.0))]
+    before = windows.to_state()
+    real = neo.run_batch
+    neo.run_batch = lambda *a, **kw: (_ for _ in ()).throw(RuntimeError("write failed"))
+    with pytest.raises(RuntimeError):
+        detect_and_write(neo, engine, windows, composites, page, "t0")
+    assert windows.to_state() == before
+    neo.run_batch = real
+    _, found, new = detect_and_write(neo, engine, windows, composites, page, "t0")
+    assert [a["performance_id"] for a in new] == ["p3"]       # same hit as a first, clean pass
+
+
+def test_detect_and_write_rolls_back_composite_state_on_failure():
+    cfg = {"anomaly_rules": {"default_metric": "temperature", "upper": 1000.0}, "anomaly_window_rules": [],
+           "anomaly_composite_rules": [{"id": "overload", "left_metric": "temperature", "right_metric": "energy",
+                                        "slot_ms": 60000}]}
+    warmup = [{"performance_id": "p1", "metric": "temperature", "value": 20.0, "component_id": "c1", "ts_ms": 0},
+              {"performance_id": "p2", "metric": "energy", "value": 100.0, "component_id": "c1", "ts_ms": 0}]
+    page = [{"performance_id": "p3", "metric": "temperature", "value": 40.0, "component_id": "c1", "ts_ms": 60000},
+            {"performance_id": "p3e", "metric": "energy", "value": 120.0, "component_id": "c1", "ts_ms": 60000}]
+
+    def scores(fail_once):
+        neo = Neo4jHelper.from_config({"backend": "memory"})
+        engine, windows, composites, _ = build_detectors(cfg)
+        detect_and_write(neo, engine, windows, composites, warmup, "t0")
+        if fail_once:
+            real = neo.run_batch
+            neo.run_batch = lambda *a, **kw: (_ for _ in ()).throw(RuntimeError("write failed"))
+            with pytest.raises(RuntimeError):
+                detect_and_write(neo, engine, windows, composites, page, "t0")
+            neo.run_batch = real
+        _, found, _ = detect_and_write(neo, engine, windows, composites, page, "t0")
+        return [(a["performance_id"], a["score"]) for a in found]
+
+    clean = scores(fail_once=False)
+    assert clean == [("p3", 40.0)]
+    assert scores(fail_once=True) == clean
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from utils.buffered_writer import BufferedWriter
+
+
+class FakeNeo:
+    """Records run_batch calls; fails the next `fail` calls."""
+
+    def __init__(self, fail: int = 0):
+        self.fail = fail
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def run_batch(self, statements, transactional=True):
+        with self.lock:
+            if self.fail:
+                self.fail -= 1
+                raise RuntimeError("transient")
+            self.batches.append([(q, list(p["rows"])) for q, p in statements])
+        return []
+
+    def rows(self, cypher):
+        return [r for b in self.batches for q, rows in b if q == cypher for r in rows]
+
+
+def test_flushes_when_full_and_on_close():
+    neo = FakeNeo()
+    w = BufferedWriter(neo, "W", max_rows=2, max_delay_s=0)
+    w.add({"i": 1})
+    assert neo.batches == []
+    w.add({"i": 2})
+    w.add({"i": 3})
+    assert neo.rows("W") == [{"i": 1}, {"i": 2}]
+    w.close()
+    assert neo.rows("W") == [{"i": 1}, {"i": 2}, {"i": 3}]
+    assert w.stats()["rows"] == 3 and w.stats()["pending"] == 0
+
+
+def test_dependency_rows_go_first_in_the_same_transaction():
+    neo = FakeNeo()
+    created = BufferedWriter(neo, "CREATE", max_delay_s=0)
+    updated = BufferedWriter(neo, "UPDATE", max_delay_s=0, depends_on=created)
+    created.add({"id": 1})
+    updated.add({"id": 1})
+    updated.flush()
+    assert neo.batches == [[("CREATE", [{"id": 1}]), ("UPDATE", [{"id": 1}])]]
+
+
+def test_failed_flush_keeps_rows_in_order():
+    neo = FakeNeo(fail=1)
+    created = BufferedWriter(neo, "CREATE", max_delay_s=0)
+    updated = BufferedWriter(neo, "UPDATE", max_delay_s=0, depends_on=created)
+    created.add({"id": 1})
+    updated.add({"id": 1})
+    with pytest.raises(RuntimeError):
+        updated.flush()
+    created.add({"id": 2})
+    updated.add({"id": 2})
+    assert updated.flush() == 4
+    assert neo.rows("CREATE") == [{"id": 1}, {"id": 2}]
+    assert neo.rows("UPDATE") == [{"id": 1}, {"id": 2}]
+    assert updated.failures == 1
+
+
+def test_add_does_not_raise_when_the_size_flush_fails():
+    neo, errors = FakeNeo(fail=1), []
+    w = BufferedWriter(neo, "W", name="W", max_rows=1, max_delay_s=0, on_error=lambda name, e: errors.append(name))
+    w.add({"i": 1})                       # flush fails, row stays buffered
+    assert errors == ["W"] and w.pending() == 1
+    w.close()
+    assert neo.rows("W") == [{"i": 1}]
+
+
+def test_timer_survives_a_failed_flush():
+    neo, errors = FakeNeo(fail=1), []
+    w = BufferedWriter(neo, "W", name="w", max_delay_s=0.05, on_error=lambda name, e: errors.append(name))
+    w.add({"i": 1})
+    w.add({"i": 2})
+    deadline = time.monotonic() + 5
+    while not neo.rows("W") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert w._timer.is_alive()
+    assert neo.rows("W") == [{"i": 1}, {"i": 2}]
+    assert errors == ["w"]
+    w.close()
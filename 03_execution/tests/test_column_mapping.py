@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from utils.column_mapping import (
+    PDM_NODE_SPECS, PDM_REL_SPECS, map_epoch_ms, map_nodes, map_rels, node_params, rel_params, spec_digest,
+)
+
+SPECS = {s.label: s for s in PDM_NODE_SPECS}
+GENERATES = next(r for r in PDM_REL_SPECS if r.rel_type == "GENERATES")
+
+
+def test_epoch_ms_parses_the_dataset_formats_and_keeps_bad_cells_as_none():
+    out = map_epoch_ms(pd.Series(["2025-02-01T00:00:00Z", "2/1/2025 0:05", None, "not a date"]))
+    assert out.tolist() == [1738368000000, 1738368300000, None, None]
+
+
+def test_nodes_are_mapped_per_column_with_id_fallback():
+    df = pd.DataFrame({"SensorDataId": [" sd-1 ", None], "SensorId": ["S1", None],
+                       "Timestamp": ["2/1/2025 0:00", "x"], "Value": [21.5, float("nan")]})
+    rows = node_params(map_nodes(df, SPECS["SensorData"], {}))
+    assert rows == [{"sensor_data_id": "sd-1", "sensor_id": "S1", "timestamp": "2/1/2025 0:00", "value": 21.5},
+                    {"sensor_data_id": "sd_1", "sensor_id": "", "timestamp": "x", "value": None}]
+
+
+def test_rows_without_id_are_dropped_when_the_spec_has_no_prefix():
+    df = pd.DataFrame({"GlobalId": ["c1", "", None], "Name": ["AHU 1", "x", "y"]})
+    out = map_nodes(df, SPECS["BuildingComponent"], {"component_id": "GlobalId"})
+    assert node_params(out) == [{"component_id": "c1", "name": "AHU 1", "type": ""}]    # missing column -> ""
+
+
+def test_performance_rows_carry_ts_ms():
+    df = pd.DataFrame({"PerformanceId": ["p1"], "Timestamp": ["2/1/2025 0:05"], "Value": ["21 C"]})
+    row = node_params(map_nodes(df, SPECS["PerformanceData"], {}))[0]
+    assert (row["ts_ms"], row["value"], row["metric"]) == (1738368300000, "21 C", "")
+
+
+def test_rels_drop_incomplete_pairs_and_honour_the_type_override():
+    df = pd.DataFrame({"SRC": [" p1", "p2", None], "TGT": ["a1", "", "a3"]})
+    assert rel_params(map_rels(df, GENERATES, {})) == [["p1", "a1"]]
+    assert GENERATES.resolved_type({"rel_type": "CAUSES"}) == "CAUSES"
+    assert spec_digest(GENERATES, {}) != spec_digest(GENERATES, {"rel_type": "CAUSES"})
+    assert spec_digest(GENERATES, {}) == spec_digest(GENERATES, {"component_id": "GlobalId"})
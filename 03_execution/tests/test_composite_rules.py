@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import json
+
+from utils.composite_rules import CompositeJoin
+
+RULE = {"id": "overload", "left_metric": "Temperature", "right_metric": "energy", "slot_ms": 60000,
+        "tolerance_ms": 0, "retention_slots": 2}
+
+
+def _r(pid, metric, value, ts_ms, comp="c1"):
+    return {"performance_id": pid, "metric": metric, "value": value, "ts_ms": ts_ms, "component_id": comp}
+
+
+# First reading of each (component, metric) only sets the running mean
+BASELINE = [_r("t0", "temperature", 20, 0), _r("e0", "energy", 100, 0)]
+
+
+def _pairs(join, readings):
+    return [(i, left[0], right[0]) for i, _, left, right in join.process(readings)]
+
+
+def test_readings_above_the_mean_in_the_same_slot_join():
+    join = CompositeJoin.from_config([RULE])
+    readings = BASELINE + [_r("t1", "temperature", 30, 60_000), _r("e1", "energy", 150, 60_500),
+                           _r("e2", "energy", 90, 61_000),                   # below the mean: no pair
+                           _r("e3", "energy", 200, 60_700, comp="c2")]      # other component
+    assert _pairs(join, readings) == [(3, "t1", "e1")]
+
+
+def test_tolerance_reaches_into_the_neighbouring_slot():
+    readings = BASELINE + [_r("t1", "temperature", 30, 119_900), _r("e1", "energy", 150, 120_100)]
+    assert _pairs(CompositeJoin.from_config([RULE]), readings) == []
+    assert _pairs(CompositeJoin.from_config([{**RULE, "tolerance_ms": 500}]), readings) == [(3, "t1", "e1")]
+
+
+def test_join_state_survives_a_checkpoint():
+    first = CompositeJoin.from_config([RULE])
+    assert _pairs(first, BASELINE + [_r("t1", "temperature", 30, 60_000)]) == []
+    second = CompositeJoin.from_config([RULE])
+    second.load_state(json.loads(json.dumps(first.to_state())))
+    assert _pairs(second, [_r("e1", "energy", 150, 60_500)]) == [(0, "t1", "e1")]
+
+
+def test_old_slots_are_evicted_and_unjoinable_readings_skipped():
+    join = CompositeJoin.from_config([RULE])
+    _pairs(join, BASELINE + [_r("t1", "temperature", 30, 60_000), _r("t9", "temperature", 40, 600_000)])
+    assert all(slot >= 10 - 2 for _, slot in join._state["overload"].buckets)
+    assert _pairs(join, [_r("e1", "energy", 150, 60_500), _r("e2", "energy", 150, None),
+                         {"metric": "energy", "value": 150, "ts_ms": 600_000}]) == []
+    assert join.skipped == 3
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from dataclasses import replace
+
+import pytest
+
+from data_ingestion_etl import file_sha256, load_nodes, load_rels
+from utils.column_mapping import PDM_NODE_SPECS, PDM_REL_SPECS, FieldSpec, spec_digest
+from utils.etl_manifest import EtlManifest
+from utils.logger import RunLogger
+from utils.neo4j_helper import Neo4jHelper
+
+SPEC = next(s for s in PDM_NODE_SPECS if s.label == "PerformanceData")
+MAPPING = {"performance_id": "event_id", "performance_value": "Value", "performance_metric": "MetricName",
+           "performance_timestamp": "date"}
+
+
+@pytest.fixture
+def env(tmp_path):
+    csv = tmp_path / "Performance_Data_300.csv"
+    csv.write_text("event_id,sensor_id,MetricName,Value,Adjusted,date\n"
+                   "EVT-1,SEN-1,Temperature,21.5,22.0,2/1/2025\n"
+                   "EVT-2,SEN-1,Temperature,23.0,24.0,2/1/2025\n")
+    neo = Neo4jHelper.from_config({"backend": "memory"})
+    manifest = EtlManifest(str(tmp_path / "manifest.sqlite"), neo.target)
+    logger = RunLogger(out_dir=str(tmp_path), scenario="s", mode="m", component="etl")
+    yield neo, manifest, logger, csv
+    manifest.close()
+    neo.close()
+
+
+def _values(neo):
+    g = neo._driver().graph
+    return sorted(g.get(n, "value") for n in g.nodes("PerformanceData"))
+
+
+def test_unchanged_file_and_mapping_is_skipped(env):
+    neo, manifest, logger, csv = env
+    sha = file_sha256(csv)
+    assert load_nodes(neo, logger, SPEC, csv, MAPPING, manifest=manifest, file_sha=sha) == 2
+    assert load_nodes(neo, logger, SPEC, csv, MAPPING, manifest=manifest, file_sha=sha) == 0
+
+
+def test_mapping_change_reimports_an_unchanged_file(env):
+    neo, manifest, logger, csv = env
+    sha = file_sha256(csv)
+    load_nodes(neo, logger, SPEC, csv, MAPPING, manifest=manifest, file_sha=sha)
+    remapped = {**MAPPING, "performance_value": "Adjusted"}
+    assert load_nodes(neo, logger, SPEC, csv, remapped, manifest=manifest, file_sha=sha) == 2
+    assert _values(neo) == [22.0, 24.0]
+
+
+def test_spec_change_reimports_an_unchanged_file(env):
+    neo, manifest, logger, csv = env
+    sha = file_sha256(csv)
+    load_nodes(neo, logger, SPEC, csv, MAPPING, manifest=manifest, file_sha=sha)
+    extended = replace(SPEC, fields=SPEC.fields + (FieldSpec("raw_value", "performance_value", "Value", "raw"),))
+    assert load_nodes(neo, logger, extended, csv, MAPPING, manifest=manifest, file_sha=sha) == 2
+
+
+def test_spec_digest_only_depends_on_the_effective_mapping():
+    assert spec_digest(SPEC, MAPPING) == spec_digest(SPEC, {**MAPPING, "unrelated_key": "x"})
+    assert spec_digest(SPEC, MAPPING) != spec_digest(SPEC, {**MAPPING, "performance_metric": "Metric"})
+
+
+def test_relationship_with_a_missing_endpoint_is_retried_on_the_next_run(env, tmp_path):
+    neo, manifest, logger, _ = env
+    spec = next(s for s in PDM_REL_SPECS if s.rel_type == "MAPS_SENSOR_DATA")
+    edges = tmp_path / "Edge_MAPS_SENSOR_DATA.csv"
+    edges.write_text("ComponentId,SensorDataId\nC1,SD-1\nC1,SD-2\n")
+    neo.merge_nodes("BuildingComponent", "component_id", [{"component_id": "C1"}])
+    neo.merge_nodes("SensorData", "sensor_data_id", [{"sensor_data_id": "SD-1"}])
+    sha = file_sha256(edges)
+    assert load_rels(neo, logger, spec, edges, {}, manifest=manifest, file_sha=sha) == 1     # SD-2 not loaded yet
+    neo.merge_nodes("SensorData", "sensor_data_id", [{"sensor_data_id": "SD-2"}])
+    assert load_rels(neo, logger, spec, edges, {}, manifest=manifest, file_sha=sha) == 1     # only the missing pair
+    assert load_rels(neo, logger, spec, edges, {}, manifest=manifest, file_sha=sha) == 0
+    g = neo._driver().graph
+    assert len(g.out(g.find_one("BuildingComponent", "component_id", "C1"), "MAPS_SENSOR_DATA")) == 2
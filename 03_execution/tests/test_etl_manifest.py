@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from utils.etl_manifest import EtlManifest, row_fingerprints
+
+
+def _frame(values):
+    return pd.DataFrame({"id": [f"k{i}" for i in range(len(values))], "value": values})
+
+
+def test_fingerprints_are_stable_and_content_sensitive():
+    a, b = row_fingerprints(_frame([1.0, 2.0])), row_fingerprints(_frame([1.0, 2.0]))
+    assert (a == b).all()
+    assert (row_fingerprints(_frame([1.0, 3.0])) == a).tolist() == [True, False]
+    assert len(row_fingerprints(_frame([]))) == 0
+
+
+def test_only_new_or_changed_rows_pass(tmp_path):
+    m = EtlManifest(str(tmp_path / "m.sqlite"), target="t")
+    f = _frame([1.0, 2.0])
+    fps = row_fingerprints(f)
+    assert m.changed_mask("L", f["id"], fps).tolist() == [True, True]
+    m.record_rows("L", f["id"], fps)
+    assert m.changed_mask("L", f["id"], fps).tolist() == [False, False]
+    g = _frame([1.0, 5.0, 6.0])
+    assert m.changed_mask("L", g["id"], row_fingerprints(g)).tolist() == [False, True, True]
+    assert m.changed_mask("Other", f["id"], fps).tolist() == [True, True]        # namespaced by label
+    m.close()
+
+
+def test_file_level_state_is_bound_to_the_target(tmp_path):
+    path = str(tmp_path / "m.sqlite")
+    m = EtlManifest(path, target="a")
+    m.record_file("L/x.csv", "sha1")
+    assert m.file_unchanged("L/x.csv", "sha1") and not m.file_unchanged("L/x.csv", "sha2")
+    m.close()
+    assert EtlManifest(path, target="a").file_unchanged("L/x.csv", "sha1")
+    other = EtlManifest(path, target="b")                                         # target changed: cleared
+    assert not other.file_unchanged("L/x.csv", "sha1")
+    other.record_file("L/x.csv", "sha1")
+    other.reset()
+    assert not other.file_unchanged("L/x.csv", "sha1")
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from utils.neo4j_helper import Neo4jHelper, merge_nodes_cypher, merge_rels_cypher
+
+
+@pytest.fixture
+def neo():
+    h = Neo4jHelper.from_config({"backend": "memory"})
+    h.merge_nodes("BuildingComponent", "component_id", [{"component_id": "c1", "type": "AHU"}])
+    yield h
+    h.close()
+
+
+def _state(neo):
+    """Data and index contents (indexes created by lookups are schema, not rolled back)."""
+    g = neo._driver().graph
+    data = g.to_json()
+    return (data["nodes"], data["rels"], g.nodes("SensorData"), g.max_value("SensorData", "seq"),
+            {k: {v: sorted(n) for v, n in idx.items()} for k, idx in g._index.items() if idx})
+
+
+def test_failed_transaction_is_rolled_back(neo):
+    before = _state(neo)
+    statements = [
+        (merge_nodes_cypher("SensorData", "sensor_data_id"), {"rows": [{"sensor_data_id": "s1", "seq": 7}]}),
+        (merge_nodes_cypher("BuildingComponent", "component_id"), {"rows": [{"component_id": "c1", "type": "x"}]}),
+        (merge_rels_cypher("BuildingComponent", "component_id", "SensorData", "sensor_data_id", "MAPS_SENSOR_DATA"),
+         {"pairs": [["c1", "s1"]]}),
+        ("MATCH (n) RETURN n", {}),                                   # not supported: fails the transaction
+    ]
+    with pytest.raises(NotImplementedError):
+        neo.run_batch(statements)
+    assert _state(neo) == before
+    neo.run_batch(statements[:3])                                     # the graph is still usable
+    g = neo._driver().graph
+    assert g.out(g.find_one("BuildingComponent", "component_id", "c1"), "MAPS_SENSOR_DATA")
+
+
+def test_failed_auto_commit_statement_leaves_no_partial_write(neo):
+    before = _state(neo)
+    with pytest.raises(KeyError):
+        neo.merge_nodes("SensorData", "sensor_data_id", [{"sensor_data_id": "s1"}, {"value": 1}])
+    assert _state(neo) == before
+
+
+def test_sequenced_merge_reads_the_graph_maximum_on_every_batch():
+    neo = Neo4jHelper.from_config({"backend": "memory"})
+    neo.merge_nodes("PerformanceData", "performance_id", [{"performance_id": "p1"}], seq_property="ingest_seq")
+    # numbered outside the counter after it exists (e.g. a bulk import into the same graph)
+    neo.merge_nodes("PerformanceData", "performance_id", [{"performance_id": "bulk", "ingest_seq": 100}])
+    rows = [{"performance_id": "p2"}]
+    neo.merge_nodes("PerformanceData", "performance_id", rows, seq_property="ingest_seq")
+    assert rows[0]["ingest_seq"] == 101
+    g = neo._driver().graph
+    assert g.props(g.find_one("IngestSequence", "name", "PerformanceData")) == \
+        {"name": "PerformanceData", "next": 102, "_lock": True}
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from utils.http_dispatch import CircuitBreaker, DispatchClient, parse_retry_after
+
+
+class _Resp:
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = ""
+
+    def json(self):
+        return {"status_code": self.status_code}
+
+
+def _client(**breaker):
+    cfg = {"window": 4, "failure_rate": 0.5, "min_calls": 1, "open_s": 0.0, **breaker}
+    return DispatchClient(max_retries=0, backoff_base_s=0.0, breaker=cfg)
+
+
+def _script(client, endpoint, *outcomes):
+    """Replace the endpoint's session.post with a scripted sequence of responses / exceptions."""
+    session, breaker, _ = client._endpoint(endpoint)
+    calls = iter(outcomes)
+
+    def post(url, json=None, timeout=None):
+        o = next(calls)
+        if isinstance(o, Exception):
+            raise o
+        return o
+
+    session.post = post
+    return breaker
+
+
+def test_breaker_opens_and_half_open_probe_closes():
+    br = CircuitBreaker(window=4, failure_rate=0.5, min_calls=2, open_s=0.0)
+    br.record(False)
+    br.record(False)
+    assert br.state == "open"
+    assert br.allow()                 # open_s elapsed → half-open probe
+    assert br.state == "half_open"
+    assert not br.allow()             # only one probe at a time
+    br.record(True)
+    assert br.state == "closed" and br.allow()
+
+
+def test_half_open_probe_released_after_unexpected_request_exception():
+    client = _client()
+    ep = "http://example.invalid/hook"
+    breaker = _script(client, ep, requests.ConnectionError("down"),
+                      requests.exceptions.ChunkedEncodingError("cut"), _Resp(200))
+    assert not client.post(ep, {}).ok
+    assert breaker.state == "open"
+    probe = client.post(ep, {})              # the half-open probe fails with a non-connection error
+    assert not probe.ok and not probe.rejected
+    assert probe.error == "ChunkedEncodingError"
+    assert breaker.state == "open" and not breaker._probe_in_flight
+    res = client.post(ep, {})                # next probe goes out and closes the breaker
+    assert res.ok and not res.rejected
+    assert breaker.state == "closed"
+    st = client.stats()[ep]
+    assert st["calls"] == 3 and st["ok"] == 1 and st["failed"] == 2
+
+
+def test_probe_released_when_post_raises_non_requests_error():
+    client = _client()
+    ep = "http://example.invalid/hook"
+    breaker = _script(client, ep, requests.ConnectionError("down"), TypeError("not serializable"))
+    client.post(ep, {})
+    with pytest.raises(TypeError):
+        client.post(ep, {})
+    assert not breaker._probe_in_flight
+    assert client.stats()[ep]["calls"] == 2
+
+
+def test_invalid_url_is_not_retried():
+    client = DispatchClient(max_retries=3, backoff_base_s=0.0)
+    ep = "http://example.invalid/hook"
+    _script(client, ep, requests.exceptions.InvalidURL("bad"), _Resp(200))
+    res = client.post(ep, {})
+    assert not res.ok and res.attempts == 1 and res.error == "InvalidURL"
+
+
+def test_retries_transient_status_then_succeeds():
+    client = DispatchClient(max_retries=3, backoff_base_s=0.0)
+    ep = "http://example.invalid/hook"
+    _script(client, ep, _Resp(503), _Resp(429, {"Retry-After": "0"}), _Resp(200))
+    res = client.post(ep, {})
+    assert res.ok and res.attempts == 3
+    assert client.stats()[ep]["retries"] == 2
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("garbage") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_latency_percentiles_come_from_a_bounded_sketch():
+    client = _client(min_calls=1000)
+    ep = "http://example.invalid/hook"
+    _script(client, ep, *[_Resp(200) for _ in range(2000)])
+    for _ in range(2000):
+        client.post(ep, {})
+    sketch = client._stats[ep].latency_ms
+    assert sketch.count == 2000 and len(sketch.pos) + len(sketch.neg) <= sketch.max_bins
+    lat = client.stats()[ep]["latency_ms"]
+    assert 0 < lat["p50"] <= lat["p95"] <= lat["p99"] <= lat["max"] * 1.01
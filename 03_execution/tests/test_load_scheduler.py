@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from utils.load_scheduler import Stage, StageResult, critical_path, run_stages
+from utils.logger import RunLogger
+
+
+def _diamond(fail=None, log=None):
+    log = [] if log is None else log
+    both = threading.Barrier(2, timeout=5)
+
+    def step(name):
+        def fn():
+            if name in ("b", "c"):
+                both.wait()                      # b and c must run at the same time
+            if name == fail:
+                raise RuntimeError(f"{name} failed")
+            log.append(name)
+            return name.upper()
+        return fn
+
+    return [Stage("a", step("a")), Stage("b", step("b"), ("a",)), Stage("c", step("c"), ("a",)),
+            Stage("d", step("d"), ("b", "c")), Stage("e", step("e"))]
+
+
+def test_stages_run_after_their_dependencies():
+    order = []
+    results = run_stages(_diamond(log=order), max_workers=2)
+    assert order.index("a") < min(order.index("b"), order.index("c"))
+    assert order.index("d") > max(order.index("b"), order.index("c"))
+    assert {n: (r.status, r.result) for n, r in results.items()} == {
+        "a": ("DONE", "A"), "b": ("DONE", "B"), "c": ("DONE", "C"), "d": ("DONE", "D"), "e": ("DONE", "E")}
+
+
+def test_failure_skips_only_downstream_stages_and_is_raised(tmp_path):
+    order = []
+    logger = RunLogger(out_dir=str(tmp_path), scenario="s", mode="m", component="etl")
+    with pytest.raises(RuntimeError, match="b failed"):
+        run_stages(_diamond(fail="b", log=order), max_workers=2, logger=logger)
+    assert sorted(order) == ["a", "c", "e"]
+    events = {}
+    for row in logger.rows:
+        events.setdefault(row["event"], []).append(row["details"])
+    assert len(events["STAGE_DONE"]) == 3 and len(events["STAGE_FAIL"]) == 1
+    assert '"stage": "d"' in events["STAGE_SKIPPED"][0]
+    assert "LOAD_CRITICAL_PATH" in events
+
+
+def test_critical_path_follows_the_latest_dependency():
+    results = {
+        "a": StageResult("a", (), "DONE", 0.0, 1.0),
+        "b": StageResult("b", ("a",), "DONE", 1.0, 5.0),
+        "c": StageResult("c", ("a",), "DONE", 1.0, 2.0),
+        "d": StageResult("d", ("b", "c"), "DONE", 5.0, 6.0),
+        "e": StageResult("e", (), "DONE", 0.0, 3.0),
+    }
+    assert critical_path(results) == ["a", "b", "d"]
+    assert critical_path({"x": StageResult("x", (), "FAILED")}) == []
+
+
+@pytest.mark.parametrize("stages, message", [
+    ([Stage("a", lambda: 1, ("b",)), Stage("b", lambda: 1, ("a",))], "cycle"),
+    ([Stage("a", lambda: 1, ("zzz",))], "unknown"),
+    ([Stage("a", lambda: 1), Stage("a", lambda: 2)], "Duplicate"),
+])
+def test_invalid_dag_is_rejected_before_anything_runs(stages, message):
+    with pytest.raises(ValueError, match=message):
+        run_stages(stages)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from utils.log_sink import StreamingCsvSink
+
+COLUMNS = ["event", "n", "details"]
+
+
+def _sink(path, **kw):
+    return StreamingCsvSink(str(path), COLUMNS, lambda rec: [rec[0], rec[1], rec[2]], flush_interval_s=60, **kw)
+
+
+def test_appended_records_reach_the_file_on_flush_and_close(tmp_path):
+    sink = _sink(tmp_path / "run.csv")
+    sink.append(("A", 1, '{"x": "a,b"}'))
+    assert sink.stats()["pending"] == 1
+    sink.flush()
+    sink.append(("B", 2, "line\nbreak"))
+    sink.close()
+    sink.close()                                             # idempotent
+    df = pd.read_csv(tmp_path / "run.csv", encoding="utf-8-sig")
+    assert df.to_dict("records") == [{"event": "A", "n": 1, "details": '{"x": "a,b"}'},
+                                     {"event": "B", "n": 2, "details": "line\nbreak"}]
+    assert sink.stats() == {"path": str(tmp_path / "run.csv"), "lines": 2, "segments": 1, "pending": 0, "errors": 0}
+
+
+def test_full_buffer_wakes_the_writer(tmp_path):
+    sink = _sink(tmp_path / "run.csv", buffer_lines=2)
+    sink.append(("A", 1, ""))
+    sink.append(("B", 2, ""))
+    for _ in range(200):
+        if sink.stats()["lines"] == 2:
+            break
+        sink._thread.join(0.01)
+    assert sink.stats()["lines"] == 2
+    sink.close()
+
+
+def test_rotation_keeps_every_segment_readable(tmp_path):
+    sink = _sink(tmp_path / "run.csv", max_bytes=64)
+    for i in range(6):
+        sink.append(("EVENT", i, "x" * 20))
+        sink.flush()
+    sink.close()
+    segments = sorted(tmp_path.glob("run.*.csv")) + [tmp_path / "run.csv"]
+    assert [p.name for p in segments[:2]] == ["run.001.csv", "run.002.csv"]
+    assert sink.stats()["segments"] == len(segments)
+    frames = [pd.read_csv(p, encoding="utf-8-sig") for p in segments]
+    assert all(list(f.columns) == COLUMNS for f in frames)
+    assert pd.concat(frames)["n"].tolist() == list(range(6))
+
+
+def test_run_logger_snapshots_details_and_writes_the_same_json_in_both_modes(tmp_path):
+    from datetime import date
+
+    from utils.logger import RunLogger
+
+    def details(mode):
+        logger = RunLogger.from_config({"stream": mode == "stream", "flush_interval_s": 60},
+                                       out_dir=str(tmp_path / mode), scenario="s", mode="m", component="c")
+        d = {"day": date(2025, 2, 1), "name": "溫度"}
+        logger.log_event("E", details=d)
+        d["day"] = "changed"                        # the caller reuses its dict right away
+        path = logger.write_csv()
+        logger.close()
+        return pd.read_csv(path, encoding="utf-8-sig")["details"].tolist()
+
+    assert details("stream") == details("rows") == ['{"day": "2025-02-01", "name": "溫度"}']
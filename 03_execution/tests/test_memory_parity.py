@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Parity check for the embedded backend (utils/graph_memory.py): its handlers never execute the Cypher they
+are registered for, so one scenario (schema -> ingest -> detection -> dispatch -> shape validation) runs on
+the memory backend and, when NEO4J_TEST_URI is set, on a real Neo4j; results and final graphs must match.
+test_scenario_covers_every_registered_statement fails when a registered statement is not exercised here,
+so every twin is checked against the real Cypher in the Neo4j run.
+
+    docker run --rm -d -p 7687:7687 -e NEO4J_AUTH=neo4j/parity-test neo4j:5
+    NEO4J_TEST_URI=bolt://localhost:7687 NEO4J_TEST_PASSWORD=parity-test python -m pytest -q tests/test_memory_parity.py
+
+The Neo4j database is emptied first: point NEO4J_TEST_URI at a throwaway instance only.
+"""
+import os
+
+import pytest
+
+import utils.graph_memory as graph_memory
+from anomaly_detection_logic import build_detectors, detect_and_write, iter_pages
+from data_ingestion_etl import INGEST_SEQ, INGEST_SEQ_SCHEMA
+from pipeline_daemon import Q_COMPONENT_TYPES
+from utils.buffered_writer import BufferedWriter
+from utils.logger import RunLogger
+from utils.neo4j_helper import Neo4jHelper
+from utils.outbox import Outbox
+from utils.shape_validation import ShapeValidator
+from utils.task_coalescing import TaskCoalescer
+from workflow_trigger_api import (
+    Q_PENDING_ANOMALIES, Q_TASK_CREATE, Q_WORKORDER_DISPATCHED, enqueue_pending, settle,
+)
+
+SCHEMA = [
+    ("CREATE CONSTRAINT IF NOT EXISTS FOR (c:BuildingComponent) REQUIRE c.component_id IS UNIQUE", None),
+    ("CREATE CONSTRAINT IF NOT EXISTS FOR (pd:PerformanceData) REQUIRE pd.performance_id IS UNIQUE", None),
+    ("CREATE CONSTRAINT IF NOT EXISTS FOR (a:Anomaly) REQUIRE a.anomaly_id IS UNIQUE", None),
+    *INGEST_SEQ_SCHEMA,
+]
+CFG = {"anomaly_rules": {"default_metric": "temperature", "upper": 30.0}}
+T0 = 1738368000000          # 2025-02-01T00:00:00Z
+
+def _readings():
+    rows = []
+    for i in range(12):
+        metric = "Temperature" if i % 2 == 0 else " energy "
+        value = None if i == 5 else (20.0 + 3 * i if metric == "Temperature" else 100.0 + i)
+        rows.append({"performance_id": f"EVT-{i}", "component_id": "c1" if i < 8 else "c2", "sensor_id": "SEN-1",
+                     "metric": metric, "value": value, "timestamp": f"2/1/2025 0:{5 * i:02d}",
+                     "ts_ms": T0 + 300000 * i})
+    return rows
+
+# Properties that depend on wall time or random ids
+def _stable(props):
+    return {k: v for k, v in props.items()
+            if not (k.startswith("t_") or k.endswith("_at") or k == "workorder_id")}
+
+def _identity(labels, props):
+    for key in ("component_id", "sensor_data_id", "performance_id", "anomaly_id", "name"):
+        if key in props and "WorkOrder" not in labels and "MaintenanceTask" not in labels:
+            return f"{key}={props[key]}"
+    return f"{'/'.join(sorted(labels))}:task_id={props.get('task_id')}"
+
+def _canonical(nodes, rels):
+    """nodes: [(labels, props)], rels: [(type, (labels, props), (labels, props))] -> comparable sets"""
+    return ({(tuple(sorted(lb)), _identity(lb, p), tuple(sorted(_stable(p).items()))) for lb, p in nodes},
+            {(t, _identity(*s), _identity(*d)) for t, s, d in rels})
+
+def snapshot(neo):
+    if neo.backend == "memory":
+        g = neo._driver().graph
+        nodes = {nid: (g._labels[nid], g.props(nid)) for nid in g._props}
+        rels = [(t, nodes[src], nodes[tgt]) for (src, t), out in g._out.items() for tgt in out]
+        return _canonical(nodes.values(), rels)
+    nodes = [(r["labels"], r["props"]) for r in neo.query("MATCH (n) RETURN labels(n) AS labels, properties(n) AS props")]
+    rels = [(r["type"], (r["sl"], r["sp"]), (r["tl"], r["tp"])) for r in neo.query(
+        "MATCH (s)-[r]->(t) RETURN type(r) AS type, labels(s) AS sl, properties(s) AS sp, "
+        "labels(t) AS tl, properties(t) AS tp")]
+    return _canonical(nodes, rels)
+
+def run_scenario(neo, tmp_path):
+    out = {}
+    neo.run_batch(SCHEMA, transactional=False)
+    neo.merge_nodes("BuildingComponent", "component_id", [{"component_id": "c1", "type": "AHU"},
+                                                          {"component_id": "c2", "type": "Chiller"}])
+    neo.merge_nodes("SensorData", "sensor_data_id", [{"sensor_data_id": "SD-1"}])
+    neo.merge_rels("BuildingComponent", "component_id", "SensorData", "sensor_data_id", [("c1", "SD-1")],
+                   rel_type="MAPS_SENSOR_DATA")
+    rows = _readings()
+    neo.merge_nodes("PerformanceData", "performance_id", rows[:7], batch_size=3, seq_property=INGEST_SEQ)
+    neo.merge_nodes("PerformanceData", "performance_id", rows[7:], seq_property=INGEST_SEQ)
+    out["ingest_seq"] = [r[INGEST_SEQ] for r in rows]
+    out["component_types"] = sorted((r["component_id"], r["type"]) for r in neo.query(Q_COMPONENT_TYPES))
+
+    engine, windows, composites, metrics = build_detectors(CFG)
+    out["pages"], out["anomalies"] = [], []
+    for page in iter_pages(neo, metrics, 0, 4):
+        out["pages"].append([(r["performance_id"], r["component_type"], r["ingest_seq"]) for r in page])
+        _, found, new = detect_and_write(neo, engine, windows, composites, page, "t")
+        out["anomalies"].append((sorted(a["anomaly_id"] for a in found), sorted(a["anomaly_id"] for a in new)))
+        _, _, again = detect_and_write(neo, *build_detectors(CFG)[:3], page, "t")     # already in the graph
+        assert again == []
+
+    outbox = Outbox(str(tmp_path / f"outbox_{neo.backend}.sqlite"), target=neo.target)
+    created = BufferedWriter(neo, Q_TASK_CREATE, "task_create", max_rows=100, max_delay_s=0)
+    updated = BufferedWriter(neo, Q_WORKORDER_DISPATCHED, "workorder_dispatched", max_rows=100, max_delay_s=0,
+                             depends_on=created)
+    out["enqueued"] = enqueue_pending(neo, outbox, created, TaskCoalescer(window_s=3600), 100, "s", "m")
+    entries = outbox.claim(100)
+    logger = RunLogger(out_dir=str(tmp_path), scenario="s", mode="m", component=neo.backend)
+    outcome = {"rejected": False, "error": None, "retry_in_s": 0.0, "t_action_start": "t1", "t_action_end": "t2",
+               "response": {}, "mock": True, "endpoint": "", "throttled_s": 0.0, "http": {}}
+    for i, e in enumerate(sorted(entries, key=lambda e: e.task_id)):
+        settle(outbox, updated, logger, e, {**outcome, "ok": i % 2 == 0, "error": None if i % 2 == 0 else "x"})
+    updated.close()
+    created.close()
+    out["pending_after"] = [a["anomaly_id"] for a in neo.query(Q_PENDING_ANOMALIES, {"after": "", "limit": 100})]
+    # Failed tasks leave their members undispatched in the graph, but the outbox still holds them
+    out["pending_not_held"] = sorted(set(out["pending_after"]) - outbox.held(out["pending_after"]))
+    outbox.close()
+
+    reports = ShapeValidator.from_config({"sample_size": 10}).validate(neo)
+    out["shapes"] = sorted((r["label"], r["scanned"], tuple((x["check"], x["violations"], tuple(sorted(x["sample"])))
+                                                             for x in r["results"])) for r in reports)
+    out["graph"] = snapshot(neo)
+    return out
+
+
+def _registered():
+    return set(graph_memory._EXACT.values()) | {fn for _, fn in graph_memory._PATTERNS}
+
+
+def test_scenario_covers_every_registered_statement(tmp_path, monkeypatch):
+    hit = set()
+    real = graph_memory._resolve
+
+    def spy(cypher):
+        fn, m = real(cypher)
+        hit.add(fn)
+        return fn, m
+
+    monkeypatch.setattr(graph_memory, "_resolve", spy)
+    out = run_scenario(Neo4jHelper.from_config({"backend": "memory"}), tmp_path)
+    missing = sorted(fn.__qualname__ for fn in _registered() - hit)
+    assert not missing, f"registered statements not exercised by the parity scenario: {missing}"
+    assert out["anomalies"] and out["enqueued"]["tasks"] and out["pending_after"] and out["pending_not_held"] == []
+
+
+@pytest.mark.skipif(not os.environ.get("NEO4J_TEST_URI"), reason="set NEO4J_TEST_URI to compare with Neo4j")
+def test_memory_backend_matches_neo4j(tmp_path):
+    pytest.importorskip("neo4j")
+    neo = Neo4jHelper.from_config({"uri": os.environ["NEO4J_TEST_URI"],
+                                   "user": os.environ.get("NEO4J_TEST_USER", "neo4j"),
+                                   "password": os.environ.get("NEO4J_TEST_PASSWORD", "neo4j"),
+                                   "database": os.environ.get("NEO4J_TEST_DATABASE")})
+    try:
+        neo.query("MATCH (n) DETACH DELETE n")
+        expected = run_scenario(neo, tmp_path)
+    finally:
+        neo.close()
+    actual = run_scenario(Neo4jHelper.from_config({"backend": "memory"}), tmp_path)
+    for key in expected:
+        assert actual[key] == expected[key], key
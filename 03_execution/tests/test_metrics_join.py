@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""The run-log join of 04_validation/metrics/compute_metrics.py on logs written by RunLogger."""
+import importlib.util
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from utils.logger import RunLogger
+
+_PATH = Path(__file__).resolve().parents[2] / "04_validation" / "metrics" / "compute_metrics.py"
+_spec = importlib.util.spec_from_file_location("compute_metrics", _PATH)
+compute_metrics = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(compute_metrics)
+
+T0 = datetime(2025, 2, 1, tzinfo=timezone.utc)
+
+
+def _t(s):
+    return (T0 + timedelta(seconds=s)).isoformat()
+
+
+def _detect(logger, anomaly_id, trigger_s, detected_s):
+    logger.log_event("DETECTION_ANOMALY", details={"anomaly_id": anomaly_id, "t_trigger": _t(trigger_s),
+                                                   "t_detected": _t(detected_s)})
+
+
+def _dispatch(logger, ids, task_id, created_s, ok=True):
+    logger.log_event("WORKFLOW_DISPATCH", details={
+        "anomaly_id": ids[0], "anomaly_ids": ids, "task_id": task_id, "t_task_created": _t(created_s),
+        "t_action_start": _t(created_s + 1), "t_action_end": _t(created_s + 2), "response_ok": ok})
+
+
+@pytest.fixture
+def logs(tmp_path):
+    def logger(component):
+        return RunLogger(out_dir=str(tmp_path / "logs"), scenario="PdM_HVAC", mode="sam", component=component)
+
+    first, workflow, rerun = logger("detect"), logger("workflow"), logger("detect")
+    _detect(first, "a1", 0, 1)
+    _detect(first, "a2", 0, 2)
+    _detect(first, "a3", 0, 2)
+    _dispatch(workflow, ["a1", "a2"], "task_1", 3)                  # one coalesced task for two anomalies
+    _dispatch(workflow, ["a3"], "task_3", 3, ok=False)
+    _detect(rerun, "a1", 100, 101)                                  # same id again, no action after it
+    for lg in (first, workflow, rerun):
+        lg.write_csv()
+    return tmp_path / "logs"
+
+
+def test_detections_join_forward_to_coalesced_actions(logs, tmp_path):
+    out = compute_metrics.compute_event_metrics([str(logs)], str(tmp_path), window_min=1.0, chunk_rows=2)
+    loss = out["loss"].set_index("framework").loc["SAM"]
+    assert (loss["events_detected"], loss["actions_executed"], loss["lost_events"]) == (4, 2, 2)
+
+    raw = pd.read_csv(tmp_path / "latency_l1_l4_raw.csv").set_index("event_id")
+    assert sorted(raw.index) == ["a1", "a2"]
+    assert raw.loc["a1", ["L1_detect_ms", "L2_reason_ms", "L3_dispatch_ms", "L4_execute_ms"]].tolist() == \
+        [1000.0, 2000.0, 1000.0, 1000.0]
+    assert raw.loc["a2", "L2_reason_ms"] == 1000.0
+    tta = pd.read_csv(tmp_path / "tta_distribution.csv").set_index("event_id")["tta_ms"]
+    assert tta.to_dict() == {"a1": 4000.0, "a2": 4000.0}
+    assert out["throughput"][0]["completed_tasks"] == 1
+
+
+def test_action_before_a_detection_is_not_credited_to_it():
+    ns = compute_metrics._to_ns
+    det = pd.DataFrame({"anomaly_id": ["a1", "a1"], "framework": "SAM", "run_id": ["r1", "r2"],
+                        "t_trigger": ns(pd.Series([_t(0), _t(100)])),
+                        "t_detected": ns(pd.Series([_t(1), _t(101)]))})
+    act = pd.DataFrame({"framework": "SAM", "run_id": "w", "anomaly_id": ["a1"], "task_id": ["t1"], "ok": [True],
+                        **{f: ns(pd.Series([_t(s)])) for f, s in
+                           (("t_task_created", 3), ("t_action_start", 4), ("t_action_end", 5))}})
+    m = compute_metrics.join_partition(det, act).set_index("run_id")
+    assert m.loc["r1", "executed"] and m.loc["r1", "task_id"] == "t1"
+    assert not m.loc["r2", "executed"]
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from utils.neo4j_helper import Neo4jHelper
+
+
+def _rows(ids):
+    return [{"performance_id": f"p{i}", "value": float(i)} for i in ids]
+
+
+def _seqs(neo):
+    g = neo._driver().graph
+    return {g.get(n, "performance_id"): g.get(n, "ingest_seq") for n in g.nodes("PerformanceData")}
+
+
+def test_sequenced_merge_numbers_rows_from_a_durable_counter(tmp_path):
+    path = str(tmp_path / "graph.json")
+    neo = Neo4jHelper.from_config({"backend": "memory", "memory_path": path})
+    first = _rows(range(3))
+    neo.merge_nodes("PerformanceData", "performance_id", first, seq_property="ingest_seq")
+    assert [r["ingest_seq"] for r in first] == [1, 2, 3]          # written back for the caller
+    neo.close()
+
+    neo = Neo4jHelper.from_config({"backend": "memory", "memory_path": path})
+    second = _rows(range(3, 8))
+    neo.merge_nodes("PerformanceData", "performance_id", second, batch_size=2, seq_property="ingest_seq")
+    assert [r["ingest_seq"] for r in second] == [4, 5, 6, 7, 8]   # continues across runs and batches
+    assert _seqs(neo) == {f"p{i}": i + 1 for i in range(8)}
+    neo.close()
+
+
+def test_counter_starts_above_existing_numbers():
+    neo = Neo4jHelper.from_config({"backend": "memory"})
+    clock_based = 1_738_400_000_000_000_000                       # numbered by the old time_ns scheme
+    neo.merge_nodes("PerformanceData", "performance_id", [{"performance_id": "old", "ingest_seq": clock_based}])
+    rows = _rows(range(2))
+    neo.merge_nodes("PerformanceData", "performance_id", rows, seq_property="ingest_seq")
+    assert [r["ingest_seq"] for r in rows] == [clock_based + 1, clock_based + 2]
+
+
+def test_unsequenced_merge_leaves_rows_alone():
+    neo = Neo4jHelper.from_config({"backend": "memory"})
+    rows = _rows(range(2))
+    summary = neo.merge_nodes("PerformanceData", "performance_id", rows)
+    assert summary.rows == 2 and all("ingest_seq" not in r for r in rows)
+
+
+def _counter(neo):
+    g = neo._driver().graph
+    return g.get(g.find_one("IngestSequence", "name", "PerformanceData"), "next")
+
+
+def test_remerging_existing_rows_keeps_their_numbers():
+    neo = Neo4jHelper.from_config({"backend": "memory"})
+    neo.merge_nodes("PerformanceData", "performance_id", _rows(range(3)), seq_property="ingest_seq")
+    before, counter = _seqs(neo), _counter(neo)
+
+    again = _rows(range(3))                                         # ETL re-run / retried chunk
+    neo.merge_nodes("PerformanceData", "performance_id", again, seq_property="ingest_seq")
+    assert [r["ingest_seq"] for r in again] == [1, 2, 3]
+    assert (_seqs(neo), _counter(neo)) == (before, counter)
+
+    mixed = _rows([1, 5, 5, 6])                                     # only created nodes take numbers
+    neo.merge_nodes("PerformanceData", "performance_id", mixed, seq_property="ingest_seq")
+    assert [r["ingest_seq"] for r in mixed] == [2, 4, 4, 5] and _counter(neo) == 6
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+import time
+
+import pytest
+
+import utils.outbox as outbox_mod
+from utils.outbox import Outbox
+
+LEGACY = """
+CREATE TABLE outbox (
+    target TEXT NOT NULL, anomaly_id TEXT NOT NULL,
+    payload TEXT NOT NULL, workorder_id TEXT NOT NULL, t_task_created TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,
+    next_at REAL NOT NULL, lease_until REAL, last_error TEXT, updated_at REAL NOT NULL,
+    PRIMARY KEY (target, anomaly_id)
+) WITHOUT ROWID;
+CREATE INDEX outbox_due ON outbox (target, status, next_at);
+"""
+
+
+def _legacy_file(path, rows):
+    con = sqlite3.connect(path)
+    con.executescript(LEGACY)
+    con.executemany("INSERT INTO outbox (target, anomaly_id, payload, workorder_id, t_task_created, status, attempts, "
+                    "next_at, updated_at) VALUES ('', ?, ?, ?, 't0', ?, ?, 0, 0)", rows)
+    con.commit()
+    con.close()
+
+
+def test_legacy_per_anomaly_rows_are_migrated(tmp_path):
+    path = str(tmp_path / "ob.sqlite")
+    _legacy_file(path, [("a1", json.dumps({"anomaly_id": "a1"}), "wo_1", "pending", 2),
+                        ("a2", json.dumps({"anomaly_id": "a2"}), "wo_2", "done", 1)])
+    ob = Outbox(path, max_attempts=5)
+    assert ob.counts() == {"pending": 1, "done": 1}
+    assert ob.held(["a1", "a2", "a3"]) == {"a1", "a2"}          # members backfilled from the payloads
+    [e] = ob.claim(10)
+    assert (e.task_id, e.workorder_id, e.attempts, e.payload) == ("a1", "wo_1", 2, {"anomaly_id": "a1"})
+    ob.close()
+
+    con = sqlite3.connect(path)
+    names = {n for (n,) in con.execute("SELECT name FROM sqlite_master")}
+    plan = " ".join(str(r) for r in con.execute("EXPLAIN QUERY PLAN SELECT * FROM task_outbox "
+                                                "WHERE target='' AND status='pending' AND next_at<=1"))
+    con.close()
+    assert "outbox" not in names and "outbox_due" not in names
+    assert "task_outbox_due" in plan
+    assert Outbox(path).counts() == {"inflight": 1, "done": 1}      # reopening is a no-op
+
+
+def test_unknown_outbox_table_is_refused(tmp_path):
+    path = str(tmp_path / "ob.sqlite")
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE outbox (id TEXT)")
+    con.commit()
+    con.close()
+    with pytest.raises(RuntimeError, match="unrecognised outbox table"):
+        Outbox(path)
+
+
+@pytest.fixture
+def ob(tmp_path):
+    o = Outbox(str(tmp_path / "ob.sqlite"), target="g", max_attempts=3, retry_base_s=10, lease_s=30)
+    yield o
+    o.close()
+
+
+def _put(ob, *ids):
+    return ob.enqueue((i, {"task_id": i}, f"wo_{i}", "t0") for i in ids)
+
+
+def test_enqueue_is_idempotent_and_keeps_the_workorder(ob):
+    assert _put(ob, "a", "b") == ["a", "b"]
+    assert ob.enqueue([("a", {}, "wo_other", "t1")]) == []
+    assert {e.task_id: e.workorder_id for e in ob.claim(10)} == {"a": "wo_a", "b": "wo_b"}
+
+
+def test_claim_leases_and_expired_leases_are_reclaimed(ob, monkeypatch):
+    _put(ob, "a")
+    now = time.time()
+    [e] = ob.claim(10)
+    assert ob.claim(10) == [] and ob.counts() == {"inflight": 1}
+    monkeypatch.setattr(outbox_mod.time, "time", lambda: now + 31)
+    assert [x.task_id for x in ob.claim(10)] == ["a"]
+
+
+def test_nack_backs_off_then_dead_letters_and_requeue(ob, monkeypatch):
+    _put(ob, "a")
+    monkeypatch.setattr(outbox_mod.random, "uniform", lambda a, b: 1.0)
+    ob.claim(1)
+    assert ob.nack("a", "503") == "pending"
+    assert ob.claim(1) == [] and 9 < ob.next_due_in() <= 10
+    assert ob.nack("a", "breaker open", count_attempt=False, delay_s=0) == "pending"
+    assert ob.claim(1)[0].attempts == 1                      # the deferral did not use an attempt
+    assert ob.nack("a", "503", delay_s=0) == "pending"
+    assert ob.nack("a", "503", delay_s=0) == "dead"
+    assert ob.claim(1) == [] and ob.next_due_in() is None
+    assert ob.dead_letters() == [{"task_id": "a", "workorder_id": "wo_a", "attempts": 3, "last_error": "503"}]
+    assert ob.requeue_dead() == 1
+    [e] = ob.claim(1)
+    assert e.attempts == 0
+    ob.ack("a")
+    assert ob.counts() == {"done": 1}
+
+
+def test_retry_delay_is_capped(ob, monkeypatch):
+    monkeypatch.setattr(outbox_mod.random, "uniform", lambda a, b: 1.0)
+    assert [ob.retry_delay(n) for n in (1, 2, 3, 10)] == [10, 20, 40, 300]
+
+
+def test_targets_share_a_file_without_mixing(tmp_path):
+    a = Outbox(str(tmp_path / "ob.sqlite"), target="a")
+    b = Outbox(str(tmp_path / "ob.sqlite"), target="b")
+    a.enqueue([("x", {}, "wo", "t")])
+    assert b.claim(10) == [] and b.counts() == {} and a.counts() == {"pending": 1}
+    a.close()
+    b.close()
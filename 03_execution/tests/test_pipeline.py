@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import queue
+import threading
+
+import pandas as pd
+
+from utils.pipeline import Batch, PipelineStage
+
+
+def _run(stages, timeout=5.0):
+    for s in stages:
+        s.start()
+    for s in stages:
+        s.join(timeout)
+        assert not s.is_alive()
+
+
+def _feed(q, *batches):
+    for items in batches:
+        q.put(Batch(items=list(items)))
+
+
+def test_batches_flow_through_stages_in_order():
+    stop = threading.Event()
+    q_in, q_out = queue.Queue(maxsize=4), queue.Queue()
+    _feed(q_in, [1, 2], [3])
+    src = PipelineStage("src", lambda _: None, stop, outbox=q_in, finite=True, idle_s=0.01)
+    double = PipelineStage("double", lambda xs: [x * 2 for x in xs], stop, inbox=q_in, outbox=q_out,
+                           upstream=src, idle_s=0.01)
+    _run([src, double])
+    out = []
+    while not q_out.empty():
+        out += q_out.get_nowait().items
+    assert out == [2, 4, 6]
+    assert double.metrics.snapshot()["items_in"] == 3
+
+
+def test_failed_batch_is_retried_before_moving_on():
+    stop = threading.Event()
+    q_in = queue.Queue()
+    _feed(q_in, ["a"], ["b"])
+    seen, fails = [], {"a": 2}
+
+    def fn(items):
+        if fails.get(items[0], 0):
+            fails[items[0]] -= 1
+            raise RuntimeError("write failed")
+        seen.append(items[0])
+        return []
+
+    stop.set()           # upstream already done: drain q_in and exit
+    stage = PipelineStage("detect", fn, stop, inbox=q_in, idle_s=0.01, retries=3, retry_backoff_s=0.0)
+    _run([stage])
+    assert seen == ["a", "b"]
+    snap = stage.metrics.snapshot()
+    assert snap["errors"] == 2 and snap["retries"] == 2 and snap["failed"] is None
+
+
+def test_exhausted_retries_stop_the_pipeline_without_processing_later_batches():
+    stop = threading.Event()
+    q_in = queue.Queue()
+    _feed(q_in, ["bad"], ["next"], ["after"])
+    seen, errors = [], []
+
+    def fn(items):
+        if items[0] == "bad":
+            raise RuntimeError("write failed")
+        seen.append(items[0])          # e.g. advancing a watermark past "bad"
+        return []
+
+    stage = PipelineStage("detect", fn, stop, inbox=q_in, idle_s=0.01, retries=1, retry_backoff_s=0.0,
+                          on_error=lambda name, e: errors.append(name))
+    stage.start()
+    stage.join(5.0)
+    assert not stage.is_alive()
+    assert seen == []
+    assert stop.is_set() and isinstance(stage.failed, RuntimeError)
+    assert errors == ["detect", "detect"]
+    assert stage.metrics.skipped == 2
+
+
+def test_failed_downstream_does_not_block_upstream_put():
+    stop = threading.Event()
+    q = queue.Queue(maxsize=1)
+    produced = iter(range(5))
+
+    def source(_):
+        n = next(produced, None)
+        return None if n is None else [n]
+
+    def sink(_items):
+        raise RuntimeError("down")
+
+    src = PipelineStage("src", source, stop, outbox=q, finite=True, idle_s=0.01)
+    dst = PipelineStage("sink", sink, stop, inbox=q, upstream=src, idle_s=0.01, retries=0)
+    _run([src, dst])
+    assert dst.failed is not None and stop.is_set()
+
+
+def test_source_retry_keeps_the_same_chunk():
+    stop = threading.Event()
+    q = queue.Queue()
+    chunks = iter([["c1"], ["c2"]])
+    held, attempts = [], {"n": 0}
+
+    def source(_):
+        if not held:
+            nxt = next(chunks, None)
+            if nxt is None:
+                return None
+            held.append(nxt)
+        attempts["n"] += 1
+        if attempts["n"] == 1:
+            raise IOError("merge failed")
+        return held.pop()
+
+    src = PipelineStage("src", source, stop, outbox=q, finite=True, idle_s=0.01, retries=2, retry_backoff_s=0.0)
+    _run([src])
+    got = []
+    while not q.empty():
+        got += q.get_nowait().items
+    assert got == ["c1", "c2"]
+
+
+def test_inbox_file_stays_until_every_chunk_is_written(tmp_path):
+    from pipeline_daemon import InboxSource
+    from utils.logger import RunLogger
+    from utils.neo4j_helper import Neo4jHelper
+
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    (inbox / "batch1.csv").write_text(
+        "PerformanceId,SensorId,ComponentId,Timestamp,Metric,Value\n"
+        "p1,s1,c1,2025-02-01T00:00:00,temperature,20\n"
+        "p2,s1,c1,2025-02-01T00:05:00,temperature,35\n", encoding="utf-8")
+    neo = Neo4jHelper.from_config({"backend": "memory"})
+    logger = RunLogger.from_config({}, out_dir=str(tmp_path), scenario="t", mode="sam", component="test")
+    source = InboxSource(neo, inbox, {}, ["temperature"], chunk_size=1, component_refresh_s=300, logger=logger)
+
+    real_merge, calls = neo.merge_nodes, {"n": 0}
+
+    def flaky_merge(*a, **kw):
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise RuntimeError("transient write failure")
+        return real_merge(*a, **kw)
+
+    neo.merge_nodes = flaky_merge
+    assert [r["performance_id"] for r in source(None)] == ["p1"]
+    try:
+        source(None)
+    except RuntimeError:
+        pass
+    assert (inbox / "batch1.csv").exists()                 # failed chunk: file not moved
+    assert [r["performance_id"] for r in source(None)] == ["p2"]   # same chunk retried
+    assert source(None) is None
+    assert not (inbox / "batch1.csv").exists() and (inbox / "processed" / "batch1.csv").exists()
+    neo.close()
+
+
+def test_detect_reads_the_graph_when_another_writer_numbered_readings_in_between():
+    from pipeline_daemon import detect_pages, ingest_chunk
+    from utils.neo4j_helper import Neo4jHelper
+
+    def chunk(*rows):
+        return pd.DataFrame([{"PerformanceId": pid, "SensorId": "s1", "ComponentId": "c1",
+                              "Timestamp": f"2025-02-01T00:0{i}:00", "Metric": metric, "Value": 20 + i}
+                             for i, (pid, metric) in enumerate(rows)])
+
+    def pages(readings, after):
+        return [([r["performance_id"] for r in page], wm) for page, wm in
+                detect_pages(neo, ["temperature"], readings, after, page_size=10)]
+
+    neo = Neo4jHelper.from_config({"backend": "memory"})
+    first = ingest_chunk(neo, chunk(("p1", "temperature"), ("p2", "humidity")), {}, {"temperature"}, {})
+    assert pages(first, 0) == [(["p1"], 2)]                 # own rows only: no graph read, skipped rows count
+    # The ETL CLI takes the next number between two daemon chunks
+    neo.merge_nodes("PerformanceData", "performance_id", [{"performance_id": "etl1", "metric": "temperature",
+                                                           "value": 50.0}], seq_property="ingest_seq")
+    second = ingest_chunk(neo, chunk(("p3", "temperature")), {}, {"temperature"}, {})
+    assert pages(second, 2) == [(["etl1", "p3"], 4)]
+    again = ingest_chunk(neo, chunk(("p3", "temperature")), {}, {"temperature"}, {})
+    assert pages(again, 4) == []                            # re-merged rows keep their number
+    neo.close()
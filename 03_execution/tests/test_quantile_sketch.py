@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from utils.quantile_sketch import DDSketch, SketchSet, merge_files
+
+ALPHA = 0.01
+
+
+def _values(seed=0, n=5000):
+    return np.random.default_rng(seed).lognormal(mean=5.0, sigma=1.2, size=n)
+
+
+def _assert_within(sketch, values, qs=(0.5, 0.95, 0.99)):
+    ordered = np.sort(values)
+    for q in qs:
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= ALPHA * exact + 1e-9, q
+
+
+def test_quantiles_within_relative_accuracy():
+    v = _values()
+    s = DDSketch(ALPHA)
+    s.add_many(v)
+    _assert_within(s, v)
+    summary = s.summary()
+    assert summary["count"] == len(v)
+    assert summary["mean"] == pytest.approx(v.mean())
+    assert summary["std"] == pytest.approx(v.std(ddof=1))
+    assert (summary["min"], summary["max"]) == (v.min(), v.max())
+
+
+def test_add_many_matches_add_and_skips_nan():
+    v = np.concatenate([_values(n=300), [0.0, -4.0, np.nan]])
+    one, many = DDSketch(ALPHA), DDSketch(ALPHA)
+    for x in v:
+        one.add(x)
+    many.add_many(v)
+    assert (one.pos, one.neg, one.zero, one.count) == (many.pos, many.neg, many.zero, many.count)
+    assert (one.count, one.zero, sum(one.neg.values())) == (302, 1, 1)
+    assert one.sum == pytest.approx(many.sum)
+
+
+def test_merge_equals_one_sketch_over_all_values_in_any_order():
+    parts = [_values(seed) for seed in range(3)]
+    whole = DDSketch(ALPHA)
+    whole.add_many(np.concatenate(parts))
+    for order in ([0, 1, 2], [2, 0, 1]):
+        merged = DDSketch(ALPHA)
+        for i in order:
+            s = DDSketch(ALPHA)
+            s.add_many(parts[i])
+            merged.merge(s)
+        assert (merged.pos, merged.count, merged.min, merged.max) == (whole.pos, whole.count, whole.min, whole.max)
+        _assert_within(merged, np.concatenate(parts))
+
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        DDSketch(0.01).merge(DDSketch(0.02))
+
+
+def test_collapse_keeps_the_upper_tail():
+    v = np.geomspace(1e-3, 1e6, 4000)
+    s = DDSketch(ALPHA, max_bins=64)
+    s.add_many(v)
+    assert len(s.pos) <= 64 and s.count == len(v)
+    _assert_within(s, v, qs=(0.99,))
+
+
+def test_round_trip_and_file_merge(tmp_path):
+    a, b = SketchSet(ALPHA), SketchSet(ALPHA)
+    a.add_many("SAM", "tta_ms", _values(1))
+    a.runs.append("r1")
+    b.add_many("SAM", "tta_ms", _values(2))
+    b.add("Baseline", "L1_detect_ms", 12.5)
+    b.runs.append("r2")
+    paths = [a.save(str(tmp_path / "a.json")), b.save(str(tmp_path / "b.json"))]
+
+    restored = DDSketch.from_dict(a.get("SAM", "tta_ms").to_dict())
+    assert restored.summary() == a.get("SAM", "tta_ms").summary()
+
+    merged = merge_files(paths)
+    assert merged.runs == ["r1", "r2"]
+    assert merged.frameworks() == ["Baseline", "SAM"]
+    assert len(merged) == len(a) + len(b)
+    _assert_within(merged.get("SAM", "tta_ms"), np.concatenate([_values(1), _values(2)]))
+    assert merge_files([]) is None
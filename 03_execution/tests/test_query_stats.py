@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import csv
+from types import SimpleNamespace
+
+from utils.logger import RunLogger
+from utils.neo4j_helper import Neo4jHelper
+from utils.query_stats import QueryStats, fingerprint, report_query_stats
+
+
+def _summary(**counters):
+    return SimpleNamespace(counters=SimpleNamespace(**counters), result_available_after=2, result_consumed_after=3)
+
+
+def test_fingerprint_ignores_literals_and_whitespace():
+    fp, text = fingerprint("MATCH (n {id: 'a\\'b'})\n  WHERE n.v > 10.5 RETURN n LIMIT 3")
+    assert text == "MATCH (n {id: ?}) WHERE n.v > ? RETURN n LIMIT ?"
+    assert fingerprint('MATCH (n {id: "x"}) WHERE n.v > 7 RETURN n   LIMIT 100')[0] == fp
+    assert fingerprint("MATCH (n {id: $id}) RETURN n")[0] != fp
+
+
+def test_record_aggregates_per_fingerprint():
+    stats = QueryStats(window=2)
+    fp, stmt, profiled = stats.prepare("RETURN 1")
+    assert (stmt, profiled) == ("RETURN 1", False)
+    stats.record(fp, "RETURN 1", "q", 0.010, 1, _summary(nodes_created=2))
+    stats.record(fp, "RETURN 2", "q", 0.030, 1, _summary(nodes_created=1))
+    stats.record(fp, "RETURN 3", "q", 0.020, 0, error=RuntimeError("boom"))
+    other, _, _ = stats.prepare("RETURN $x")
+    stats.record(other, "RETURN $x", "p", 0.001, 1)
+
+    top = stats.summary()
+    assert [r["fingerprint"] for r in top] == [fp, other]
+    row = top[0]
+    assert (row["calls"], row["errors"], row["rows"], row["nodes_created"]) == (3, 1, 2, 3)
+    assert (row["client_ms_total"], row["client_ms_max"], row["client_ms_mean"]) == (60.0, 30.0, 20.0)
+    assert row["client_ms_p50"] == 30.0                     # window=2 keeps the last two spans (30, 20)
+    assert row["server_available_ms_total"] == 4 and "boom" in row["last_error"]
+    assert stats.summary(top=1) == top[:1]
+
+
+def test_slow_statement_is_profiled_on_its_next_run_only():
+    stats = QueryStats(profile_slow_ms=5, profile_max_plans=1)
+    cypher = "MATCH (n) RETURN n"
+    fp, _, _ = stats.prepare(cypher)
+    stats.record(fp, cypher, "q", 0.010, 0)
+    assert stats.prepare(cypher) == (fp, "PROFILE " + cypher, True)
+    assert stats.prepare(cypher)[2] is False                 # handed out once
+    plan = {"operatorType": "ProduceResults", "rows": 1, "dbHits": 0,
+            "children": [{"operatorType": "AllNodesScan", "args": {"Rows": 1, "DbHits": 2}}]}
+    stats.record(fp, cypher, "q", 0.010, 1, SimpleNamespace(profile=plan), profiled=True)
+    assert stats.plans[fp]["plan"]["children"] == [{"operator": "AllNodesScan", "rows": 1, "db_hits": 2}]
+
+    schema = "CREATE INDEX x IF NOT EXISTS FOR (n:N) ON (n.v)"
+    sfp, _, _ = stats.prepare(schema)
+    stats.record(sfp, schema, "schema", 1.0, 0)
+    assert stats.prepare(schema)[2] is False
+
+
+def test_helper_spans_profile_and_report(tmp_path):
+    neo = Neo4jHelper.from_config({"backend": "memory", "profile_slow_ms": 0})
+    for i in range(2):
+        neo.merge_nodes("BuildingComponent", "component_id", [{"component_id": f"c{i}"}])
+    logger = RunLogger(out_dir=str(tmp_path), scenario="s", mode="m", component="etl")
+    path = report_query_stats(neo, logger)
+
+    with open(path, encoding="utf-8-sig") as fh:
+        rows = list(csv.DictReader(fh))
+    assert len(rows) == 1 and rows[0]["calls"] == "2" and rows[0]["nodes_created"] == "2"
+    assert "EmbeddedHandler" in rows[0]["plan"]
+    assert [r["event"] for r in logger.rows] == ["QUERY_STATS", "QUERY_STATS_SUMMARY"]
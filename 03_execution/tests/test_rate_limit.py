@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import utils.rate_limit as rate_limit
+from utils.rate_limit import RateLimiters, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock; sleep() advances it (rates below are powers of two, so refills are exact)."""
+    now = [0.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(rate_limit.time, "sleep", lambda s: now.__setitem__(0, now[0] + s))
+    return now
+
+
+def test_burst_then_steady_rate(clock):
+    b = TokenBucket(rate_per_s=8, burst=3)
+    assert [b.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert b.acquire() == 0.125
+    clock[0] += 1.0                                   # refills up to the burst, not beyond
+    assert [b.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert b.acquire() == 0.125
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_per_key_limits_and_unlimited_keys(clock):
+    lim = RateLimiters({"rate_per_s": 4, "per_key": {"slow": {"rate_per_s": 1, "burst": 1}}})
+    assert lim.get("slow").rate == 1 and lim.get("other").rate == 4
+    assert lim.get("slow") is lim.get("slow")
+    lim.acquire("slow")
+    assert lim.acquire("slow") == 1.0
+    free = RateLimiters({"per_key": {"slow": {"rate_per_s": 1}}})
+    assert free.get("fast") is None and free.acquire("fast") == 0.0
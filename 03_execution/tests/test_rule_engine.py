@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from anomaly_detection_logic import iter_pages
+from utils.neo4j_helper import Neo4jHelper
+from utils.rule_engine import ANY_METRIC, RuleEngine, metric_selected, parse_numeric, parse_rules
+
+
+def _hits(engine, readings):
+    return [(i, rule.rule_id, direction) for i, rule, direction, _ in engine.evaluate(readings)]
+
+
+def test_parse_numeric_strips_units():
+    out = parse_numeric(["25.14 C", 3, None, "n/a", "-1e2 kWh"])
+    assert out[0] == 25.14 and out[1] == 3.0 and out[4] == -100.0
+    assert np.isnan(out[2]) and np.isnan(out[3])
+
+
+def test_legacy_format_and_multi_rule_matching():
+    assert [r.rule_id for r in parse_rules({"default_metric": "temperature", "upper": 30})] == ["threshold_temperature"]
+    engine = RuleEngine.from_config([
+        {"id": "t_hi", "metric": "Temperature", "upper": 30},
+        {"id": "p_lo", "metric": "pressure", "lower": 80, "severity": "LOW"},
+    ])
+    readings = [{"metric": " temperature ", "value": "31 C"}, {"metric": "pressure", "value": 70},
+                {"metric": "energy", "value": 1000}, {"metric": "temperature", "value": 20}]
+    assert _hits(engine, readings) == [(0, "t_hi", "upper"), (1, "p_lo", "lower")]
+
+
+def test_component_type_rule_overrides_generic_rule():
+    engine = RuleEngine.from_config([
+        {"id": "generic", "metric": "temperature", "upper": 30},
+        {"id": "ahu", "metric": "temperature", "component_type": "AHU", "upper": 27.5},
+    ])
+    readings = [{"metric": "temperature", "value": 28, "component_type": "AHU"},
+                {"metric": "temperature", "value": 28, "component_type": "Chiller"},
+                {"metric": "temperature", "value": 31, "component_type": "ahu"}]
+    assert _hits(engine, readings) == [(0, "ahu", "upper"), (2, "ahu", "upper")]
+
+
+def test_null_metric_is_a_wildcard():
+    engine = RuleEngine.from_config({"default_metric": None, "upper": 30, "lower": None})
+    assert engine.metrics == [ANY_METRIC]
+    assert engine.rules[0].rule_id == "threshold_all"
+    readings = [{"metric": "temperature", "value": 31}, {"metric": "energy", "value": 45}, {"metric": None, "value": 5}]
+    assert _hits(engine, readings) == [(0, "threshold_all", "upper"), (1, "threshold_all", "upper")]
+    assert metric_selected("anything", engine.metrics)
+
+
+def test_rule_without_metric_key_is_rejected():
+    with pytest.raises(ValueError):
+        parse_rules([{"id": "x", "upper": 1}])
+
+
+def test_wildcard_reading_query_skips_the_metric_filter():
+    neo = Neo4jHelper.from_config({"backend": "memory"})
+    neo.merge_nodes("PerformanceData", "performance_id", [
+        {"performance_id": "p1", "metric": "temperature", "value": 1, "ingest_seq": 1},
+        {"performance_id": "p2", "metric": "energy", "value": 2, "ingest_seq": 2},
+    ])
+    seen = lambda metrics: [r["performance_id"] for page in iter_pages(neo, metrics, 0, 10) for r in page]
+    assert seen(["temperature"]) == ["p1"]
+    assert seen([ANY_METRIC]) == ["p1", "p2"]
+    neo.close()
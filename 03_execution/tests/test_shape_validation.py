@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from utils.neo4j_helper import Neo4jHelper
+from utils.shape_validation import Shape, ShapeValidator, label_statement, sample_statement
+
+
+@pytest.fixture
+def neo():
+    h = Neo4jHelper.from_config({"backend": "memory"})
+    h.merge_nodes("BuildingComponent", "component_id",
+                  [{"component_id": f"c{i}", **({"type": "AHU"} if i < 2 else {})} for i in range(6)])
+    h.merge_nodes("SensorData", "sensor_data_id", [{"sensor_data_id": "s1"}])
+    h.merge_rels("BuildingComponent", "component_id", "SensorData", "sensor_data_id", [("c0", "s1")],
+                 rel_type="MAPS_SENSOR_DATA")
+    yield h
+    h.close()
+
+
+SHAPES = [Shape.from_dict(d) for d in (
+    {"label": "BuildingComponent", "property": "type"},
+    {"label": "BuildingComponent", "rel_type": "MAPS_SENSOR_DATA", "target": "SensorData"},
+    {"label": "BuildingComponent", "property": "component_id"},
+    {"label": "SensorData", "rel_type": "MAPS_SENSOR_DATA", "direction": "in"},
+)]
+
+
+def test_counts_and_bounded_samples(neo):
+    reports = {r["label"]: r for r in ShapeValidator(SHAPES, sample_size=3).validate(neo)}
+    comp = reports["BuildingComponent"]
+    assert comp["scanned"] == 6
+    assert [(r["violations"], r["sample"]) for r in comp["results"]] == [
+        (4, ["c2", "c3", "c4"]), (5, ["c1", "c2", "c3"]), (0, [])]
+    assert reports["SensorData"]["results"][0]["violations"] == 0
+
+
+def test_samples_are_queried_only_for_failing_shapes(neo):
+    ops = []
+    real = neo.query
+
+    def spy(cypher, params=None, op="query"):
+        ops.append(op)
+        return real(cypher, params, op)
+
+    neo.query = spy
+    ShapeValidator(SHAPES, sample_size=2, concurrency=1).validate(neo)
+    assert ops.count("shacl_sample:BuildingComponent") == 1 and "shacl_sample:SensorData" not in ops
+    ops.clear()
+    ShapeValidator(SHAPES, sample_size=0, concurrency=1).validate(neo)
+    assert not [o for o in ops if o.startswith("shacl_sample")]
+
+
+def test_statements_do_not_collect_ids():
+    assert "collect(" not in label_statement("BuildingComponent", SHAPES[:3])
+    q = sample_statement("BuildingComponent", SHAPES[:2], "component_id")
+    assert q.endswith("LIMIT $limit") and "NOT EXISTS { (x)-[:`MAPS_SENSOR_DATA`]->(:`SensorData`) }" in q
+
+
+def test_memory_backend_evaluates_the_statement_text(neo):
+    # No shape parameters: the handlers read label, predicates and id property from the Cypher
+    [row] = neo.query(label_statement("BuildingComponent", SHAPES[:3]))
+    assert (row["scanned"], row["n0"], row["n1"], row["n2"]) == (6, 4, 5, 0)
+    rows = neo.query(sample_statement("BuildingComponent", SHAPES[:2], "component_id"), {"limit": 2})
+    assert rows == [{"id": "c1", "v": [False, True]}, {"id": "c2", "v": [True, True]}]
+    [row] = neo.query(label_statement("SensorData", SHAPES[3:]))
+    assert row["n0"] == 0
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from utils.state_store import JsonStateStore
+
+
+def test_round_trip_and_atomic_replace(tmp_path):
+    s = JsonStateStore(str(tmp_path / "sub" / "state.json"), target="bolt://a/")
+    assert s.load() == {}
+    s.save({"wm": 5, "buffers": {"c1": [1, 2]}})
+    s.save({"wm": 7})
+    assert s.load() == {"wm": 7}
+    assert [p.name for p in (tmp_path / "sub").iterdir()] == ["state.json"]     # no leftover .tmp
+
+
+def test_state_of_another_target_is_ignored(tmp_path):
+    path = str(tmp_path / "state.json")
+    JsonStateStore(path, target="bolt://a/").save({"wm": 5})
+    assert JsonStateStore(path, target="bolt://b/").load() == {}
+    assert JsonStateStore(path, target="bolt://a/").load() == {"wm": 5}
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from utils.task_coalescing import TaskCoalescer, anomaly_epoch_s, task_id_for
+
+
+def _a(aid, ts=None, severity="HIGH", component_id=None, sensor_id=None, ts_ms=None):
+    return {"anomaly_id": aid, "ts": ts, "ts_ms": ts_ms, "severity": severity,
+            "component_id": component_id, "sensor_id": sensor_id}
+
+
+def test_timestamps_in_the_dataset_formats_parse():
+    out = anomaly_epoch_s([_a("a", "2/1/2025 12:35"), _a("b", "2/27/2025"), _a("c", "2025-02-01T12:35:00Z"),
+                           _a("d", ts_ms=1738413300000), _a("e", "not a date"), _a("f")])
+    assert out[0] == out[2] == out[3] == 1738413300.0
+    assert out[1] == 1740614400.0
+    assert out[4] is None and out[5] is None
+
+
+def test_shipped_pdm_anomalies_coalesce_by_sensor_and_window():
+    # Anomaly_Data_300.csv shape: sensor_id + "M/D/YYYY H:MM" timestamps, no component id
+    anomalies = [_a("151", "2/1/2025 12:35", sensor_id="SEN-002"),
+                 _a("153", "2/1/2025 12:45", sensor_id="SEN-001"),
+                 _a("156", "2/1/2025 13:00", sensor_id="SEN-001"),
+                 _a("159", "2/1/2025 13:15", sensor_id="SEN-001"),
+                 _a("162", "2/1/2025 14:05", sensor_id="SEN-001")]
+    groups = TaskCoalescer(window_s=3600).group(anomalies, fallback_ts=0.0)
+    by_members = sorted(sorted(g.anomaly_ids) for g in groups)
+    assert by_members == [["151"], ["153"], ["156", "159"], ["162"]]
+    g = next(g for g in groups if len(g.anomalies) == 2)
+    assert g.window_start == "2025-02-01T13:00:00+00:00"
+    assert g.task_id == task_id_for(["159", "156"])            # deterministic, order-free
+
+
+def test_severity_classes_and_group_size_split():
+    c = TaskCoalescer(window_s=3600, max_group_size=2,
+                      severity_classes={"CRITICAL": "urgent", "HIGH": "urgent", "LOW": "routine"})
+    anomalies = [_a(f"a{i}", ts_ms=1000 * i, component_id="IFC-1", severity=s)
+                 for i, s in enumerate(["HIGH", "CRITICAL", "LOW", "HIGH"])]
+    groups = c.group(anomalies, fallback_ts=0.0)
+    urgent = [g for g in groups if g.severity_class == "urgent"]
+    assert sorted(len(g.anomalies) for g in urgent) == [1, 2]
+    assert [g for g in urgent if len(g.anomalies) == 2][0].lead["severity"] == "CRITICAL"
+    assert [g.anomaly_ids for g in groups if g.severity_class == "routine"] == [["a2"]]
+
+
+def test_without_component_or_sensor_each_anomaly_is_its_own_task():
+    groups = TaskCoalescer(window_s=3600).group([_a("x", ts_ms=0), _a("y", ts_ms=0)], fallback_ts=0.0)
+    assert len(groups) == 2
+    assert len(TaskCoalescer(window_s=0).group([_a("x", ts_ms=0, component_id="c"),
+                                                _a("y", ts_ms=0, component_id="c")], fallback_ts=0.0)) == 2
+
+
+def test_groups_stay_open_across_calls_until_their_window_closes():
+    c = TaskCoalescer(window_s=3600, max_hold_s=60)
+    assert c.add([_a("a1", ts_ms=0, component_id="c")], fallback_ts=0.0, now=0.0) == []
+    assert c.add([_a("a2", ts_ms=1_000_000, component_id="c")], fallback_ts=0.0, now=1.0) == []
+    assert c.held == 2
+    # An anomaly of the next hour closes the first window
+    [g] = c.add([_a("a3", ts_ms=3_600_000, component_id="c")], fallback_ts=0.0, now=2.0)
+    assert sorted(g.anomaly_ids) == ["a1", "a2"] and c.held == 1
+    assert c.add([], fallback_ts=0.0, now=61.0) == [] and c.held == 1       # a3's group opened at 2.0
+    assert [g.anomaly_ids for g in c.add([], fallback_ts=0.0, now=62.0)] == [["a3"]]
+
+
+def test_full_groups_are_released_and_flush_empties_the_rest():
+    c = TaskCoalescer(window_s=3600, max_group_size=2, max_hold_s=60)
+    groups = c.add([_a(f"a{i}", ts_ms=i, component_id="c") for i in range(3)], fallback_ts=0.0, now=0.0)
+    assert [sorted(g.anomaly_ids) for g in groups] == [["a0", "a1"]] and c.held == 1
+    assert [g.anomaly_ids for g in c.flush()] == [["a2"]] and c.held == 0
+    assert len(TaskCoalescer(window_s=3600, max_hold_s=0).add([_a("x", ts_ms=0, component_id="c")],
+                                                               fallback_ts=0.0, now=0.0)) == 1
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from utils.window_rules import RingBuffer, WindowDetector, parse_window_rules
+
+RULES = [{"id": "rise", "kind": "rate_of_change", "metric": "temperature", "window": 3, "min_rise": 3.0},
+         {"id": "ma", "kind": "moving_average", "metric": "energy", "window": 4, "factor": 1.5}]
+
+
+def _readings(metric, values, sensor="S1", t0=0):
+    return [{"metric": metric, "value": v, "sensor_id": sensor, "ts_ms": t0 + 1000 * i} for i, v in enumerate(values)]
+
+
+def _hits(detector, readings):
+    return [(i, rule.rule_id, score, thr) for i, rule, _, score, thr in detector.process(readings)]
+
+
+def test_ring_buffer_keeps_the_last_cap_values_and_their_sum():
+    rb = RingBuffer(3)
+    for v in (1.0, 2.0, 3.0, 4.0, 5.0):
+        rb.push(v)
+    assert rb.full and rb.to_list() == [3.0, 4.0, 5.0]
+    assert (rb.oldest(), rb.newest(), rb.total, rb.mean()) == (3.0, 5.0, 12.0, 4.0)
+    assert RingBuffer.from_list(2, [1.0, 2.0, 3.0]).to_list() == [2.0, 3.0]
+
+
+def test_rate_of_change_needs_a_full_window_and_a_rise_above_the_baseline():
+    d = WindowDetector.from_config(RULES)
+    assert _hits(d, _readings("Temperature", [20, 20, 20, 25, 22])) == [(3, "rise", 5.0, 20.0)]
+
+
+def test_moving_average_and_sensors_are_independent():
+    d = WindowDetector.from_config(RULES)
+    readings = _readings("energy", [10, 10, 10, 30]) + _readings("energy", [10, 10, 30], sensor="S2")
+    # S1: mean of the window (10, 10, 10, 30) = 15, 30 > 15 * 1.5; S2 never fills its window
+    assert _hits(d, readings) == [(3, "ma", 15.0, 22.5)]
+
+
+def test_checkpoint_resumes_the_same_windows():
+    readings = _readings("temperature", [20, 20, 20, 25, 21, 26])
+    whole = _hits(WindowDetector.from_config(RULES), readings)
+
+    first = WindowDetector.from_config(RULES)
+    _hits(first, readings[:2])
+    state = json.loads(json.dumps(first.to_state()))
+    second = WindowDetector.from_config(RULES)
+    second.load_state(state)
+    assert [(i + 2, *rest) for i, *rest in _hits(second, readings[2:])] == [tuple(h) for h in whole]
+
+    changed = WindowDetector.from_config([{**RULES[0], "min_rise": 1.0}])
+    changed.load_state(state)                   # other signature: buffers start over
+    assert _hits(changed, readings[2:4]) == []
+
+
+def test_late_readings_stay_out_of_the_window():
+    d = WindowDetector.from_config(RULES)
+    readings = _readings("temperature", [20, 20, 20], t0=10_000) + _readings("temperature", [99], t0=0)
+    assert _hits(d, readings) == [] and d.late == 1
+
+
+def test_unknown_kind_and_defaults():
+    with pytest.raises(ValueError):
+        parse_window_rules([{"kind": "median", "metric": "temperature"}])
+    assert [r.anomaly_type for r in parse_window_rules(None)] == ["Rapid_Temperature_Rise",
+                                                                 "Energy_Efficiency_Degradation"]
+    assert WindowDetector.from_config([]).process(_readings("temperature", [1, 2])) == []
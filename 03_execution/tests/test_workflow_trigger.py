@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from utils.buffered_writer import BufferedWriter
+from utils.logger import RunLogger
+from utils.neo4j_helper import Neo4jHelper
+from utils.outbox import Outbox
+from utils.task_coalescing import TaskCoalescer
+from workflow_trigger_api import Q_TASK_CREATE, Q_WORKORDER_DISPATCHED, enqueue_anomalies, enqueue_pending, settle
+
+
+@pytest.fixture
+def neo():
+    h = Neo4jHelper.from_config({"backend": "memory"})
+    h.merge_nodes("Anomaly", "anomaly_id", [{"anomaly_id": a, "severity": "HIGH", "type": "T", "sensor_id": "s1",
+                                             "timestamp": "2/1/2025 13:00"} for a in ("a1", "a2")])
+    yield h
+    h.close()
+
+
+def _outcome(ok=True):
+    return {"rejected": False, "ok": ok, "error": None if ok else "boom", "retry_in_s": 0.0,
+            "t_action_start": "2025-02-01T13:00:01+00:00", "t_action_end": "2025-02-01T13:00:02+00:00",
+            "response": {}, "mock": True, "endpoint": "", "throttled_s": 0.0, "http": {}}
+
+
+def _enqueue_without_create(neo, tmp_path):
+    """enqueue, then 'crash' before the buffered MaintenanceTask / WorkOrder create reaches the graph"""
+    outbox = Outbox(str(tmp_path / "ob.sqlite"), target=neo.target)
+    created = BufferedWriter(neo, Q_TASK_CREATE, "task_create", max_rows=100, max_delay_s=0)   # never flushed
+    anomalies = [{"anomaly_id": a, "type": "T", "severity": "HIGH", "ts": "2/1/2025 13:00", "sensor_id": "s1"}
+                 for a in ("a1", "a2")]
+    enqueue_anomalies(neo, outbox, created, TaskCoalescer(window_s=3600), anomalies, "s", "m")
+    return outbox
+
+
+def test_dispatch_after_a_lost_create_still_records_task_and_workorder(neo, tmp_path):
+    outbox = _enqueue_without_create(neo, tmp_path)
+    g = neo._driver().graph
+    assert g.nodes("MaintenanceTask") == [] and g.nodes("WorkOrder") == []
+
+    [entry] = outbox.claim(10)
+    updated = BufferedWriter(neo, Q_WORKORDER_DISPATCHED, "workorder_dispatched", max_rows=100, max_delay_s=0)
+    logger = RunLogger(out_dir=str(tmp_path), scenario="s", mode="m", component="c")
+    assert settle(outbox, updated, logger, entry, _outcome()) == "done"
+    updated.flush()
+
+    t = g.find_one("MaintenanceTask", "task_id", entry.task_id)
+    wo = g.find_one("WorkOrder", "workorder_id", entry.workorder_id)
+    assert t is not None and wo is not None and g.out(t, "EXECUTES") == [wo]
+    assert g.get(t, "status") == g.get(wo, "status") == "DISPATCHED"
+    assert g.get(t, "anomaly_count") == 2 and g.get(wo, "task_id") == entry.task_id
+    for aid in ("a1", "a2"):
+        a = g.find_one("Anomaly", "anomaly_id", aid)
+        assert g.get(a, "dispatched") is True
+        assert g.out(a, "TRIGGERS") == [t] and a in g.out(wo, "DISPATCHED_FOR")
+
+
+def test_a_late_create_does_not_reset_the_dispatch_status(neo, tmp_path):
+    outbox = Outbox(str(tmp_path / "ob.sqlite"), target=neo.target)
+    created = BufferedWriter(neo, Q_TASK_CREATE, "task_create", max_rows=100, max_delay_s=0)
+    anomalies = [{"anomaly_id": "a1", "type": "T", "severity": "HIGH", "ts": "2/1/2025 13:00", "sensor_id": "s1"}]
+    enqueue_anomalies(neo, outbox, created, TaskCoalescer(window_s=3600), anomalies, "s", "m")
+    [entry] = outbox.claim(10)
+    updated = BufferedWriter(neo, Q_WORKORDER_DISPATCHED, "workorder_dispatched", max_rows=100, max_delay_s=0)
+    settle(outbox, updated, RunLogger(out_dir=str(tmp_path), scenario="s", mode="m", component="c"), entry, _outcome())
+    updated.flush()
+    created.flush()                       # the create lands after the status update
+    g = neo._driver().graph
+    assert g.get(g.find_one("WorkOrder", "workorder_id", entry.workorder_id), "status") == "DISPATCHED"
+    assert g.get(g.find_one("MaintenanceTask", "task_id", entry.task_id), "status") == "DISPATCHED"
+
+
+def test_pending_anomalies_are_reconciled_against_the_outbox(neo, tmp_path):
+    created = BufferedWriter(neo, Q_TASK_CREATE, "task_create", max_rows=100, max_delay_s=0)
+    outbox = Outbox(str(tmp_path / "ob.sqlite"), target=neo.target)
+    assert enqueue_pending(neo, outbox, created, TaskCoalescer(window_s=3600), 1, "s", "m")["candidates"] == 1
+    # Paged past a1, which the outbox already holds
+    assert enqueue_pending(neo, outbox, created, TaskCoalescer(window_s=3600), 1, "s", "m")["candidates"] == 1
+    assert enqueue_pending(neo, outbox, created, TaskCoalescer(window_s=3600), 1, "s", "m")["candidates"] == 0
+    outbox.close()
+
+    # The outbox file is lost: both undispatched anomalies are queued again
+    fresh = Outbox(str(tmp_path / "new.sqlite"), target=neo.target)
+    assert enqueue_pending(neo, fresh, created, TaskCoalescer(window_s=3600), 10, "s", "m")["enqueued"] == 1
+    assert fresh.held(["a1", "a2"]) == {"a1", "a2"}
+    fresh.close()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/buffered_writer.py
+
+緩衝批次寫入：把逐筆的 write query 累積成 `UNWIND $rows AS row ...` 一次送出。
+- 累積到 max_rows 筆 → 立即 flush；最舊一筆等待超過 max_delay_s → 背景執行緒 flush
+- depends_on：flush 時把所依賴 writer 目前緩衝的資料放在同一個 transaction、排在前面一起送出
+  （例如 WorkOrder 狀態更新之前一定先寫入建立 WorkOrder 的批次），保證寫入順序且不多一次 round-trip
+- close()：停止背景執行緒並做最後一次 flush（亦可用 with 區塊）；仍寫不進去時拋出例外
+- 寫入失敗：該次 flush 取出的資料（含 depends_on 的）放回各自 buffer 的最前面，順序不變、不遺失，由下一次
+  flush 重送；背景執行緒與 add() 觸發的 flush 失敗時不中斷（呼叫 on_error(name, exc)，計入 failures），
+  背景執行緒在 max_delay_s 後重試
+- 每次 flush 為一個 write transaction（Neo4jHelper.run_batch，UNWIND statement 依相依順序），
+  transient error 由 driver 重試
+- add() / flush() 皆 thread-safe，可由多個派發執行緒共用
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.neo4j_helper import Neo4jHelper
+
+class BufferedWriter:
+    def __init__(self, neo: Neo4jHelper, cypher: str, name: str = "", max_rows: int = 500,
+                 max_delay_s: float = 0.5, depends_on: Optional["BufferedWriter"] = None,
+                 on_error: Optional[Callable[[str, BaseException], None]] = None):
+        self.neo = neo
+        self.cypher = cypher
+        self.name = name
+        self.max_rows = max(int(max_rows), 1)
+        self.max_delay_s = float(max_delay_s)
+        self.depends_on = depends_on
+        self.on_error = on_error
+        self.flushes = 0
+        self.failures = 0
+        self.transactions = 0
+        self.rows_written = 0
+        self.write_s = 0.0
+        self._buf: List[Dict[str, Any]] = []
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()         # guards _buf
+        self._flush_lock = threading.Lock()   # one flush at a time; taken dependency-first
+        self._stop = threading.Event()
+        self._timer: Optional[threading.Thread] = None
+        if self.max_delay_s > 0:
+            self._timer = threading.Thread(target=self._run_timer, name=f"flush-{name}", daemon=True)
+            self._timer.start()
+
+    def __enter__(self) -> "BufferedWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, row: Dict[str, Any]):
+        with self._lock:
+            self._buf.append(row)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = len(self._buf) >= self.max_rows
+        if full:
+            self._try_flush(min_rows=self.max_rows)
+
+    def _chain(self) -> List["BufferedWriter"]:
+        return (self.depends_on._chain() if self.depends_on is not None else []) + [self]
+
+    def flush(self, min_rows: int = 0) -> int:
+        """
+        Write everything buffered so far, together with (and after) the writers this one depends on,
+        in one transaction; returns rows written. min_rows skips the flush if, once it is this
+        flush's turn, another thread has already drained the buffer below that size.
+        """
+        chain = self._chain()
+        for w in chain:
+            w._flush_lock.acquire()
+        try:
+            if min_rows and len(self._buf) < min_rows:
+                return 0
+            batches = []
+            for w in chain:
+                with w._lock:
+                    rows, oldest, w._buf, w._oldest = w._buf, w._oldest, [], None
+                if rows:
+                    batches.append((w, rows, oldest))
+            if not batches:
+                return 0
+            t0 = time.perf_counter()
+            try:
+                self.neo.run_batch([(w.cypher, {"rows": rows}) for w, rows, _ in batches])
+            except Exception:
+                # Back in front of whatever was added meanwhile: nothing is lost and the order holds
+                for w, rows, oldest in batches:
+                    with w._lock:
+                        w._buf = rows + w._buf
+                        w._oldest = oldest if w._oldest is None else min(oldest, w._oldest)
+                self.failures += 1
+                raise
+            elapsed = time.perf_counter() - t0
+            self.transactions += 1
+            for w, rows, _ in batches:
+                w.flushes += 1
+                w.rows_written += len(rows)
+                w.write_s += elapsed
+            return sum(len(rows) for _, rows, _ in batches)
+        finally:
+            for w in reversed(chain):
+                w._flush_lock.release()
+
+    def _try_flush(self, min_rows: int = 0) -> bool:
+        """flush() that reports a failure to on_error instead of raising (the rows stay buffered)."""
+        try:
+            self.flush(min_rows=min_rows)
+            return True
+        except Exception as e:
+            if self.on_error is not None:
+                self.on_error(self.name, e)
+            return False
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._buf)
+
+    def _run_timer(self):
+        tick = max(self.max_delay_s / 4, 0.01)
+        wait_s = tick
+        while not self._stop.wait(wait_s):
+            wait_s = tick
+            with self._lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= self.max_delay_s
+            if due and not self._try_flush():
+                wait_s = max(self.max_delay_s, tick)     # back off before retrying the same rows
+
+    def close(self):
+        self._stop.set()
+        if self._timer is not None:
+            self._timer.join()
+            self._timer = None
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"writer": self.name, "rows": self.rows_written, "flushes": self.flushes,
+                "transactions": self.transactions, "failures": self.failures, "pending": self.pending(),
+                "write_s": round(self.write_s, 6)}
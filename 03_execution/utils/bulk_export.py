@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/bulk_export.py
+
+離線批次匯入（bulk import）產物：
+- nodes_<Label>.csv            header 帶型別（`key:ID(space)`、`value:double` ...），供 neo4j-admin 使用
+- rels_<TYPE>_<Src>_<Tgt>.csv  `:START_ID(space)` / `:END_ID(space)`
+- import.sh                    `neo4j-admin database import full`（全新資料庫，最快）
+- load_csv.cypher              同一批檔案的 `LOAD CSV ... CALL { } IN TRANSACTIONS`（既有資料庫；
+                               Neo4j 5 以此取代舊版 USING PERIODIC COMMIT）
+
+檔案以 append 方式逐 chunk 寫入，因此可與 ETL 串流模式搭配，記憶體上限仍由 chunk 大小決定。
+型別由每個檔案的第一個 chunk 推斷（整數 → long、浮點 → double、布林 → boolean、其餘 → string）。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+_CYPHER_CAST = {"long": "toInteger", "double": "toFloat", "boolean": "toBoolean"}
+
+def _neo_type(s: pd.Series) -> str:
+    kind = pd.api.types.infer_dtype(s, skipna=True)
+    if kind == "boolean":
+        return "boolean"
+    if kind == "integer":
+        return "long"
+    if kind in ("floating", "mixed-integer-float", "decimal"):
+        return "double"
+    return "string"
+
+@dataclass
+class _NodeFile:
+    label: str
+    key: str
+    id_space: str
+    path: Path
+    props: List[Tuple[str, str]]           # (property, neo4j type), key first
+    rows: int = 0
+
+    def header(self) -> List[str]:
+        out = []
+        for prop, typ in self.props:
+            if prop == self.key:
+                out.append(f"{prop}:ID({self.id_space})")
+            else:
+                out.append(prop if typ == "string" else f"{prop}:{typ}")
+        return out
+
+@dataclass
+class _RelFile:
+    rel_type: str
+    src_label: str
+    src_key: str
+    src_space: str
+    tgt_label: str
+    tgt_key: str
+    tgt_space: str
+    path: Path
+    props: List[Tuple[str, str]] = field(default_factory=list)
+    rows: int = 0
+
+    def header(self) -> List[str]:
+        return [f":START_ID({self.src_space})", f":END_ID({self.tgt_space})"] + [
+            p if t == "string" else f"{p}:{t}" for p, t in self.props
+        ]
+
+class BulkExporter:
+    def __init__(self, out_dir: str):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._nodes: Dict[str, _NodeFile] = {}
+        self._rels: Dict[Tuple[str, str, str], _RelFile] = {}
+
+    # -----------------------------
+    # Data files
+    # -----------------------------
+    def add_nodes(self, label: str, key: str, frame: pd.DataFrame, id_space: Optional[str] = None):
+        if frame.empty:
+            return
+        nf = self._nodes.get(label)
+        if nf is None:
+            cols = [key] + [c for c in frame.columns if c != key]
+            nf = _NodeFile(label, key, id_space or label, self.out_dir / f"nodes_{label}.csv",
+                           [(c, _neo_type(frame[c])) for c in cols])
+            self._nodes[label] = nf
+            pd.DataFrame(columns=nf.header()).to_csv(nf.path, index=False, encoding="utf-8")
+        out = frame[[p for p, _ in nf.props]]
+        out.to_csv(nf.path, mode="a", header=False, index=False, encoding="utf-8")
+        nf.rows += len(out)
+
+    def add_rels(self, rel_type: str, src_label: str, src_key: str, tgt_label: str, tgt_key: str,
+                 frame: pd.DataFrame, src_space: Optional[str] = None, tgt_space: Optional[str] = None):
+        """frame: columns src, tgt (+ optional relationship properties)."""
+        if frame.empty:
+            return
+        k = (rel_type, src_label, tgt_label)
+        rf = self._rels.get(k)
+        if rf is None:
+            props = [(c, _neo_type(frame[c])) for c in frame.columns if c not in ("src", "tgt")]
+            rf = _RelFile(rel_type, src_label, src_key, src_space or src_label,
+                          tgt_label, tgt_key, tgt_space or tgt_label,
+                          self.out_dir / f"rels_{rel_type}_{src_label}_{tgt_label}.csv", props)
+            self._rels[k] = rf
+            pd.DataFrame(columns=rf.header()).to_csv(rf.path, index=False, encoding="utf-8")
+        out = frame[["src", "tgt"] + [p for p, _ in rf.props]]
+        out.to_csv(rf.path, mode="a", header=False, index=False, encoding="utf-8")
+        rf.rows += len(out)
+
+    # -----------------------------
+    # Scripts
+    # -----------------------------
+    def _import_sh(self, database: str) -> str:
+        lines = [
+            "#!/usr/bin/env bash",
+            "# Offline bulk load into a NEW/EMPTY database (stop the database first).",
+            "set -euo pipefail",
+            'cd "$(dirname "$0")"',
+            f"neo4j-admin database import full {database} \\",
+            "  --overwrite-destination \\",
+            "  --skip-duplicate-nodes \\",
+            "  --skip-bad-relationships \\",
+        ]
+        args = [f"  --nodes={nf.label}={nf.path.name}" for nf in self._nodes.values()]
+        args += [f"  --relationships={rf.rel_type}={rf.path.name}" for rf in self._rels.values()]
+        lines += [a + " \\" for a in args[:-1]] + args[-1:]
+        return "\n".join(lines) + "\n"
+
+    def _load_csv_cypher(self, batch_rows: int) -> str:
+        out = [
+            "// LOAD CSV equivalent of import.sh for an EXISTING database.",
+            "// Copy the CSV files into the Neo4j import directory, then run with cypher-shell",
+            "// (or prefix each statement with :auto in Neo4j Browser).",
+            "",
+        ]
+        for nf in self._nodes.values():
+            out.append(f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:{nf.label}) REQUIRE n.{nf.key} IS UNIQUE;")
+        out.append("")
+        for nf in self._nodes.values():
+            hdr = nf.header()
+            sets = []
+            for (prop, typ), h in zip(nf.props, hdr):
+                if prop == nf.key:
+                    continue
+                val = f"row.`{h}`"
+                sets.append(f"n.{prop} = {_CYPHER_CAST[typ]}({val})" if typ in _CYPHER_CAST else f"n.{prop} = {val}")
+            out += [
+                f"LOAD CSV WITH HEADERS FROM 'file:///{nf.path.name}' AS row",
+                "CALL {",
+                "  WITH row",
+                f"  MERGE (n:{nf.label} {{{nf.key}: row.`{hdr[0]}`}})",
+            ] + ([f"  SET {', '.join(sets)}"] if sets else []) + [
+                f"}} IN TRANSACTIONS OF {batch_rows} ROWS;",
+                "",
+            ]
+        for rf in self._rels.values():
+            hdr = rf.header()
+            sets = []
+            for (prop, typ), h in zip(rf.props, hdr[2:]):
+                val = f"row.`{h}`"
+                sets.append(f"r.{prop} = {_CYPHER_CAST[typ]}({val})" if typ in _CYPHER_CAST else f"r.{prop} = {val}")
+            out += [
+                f"LOAD CSV WITH HEADERS FROM 'file:///{rf.path.name}' AS row",
+                "CALL {",
+                "  WITH row",
+                f"  MATCH (s:{rf.src_label} {{{rf.src_key}: row.`{hdr[0]}`}})",
+                f"  MATCH (t:{rf.tgt_label} {{{rf.tgt_key}: row.`{hdr[1]}`}})",
+                f"  MERGE (s)-[r:{rf.rel_type}]->(t)",
+            ] + ([f"  SET {', '.join(sets)}"] if sets else []) + [
+                f"}} IN TRANSACTIONS OF {batch_rows} ROWS;",
+                "",
+            ]
+        return "\n".join(out)
+
+    def finish(self, database: str = "neo4j", batch_rows: int = 10000) -> Dict[str, object]:
+        """Write import.sh + load_csv.cypher and return a summary for the run log."""
+        if not self._nodes and not self._rels:
+            return {"out_dir": str(self.out_dir), "nodes": {}, "relationships": {}}
+        sh = self.out_dir / "import.sh"
+        sh.write_text(self._import_sh(database), encoding="utf-8")
+        sh.chmod(0o755)
+        (self.out_dir / "load_csv.cypher").write_text(self._load_csv_cypher(batch_rows), encoding="utf-8")
+        return {
+            "out_dir": str(self.out_dir),
+            "nodes": {nf.label: nf.rows for nf in self._nodes.values()},
+            "relationships": {rf.path.name: rf.rows for rf in self._rels.values()},
+        }
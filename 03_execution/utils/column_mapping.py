@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/column_mapping.py
+
+ETL 欄位對映層（column-mapping layer）：
+- 以宣告式 spec 描述每個 label / 關係型別由哪些 CSV 欄位組成
+- 以「整欄」方式 rename / strip / cast（不使用 iterrows）
+- 直接由 DataFrame 產出 merge_nodes / merge_rels 所需的參數批次
+- 已建模的 graph CSV（Carbon_SIDCM：node_type / relationship_type 欄位決定 label / 關係型別）
+
+欄位名稱可由 config 的 `mapping` 覆寫（key 與原本 ETL 相同，例如
+mapping.component_id = "GlobalId"），未覆寫時使用 spec 內的預設欄名。
+
+欄位種類（FieldSpec.kind）：
+- "id"  ：業務主鍵，轉字串並 strip；缺值時依 NodeSpec.id_prefix 補 `{prefix}_{row_index}`，
+          若 id_prefix 為 None 則整列略過
+- "str" ：轉字串（缺欄或缺值 → ""）
+- "raw" ：保留原始值（缺欄或缺值 → None）
+- "epoch_ms"：解析為 UTC epoch 毫秒（int；無法解析 → None），供排序 / 時間窗查詢使用
+
+NodeSpec.sequenced=True 的 label（PerformanceData）在匯入時另由 ETL 加上單調遞增的
+`ingest_seq`，作為增量異常偵測的 watermark。
+
+spec_digest(spec, mapping)：spec 定義與實際生效的來源欄名（含 mapping 覆寫、關係型別改名）的 hash，
+ETL manifest 以「檔案 sha256 + spec_digest」判斷整檔是否可略過——只改 mapping 或 spec 時也會重新對映匯入。
+對映 / 轉型邏輯本身改變（輸出不同）時請遞增 MAPPING_VERSION。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+MAPPING_VERSION = 1
+
+@dataclass(frozen=True)
+class FieldSpec:
+    prop: str           # Neo4j property name
+    mapping_key: str    # key in cfg["mapping"]
+    default_col: str    # source column when not overridden
+    kind: str = "str"   # id / str / raw / epoch_ms
+
+@dataclass(frozen=True)
+class NodeSpec:
+    label: str
+    key: str                        # merge key property (must be an "id" field)
+    fields: Tuple[FieldSpec, ...]
+    id_prefix: Optional[str]        # fallback id prefix; None -> drop rows without id
+    subdir: str                     # dataset sub-folder (raw / processed / ...)
+    file_key: str                   # key in cfg["files"]
+    default_file: str
+    sequenced: bool = False         # stamp ingest_seq at load time (watermark for detection)
+
+    def key_field(self) -> FieldSpec:
+        return next(f for f in self.fields if f.prop == self.key)
+
+@dataclass(frozen=True)
+class RelSpec:
+    rel_type: str
+    src_label: str
+    src_key: str
+    tgt_label: str
+    tgt_key: str
+    src: FieldSpec
+    tgt: FieldSpec
+    subdir: str
+    file_key: str
+    default_file: str
+    rel_type_mapping_key: Optional[str] = None   # allow cfg["mapping"] to rename the type
+
+    def resolved_type(self, mapping: Dict[str, Any]) -> str:
+        if self.rel_type_mapping_key:
+            return mapping.get(self.rel_type_mapping_key, self.rel_type)
+        return self.rel_type
+
+# -----------------------------
+# PdM_HVAC specs (same defaults as the original per-label ETL blocks)
+# -----------------------------
+PDM_NODE_SPECS: Tuple[NodeSpec, ...] = (
+    NodeSpec("BuildingComponent", "component_id", (
+        FieldSpec("component_id", "component_id", "ComponentId", "id"),
+        FieldSpec("name", "component_name", "Name"),
+        FieldSpec("type", "component_type", "Type"),
+    ), None, "raw", "assets", "BuildingComponent_Dataset.csv"),
+    NodeSpec("SensorData", "sensor_data_id", (
+        FieldSpec("sensor_data_id", "sensor_data_id", "SensorDataId", "id"),
+        FieldSpec("sensor_id", "sensor_id", "SensorId"),
+        FieldSpec("timestamp", "sensor_timestamp", "Timestamp"),
+        FieldSpec("value", "sensor_value", "Value", "raw"),
+    ), "sd", "raw", "sensor", "Sensor_Data_300.csv"),
+    NodeSpec("PerformanceData", "performance_id", (
+        FieldSpec("performance_id", "performance_id", "PerformanceId", "id"),
+        FieldSpec("sensor_id", "sensor_id", "SensorId"),
+        FieldSpec("component_id", "component_id", "ComponentId"),
+        FieldSpec("timestamp", "performance_timestamp", "Timestamp"),
+        FieldSpec("metric", "performance_metric", "Metric"),
+        FieldSpec("value", "performance_value", "Value", "raw"),
+        FieldSpec("ts_ms", "performance_timestamp", "Timestamp", "epoch_ms"),
+    ), "pd", "processed", "performance", "Performance_Data_300.csv", sequenced=True),
+    NodeSpec("Anomaly", "anomaly_id", (
+        FieldSpec("anomaly_id", "anomaly_id", "AnomalyId", "id"),
+        FieldSpec("timestamp", "anomaly_timestamp", "Timestamp"),
+        FieldSpec("type", "anomaly_type", "Type"),
+        FieldSpec("severity", "anomaly_severity", "Severity"),
+        FieldSpec("component_id", "component_id", "ComponentId"),
+        FieldSpec("sensor_id", "sensor_id", "SensorId"),
+    ), "a", "processed", "anomaly", "Anomaly_Data_300.csv"),
+    NodeSpec("MaintenanceTask", "task_id", (
+        FieldSpec("task_id", "task_id", "TaskId", "id"),
+        FieldSpec("type", "task_type", "TaskType"),
+        FieldSpec("priority", "task_priority", "Priority"),
+        FieldSpec("component_id", "component_id", "ComponentId"),
+    ), "t", "tasks", "tasks", "MaintenanceTasks_Generated.csv"),
+    NodeSpec("Person", "person_id", (
+        FieldSpec("person_id", "person_id", "ActorId", "id"),
+        FieldSpec("name", "person_name", "Name"),
+        FieldSpec("role", "person_role", "Role"),
+    ), "p", "actors", "actors", "Actors.csv"),
+)
+
+PDM_REL_SPECS: Tuple[RelSpec, ...] = (
+    # (BuildingComponent)-[:MAPS_SENSOR_DATA]->(SensorData)
+    RelSpec("MAPS_SENSOR_DATA", "BuildingComponent", "component_id", "SensorData", "sensor_data_id",
+            FieldSpec("src", "src_component_id", "ComponentId", "id"),
+            FieldSpec("tgt", "tgt_sensor_data_id", "SensorDataId", "id"),
+            "edges", "edge_maps", "Edge_MAPS_SENSOR_DATA.csv"),
+    # Labels are not in the edge file; assume the common pattern PerformanceData -> Anomaly
+    RelSpec("GENERATES", "PerformanceData", "performance_id", "Anomaly", "anomaly_id",
+            FieldSpec("src", "src_id", "SRC", "id"),
+            FieldSpec("tgt", "tgt_id", "TGT", "id"),
+            "edges", "edge_generates", "Edge_GENERATES.csv",
+            rel_type_mapping_key="rel_type"),
+)
+
+# -----------------------------
+# Pre-modelled graph CSVs (Carbon_SIDCM processed layer)
+# -----------------------------
+@dataclass(frozen=True)
+class GraphCsvSpec:
+    """One node file with a label column + one edge file with a type column; all ids share one id space."""
+    id_space: str
+    subdir: str
+    nodes_file_key: str
+    nodes_default_file: str
+    node_id_col: str
+    node_label_col: str
+    rels_file_key: str
+    rels_default_file: str
+    src_col: str
+    tgt_col: str
+    type_col: str
+
+CARBON_GRAPH_SPEC = GraphCsvSpec(
+    "Carbon", "processed",
+    "graph_nodes", "SIDCM_Graph_Nodes_demo.csv", "node_id", "node_type",
+    "graph_relationships", "SIDCM_Graph_Relationships_demo.csv", "source_id", "target_id", "relationship_type",
+)
+
+GRAPH_CSV_SPECS: Dict[str, GraphCsvSpec] = {"Carbon_SIDCM": CARBON_GRAPH_SPEC}
+
+# -----------------------------
+# Column casts (whole-column)
+# -----------------------------
+def map_str(s: pd.Series) -> pd.Series:
+    """Whole-column string cast; missing cells become ""."""
+    return s.astype(object).where(s.notna(), "").astype(str)
+
+def _as_raw(s: pd.Series) -> pd.Series:
+    return s.astype(object).where(s.notna(), None)
+
+_EPOCH = pd.Timestamp("1970-01-01", tz="UTC")
+
+def map_epoch_ms(s: pd.Series) -> pd.Series:
+    """Whole-column timestamp parse to UTC epoch milliseconds; unparseable cells become None."""
+    dt = pd.to_datetime(s.astype(object).where(s.notna(), None), errors="coerce", utc=True, format="mixed")
+    ms = ((dt - _EPOCH) // pd.Timedelta(milliseconds=1)).astype("Int64")
+    return pd.Series([None if v is pd.NA else int(v) for v in ms], index=s.index, dtype=object)
+
+def _source(df: pd.DataFrame, f: FieldSpec, mapping: Dict[str, Any]) -> Optional[pd.Series]:
+    col = mapping.get(f.mapping_key, f.default_col)
+    return df[col] if col in df.columns else None
+
+def spec_digest(spec: Union[NodeSpec, RelSpec], mapping: Dict[str, Any]) -> str:
+    """Hash of the spec and of the source columns / type it resolves to under `mapping`."""
+    fields = spec.fields if isinstance(spec, NodeSpec) else (spec.src, spec.tgt)
+    effective = {
+        "version": MAPPING_VERSION,
+        "spec": asdict(spec),
+        "columns": {f.prop: mapping.get(f.mapping_key, f.default_col) for f in fields},
+        "rel_type": spec.resolved_type(mapping) if isinstance(spec, RelSpec) else None,
+    }
+    return hashlib.sha1(json.dumps(effective, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+def map_nodes(df: pd.DataFrame, spec: NodeSpec, mapping: Dict[str, Any]) -> pd.DataFrame:
+    """Map a raw CSV frame to a frame whose columns are the spec's Neo4j properties."""
+    out = pd.DataFrame(index=df.index)
+    for f in spec.fields:
+        src = _source(df, f, mapping)
+        if f.kind == "raw":
+            out[f.prop] = _as_raw(src) if src is not None else None
+            continue
+        if f.kind == "epoch_ms":
+            out[f.prop] = map_epoch_ms(src) if src is not None else None
+            continue
+        col = map_str(src) if src is not None else pd.Series("", index=df.index, dtype=object)
+        if f.kind == "id":
+            col = col.str.strip()
+        out[f.prop] = col
+
+    kid = spec.key
+    missing = out[kid] == ""
+    if missing.any():
+        if spec.id_prefix is None:
+            out = out[~missing]
+        else:
+            out.loc[missing, kid] = spec.id_prefix + "_" + out.index[missing].astype(str)
+    return out
+
+def map_rels(df: pd.DataFrame, spec: RelSpec, mapping: Dict[str, Any]) -> pd.DataFrame:
+    """Map an edge CSV frame to a two-column (src, tgt) frame, dropping incomplete pairs."""
+    out = pd.DataFrame(index=df.index)
+    for f in (spec.src, spec.tgt):
+        src = _source(df, f, mapping)
+        out[f.prop] = map_str(src).str.strip() if src is not None else ""
+    return out[(out["src"] != "") & (out["tgt"] != "")]
+
+def node_params(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Parameter rows for Neo4jHelper.merge_nodes."""
+    return frame.to_dict("records")
+
+def rel_params(frame: pd.DataFrame) -> List[List[str]]:
+    """Parameter pairs for Neo4jHelper.merge_rels."""
+    return frame[["src", "tgt"]].values.tolist()
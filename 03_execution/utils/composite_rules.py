@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/composite_rules.py
+
+複合規則（對應 reasoning_examples.cypher 的 1. Composite_Temp_Energy_Overload）：
+同一 component 的溫度讀值與能耗讀值「同時」高於該 component 的平均值。
+
+原 Cypher 先把同 component 的每筆溫度 × 每筆能耗配對，再以 td.timestamp = ed.timestamp 過濾，
+等同每個 component 一個 Cartesian product。這裡改為 hash join：
+- 兩側讀值依 (component_id, ts_ms // slot_ms) 放入 bucket（hash table）
+- 每筆新讀值只 probe 對側在容許範圍內的 bucket（tolerance_ms=0 → 同一 slot；>0 → 另外接受
+  |Δts| <= tolerance_ms 的相鄰 slot），因此成本與讀值數呈線性
+- 「高於平均」以每個 (component, metric) 的累計平均（O(1) 更新）作為 c.avg_temp / c.avg_energy
+- 跨頁 / 跨執行：bucket 只保留最近 retention_slots 個 slot，與累計平均一起 checkpoint
+
+Config（anomaly_composite_rules，省略時使用預設規則；設為 [] 可關閉）：
+    anomaly_composite_rules:
+      - id: composite_temp_energy_overload
+        left_metric: temperature
+        right_metric: energy
+        slot_ms: 60000
+        tolerance_ms: 0
+        retention_slots: 60
+
+沒有 ts_ms（ETL 無法解析 timestamp）或 component_id 的讀值不參與 join（計入 skipped）。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.rule_engine import parse_numeric
+
+DEFAULT_COMPOSITE_RULES: List[Dict[str, Any]] = [
+    {"id": "composite_temp_energy_overload", "left_metric": "temperature", "right_metric": "energy",
+     "slot_ms": 60000, "tolerance_ms": 0, "retention_slots": 60},
+]
+
+# Bucket entry: [performance_id, ts_ms, value, excess over the component mean, timestamp]
+Entry = List[Any]
+
+@dataclass(frozen=True)
+class CompositeRule:
+    rule_id: str
+    left_metric: str
+    right_metric: str
+    slot_ms: int = 60000
+    tolerance_ms: int = 0
+    retention_slots: int = 60
+    severity: str = "HIGH"
+    version: str = "1"
+    anomaly_type: str = "Composite_Temp_Energy_Overload"
+
+    def signature(self) -> str:
+        return f"{self.left_metric}|{self.right_metric}|{self.slot_ms}|{self.tolerance_ms}|{self.version}"
+
+def parse_composite_rules(cfg_rules: Any) -> List[CompositeRule]:
+    if cfg_rules is None:
+        cfg_rules = DEFAULT_COMPOSITE_RULES
+    rules = []
+    for i, r in enumerate(cfg_rules):
+        slot_ms = max(int(r.get("slot_ms", 60000)), 1)
+        rules.append(CompositeRule(
+            rule_id=str(r.get("id", f"composite_{i}")),
+            left_metric=str(r["left_metric"]).strip().lower(),
+            right_metric=str(r["right_metric"]).strip().lower(),
+            slot_ms=slot_ms,
+            tolerance_ms=max(int(r.get("tolerance_ms", 0)), 0),
+            retention_slots=max(int(r.get("retention_slots", 60)), 1),
+            severity=str(r.get("severity", "HIGH")),
+            version=str(r.get("version", "1")),
+            anomaly_type=str(r.get("anomaly_type", "Composite_Temp_Energy_Overload")),
+        ))
+    return rules
+
+def _copy_bucket(bucket: Dict[str, List[Entry]]) -> Dict[str, List[Entry]]:
+    return {side: [list(e) for e in entries] for side, entries in bucket.items()}
+
+class _JoinState:
+    def __init__(self):
+        self.means: Dict[str, List[float]] = {}                 # "comp|metric" -> [n, mean]
+        self.buckets: Dict[Tuple[str, int], Dict[str, List[Entry]]] = {}
+        self.max_slot: Optional[int] = None
+
+    # Copies on both sides: _excess / process mutate means and buckets in place, and detect_and_write
+    # restores a pre-page snapshot after a failed write
+    def to_dict(self) -> Dict[str, Any]:
+        return {"means": {k: list(v) for k, v in self.means.items()}, "max_slot": self.max_slot,
+                "buckets": [[c, s, _copy_bucket(b)] for (c, s), b in self.buckets.items()]}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "_JoinState":
+        st = cls()
+        st.means = {k: list(v) for k, v in d.get("means", {}).items()}
+        st.max_slot = d.get("max_slot")
+        st.buckets = {(c, int(s)): _copy_bucket(b) for c, s, b in d.get("buckets", [])}
+        return st
+
+class CompositeJoin:
+    """Streaming symmetric hash join of two metrics per component on aligned time slots."""
+
+    def __init__(self, rules: Sequence[CompositeRule]):
+        self.rules = list(rules)
+        self.metrics = sorted({m for r in self.rules for m in (r.left_metric, r.right_metric)})
+        self._state: Dict[str, _JoinState] = {r.rule_id: _JoinState() for r in self.rules}
+        self.skipped = 0
+
+    @classmethod
+    def from_config(cls, cfg_rules: Any) -> "CompositeJoin":
+        return cls(parse_composite_rules(cfg_rules))
+
+    @staticmethod
+    def _excess(st: _JoinState, comp: str, metric: str, v: float) -> Optional[float]:
+        """v minus the component's running mean for this metric (None on the first reading); updates the mean."""
+        k = f"{comp}|{metric}"
+        nm = st.means.get(k)
+        if nm is None:
+            st.means[k] = [1, v]
+            return None
+        excess = v - nm[1]
+        nm[0] += 1
+        nm[1] += (v - nm[1]) / nm[0]
+        return excess
+
+    def process(self, readings: Sequence[Dict[str, Any]]) -> List[Tuple[int, CompositeRule, Entry, Entry]]:
+        """Returns (reading index of the later arrival, rule, left entry, right entry) per joined pair."""
+        if not readings or not self.rules:
+            return []
+        values = parse_numeric([r.get("value") for r in readings])
+        hits = []
+        for rule in self.rules:
+            st = self._state[rule.rule_id]
+            for i, r in enumerate(readings):
+                metric = str(r.get("metric", "")).strip().lower()
+                if metric == rule.left_metric:
+                    side, other = "L", "R"
+                elif metric == rule.right_metric:
+                    side, other = "R", "L"
+                else:
+                    continue
+                v, ts, comp = values[i], r.get("ts_ms"), r.get("component_id")
+                if v != v or ts is None or not comp:
+                    self.skipped += 1
+                    continue
+                ts = int(ts)
+                slot = ts // rule.slot_ms
+                if st.max_slot is not None and slot < st.max_slot - rule.retention_slots:
+                    self.skipped += 1                    # older than anything still buffered
+                    continue
+                excess = self._excess(st, comp, metric, float(v))
+                if excess is None or excess <= 0:
+                    continue
+                entry: Entry = [r.get("performance_id"), ts, float(v), excess, r.get("timestamp")]
+                lo = (ts - rule.tolerance_ms) // rule.slot_ms
+                hi = (ts + rule.tolerance_ms) // rule.slot_ms
+                for s in range(lo, hi + 1):
+                    bucket = st.buckets.get((comp, s))
+                    if not bucket:
+                        continue
+                    for e in bucket.get(other, ()):
+                        if s != slot and abs(e[1] - ts) > rule.tolerance_ms:
+                            continue
+                        left, right = (entry, e) if side == "L" else (e, entry)
+                        hits.append((i, rule, left, right))
+                st.buckets.setdefault((comp, slot), {}).setdefault(side, []).append(entry)
+                st.max_slot = slot if st.max_slot is None else max(st.max_slot, slot)
+            self._evict(rule, st)
+        return hits
+
+    @staticmethod
+    def _evict(rule: CompositeRule, st: _JoinState):
+        if st.max_slot is None:
+            return
+        horizon = st.max_slot - rule.retention_slots
+        for k in [k for k in st.buckets if k[1] < horizon]:
+            del st.buckets[k]
+
+    # ---- checkpoint
+    def to_state(self) -> Dict[str, Any]:
+        return {r.rule_id: {"sig": r.signature(), "join": self._state[r.rule_id].to_dict()} for r in self.rules}
+
+    def load_state(self, state: Dict[str, Any]):
+        for r in self.rules:
+            saved = state.get(r.rule_id)
+            if saved and saved.get("sig") == r.signature():
+                self._state[r.rule_id] = _JoinState.from_dict(saved.get("join", {}))
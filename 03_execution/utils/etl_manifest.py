@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/etl_manifest.py
+
+增量匯入用的 manifest（SQLite，單一檔案）：
+- files：每個輸入檔最後一次「完整匯入成功」時的 sha256
+- rows ：每列的內容指紋（content fingerprint），以 (label, 業務主鍵) 為 key
+
+ETL 使用方式：
+1. 檔案 sha256 與 manifest 相同 → 整個檔案略過
+2. 否則逐 chunk 計算指紋，只把「新列或內容已變更的列」送進 Neo4j
+3. 寫入成功後才更新 rows；整個檔案完成後才更新 files（中途失敗可安全重跑）
+
+manifest 綁定匯入目標（neo4j uri + database）；目標改變時自動清空，避免把
+「另一個資料庫已有的資料」誤判為不需匯入。
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+def row_fingerprints(frame: pd.DataFrame) -> np.ndarray:
+    """Deterministic 64-bit content hash per row (stable across runs for the same values)."""
+    if frame.empty:
+        return np.empty(0, dtype=np.int64)
+    return pd.util.hash_pandas_object(frame.astype(object), index=False).to_numpy().view(np.int64)
+
+class EtlManifest:
+    def __init__(self, path: str, target: str = ""):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT);
+            CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, sha256 TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS rows (
+                label TEXT NOT NULL, key TEXT NOT NULL, fp INTEGER NOT NULL,
+                PRIMARY KEY (label, key)
+            ) WITHOUT ROWID;
+        """)
+        cur = self._con.execute("SELECT v FROM meta WHERE k='target'").fetchone()
+        if cur is None or cur[0] != target:
+            self._con.executescript("DELETE FROM files; DELETE FROM rows;")
+            self._con.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('target', ?)", (target,))
+        self._con.commit()
+
+    # -----------------------------
+    # File level
+    # -----------------------------
+    def file_unchanged(self, name: str, sha256: str) -> bool:
+        with self._lock:
+            cur = self._con.execute("SELECT sha256 FROM files WHERE name=?", (name,)).fetchone()
+        return cur is not None and cur[0] == sha256
+
+    def record_file(self, name: str, sha256: str):
+        with self._lock:
+            self._con.execute("INSERT OR REPLACE INTO files (name, sha256) VALUES (?, ?)", (name, sha256))
+            self._con.commit()
+
+    # -----------------------------
+    # Row level
+    # -----------------------------
+    def changed_mask(self, label: str, keys: pd.Series, fps: np.ndarray) -> np.ndarray:
+        """True for rows whose key is unknown or whose fingerprint differs from the manifest."""
+        if len(keys) == 0:
+            return np.zeros(0, dtype=bool)
+        with self._lock:
+            con = self._con
+            con.execute("CREATE TEMP TABLE IF NOT EXISTS probe (pos INTEGER PRIMARY KEY, key TEXT, fp INTEGER)")
+            con.execute("DELETE FROM probe")
+            con.executemany("INSERT INTO probe (pos, key, fp) VALUES (?, ?, ?)",
+                            zip(range(len(keys)), keys.astype(str).tolist(), fps.tolist()))
+            stale = con.execute("""
+                SELECT p.pos FROM probe p
+                LEFT JOIN rows r ON r.label = ? AND r.key = p.key
+                WHERE r.fp IS NULL OR r.fp != p.fp
+            """, (label,)).fetchall()
+            con.execute("DELETE FROM probe")
+        mask = np.zeros(len(keys), dtype=bool)
+        if stale:
+            mask[np.fromiter((p for (p,) in stale), dtype=np.int64, count=len(stale))] = True
+        return mask
+
+    def record_rows(self, label: str, keys: pd.Series, fps: np.ndarray):
+        if len(keys) == 0:
+            return
+        with self._lock:
+            self._con.executemany(
+                "INSERT OR REPLACE INTO rows (label, key, fp) VALUES (?, ?, ?)",
+                zip([label] * len(keys), keys.astype(str).tolist(), fps.tolist()),
+            )
+            self._con.commit()
+
+    def reset(self):
+        """Forget everything (used by a forced full re-import)."""
+        with self._lock:
+            self._con.executescript("DELETE FROM files; DELETE FROM rows;")
+            self._con.commit()
+
+    def close(self):
+        with self._lock:
+            self._con.close()
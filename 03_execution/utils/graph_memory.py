@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/graph_memory.py
+
+內嵌（in-process）property graph 測試替身，實作 Neo4jHelper 所使用的 driver 介面
+（driver.session() → session.run() / execute_write() / execute_read()，result.consume()）。
+用途：在沒有 Neo4j server 的環境（單元測試、profiling、離線 benchmark）以記憶體速度執行
+ETL → 異常偵測 → 工作流派發整條管線。它不是 Cypher 引擎，也不是 Neo4j 的替代品。
+
+設計：
+- 節點：id → (labels, props)；label → 節點集合；(label, property) → {value: 節點集合} 的 hash index
+  （CREATE CONSTRAINT / CREATE INDEX 時建立，首次以該屬性查找時亦會自動建立）
+- 範圍掃描：iter_after(label, prop, after) 以 index 的排序鍵（依需要重建並快取）依序列出節點，
+  對應 `WHERE n.prop > $after ORDER BY n.prop`（例如 ingest_seq watermark）
+- 關係：以 (src, type) / (tgt, type) 的鄰接表保存，MERGE 語意（同型別同端點只會有一條）
+- 不解析 Cypher：每個 statement 以「正規化後的文字」或 regex 註冊對應的 Python 實作
+  （register_statement）。各腳本在自己的 Cypher 常數旁註冊實作，未註冊的 statement 會
+  拋出 NotImplementedError，避免靜默地回傳錯誤結果。實作與 Cypher 是否一致只由
+  tests/test_memory_parity.py 對真實 Neo4j（NEO4J_TEST_URI）的比對保證；未設定時只檢查每個註冊的
+  statement 都被比對情境執行到——修改 Cypher 或其實作後請對 Neo4j 執行一次
+- 以 RLock 序列化所有 statement；transaction（execute_write 的整個 work，或單一 auto-commit statement）
+  以 undo log 記錄節點 / 屬性 / 關係的變更，拋出例外時全部還原（index 屬 schema，不還原）
+- 可選持久化（neo4j.memory_path）：開啟時載入 JSON snapshot，close() 時寫回，
+  讓分開執行的 CLI 腳本（ETL / 偵測 / 派發）共用同一份離線圖譜
+
+Config：
+    neo4j:
+      backend: memory          # bolt（預設）/ memory
+      memory_path: ./logs/graph_memory.json
+"""
+from __future__ import annotations
+
+import bisect
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+Handler = Callable[["MemoryGraph", Dict[str, Any], Optional[re.Match]], List[Dict[str, Any]]]
+
+_EXACT: Dict[str, Handler] = {}
+_PATTERNS: List[Tuple[re.Pattern, Handler]] = []
+
+def normalize_cypher(cypher: str) -> str:
+    """Collapse whitespace so formatting differences do not change a statement's identity."""
+    return " ".join(cypher.split())
+
+def register_statement(cypher: str, regex: bool = False):
+    """
+    Decorator: bind an in-memory implementation to a Cypher statement.
+    regex=True treats `cypher` as a pattern matched against the normalized text
+    (for templated statements such as merge_nodes' `MERGE (n:{label} ...)`).
+    """
+    def deco(fn: Handler) -> Handler:
+        if regex:
+            _PATTERNS.append((re.compile(cypher), fn))
+        else:
+            _EXACT[normalize_cypher(cypher)] = fn
+        return fn
+    return deco
+
+def _resolve(cypher: str) -> Tuple[Handler, Optional[re.Match]]:
+    text = normalize_cypher(cypher)
+    fn = _EXACT.get(text)
+    if fn is not None:
+        return fn, None
+    for pat, fn in _PATTERNS:
+        m = pat.fullmatch(text)
+        if m:
+            return fn, m
+    raise NotImplementedError(f"Statement not supported by the embedded graph backend: {text[:200]}")
+
+# -----------------------------
+# Cypher-like value helpers
+# -----------------------------
+def to_float(v: Any) -> Optional[float]:
+    """Cypher toFloat(): numbers pass through, numeric strings parse, everything else -> null."""
+    if v is None or isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        return float(v)
+    try:
+        return float(str(v).strip())
+    except ValueError:
+        return None
+
+# -----------------------------
+# Graph store
+# -----------------------------
+@dataclass
+class Counters:
+    nodes_created: int = 0
+    relationships_created: int = 0
+    properties_set: int = 0
+    labels_added: int = 0
+    indexes_added: int = 0
+
+    @property
+    def contains_updates(self) -> bool:
+        return any((self.nodes_created, self.relationships_created, self.properties_set,
+                    self.labels_added, self.indexes_added))
+
+class MemoryGraph:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._next_id = 0
+        self._labels: Dict[int, Set[str]] = {}
+        self._props: Dict[int, Dict[str, Any]] = {}
+        self._by_label: Dict[str, Dict[int, None]] = {}          # insertion-ordered sets
+        self._index: Dict[Tuple[str, str], Dict[Any, Set[int]]] = {}
+        self._sorted: Dict[Tuple[str, str], List[Any]] = {}           # sorted index keys (lazy)
+        self._out: Dict[Tuple[int, str], Dict[int, Dict[str, Any]]] = {}
+        self._in: Dict[Tuple[int, str], Dict[int, None]] = {}
+        self._undo: Optional[List[Callable[[], None]]] = None             # set inside transaction()
+        self.counters = Counters()
+
+    # ---- transactions
+    @contextmanager
+    def transaction(self):
+        """All-or-nothing block: data changes made inside are undone if it raises (nested blocks join the outer one)."""
+        with self.lock:
+            if self._undo is not None:
+                yield
+                return
+            self._undo = []
+            try:
+                yield
+            except BaseException:
+                undo, self._undo = self._undo, None
+                for fn in reversed(undo):
+                    fn()
+                raise
+            self._undo = None
+
+    def _record(self, fn: Callable[[], None]):
+        if self._undo is not None:
+            self._undo.append(fn)
+
+    # ---- nodes
+    def nodes(self, label: str) -> Iterable[int]:
+        return list(self._by_label.get(label, ()))
+
+    def count(self, label: str) -> int:
+        return len(self._by_label.get(label, ()))
+
+    def props(self, nid: int) -> Dict[str, Any]:
+        return self._props[nid]
+
+    def get(self, nid: int, key: str, default: Any = None) -> Any:
+        return self._props[nid].get(key, default)
+
+    def create_index(self, label: str, prop: str):
+        if (label, prop) in self._index:
+            return
+        idx: Dict[Any, Set[int]] = {}
+        for nid in self._by_label.get(label, ()):
+            v = self._props[nid].get(prop)
+            if v is not None:
+                idx.setdefault(v, set()).add(nid)
+        self._index[(label, prop)] = idx
+        self._sorted.pop((label, prop), None)
+        self.counters.indexes_added += 1
+
+    def find(self, label: str, prop: str, value: Any) -> List[int]:
+        if value is None:
+            return []
+        if (label, prop) not in self._index:
+            self.create_index(label, prop)
+        return list(self._index[(label, prop)].get(value, ()))
+
+    def _sorted_keys(self, label: str, prop: str) -> List[Any]:
+        k = (label, prop)
+        if k not in self._index:
+            self.create_index(label, prop)
+        keys = self._sorted.get(k)
+        if keys is None:
+            keys = self._sorted[k] = sorted(self._index[k])
+        return keys
+
+    def iter_after(self, label: str, prop: str, after: Any) -> Iterator[int]:
+        """Nodes with prop > after in ascending prop order (index-backed; keys must be mutually comparable)."""
+        keys = self._sorted_keys(label, prop)
+        idx = self._index[(label, prop)]
+        start = 0 if after is None else bisect.bisect_right(keys, after)
+        for v in keys[start:]:
+            yield from sorted(idx.get(v, ()))
+
+    def max_value(self, label: str, prop: str) -> Any:
+        """Largest value of prop on label (`ORDER BY n.prop DESC LIMIT 1`); None when no node has it."""
+        keys = self._sorted_keys(label, prop)
+        return keys[-1] if keys else None
+
+    def find_one(self, label: str, prop: str, value: Any) -> Optional[int]:
+        hits = self.find(label, prop, value)
+        return hits[0] if hits else None
+
+    def create_node(self, labels: Iterable[str], props: Optional[Dict[str, Any]] = None) -> int:
+        nid = self._next_id
+        self._next_id += 1
+        self._labels[nid] = set(labels)
+        self._props[nid] = {}
+        for lb in self._labels[nid]:
+            self._by_label.setdefault(lb, {})[nid] = None
+        self.counters.nodes_created += 1
+        self.counters.labels_added += len(self._labels[nid])
+        self._record(lambda: self._drop_node(nid))
+        if props:
+            self.set_props(nid, props)
+        return nid
+
+    def _drop_node(self, nid: int):
+        """Undo of create_node (its relationships and properties are undone before it)."""
+        self.set_props(nid, {k: None for k in self._props[nid]})
+        for lb in self._labels.pop(nid):
+            self._by_label[lb].pop(nid, None)
+        del self._props[nid]
+
+    def merge_node(self, label: str, key: str, value: Any) -> int:
+        nid = self.find_one(label, key, value)
+        if nid is None:
+            nid = self.create_node([label], {key: value})
+        return nid
+
+    def set_props(self, nid: int, updates: Dict[str, Any]):
+        """SET n += updates (None removes the property, like Cypher)."""
+        props = self._props[nid]
+        for k, v in updates.items():
+            old = props.get(k)
+            if old == v and (k in props or v is None):
+                continue
+            self._record(lambda k=k, old=old: self.set_props(nid, {k: old}))
+            for lb in self._labels[nid]:
+                idx = self._index.get((lb, k))
+                if idx is None:
+                    continue
+                if old is not None:
+                    bucket = idx.get(old)
+                    if bucket is not None:
+                        bucket.discard(nid)
+                        if not bucket:
+                            del idx[old]
+                            self._sorted.pop((lb, k), None)
+                if v is not None:
+                    bucket = idx.get(v)
+                    if bucket is None:
+                        bucket = idx[v] = set()
+                        self._add_sorted_key((lb, k), v)
+                    bucket.add(nid)
+            if v is None:
+                props.pop(k, None)
+            else:
+                props[k] = v
+            self.counters.properties_set += 1
+
+    def _add_sorted_key(self, k: Tuple[str, str], v: Any):
+        # Appending keeps the cached order for increasing values (sequence numbers); anything else rebuilds lazily
+        keys = self._sorted.get(k)
+        if keys is None:
+            return
+        try:
+            in_order = not keys or keys[-1] < v
+        except TypeError:
+            in_order = False
+        if in_order:
+            keys.append(v)
+        else:
+            del self._sorted[k]
+
+    # ---- relationships
+    def merge_rel(self, src: int, rel_type: str, tgt: int, props: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        out = self._out.setdefault((src, rel_type), {})
+        rel = out.get(tgt)
+        if rel is None:
+            rel = out[tgt] = {}
+            self._in.setdefault((tgt, rel_type), {})[src] = None
+            self.counters.relationships_created += 1
+            self._record(lambda: self._drop_rel(src, rel_type, tgt))
+        elif props:
+            before = dict(rel)
+            self._record(lambda: (rel.clear(), rel.update(before)))
+        if props:
+            rel.update(props)
+            self.counters.properties_set += len(props)
+        return rel
+
+    def _drop_rel(self, src: int, rel_type: str, tgt: int):
+        for table, a, b in ((self._out, src, tgt), (self._in, tgt, src)):
+            adj = table[(a, rel_type)]
+            del adj[b]
+            if not adj:
+                del table[(a, rel_type)]
+
+    def out(self, nid: int, rel_type: str) -> List[int]:
+        return list(self._out.get((nid, rel_type), ()))
+
+    def inc(self, nid: int, rel_type: str) -> List[int]:
+        return list(self._in.get((nid, rel_type), ()))
+
+    def has_label(self, nid: int, label: str) -> bool:
+        return label in self._labels[nid]
+
+    # ---- persistence
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "nodes": [{"id": nid, "labels": sorted(self._labels[nid]), "props": self._props[nid]}
+                      for nid in self._props],
+            "rels": [[s, t, d, p] for (s, t), outs in self._out.items() for d, p in outs.items()],
+            "indexes": [list(k) for k in self._index],
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "MemoryGraph":
+        g = cls()
+        for lb, prop in data.get("indexes", []):
+            g._index[(lb, prop)] = {}
+        remap: Dict[int, int] = {}
+        for n in data.get("nodes", []):
+            remap[int(n["id"])] = g.create_node(n["labels"], n["props"])
+        for s, t, d, p in data.get("rels", []):
+            g.merge_rel(remap[int(s)], t, remap[int(d)], p)
+        g.counters = Counters()
+        return g
+
+# -----------------------------
+# Driver facade
+# -----------------------------
+@dataclass
+class MemorySummary:
+    """Subset of neo4j.ResultSummary used by the helpers (timings in ms, like the driver)."""
+    query: str
+    counters: Counters
+    result_available_after: int
+    result_consumed_after: int
+    profile: Optional[Dict[str, Any]] = None
+
+class MemoryResult:
+    def __init__(self, records: List[Dict[str, Any]], summary: MemorySummary):
+        self._records = records
+        self._summary = summary
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._records)
+
+    def data(self) -> List[Dict[str, Any]]:
+        return list(self._records)
+
+    def consume(self) -> MemorySummary:
+        return self._summary
+
+class MemorySession:
+    def __init__(self, graph: MemoryGraph):
+        self._g = graph
+
+    def __enter__(self) -> "MemorySession":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        pass
+
+    def run(self, cypher: str, parameters: Optional[Dict[str, Any]] = None, **kwargs) -> MemoryResult:
+        params = dict(parameters or {}, **kwargs)
+        profile = None
+        text = cypher.lstrip()
+        if text[:8].upper() == "PROFILE ":
+            cypher = text[8:]
+            profile = {"operatorType": "EmbeddedHandler", "args": {}, "children": []}
+        fn, m = _resolve(cypher)
+        g = self._g
+        with g.transaction():
+            g.counters = Counters()
+            t0 = time.perf_counter()
+            records = fn(g, params, m) or []
+            elapsed_ms = int((time.perf_counter() - t0) * 1000)
+            counters = g.counters
+        if profile is not None:
+            profile["args"] = {"handler": getattr(fn, "__name__", "handler"), "rows": len(records)}
+        return MemoryResult(records, MemorySummary(cypher, counters, elapsed_ms, 0, profile))
+
+    def execute_write(self, work: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._g.transaction():
+            return work(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+class MemoryDriver:
+    """Stand-in for neo4j.Driver; one graph per driver, optionally persisted as JSON."""
+
+    def __init__(self, graph: Optional[MemoryGraph] = None, path: Optional[str] = None):
+        self.graph = graph or MemoryGraph()
+        self.path = path
+
+    @classmethod
+    def open(cls, path: Optional[str] = None) -> "MemoryDriver":
+        if path and Path(path).exists():
+            data = json.loads(Path(path).read_text(encoding="utf-8"))
+            return cls(MemoryGraph.from_json(data), path)
+        return cls(MemoryGraph(), path)
+
+    def session(self, **kwargs) -> MemorySession:
+        return MemorySession(self.graph)
+
+    def save(self):
+        if not self.path:
+            return
+        p = Path(self.path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_suffix(p.suffix + ".tmp")
+        with self.graph.lock:
+            tmp.write_text(json.dumps(self.graph.to_json(), ensure_ascii=False, default=str), encoding="utf-8")
+        os.replace(tmp, p)
+
+    def close(self):
+        self.save()
+
+# -----------------------------
+# Built-in statements (schema + Neo4jHelper write templates)
+# -----------------------------
+@register_statement(r"CREATE CONSTRAINT (?:\w+ )?IF NOT EXISTS FOR \((\w+):(\w+)\) REQUIRE \1\.(\w+) IS UNIQUE", regex=True)
+def _create_constraint(g: MemoryGraph, params, m):
+    g.create_index(m.group(2), m.group(3))
+    return []
+
+@register_statement(r"CREATE INDEX (?:\w+ )?IF NOT EXISTS FOR \((\w+):(\w+)\) ON \(\1\.(\w+)\)", regex=True)
+def _create_index(g: MemoryGraph, params, m):
+    g.create_index(m.group(2), m.group(3))
+    return []
+
+@register_statement(r"UNWIND \$rows AS row MERGE \(n:(\w+) \{(\w+): row\.\2\}\) SET n \+= row", regex=True)
+def _merge_nodes(g: MemoryGraph, params, m):
+    label, key = m.group(1), m.group(2)
+    for row in params["rows"]:
+        nid = g.merge_node(label, key, row[key])
+        g.set_props(nid, row)
+    return []
+
+@register_statement(r"OPTIONAL MATCH \(top:(\w+)\) WHERE top\.(\w+) IS NOT NULL .* "
+                    r"MERGE \(n:\1 \{(\w+): row\.\3\}\) ON CREATE SET n\.\2 = seq\.next, seq\.next = seq\.next \+ 1 "
+                    r"SET n \+= row RETURN i, n\.\2 AS seq", regex=True)
+def _merge_nodes_sequenced(g: MemoryGraph, params, m):
+    label, seq_prop, key = m.group(1), m.group(2), m.group(3)
+    top = g.max_value(label, seq_prop)
+    seq = g.merge_node("IngestSequence", "name", label)
+    nxt = g.get(seq, "next", 1)
+    if top is not None and top >= nxt:
+        nxt = top + 1
+    g.set_props(seq, {"_lock": True, "next": nxt})
+    out = []
+    for i, row in enumerate(params["rows"]):
+        nid = g.find_one(label, key, row[key])
+        if nid is None:
+            nid = g.create_node([label], {key: row[key], seq_prop: nxt})
+            nxt += 1
+        g.set_props(nid, row)
+        out.append({"i": i, "seq": g.get(nid, seq_prop)})
+    g.set_props(seq, {"next": nxt})
+    return out
+
+@register_statement(
+    r"UNWIND \$pairs AS p MATCH \(s:(\w+) \{(\w+): p\[0\]\}\) MATCH \(t:(\w+) \{(\w+): p\[1\]\}\) "
+    r"MERGE \(s\)-\[r:(\w+)\]->\(t\) RETURN DISTINCT p\[0\] AS src, p\[1\] AS tgt", regex=True)
+def _merge_rels(g: MemoryGraph, params, m):
+    src_label, src_key, tgt_label, tgt_key, rel_type = m.groups()
+    written = {}
+    for p in params["pairs"]:
+        for s in g.find(src_label, src_key, p[0]):
+            for t in g.find(tgt_label, tgt_key, p[1]):
+                g.merge_rel(s, rel_type, t)
+                written[(p[0], p[1])] = None
+    return [{"src": s, "tgt": t} for s, t in written]
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/http_dispatch.py
+
+Webhook 派發用 HTTP client（n8n / Power Automate / 任意 webhook）：
+- 每個 endpoint 一個 requests.Session + HTTPAdapter 連線池（keep-alive，TCP/TLS 握手只做一次）
+- 429 / 5xx / 連線錯誤 / timeout / 其他 requests 例外自動重試：指數退避 + jitter，回應帶 Retry-After 時依其等待；
+  URL / schema / header 無效不重試
+- breaker 與計數在 finally 中更新：任何例外都會釋放 half-open 的試探名額
+- circuit breaker（每個 endpoint）：最近 window 次呼叫的失敗率超過 failure_rate 即 open，
+  open_s 秒內直接拒絕（不送出、不阻塞其他 endpoint），之後 half-open 試探一次，成功才恢復
+- 每個 endpoint 的計數（成功 / 失敗 / 重試 / 被 breaker 拒絕 / 各 status code）與延遲百分位；延遲累積在
+  DDSketch（utils/quantile_sketch.py，相對誤差 1%、bucket 數有上限），長時間執行的 daemon 記憶體不隨呼叫數成長
+
+Config（workflow.http，皆可省略）：
+    pool_size: 8            # 每個 endpoint 的連線數上限（預設 = workflow.concurrency）
+    timeout_s: 5.0
+    max_retries: 3
+    backoff_base_s: 0.2
+    backoff_max_s: 5.0
+    max_retry_after_s: 30   # Retry-After 的等待上限
+    breaker: {window: 20, failure_rate: 0.5, min_calls: 10, open_s: 30}
+"""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Optional
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    _NON_RETRYABLE: tuple = (requests.exceptions.InvalidURL, requests.exceptions.InvalidSchema,
+                             requests.exceptions.MissingSchema, requests.exceptions.InvalidHeader,
+                             requests.exceptions.URLRequired)
+except Exception:
+    requests = None  # allow importing without requests (mock mode)
+    _NON_RETRYABLE = ()
+
+from utils.quantile_sketch import DDSketch
+
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds (delta-seconds or HTTP-date); None when absent/invalid."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+class CircuitBreaker:
+    """closed → open (failure rate over the rolling window) → half-open (one probe) → closed / open."""
+
+    def __init__(self, window: int = 20, failure_rate: float = 0.5, min_calls: int = 10, open_s: float = 30.0):
+        self.window = max(int(window), 1)
+        self.failure_rate = float(failure_rate)
+        self.min_calls = max(int(min_calls), 1)
+        self.open_s = float(open_s)
+        self.state = "closed"
+        self.opened = 0
+        self._outcomes: Deque[bool] = deque(maxlen=self.window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.open_s:
+                    return False
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets a probe through (0 when closed / half-open)."""
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(self.open_s - (time.monotonic() - self._opened_at), 0.0)
+
+    def record(self, ok: bool):
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+                if ok:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+            self._outcomes.append(ok)
+            n = len(self._outcomes)
+            if n >= self.min_calls and self._outcomes.count(False) / n >= self.failure_rate:
+                self._trip()
+
+    def _trip(self):
+        self.state = "open"
+        self.opened += 1
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+@dataclass
+class DispatchResult:
+    ok: bool
+    status_code: Optional[int] = None
+    body: Dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    error: Optional[str] = None
+    latency_s: float = 0.0
+    rejected: bool = False        # circuit open: the request was never sent
+    retry_in_s: float = 0.0       # when rejected: time until the breaker lets a probe through
+
+@dataclass
+class EndpointStats:
+    calls: int = 0
+    ok: int = 0
+    failed: int = 0
+    retries: int = 0
+    rejected: int = 0
+    status: Dict[str, int] = field(default_factory=dict)
+    latency_ms: DDSketch = field(default_factory=lambda: DDSketch(0.01, max_bins=512))
+
+    def as_dict(self) -> Dict[str, Any]:
+        lat = self.latency_ms
+
+        def pct(p: float) -> Optional[float]:
+            if not lat.count:
+                return None
+            return round(lat.max if p >= 1.0 else lat.quantile(p), 3)
+
+        return {"calls": self.calls, "ok": self.ok, "failed": self.failed, "retries": self.retries,
+                "rejected": self.rejected, "status": dict(self.status),
+                "latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "max": pct(1.0)}}
+
+class DispatchClient:
+    def __init__(self, pool_size: int = 8, timeout_s: float = 5.0, max_retries: int = 3,
+                 backoff_base_s: float = 0.2, backoff_max_s: float = 5.0, max_retry_after_s: float = 30.0,
+                 breaker: Optional[Dict[str, Any]] = None):
+        if requests is None:
+            raise RuntimeError("requests not installed; set workflow.mock=true or pip install requests")
+        self.pool_size = max(int(pool_size), 1)
+        self.timeout_s = float(timeout_s)
+        self.max_retries = max(int(max_retries), 0)
+        self.backoff_base_s = float(backoff_base_s)
+        self.backoff_max_s = float(backoff_max_s)
+        self.max_retry_after_s = float(max_retry_after_s)
+        self._breaker_cfg = dict(breaker or {})
+        self._sessions: Dict[str, Any] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats: Dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, http_cfg: Dict[str, Any], default_pool_size: int = 8) -> "DispatchClient":
+        return cls(
+            pool_size=int(http_cfg.get("pool_size", default_pool_size)),
+            timeout_s=float(http_cfg.get("timeout_s", 5.0)),
+            max_retries=int(http_cfg.get("max_retries", 3)),
+            backoff_base_s=float(http_cfg.get("backoff_base_s", 0.2)),
+            backoff_max_s=float(http_cfg.get("backoff_max_s", 5.0)),
+            max_retry_after_s=float(http_cfg.get("max_retry_after_s", 30.0)),
+            breaker=http_cfg.get("breaker"),
+        )
+
+    def _endpoint(self, endpoint: str):
+        with self._lock:
+            s = self._sessions.get(endpoint)
+            if s is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                self._sessions[endpoint] = s
+                self._breakers[endpoint] = CircuitBreaker(**self._breaker_cfg)
+                self._stats[endpoint] = EndpointStats()
+            return s, self._breakers[endpoint], self._stats[endpoint]
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after_s)
+        delay = min(self.backoff_base_s * (2 ** (attempt - 1)), self.backoff_max_s)
+        return delay * random.uniform(0.5, 1.5)
+
+    def post(self, endpoint: str, payload: Dict[str, Any]) -> DispatchResult:
+        session, breaker, stats = self._endpoint(endpoint)
+        if not breaker.allow():
+            with self._lock:
+                stats.rejected += 1
+            return DispatchResult(ok=False, error="circuit_open", rejected=True, retry_in_s=breaker.retry_in())
+
+        t0 = time.perf_counter()
+        res = DispatchResult(ok=False)
+        retries = 0
+        try:
+            while True:
+                res.attempts += 1
+                retry_after = None
+                try:
+                    r = session.post(endpoint, json=payload, timeout=self.timeout_s)
+                    res.status_code = r.status_code
+                    res.ok = 200 <= r.status_code < 300
+                    res.error = None if res.ok else f"http_{r.status_code}"
+                    try:
+                        res.body = r.json()
+                    except Exception:
+                        res.body = {"text": r.text[:500], "status_code": r.status_code}
+                    retryable = r.status_code in RETRY_STATUS
+                    retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                except requests.RequestException as e:
+                    # bad URL / schema / header: resending cannot help; anything else (connection, timeout,
+                    # chunked encoding, redirects …) is treated as transient
+                    res.ok, res.status_code, res.error = False, None, type(e).__name__
+                    res.body = {"error": str(e)}
+                    retryable = not isinstance(e, _NON_RETRYABLE)
+                if res.ok or not retryable or res.attempts > self.max_retries:
+                    break
+                retries += 1
+                time.sleep(self._backoff(res.attempts, retry_after))
+        finally:
+            # always settle the breaker (releases a half-open probe) and the stats, even on an unexpected error
+            res.latency_s = time.perf_counter() - t0
+            breaker.record(res.ok)
+            with self._lock:
+                stats.calls += 1
+                stats.retries += retries
+                stats.ok += int(res.ok)
+                stats.failed += int(not res.ok)
+                key = str(res.status_code) if res.status_code is not None else (res.error or "error")
+                stats.status[key] = stats.status.get(key, 0) + 1
+                stats.latency_ms.add(res.latency_s * 1000)
+        return res
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            out = {ep: st.as_dict() for ep, st in self._stats.items()}
+            for ep, br in self._breakers.items():
+                out[ep]["breaker"] = {"state": br.state, "opened": br.opened}
+            return out
+
+    def close(self):
+        with self._lock:
+            for s in self._sessions.values():
+                s.close()
+            self._sessions.clear()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/load_scheduler.py
+
+以小型 DAG 表達匯入流程，並在 worker pool 上依相依關係平行執行：
+- 每個 Stage 有名稱、執行函式與相依 stage
+- 相依全部完成後才會啟動；互不相依的 stage 同時執行（上限 max_workers）
+- 某 stage 失敗時，其下游 stage 標記為 SKIPPED，其餘分支照常完成，最後再拋出第一個錯誤
+- 每個 stage 的開始/結束時間與 wall time 寫入 RunLogger（STAGE_DONE），
+  並計算 critical path（LOAD_CRITICAL_PATH），方便找出拖慢整體匯入的環節
+"""
+from __future__ import annotations
+
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[], Any]
+    deps: Tuple[str, ...] = ()
+
+@dataclass
+class StageResult:
+    name: str
+    deps: Tuple[str, ...]
+    status: str = "PENDING"         # DONE / FAILED / SKIPPED
+    start_s: float = 0.0            # seconds since the scheduler started
+    end_s: float = 0.0
+    result: Any = None
+    error: Optional[str] = None
+
+    @property
+    def wall_s(self) -> float:
+        return max(self.end_s - self.start_s, 0.0)
+
+def _check_dag(stages: Sequence[Stage]):
+    names = {s.name for s in stages}
+    if len(names) != len(stages):
+        raise ValueError("Duplicate stage names in load DAG")
+    for s in stages:
+        missing = [d for d in s.deps if d not in names]
+        if missing:
+            raise ValueError(f"Stage {s.name} depends on unknown stage(s): {missing}")
+    # Kahn's algorithm: every stage must be reachable in topological order
+    indeg = {s.name: len(s.deps) for s in stages}
+    children: Dict[str, List[str]] = {s.name: [] for s in stages}
+    for s in stages:
+        for d in s.deps:
+            children[d].append(s.name)
+    ready = [n for n, k in indeg.items() if k == 0]
+    seen = 0
+    while ready:
+        n = ready.pop()
+        seen += 1
+        for c in children[n]:
+            indeg[c] -= 1
+            if indeg[c] == 0:
+                ready.append(c)
+    if seen != len(stages):
+        raise ValueError("Load DAG contains a cycle")
+
+def critical_path(results: Dict[str, StageResult]) -> List[str]:
+    """Walk back from the last stage to finish, always through the dependency that finished last."""
+    done = [r for r in results.values() if r.status == "DONE"]
+    if not done:
+        return []
+    cur = max(done, key=lambda r: r.end_s)
+    path = [cur.name]
+    while cur.deps:
+        cur = max((results[d] for d in cur.deps), key=lambda r: r.end_s)
+        path.append(cur.name)
+    return path[::-1]
+
+def run_stages(stages: Sequence[Stage], max_workers: int = 4, logger=None) -> Dict[str, StageResult]:
+    _check_dag(stages)
+    by_name = {s.name: s for s in stages}
+    results = {s.name: StageResult(s.name, tuple(s.deps)) for s in stages}
+    t0 = time.perf_counter()
+
+    def _run(stage: Stage):
+        r = results[stage.name]
+        r.start_s = time.perf_counter() - t0
+        try:
+            r.result = stage.fn()
+            r.status = "DONE"
+        finally:
+            r.end_s = time.perf_counter() - t0
+        return r
+
+    def _ready(name: str) -> bool:
+        return results[name].status == "PENDING" and all(results[d].status == "DONE" for d in by_name[name].deps)
+
+    def _skip_downstream(failed: str):
+        for s in stages:
+            r = results[s.name]
+            if r.status == "PENDING" and failed in s.deps:
+                r.status = "SKIPPED"
+                r.error = f"upstream stage {failed} did not complete"
+                _skip_downstream(s.name)
+
+    first_error: Optional[BaseException] = None
+    running: Dict[Future, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="etl-stage") as pool:
+        def _submit_ready():
+            for s in stages:
+                if _ready(s.name) and s.name not in running.values():
+                    results[s.name].status = "RUNNING"
+                    running[pool.submit(_run, s)] = s.name
+
+        _submit_ready()
+        while running:
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                r = results[name]
+                err = fut.exception()
+                if err is not None:
+                    r.status = "FAILED"
+                    r.error = repr(err)
+                    first_error = first_error or err
+                    _skip_downstream(name)
+                if logger is not None:
+                    logger.log_event("STAGE_DONE" if r.status == "DONE" else "STAGE_FAIL",
+                                     level="INFO" if r.status == "DONE" else "ERROR",
+                                     details={"stage": name, "deps": list(r.deps), "status": r.status,
+                                              "start_s": round(r.start_s, 6), "end_s": round(r.end_s, 6),
+                                              "wall_s": round(r.wall_s, 6), "error": r.error})
+            _submit_ready()
+
+    if logger is not None:
+        for r in results.values():
+            if r.status == "SKIPPED":
+                logger.log_event("STAGE_SKIPPED", level="WARN", details={"stage": r.name, "reason": r.error})
+        path = critical_path(results)
+        logger.log_event("LOAD_CRITICAL_PATH", details={
+            "stages": path,
+            "stage_wall_s": {n: round(results[n].wall_s, 6) for n in path},
+            "total_wall_s": round(time.perf_counter() - t0, 6),
+        })
+    if first_error is not None:
+        raise first_error
+    return results
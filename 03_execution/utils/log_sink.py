@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/log_sink.py
+
+RunLogger 的串流 CSV sink：事件發生時即附加到檔案，不必等執行結束才一次以 pandas 寫出。
+- append() 只把原始 record 放進 deque（不做 json / 時間格式化），成本低，可用於派發熱迴圈；
+  格式化、寫檔由背景執行緒每 flush_interval_s 秒（或累積 buffer_lines 筆時）批次進行
+- 每 fsync_interval_s 秒 fsync 一次；flush(fsync=True) / close() 立即落盤，行程結束時（atexit）自動 close，
+  非正常中止最多遺失最近 flush_interval_s 秒的事件
+- rotation：檔案超過 max_bytes 時，目前的檔案改名為 <stem>.001.csv、<stem>.002.csv …（由舊到新），
+  再開新檔續寫；每個檔案都有 BOM + header，可各自以 pandas 讀取
+- 輸出格式與 pandas to_csv(encoding="utf-8-sig") 相同（逗號分隔、必要時加引號、\\n 換行）
+- record 在寫出前才格式化：append 之後請勿再修改 record 內的物件（RunLogger.log_event 會先複製 details）
+"""
+from __future__ import annotations
+
+import atexit
+import csv
+import os
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Sequence
+
+class StreamingCsvSink:
+    def __init__(self, path: str, columns: Sequence[str], formatter: Callable[[Any], Sequence[Any]],
+                 flush_interval_s: float = 1.0, fsync_interval_s: float = 5.0, max_bytes: int = 64 * 1024 * 1024,
+                 buffer_lines: int = 2000):
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.formatter = formatter
+        self.flush_interval_s = max(float(flush_interval_s), 0.01)
+        self.fsync_interval_s = float(fsync_interval_s)
+        self.max_bytes = int(max_bytes)
+        self.buffer_lines = max(int(buffer_lines), 1)
+        self.lines = 0
+        self.segments = 1
+        self.errors = 0
+        self._q: Deque[Any] = deque()
+        self._io = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._last_fsync = time.monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._open()
+        self._thread = threading.Thread(target=self._run, name=f"log-sink-{self.path.stem}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _open(self):
+        self._fh = open(self.path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.writer(self._fh, lineterminator="\n")
+        self._writer.writerow(self.columns)
+
+    def append(self, record: Any):
+        self._q.append(record)
+        if len(self._q) >= self.buffer_lines:
+            self._wake.set()
+
+    def _rotate(self):
+        self._fh.close()
+        os.replace(self.path, self.path.with_name(f"{self.path.stem}.{self.segments:03d}{self.path.suffix}"))
+        self.segments += 1
+        self._open()
+
+    def flush(self, fsync: bool = False):
+        with self._io:
+            if self._fh.closed:
+                return
+            q, rows = self._q, []
+            for _ in range(len(q)):
+                rows.append(self.formatter(q.popleft()))
+            if rows:
+                self._writer.writerows(rows)
+                self.lines += len(rows)
+            self._fh.flush()
+            now = time.monotonic()
+            if fsync or now - self._last_fsync >= self.fsync_interval_s:
+                os.fsync(self._fh.fileno())
+                self._last_fsync = now
+            if self.max_bytes > 0 and self._fh.tell() >= self.max_bytes:
+                os.fsync(self._fh.fileno())
+                self._rotate()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:               # never take the caller down; retry on the next tick
+                self.errors += 1
+                if self.errors == 1:
+                    print(f"[log_sink] write failed for {self.path}: {e!r}", file=sys.stderr)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush(fsync=True)
+        with self._io:
+            self._fh.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": str(self.path), "lines": self.lines, "segments": self.segments,
+                "pending": len(self._q), "errors": self.errors}
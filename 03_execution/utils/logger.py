@@ -6,6 +6,25 @@ utils/logger.py
 統一輸出「可重現」的執行 log（CSV）。
 - 每個事件一列
 - 包含 run_id / scenario / mode / component / event_name / timestamp / details(json)
+- t_mono_ns：time.monotonic_ns()，與 UTC wall clock 並列；同一行程內的事件間隔請以此計算（不受校時影響）
+- 串流模式（RunLogger.from_config，logging.stream 預設開啟）：事件經 utils/log_sink.py 即時附加到
+  <component>_<run_id>.csv（背景批次寫入、定期 fsync、超過大小自動 rotation），中途當掉也保留已寫出的事件，
+  記憶體不隨事件數成長；write_csv() 僅 flush + fsync，檔名與欄位與一次寫出時相同
+- 直接建構 RunLogger(...) 時維持原行為：事件留在 rows，write_csv() 時一次寫出
+- 延遲 sketch（from_config，logging.sketches 預設開啟）：observe(stage, ms) 更新依 (mode, stage) 維護的 DDSketch
+  （utils/quantile_sketch.py），write_csv() / close() 時寫到 <out_dir>/latency_sketch_<component>_<run_id>.json，
+  供 compute_metrics.py 跨 run 合併出 p50 / p95 / p99，不需保留逐筆資料
+
+Config（logging，皆可省略）：
+    stream: true
+    flush_interval_s: 1.0
+    fsync_interval_s: 5.0
+    max_bytes: 67108864       # 64 MiB；0 = 不 rotation
+    buffer_lines: 2000        # 累積這麼多筆即提早寫出
+    keep_rows: false          # 串流時是否仍在記憶體保留 rows
+    sketches: true            # 維護延遲 sketch
+    sketch_relative_accuracy: 0.01
+    sketch_max_bins: 2048
 
 此 log 可用於：
 - 第六章指標（TTA / latency）之 timestamp 證據
@@ -14,17 +33,32 @@ utils/logger.py
 from __future__ import annotations
 
 import json
+import time
 import uuid
 from dataclasses import dataclass, field
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
 
+from utils.log_sink import StreamingCsvSink
+from utils.quantile_sketch import SketchSet
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+COLUMNS = ["run_id", "scenario", "mode", "component", "event", "level", "timestamp", "t_mono_ns", "details"]
+
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
+def iso_from_ns(wall_ns: int) -> str:
+    """Same format as utc_now_iso() for a time.time_ns() value."""
+    return (EPOCH + timedelta(microseconds=wall_ns // 1000)).isoformat()
+
+def details_json(details: Optional[Dict[str, Any]]) -> str:
+    """The details column; the same in the streamed and the in-memory CSV."""
+    return json.dumps(details or {}, ensure_ascii=False, default=str)
+
 @dataclass
 class RunLogger:
     out_dir: str
@@ -33,8 +67,46 @@ class RunLogger:
     component: str
     run_id: str = field(default_factory=lambda: f"run_{uuid.uuid4().hex[:10]}")
     rows: List[Dict[str, Any]] = field(default_factory=list)
+    sink: Optional[StreamingCsvSink] = None
+    keep_rows: bool = True
+    sketches: Optional[SketchSet] = None
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any], out_dir: str, scenario: str, mode: str, component: str) -> "RunLogger":
+        stream = bool(cfg.get("stream", True))
+        logger = cls(out_dir=str(out_dir), scenario=scenario, mode=mode, component=component,
+                     keep_rows=bool(cfg.get("keep_rows", False)) or not stream)
+        if stream:
+            logger.sink = StreamingCsvSink(
+                str(Path(out_dir) / logger.default_csv_name()), COLUMNS, logger._format,
+                flush_interval_s=float(cfg.get("flush_interval_s", 1.0)),
+                fsync_interval_s=float(cfg.get("fsync_interval_s", 5.0)),
+                max_bytes=int(cfg.get("max_bytes", 64 * 1024 * 1024)),
+                buffer_lines=int(cfg.get("buffer_lines", 2000)),
+            )
+        if bool(cfg.get("sketches", True)):
+            logger.sketches = SketchSet(float(cfg.get("sketch_relative_accuracy", 0.01)),
+                                        int(cfg.get("sketch_max_bins", 2048)))
+            logger.sketches.runs.append(logger.run_id)
+        return logger
+
+    def _format(self, rec: Tuple[str, str, int, int, Optional[Dict[str, Any]]]) -> List[Any]:
+        name, level, wall_ns, mono_ns, details = rec
+        return [self.run_id, self.scenario, self.mode, self.component, name, level, iso_from_ns(wall_ns), mono_ns,
+                details_json(details)]
 
     def log_event(self, name: str, level: str = "INFO", details: Optional[Dict[str, Any]] = None):
+        """
+        Record one event. In streaming mode details is serialized later on the sink thread: the dict itself is
+        copied here, so callers may reuse it, but values inside it (nested dicts / lists) must not be changed
+        after the call.
+        """
+        wall_ns, mono_ns = time.time_ns(), time.monotonic_ns()
+        if self.sink is not None:
+            # Formatting (json / ISO time) happens on the sink thread
+            self.sink.append((name, level, wall_ns, mono_ns, dict(details) if details else None))
+            if not self.keep_rows:
+                return
         self.rows.append({
             "run_id": self.run_id,
             "scenario": self.scenario,
@@ -42,16 +114,39 @@ class RunLogger:
             "component": self.component,
             "event": name,
             "level": level,
-            "timestamp": utc_now_iso(),
-            "details": json.dumps(details or {}, ensure_ascii=False),
+            "timestamp": iso_from_ns(wall_ns),
+            "t_mono_ns": mono_ns,
+            "details": details_json(details),
         })
 
+    def observe(self, stage: str, value_ms: Optional[float], n: int = 1):
+        """Add a latency sample (ms) to this run's sketch for (mode, stage); no-op without sketches."""
+        if self.sketches is not None:
+            self.sketches.add(self.mode, stage, value_ms, n)
+
     def default_csv_name(self) -> str:
         return f"{self.component}_{self.run_id}.csv"
 
+    def sketch_path(self) -> Path:
+        return Path(self.out_dir) / f"latency_sketch_{self.component}_{self.run_id}.json"
+
+    def _save_sketches(self):
+        if self.sketches is not None and len(self.sketches):
+            self.sketches.save(str(self.sketch_path()))
+
     def write_csv(self, filename: Optional[str] = None):
+        self._save_sketches()
+        if self.sink is not None:
+            # Already on disk: make everything logged so far durable
+            self.sink.flush(fsync=True)
+            return str(self.sink.path)
         out = Path(self.out_dir)
         out.mkdir(parents=True, exist_ok=True)
         fn = filename or self.default_csv_name()
-        pd.DataFrame(self.rows).to_csv(out / fn, index=False, encoding="utf-8-sig")
+        pd.DataFrame(self.rows, columns=COLUMNS).to_csv(out / fn, index=False, encoding="utf-8-sig")
         return str(out / fn)
+
+    def close(self):
+        self._save_sketches()
+        if self.sink is not None:
+            self.sink.close()
@@ -4,19 +4,49 @@
 utils/neo4j_helper.py
 
 Neo4j 操作封裝：
-- 建立 driver/session
+- 建立 driver/session（helper 生命週期內共用同一個 pooled driver）
 - query()
-- merge_nodes()
-- merge_rels()
+- run_batch()：多個 statement 於同一 session / transaction 內執行
+- merge_nodes() / merge_rels()：自適應 batch 大小 + transient error 重試，回傳 WriteSummary
+- 每個 statement（query、run_batch 內各 statement、merge_* 每個 batch）記錄 timing span，依 fingerprint 彙總於
+  query_stats（utils/query_stats.py；各腳本結束時以 report_query_stats() 寫入 log 與 summary 表）
+- close() / context manager
 
 設計原則：
 - 對 replication 友善：以 MERGE 為主，避免重複匯入
 - 允許在未安裝 neo4j driver 時 graceful fallback
+- 可插拔 backend：bolt（Neo4j server）或 memory（utils/graph_memory.py，內嵌的測試替身：只支援各腳本
+  註冊了 Python 實作的 statement，供單元測試 / profiling / 離線 benchmark 使用；不是 Neo4j 的替代品）
+- 連線成本只付一次：driver 於第一次使用時建立，之後所有 query / batch 共用連線池
+
+Config（neo4j 區塊，皆可省略）：
+    backend                           bolt（預設）/ memory
+    memory_path                       memory backend 的 JSON snapshot（可選；讓分開執行的腳本共用同一份圖）
+    uri / user / password / database
+    max_connection_pool_size          連線池上限（預設 50）
+    connection_acquisition_timeout_s  取得連線的等待上限（預設 60）
+    max_connection_lifetime_s         連線最長存活時間（預設 3600）
+    liveness_check_timeout_s          閒置超過此秒數的連線於取用前先做存活檢查（預設 None = 不檢查）
+    connection_timeout_s              建立 TCP 連線的逾時（預設 30）
+    target_batch_latency_s            merge_* 每個 batch 的目標 commit 時間（預設 0.5）；batch 依實測時間放大/縮小
+    min_batch_size / max_batch_size   自適應 batch 的上下限（預設 50 / 20000）
+    max_retries                       transient / deadlock 錯誤的重試次數（預設 5，指數退避 + jitter）
+    retry_base_delay_s                退避基準秒數（預設 0.2）
+    split_after_retries               同一 batch 連續失敗幾次後對半切分（預設 2）
+    instrument                        statement timing span 與 fingerprint 彙總（預設 true）
+    query_stats_top                   記為 QUERY_STATS 事件的 fingerprint 數（預設 20，summary 表含全部）
+    profile_slow_ms                   opt-in：span 超過此毫秒數的 statement 於下次執行時擷取 PROFILE plan（預設關閉）
+    profile_max_plans                 PROFILE plan 數量上限（預設 10）
 """
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from utils.query_stats import QueryStats
 
 def neo4j_available() -> bool:
     try:
@@ -25,12 +55,129 @@ def neo4j_available() -> bool:
     except Exception:
         return False
 
+def backend_available(cfg: Dict[str, Any]) -> bool:
+    """True when the configured backend can run here (the embedded backend needs no driver)."""
+    return cfg.get("backend", "bolt") == "memory" or neo4j_available()
+
+# (cypher, params) pair used by run_batch()
+Statement = Tuple[str, Optional[Dict[str, Any]]]
+
+def is_transient_error(e: BaseException) -> bool:
+    """Deadlocks, leader switches, lost connections... anything safe to retry."""
+    try:
+        from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+        if isinstance(e, (TransientError, ServiceUnavailable, SessionExpired)):
+            return True
+    except Exception:
+        pass
+    retryable = getattr(e, "is_retryable", None)
+    return bool(retryable()) if callable(retryable) else False
+
+@dataclass
+class WriteSummary:
+    """Per-call outcome of merge_nodes / merge_rels (logged by the ETL)."""
+    target: str
+    rows: int = 0
+    batches: int = 0
+    retries: int = 0
+    splits: int = 0
+    elapsed_s: float = 0.0
+    final_batch_size: int = 0
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    def merge(self, other: "WriteSummary") -> "WriteSummary":
+        self.rows += other.rows
+        self.batches += other.batches
+        self.retries += other.retries
+        self.splits += other.splits
+        self.elapsed_s += other.elapsed_s
+        self.final_batch_size = other.final_batch_size or self.final_batch_size
+        return self
+
+    def as_dict(self) -> Dict[str, Any]:
+        d = asdict(self)
+        d["elapsed_s"] = round(self.elapsed_s, 6)
+        d["rows_per_s"] = round(self.rows_per_s, 1)
+        return d
+
+def merge_nodes_cypher(label: str, key: str) -> str:
+    """UNWIND $rows MERGE statement of merge_nodes (also usable inside run_batch)."""
+    return f"""
+    UNWIND $rows AS row
+    MERGE (n:{label} {{{key}: row.{key}}})
+    SET n += row
+    """
+
+def merge_sequenced_cypher(label: str, key: str, seq_property: str) -> str:
+    """
+    merge_nodes statement that also numbers the nodes it creates (seq_property) from the durable
+    (:IngestSequence {name: label}) counter in the same transaction. The counter node stays write-locked
+    until commit, so concurrent writers commit their ranges in number order and a reader's watermark never
+    passes a range that is still being written. The counter starts above the highest number already in the
+    graph (bulk imports, older clock-based numbering). A node that already exists keeps its number (re-runs
+    and retries are not detected twice) and consumes none. Returns (i, number) per row of $rows.
+    """
+    return f"""
+    OPTIONAL MATCH (top:{label}) WHERE top.{seq_property} IS NOT NULL
+    WITH top ORDER BY top.{seq_property} DESC LIMIT 1
+    MERGE (seq:IngestSequence {{name: '{label}'}})
+    ON CREATE SET seq.next = 1
+    SET seq._lock = true
+    SET seq.next = CASE WHEN top.{seq_property} >= seq.next THEN top.{seq_property} + 1 ELSE seq.next END
+    WITH seq
+    UNWIND range(0, size($rows) - 1) AS i
+    WITH seq, i, $rows[i] AS row
+    MERGE (n:{label} {{{key}: row.{key}}})
+    ON CREATE SET n.{seq_property} = seq.next, seq.next = seq.next + 1
+    SET n += row
+    RETURN i, n.{seq_property} AS seq
+    """
+
+def merge_rels_cypher(src_label: str, src_key: str, tgt_label: str, tgt_key: str, rel_type: str) -> str:
+    """
+    UNWIND $pairs MERGE statement of merge_rels (also usable inside run_batch). Returns the pairs whose
+    endpoints both matched, i.e. the ones actually written.
+    """
+    return f"""
+    UNWIND $pairs AS p
+    MATCH (s:{src_label} {{{src_key}: p[0]}})
+    MATCH (t:{tgt_label} {{{tgt_key}: p[1]}})
+    MERGE (s)-[r:{rel_type}]->(t)
+    RETURN DISTINCT p[0] AS src, p[1] AS tgt
+    """
+
 @dataclass
 class Neo4jHelper:
     uri: str
     user: str
     password: str
     database: Optional[str] = None
+    backend: str = "bolt"
+    memory_path: Optional[str] = None
+    max_connection_pool_size: int = 50
+    connection_acquisition_timeout_s: float = 60.0
+    max_connection_lifetime_s: float = 3600.0
+    liveness_check_timeout_s: Optional[float] = None
+    connection_timeout_s: float = 30.0
+    target_batch_latency_s: float = 0.5
+    min_batch_size: int = 50
+    max_batch_size: int = 20000
+    max_retries: int = 5
+    retry_base_delay_s: float = 0.2
+    split_after_retries: int = 2
+    instrument: bool = True
+    query_stats_top: int = 20
+    profile_slow_ms: Optional[float] = None
+    profile_max_plans: int = 10
+    query_stats: QueryStats = field(init=False, repr=False)
+    _drv: Any = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        self.query_stats = QueryStats(profile_slow_ms=self.profile_slow_ms, profile_max_plans=self.profile_max_plans)
 
     @classmethod
     def from_config(cls, cfg: Dict[str, Any]) -> "Neo4jHelper":
@@ -39,11 +186,67 @@ class Neo4jHelper:
             user=cfg.get("user", "neo4j"),
             password=cfg.get("password", "neo4j"),
             database=cfg.get("database", None),
+            backend=cfg.get("backend", "bolt"),
+            memory_path=cfg.get("memory_path", None),
+            max_connection_pool_size=int(cfg.get("max_connection_pool_size", 50)),
+            connection_acquisition_timeout_s=float(cfg.get("connection_acquisition_timeout_s", 60.0)),
+            max_connection_lifetime_s=float(cfg.get("max_connection_lifetime_s", 3600.0)),
+            liveness_check_timeout_s=cfg.get("liveness_check_timeout_s", None),
+            connection_timeout_s=float(cfg.get("connection_timeout_s", 30.0)),
+            target_batch_latency_s=float(cfg.get("target_batch_latency_s", 0.5)),
+            min_batch_size=int(cfg.get("min_batch_size", 50)),
+            max_batch_size=int(cfg.get("max_batch_size", 20000)),
+            max_retries=int(cfg.get("max_retries", 5)),
+            retry_base_delay_s=float(cfg.get("retry_base_delay_s", 0.2)),
+            split_after_retries=int(cfg.get("split_after_retries", 2)),
+            instrument=bool(cfg.get("instrument", True)),
+            query_stats_top=int(cfg.get("query_stats_top", 20)),
+            profile_slow_ms=cfg.get("profile_slow_ms", None),
+            profile_max_plans=int(cfg.get("profile_max_plans", 10)),
         )
 
+    @property
+    def target(self) -> str:
+        """Identity of the graph this helper writes to (used to scope local state such as the ETL manifest)."""
+        if self.backend == "memory":
+            return f"memory:{self.memory_path or ''}"
+        return f"{self.uri}/{self.database or ''}"
+
+    # -----------------------------
+    # Lifecycle
+    # -----------------------------
     def _driver(self):
-        from neo4j import GraphDatabase
-        return GraphDatabase.driver(self.uri, auth=(self.user, self.password))
+        """Return the shared driver, creating it on first use (thread-safe)."""
+        if self._drv is not None:
+            return self._drv
+        with self._lock:
+            if self._drv is None and self.backend == "memory":
+                from utils.graph_memory import MemoryDriver
+                self._drv = MemoryDriver.open(self.memory_path)
+            elif self._drv is None:
+                from neo4j import GraphDatabase
+                opts: Dict[str, Any] = {
+                    "max_connection_pool_size": self.max_connection_pool_size,
+                    "connection_acquisition_timeout": self.connection_acquisition_timeout_s,
+                    "max_connection_lifetime": self.max_connection_lifetime_s,
+                    "connection_timeout": self.connection_timeout_s,
+                }
+                if self.liveness_check_timeout_s is not None:
+                    opts["liveness_check_timeout"] = float(self.liveness_check_timeout_s)
+                self._drv = GraphDatabase.driver(self.uri, auth=(self.user, self.password), **opts)
+        return self._drv
+
+    def close(self):
+        with self._lock:
+            if self._drv is not None:
+                self._drv.close()
+                self._drv = None
+
+    def __enter__(self) -> "Neo4jHelper":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
     def session(self):
         driver = self._driver()
@@ -51,23 +254,131 @@ class Neo4jHelper:
             return driver.session(database=self.database)
         return driver.session()
 
-    def query(self, cypher: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-        params = params or {}
+    # -----------------------------
+    # Queries
+    # -----------------------------
+    def _run_timed(self, run: Callable[..., Any], cypher: str, params: Dict[str, Any], op: str) -> List[Dict[str, Any]]:
+        """One statement inside a timing span (client latency, server timings, rows, counters)."""
+        if not self.instrument:
+            return [dict(r) for r in run(cypher, params)]
+        stats = self.query_stats
+        fp, stmt, profiled = stats.prepare(cypher)
+        t0 = time.perf_counter()
+        try:
+            res = run(stmt, params)
+            rows = [dict(r) for r in res]
+            summary = res.consume()
+        except Exception as e:
+            stats.record(fp, cypher, op, time.perf_counter() - t0, 0, error=e)
+            raise
+        stats.record(fp, cypher, op, time.perf_counter() - t0, len(rows), summary, profiled=profiled)
+        return rows
+
+    def query(self, cypher: str, params: Optional[Dict[str, Any]] = None, op: str = "query") -> List[Dict[str, Any]]:
         with self.session() as s:
-            res = s.run(cypher, params)
-            return [dict(r) for r in res]
+            return self._run_timed(s.run, cypher, params or {}, op)
 
-    def merge_nodes(self, label: str, key: str, rows: List[Dict[str, Any]], batch_size: int = 1000):
-        if not rows:
-            return
-        q = f"""
-        UNWIND $rows AS row
-        MERGE (n:{label} {{{key}: row.{key}}})
-        SET n += row
+    def run_batch(self, statements: Iterable[Statement], transactional: bool = True) -> List[List[Dict[str, Any]]]:
+        """
+        Run several statements over a single session.
+
+        transactional=True：全部 statement 於同一個 write transaction 內執行（全有或全無，
+        transient error 由 driver 依 managed transaction 規則重試）。
+        transactional=False：同一 session 依序以 auto-commit 執行（適用 schema 指令等
+        不可與資料寫入混在同一 transaction 的情況）。
+
+        回傳每個 statement 的結果列（順序與輸入相同）。
+        """
+        stmts = [(q, p or {}) for q, p in statements]
+        if not stmts:
+            return []
+
+        def _work(tx):
+            return [self._run_timed(tx.run, q, p, "run_batch") for q, p in stmts]
+
+        with self.session() as s:
+            if transactional:
+                return s.execute_write(_work)
+            return [self._run_timed(s.run, q, p, "run_batch") for q, p in stmts]
+
+    # -----------------------------
+    # Batched writes (adaptive size + retry)
+    # -----------------------------
+    def _next_batch_size(self, size: int, elapsed_s: float) -> int:
+        """Steer toward target_batch_latency_s; grow/shrink at most 2x per batch."""
+        if elapsed_s <= 0:
+            ratio = 2.0
+        else:
+            ratio = min(max(self.target_batch_latency_s / elapsed_s, 0.5), 2.0)
+        return int(min(max(size * ratio, self.min_batch_size), self.max_batch_size))
+
+    def _write_chunk(self, cypher: str, param: str, chunk: List[Any], summary: WriteSummary, op: str,
+                     seq_property: Optional[str] = None,
+                     on_result: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> float:
+        """
+        Write one batch; transient errors are retried with exponential backoff + jitter. After
+        split_after_retries failures a multi-row batch is split in half and each half retried on
+        its own budget. Returns the duration of the successful attempt(s).
+        """
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                if seq_property is None:
+                    res = self.query(cypher, {param: chunk}, op=op)
+                else:
+                    # The graph assigns the number; a value left in the row by an earlier write must not overwrite it
+                    res = self.query(cypher, {param: [{k: v for k, v in row.items() if k != seq_property}
+                                                      for row in chunk]}, op=op)
+                    for r in res:
+                        chunk[int(r["i"])][seq_property] = r["seq"]
+                if on_result is not None:
+                    on_result(res)
+                summary.batches += 1
+                summary.rows += len(chunk)
+                return time.perf_counter() - t0
+            except Exception as e:
+                if not is_transient_error(e):
+                    raise
+                attempt += 1
+                summary.retries += 1
+                if attempt >= self.split_after_retries and len(chunk) > 1:
+                    summary.splits += 1
+                    mid = len(chunk) // 2
+                    return (self._write_chunk(cypher, param, chunk[:mid], summary, op, seq_property, on_result)
+                            + self._write_chunk(cypher, param, chunk[mid:], summary, op, seq_property, on_result))
+                if attempt > self.max_retries:
+                    raise
+                delay = self.retry_base_delay_s * (2 ** (attempt - 1))
+                time.sleep(delay * random.uniform(0.5, 1.5))
+
+    def _write_adaptive(self, target: str, cypher: str, param: str, items: Sequence[Any],
+                        batch_size: int, op: str, seq_property: Optional[str] = None,
+                        on_result: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> WriteSummary:
+        summary = WriteSummary(target=target)
+        size = max(int(batch_size), 1)
+        t0 = time.perf_counter()
+        i = 0
+        while i < len(items):
+            chunk = list(items[i:i+size])
+            elapsed = self._write_chunk(cypher, param, chunk, summary, op, seq_property, on_result)
+            i += len(chunk)
+            size = self._next_batch_size(size, elapsed)
+        summary.elapsed_s = time.perf_counter() - t0
+        summary.final_batch_size = size
+        return summary
+
+    def merge_nodes(self, label: str, key: str, rows: List[Dict[str, Any]], batch_size: int = 1000,
+                    seq_property: Optional[str] = None) -> WriteSummary:
         """
-        for i in range(0, len(rows), batch_size):
-            chunk = rows[i:i+batch_size]
-            self.query(q, {"rows": chunk})
+        batch_size is the starting size; it adapts toward target_batch_latency_s.
+        seq_property: number the created nodes from the label's durable counter (merge_sequenced_cypher);
+        existing nodes keep theirs. Each row's number is written back into its dict.
+        """
+        if not rows:
+            return WriteSummary(target=label)
+        cypher = merge_sequenced_cypher(label, key, seq_property) if seq_property else merge_nodes_cypher(label, key)
+        return self._write_adaptive(label, cypher, "rows", rows, batch_size, f"merge_nodes:{label}", seq_property)
 
     def merge_rels(
         self,
@@ -77,16 +388,17 @@ class Neo4jHelper:
         tgt_key: str,
         pairs: Sequence[Tuple[str, str]],
         rel_type: str,
-        batch_size: int = 2000
-    ):
-        if not pairs:
-            return
-        q = f"""
-        UNWIND $pairs AS p
-        MATCH (s:{src_label} {{{src_key}: p[0]}})
-        MATCH (t:{tgt_label} {{{tgt_key}: p[1]}})
-        MERGE (s)-[r:{rel_type}]->(t)
+        batch_size: int = 2000,
+        written: Optional[Set[Tuple[str, str]]] = None
+    ) -> WriteSummary:
         """
-        for i in range(0, len(pairs), batch_size):
-            chunk = pairs[i:i+batch_size]
-            self.query(q, {"pairs": chunk})
+        batch_size is the starting size; it adapts toward target_batch_latency_s.
+        written: if given, receives the (src, tgt) pairs whose endpoints both matched; a pair with a
+        missing endpoint writes nothing and is not added.
+        """
+        if not pairs:
+            return WriteSummary(target=rel_type)
+        q = merge_rels_cypher(src_label, src_key, tgt_label, tgt_key, rel_type)
+        on_result = None if written is None else (lambda res: written.update((r["src"], r["tgt"]) for r in res))
+        return self._write_adaptive(rel_type, q, "pairs", pairs, batch_size, f"merge_rels:{rel_type}",
+                                    on_result=on_result)
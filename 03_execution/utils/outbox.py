@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/outbox.py
+
+工作流派發的 durable outbox（SQLite，單一檔案，WAL）：at-least-once delivery。
+每一筆是一張 MaintenanceTask（utils/task_coalescing.py 合併後的 anomaly 群組），以 task_id 為 key。
+
+狀態：pending → inflight（claim，附 lease）→ done（ack）
+                               └→ pending（nack，指數退避 + jitter 後重送）→ … → dead（attempts 達上限）
+- enqueue：INSERT OR IGNORE（同一 task 只排入一次），同時配發 workorder_id 與 t_task_created，
+  之後每次重送都沿用同一張 WorkOrder，TTA 由第一次建立工單起算
+- claim：取出到期的 pending 與 lease 過期的 inflight（行程中斷時自動重送）
+- nack(count_attempt=False)：未實際送出（例如 circuit breaker open）時只延後，不消耗重試次數
+- 以 target（Neo4jHelper.target）區分不同圖譜的資料，同一檔案可服務多個資料庫
+- task_members 記錄每個 task 的成員 anomaly_id（enqueue 時於同一 transaction 寫入）：held() 回答哪些
+  anomaly 已在 outbox 中（任何狀態），派發端以此對帳，而不是依賴圖譜上的旗標；較舊的檔案開啟時由 payload 補建
+- 舊版檔案（每筆 anomaly 一列的 outbox 表）開啟時自動搬移：未完成與已完成的列原樣複製到 task_outbox
+  （task_id = 原 anomaly_id，payload 本身帶 anomaly_id，派發端照常處理），再刪除舊表與其 index
+
+Config（workflow.outbox，皆可省略）：
+    path: <output_dir>/workflow_outbox.sqlite
+    max_attempts: 5
+    retry_base_s: 5.0       # 第 n 次失敗後等待 retry_base_s * 2^(n-1)（± 50% jitter）
+    retry_max_s: 300.0
+    lease_s: 60.0
+"""
+from __future__ import annotations
+
+import json
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+def member_ids(payload: Dict[str, Any]) -> List[str]:
+    """Anomaly ids a task payload covers (coalesced members, or the single anomaly of a legacy row)."""
+    ids = [m["anomaly_id"] for m in payload.get("anomalies", [])]
+    return ids or ([payload["anomaly_id"]] if payload.get("anomaly_id") else [])
+
+@dataclass
+class OutboxEntry:
+    task_id: str
+    payload: Dict[str, Any]
+    workorder_id: str
+    t_task_created: str
+    attempts: int
+
+class Outbox:
+    def __init__(self, path: str, target: str = "", max_attempts: int = 5, retry_base_s: float = 5.0,
+                 retry_max_s: float = 300.0, lease_s: float = 60.0):
+        self.path = str(path)
+        self.target = target
+        self.max_attempts = max(int(max_attempts), 1)
+        self.retry_base_s = float(retry_base_s)
+        self.retry_max_s = float(retry_max_s)
+        self.lease_s = float(lease_s)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        con = self._con
+        con.execute("BEGIN IMMEDIATE")
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS task_outbox (
+                target TEXT NOT NULL, task_id TEXT NOT NULL,
+                payload TEXT NOT NULL, workorder_id TEXT NOT NULL, t_task_created TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,
+                next_at REAL NOT NULL, lease_until REAL, last_error TEXT, updated_at REAL NOT NULL,
+                PRIMARY KEY (target, task_id)
+            ) WITHOUT ROWID""")
+        try:
+            self._migrate_legacy()
+            self._create_members()
+        except Exception:
+            con.rollback()
+            con.close()
+            raise
+        con.execute("CREATE INDEX IF NOT EXISTS task_outbox_due ON task_outbox (target, status, next_at)")
+        con.commit()
+
+    def _create_members(self):
+        """task_members (anomaly -> task); filled from the stored payloads when the table is new."""
+        con = self._con
+        if con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='task_members'").fetchone():
+            return
+        con.execute("""
+            CREATE TABLE task_members (
+                target TEXT NOT NULL, anomaly_id TEXT NOT NULL, task_id TEXT NOT NULL,
+                PRIMARY KEY (target, anomaly_id)
+            ) WITHOUT ROWID""")
+        con.executemany("INSERT OR IGNORE INTO task_members (target, anomaly_id, task_id) VALUES (?, ?, ?)",
+                        [(target, aid, tid) for target, tid, p in con.execute(
+                            "SELECT target, task_id, payload FROM task_outbox").fetchall()
+                         for aid in member_ids(json.loads(p))])
+
+    def _migrate_legacy(self):
+        """Move rows of the per-anomaly `outbox` table (older files) into task_outbox, then drop it."""
+        con = self._con
+        cols = [r[1] for r in con.execute("PRAGMA table_info(outbox)")]
+        if cols:
+            if "anomaly_id" not in cols:
+                raise RuntimeError(f"{self.path}: unrecognised outbox table (columns {cols}); move the file aside")
+            con.execute("INSERT OR IGNORE INTO task_outbox (target, task_id, payload, workorder_id, t_task_created, "
+                        "status, attempts, next_at, lease_until, last_error, updated_at) "
+                        "SELECT target, anomaly_id, payload, workorder_id, t_task_created, status, attempts, next_at, "
+                        "lease_until, last_error, updated_at FROM outbox")
+            con.execute("DROP TABLE outbox")
+        con.execute("DROP INDEX IF EXISTS outbox_due")      # old name, on either table
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any], default_path: str, target: str = "") -> "Outbox":
+        return cls(
+            cfg.get("path", default_path), target,
+            max_attempts=int(cfg.get("max_attempts", 5)),
+            retry_base_s=float(cfg.get("retry_base_s", 5.0)),
+            retry_max_s=float(cfg.get("retry_max_s", 300.0)),
+            lease_s=float(cfg.get("lease_s", 60.0)),
+        )
+
+    def close(self):
+        with self._lock:
+            self._con.close()
+
+    # -----------------------------
+    # Producer
+    # -----------------------------
+    def enqueue(self, items: Iterable[Tuple[str, Dict[str, Any], str, str]]) -> List[str]:
+        """items: (task_id, payload, workorder_id, t_task_created); returns the ids that were not queued yet."""
+        now = time.time()
+        new = []
+        with self._lock:
+            con = self._con
+            con.execute("BEGIN IMMEDIATE")
+            for aid, p, woid, t_created in items:
+                cur = con.execute(
+                    "INSERT OR IGNORE INTO task_outbox (target, task_id, payload, workorder_id, t_task_created, next_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.target, aid, json.dumps(p, ensure_ascii=False, default=str), woid, t_created, now, now))
+                if cur.rowcount:
+                    new.append(aid)
+                    con.executemany("INSERT OR IGNORE INTO task_members (target, anomaly_id, task_id) VALUES (?, ?, ?)",
+                                    [(self.target, m, aid) for m in member_ids(p)])
+            con.commit()
+        return new
+
+    def held(self, anomaly_ids: Iterable[str]) -> Set[str]:
+        """The given anomaly ids that already belong to a task in the outbox (pending, inflight, done or dead)."""
+        ids = list(dict.fromkeys(anomaly_ids))
+        out: Set[str] = set()
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                rows = self._con.execute(
+                    f"SELECT anomaly_id FROM task_members WHERE target=? AND anomaly_id IN ({','.join('?' * len(part))})",
+                    (self.target, *part)).fetchall()
+                out.update(r[0] for r in rows)
+        return out
+
+    # -----------------------------
+    # Consumer
+    # -----------------------------
+    def claim(self, limit: int) -> List[OutboxEntry]:
+        """Lease up to `limit` due entries (pending and due, or inflight with an expired lease)."""
+        now = time.time()
+        with self._lock:
+            con = self._con
+            con.execute("BEGIN IMMEDIATE")
+            cur = con.execute(
+                "SELECT task_id, payload, workorder_id, t_task_created, attempts FROM task_outbox "
+                "WHERE target=? AND ((status='pending' AND next_at<=?) OR (status='inflight' AND lease_until<=?)) "
+                "ORDER BY next_at LIMIT ?", (self.target, now, now, int(limit))).fetchall()
+            con.executemany("UPDATE task_outbox SET status='inflight', lease_until=?, updated_at=? WHERE target=? AND task_id=?",
+                            [(now + self.lease_s, now, self.target, r[0]) for r in cur])
+            con.commit()
+        return [OutboxEntry(r[0], json.loads(r[1]), r[2], r[3], int(r[4])) for r in cur]
+
+    def ack(self, task_id: str):
+        with self._lock:
+            self._con.execute("UPDATE task_outbox SET status='done', attempts=attempts+1, lease_until=NULL, last_error=NULL, "
+                              "updated_at=? WHERE target=? AND task_id=?", (time.time(), self.target, task_id))
+            self._con.commit()
+
+    def retry_delay(self, attempts: int) -> float:
+        return min(self.retry_base_s * (2 ** max(attempts - 1, 0)), self.retry_max_s) * random.uniform(0.5, 1.5)
+
+    def nack(self, task_id: str, error: str, count_attempt: bool = True, delay_s: Optional[float] = None) -> str:
+        """Schedule a retry (or dead-letter after max_attempts); returns the new status."""
+        now = time.time()
+        with self._lock:
+            row = self._con.execute("SELECT attempts FROM task_outbox WHERE target=? AND task_id=?",
+                                    (self.target, task_id)).fetchone()
+            attempts = int(row[0]) + (1 if count_attempt else 0) if row else 1
+            status = "dead" if attempts >= self.max_attempts else "pending"
+            delay = self.retry_delay(attempts) if delay_s is None else delay_s
+            self._con.execute("UPDATE task_outbox SET status=?, attempts=?, next_at=?, lease_until=NULL, last_error=?, "
+                              "updated_at=? WHERE target=? AND task_id=?",
+                              (status, attempts, now + delay, str(error)[:500], now, self.target, task_id))
+            self._con.commit()
+        return status
+
+    # -----------------------------
+    # Compensation / reporting
+    # -----------------------------
+    def next_due_in(self) -> Optional[float]:
+        """Seconds until the next pending/inflight entry becomes claimable; None when nothing is left."""
+        with self._lock:
+            row = self._con.execute(
+                "SELECT MIN(CASE WHEN status='pending' THEN next_at ELSE lease_until END) FROM task_outbox "
+                "WHERE target=? AND status IN ('pending', 'inflight')", (self.target,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return max(float(row[0]) - time.time(), 0.0)
+
+    def requeue_dead(self) -> int:
+        """Give dead-lettered entries a fresh attempt budget (manual compensation)."""
+        now = time.time()
+        with self._lock:
+            cur = self._con.execute("UPDATE task_outbox SET status='pending', attempts=0, next_at=?, updated_at=? "
+                                    "WHERE target=? AND status='dead'", (now, now, self.target))
+            self._con.commit()
+            return cur.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._con.execute("SELECT status, COUNT(*) FROM task_outbox WHERE target=? GROUP BY status",
+                                     (self.target,)).fetchall()
+        return {s: int(n) for s, n in rows}
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._con.execute("SELECT task_id, workorder_id, attempts, last_error FROM task_outbox "
+                                     "WHERE target=? AND status='dead' ORDER BY updated_at LIMIT ?",
+                                     (self.target, int(limit))).fetchall()
+        return [{"task_id": a, "workorder_id": w, "attempts": n, "last_error": e} for a, w, n, e in rows]
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/pipeline.py
+
+行程內串流 pipeline：各 stage 一個執行緒，stage 之間以有界 queue（queue.Queue(maxsize)）相連。
+- backpressure：下游 queue 滿時上游的 put 會阻塞（不丟資料），阻塞時間記為 blocked_s
+- 每個 item 為 Batch（一批資料 + 進入 pipeline 的 monotonic 時間），可算出 end-to-end latency
+- source stage（inbox=None）每個 tick 呼叫 fn(None) 取得新資料；其餘 stage 等待 inbox，
+  idle_s 內沒有資料時呼叫 on_idle()（例如重送到期的失敗項目）
+- 關閉：stop event 設定後 source 停止產生資料，下游 stage 處理完 inbox 內剩餘的 batch 才結束
+- 失敗：fn 拋出例外時以指數退避重試同一批（retries 次，預設 3）；仍失敗則該 stage 標記 failed 並設定
+  stop event，之後收到的 batch 只取出、不處理（上游不會卡在 put），失敗的 batch 與其後的資料都不會被
+  當成已處理——fn 只在成功時推進 watermark / 搬移檔案，重新啟動後從失敗點重做
+- StageMetrics：處理批數 / 筆數、重試 / 略過次數、忙碌時間、queue 等待時間與處理時間的百分位（最近 window 批）
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+@dataclass
+class Batch:
+    items: List[Any]
+    t_ingest_ns: int = field(default_factory=time.monotonic_ns)   # when the batch entered the pipeline
+    t_enqueued_ns: int = 0                                         # when it was put on the current queue
+
+def _pct_ms(values: List[int], p: float) -> Optional[float]:
+    if not values:
+        return None
+    v = sorted(values)
+    return round(v[min(int(p * len(v)), len(v) - 1)] / 1e6, 3)
+
+class StageMetrics:
+    def __init__(self, name: str, window: int = 1024):
+        self.name = name
+        self.batches = 0
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.retries = 0
+        self.skipped = 0
+        self.failed: Optional[str] = None
+        self.busy_s = 0.0
+        self.blocked_s = 0.0
+        self._wait_ns: Deque[int] = deque(maxlen=window)
+        self._proc_ns: Deque[int] = deque(maxlen=window)
+        self._e2e_ns: Deque[int] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, n_in: int, n_out: int, wait_ns: int, proc_ns: int, e2e_ns: Optional[int] = None):
+        with self._lock:
+            self.batches += 1
+            self.items_in += n_in
+            self.items_out += n_out
+            self.busy_s += proc_ns / 1e9
+            self._wait_ns.append(wait_ns)
+            self._proc_ns.append(proc_ns)
+            if e2e_ns is not None:
+                self._e2e_ns.append(e2e_ns)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            wait, proc, e2e = list(self._wait_ns), list(self._proc_ns), list(self._e2e_ns)
+            out = {"stage": self.name, "batches": self.batches, "items_in": self.items_in,
+                   "items_out": self.items_out, "errors": self.errors, "retries": self.retries,
+                   "skipped": self.skipped, "failed": self.failed, "busy_s": round(self.busy_s, 6),
+                   "blocked_s": round(self.blocked_s, 6),
+                   "queue_wait_ms": {"p50": _pct_ms(wait, 0.50), "p95": _pct_ms(wait, 0.95)},
+                   "process_ms": {"p50": _pct_ms(proc, 0.50), "p95": _pct_ms(proc, 0.95), "max": _pct_ms(proc, 1.0)}}
+        if e2e:
+            out["end_to_end_ms"] = {"p50": _pct_ms(e2e, 0.50), "p95": _pct_ms(e2e, 0.95), "max": _pct_ms(e2e, 1.0)}
+        return out
+
+class PipelineStage(threading.Thread):
+    """
+    fn(items) -> output items (list; empty/None = nothing to pass on). Sources get fn(None) every idle_s
+    and return None when they have nothing (or, with finite=True, once exhausted).
+    fn must be safe to call again with the same items after it raised (a failed source call is retried
+    with None, so a source keeps its current chunk until fn succeeds).
+    """
+
+    def __init__(self, name: str, fn: Callable[[Optional[List[Any]]], Optional[List[Any]]],
+                 stop: threading.Event, inbox: Optional["queue.Queue[Batch]"] = None,
+                 outbox: Optional["queue.Queue[Batch]"] = None, upstream: Optional["PipelineStage"] = None,
+                 idle_s: float = 0.5, on_idle: Optional[Callable[[], None]] = None,
+                 on_error: Optional[Callable[[str, BaseException], None]] = None, finite: bool = False,
+                 retries: int = 3, retry_backoff_s: float = 0.5, retry_max_s: float = 30.0):
+        super().__init__(name=f"stage-{name}", daemon=True)
+        self.stage_name = name
+        self.fn = fn
+        self.stop_event = stop
+        self.inbox = inbox
+        self.outbox = outbox
+        self.upstream = upstream
+        self.idle_s = float(idle_s)
+        self.on_idle = on_idle
+        self.on_error = on_error
+        self.finite = finite
+        self.retries = max(int(retries), 0)
+        self.retry_backoff_s = float(retry_backoff_s)
+        self.retry_max_s = float(retry_max_s)
+        self.failed: Optional[BaseException] = None
+        self.metrics = StageMetrics(name)
+        self.finished = threading.Event()
+
+    def _put(self, batch: Batch):
+        """Blocking put: a full downstream queue stalls this stage (backpressure) instead of dropping data."""
+        t0 = time.perf_counter()
+        batch.t_enqueued_ns = time.monotonic_ns()
+        self.outbox.put(batch)
+        self.metrics.blocked_s += time.perf_counter() - t0
+
+    def _call(self, items: Optional[List[Any]]) -> Optional[List[Any]]:
+        """fn(items), retried with exponential backoff; re-raises after the last attempt."""
+        attempt = 0
+        while True:
+            try:
+                return self.fn(items)
+            except Exception as e:             # the caller logs it
+                self.metrics.errors += 1
+                if self.on_error is not None:
+                    self.on_error(self.stage_name, e)
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                self.metrics.retries += 1
+                time.sleep(min(self.retry_backoff_s * 2 ** (attempt - 1), self.retry_max_s))
+
+    def _fail(self, e: BaseException):
+        """Give up: stop the whole pipeline rather than move on past an unprocessed batch."""
+        self.failed = e
+        self.metrics.failed = repr(e)
+        self.stop_event.set()
+
+    def _process(self, batch: Optional[Batch]):
+        items = None if batch is None else batch.items
+        t_start = time.monotonic_ns()
+        wait_ns = 0 if batch is None or not batch.t_enqueued_ns else t_start - batch.t_enqueued_ns
+        try:
+            out = self._call(items)
+        except Exception as e:
+            self._fail(e)
+            return
+        t_end = time.monotonic_ns()
+        if batch is None and not out:
+            return                             # idle source tick
+        src = batch if batch is not None else Batch(items=[], t_ingest_ns=t_start)
+        e2e = t_end - src.t_ingest_ns if self.outbox is None and batch is not None else None
+        self.metrics.record(len(items or []), len(out or []), wait_ns, t_end - t_start, e2e)
+        if out and self.outbox is not None:
+            self._put(Batch(items=list(out), t_ingest_ns=src.t_ingest_ns))
+
+    def _upstream_done(self) -> bool:
+        return self.upstream.finished.is_set() if self.upstream is not None else self.stop_event.is_set()
+
+    def run(self):
+        try:
+            if self.inbox is None:
+                while not self.stop_event.is_set() and self.failed is None:
+                    before = self.metrics.items_out
+                    self._process(None)
+                    if self.metrics.items_out == before:
+                        if self.finite:
+                            break
+                        self.stop_event.wait(self.idle_s)
+                return
+            while True:
+                try:
+                    batch = self.inbox.get(timeout=self.idle_s)
+                except queue.Empty:
+                    if self._upstream_done():
+                        return
+                    if self.on_idle is not None:
+                        try:
+                            self.on_idle()
+                        except Exception as e:
+                            self.metrics.errors += 1
+                            if self.on_error is not None:
+                                self.on_error(self.stage_name, e)
+                    continue
+                if self.failed is not None:
+                    self.metrics.skipped += 1      # left for the restart; keeps the upstream put from blocking
+                    continue
+                self._process(batch)
+        finally:
+            self.finished.set()
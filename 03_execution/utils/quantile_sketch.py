@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/quantile_sketch.py
+
+可合併（mergeable）的串流分位數 sketch（DDSketch），用於長時間、跨 run / 跨站點的 TTA 與 L1–L4 延遲監控：
+- DDSketch：值 v 落在 bucket ceil(log_γ |v|)，γ = (1+α)/(1−α)；任何分位數的回傳值與真值的相對誤差 ≤ α
+  （relative_accuracy，預設 0.01）。正值、負值（跨主機時鐘偏移）分開存，0 另計；另記 count / sum / sumsq /
+  min / max，mean、std 為精確值
+- 記憶體固定：bucket 數超過 max_bins 時合併最小的 bucket（低分位數精度下降，p95 / p99 不受影響）；
+  1 ms–1 h 的延遲在 α=0.01 時約 760 個 bucket
+- merge：同一 α 的 sketch 直接把 bucket 計數相加，結果與把所有值加進同一個 sketch 相同（與順序無關）
+- SketchSet：依 (framework, stage) 維護多個 sketch，thread-safe；to_dict / save / load 為 JSON，
+  merge_files() 合併多個 run / 站點的檔案
+- stage 名稱與 04_validation/metrics/compute_metrics.py 的欄位一致（LATENCY_STAGES）
+
+RunLogger（utils/logger.py）持有一個 SketchSet，由 workflow_trigger_api.settle() 在每次成功派發時更新，
+寫入 <output_dir>/latency_sketch_<component>_<run_id>.json。
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+LATENCY_STAGES = ("L1_detect_ms", "L2_reason_ms", "L3_dispatch_ms", "L4_execute_ms", "tta_ms")
+PERCENTILES = (50, 95, 99)
+
+class DDSketch:
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        if not 0.0 < relative_accuracy < 1.0:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = float(relative_accuracy)
+        self.max_bins = max(int(max_bins), 16)
+        self.gamma = (1.0 + self.relative_accuracy) / (1.0 - self.relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.pos: Dict[int, int] = {}
+        self.neg: Dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    # ---- update
+    def _key(self, magnitude: float) -> int:
+        return int(math.ceil(math.log(magnitude) / self._log_gamma))
+
+    def _value(self, key: int) -> float:
+        return 2.0 * self.gamma ** key / (self.gamma + 1.0)
+
+    def add(self, value: float, n: int = 1):
+        if value != value or n <= 0:           # NaN
+            return
+        if value > 0:
+            k = self._key(value)
+            self.pos[k] = self.pos.get(k, 0) + n
+        elif value < 0:
+            k = self._key(-value)
+            self.neg[k] = self.neg.get(k, 0) + n
+        else:
+            self.zero += n
+        self.count += n
+        self.sum += value * n
+        self.sumsq += value * value * n
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.pos) + len(self.neg) > self.max_bins:
+            self._collapse()
+
+    def add_many(self, values: Iterable[float]):
+        """Vectorized add (numpy array / list); NaN is skipped."""
+        v = np.asarray(values, dtype="float64")
+        v = v[~np.isnan(v)]
+        if not len(v):
+            return
+        for store, part in ((self.pos, v[v > 0]), (self.neg, -v[v < 0])):
+            if len(part):
+                keys, counts = np.unique(np.ceil(np.log(part) / self._log_gamma).astype("int64"), return_counts=True)
+                for k, c in zip(keys.tolist(), counts.tolist()):
+                    store[k] = store.get(k, 0) + c
+        self.zero += int((v == 0).sum())
+        self.count += int(len(v))
+        self.sum += float(v.sum())
+        self.sumsq += float((v * v).sum())
+        self.min = min(self.min, float(v.min()))
+        self.max = max(self.max, float(v.max()))
+        if len(self.pos) + len(self.neg) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self):
+        """Fold the smallest-magnitude buckets together until max_bins holds (keeps the upper tail exact)."""
+        for store in (self.neg, self.pos):
+            excess = len(self.pos) + len(self.neg) - self.max_bins
+            if excess <= 0:
+                return
+            keys = sorted(store)
+            if len(keys) < 2:
+                continue
+            drop = keys[:min(excess, len(keys) - 1)]
+            into = keys[len(drop)]
+            store[into] += sum(store.pop(k) for k in drop)
+
+    def merge(self, other: "DDSketch"):
+        if abs(other.gamma - self.gamma) > 1e-12:
+            raise ValueError("cannot merge sketches with different relative_accuracy")
+        for mine, theirs in ((self.pos, other.pos), (self.neg, other.neg)):
+            for k, c in theirs.items():
+                mine[k] = mine.get(k, 0) + c
+        self.zero += other.zero
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self.pos) + len(self.neg) > self.max_bins:
+            self._collapse()
+
+    # ---- query
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for k in sorted(self.neg, reverse=True):
+            seen += self.neg[k]
+            if seen > rank:
+                return max(-self._value(k), self.min)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.pos):
+            seen += self.pos[k]
+            if seen > rank:
+                return min(self._value(k), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        if self.count == 0:
+            return {"count": 0}
+        mean = self.sum / self.count
+        var = (self.sumsq - self.count * mean * mean) / (self.count - 1) if self.count > 1 else 0.0
+        out = {"count": self.count, "mean": mean, "median": self.quantile(0.5), "std": math.sqrt(max(var, 0.0)),
+               "min": self.min, "max": self.max}
+        for p in PERCENTILES:
+            out[f"p{p}"] = self.quantile(p / 100.0)
+        return out
+
+    # ---- serialization
+    def to_dict(self) -> Dict[str, Any]:
+        return {"relative_accuracy": self.relative_accuracy, "max_bins": self.max_bins,
+                "count": self.count, "sum": self.sum, "sumsq": self.sumsq,
+                "min": self.min if self.count else None, "max": self.max if self.count else None,
+                "zero": self.zero,
+                "pos": [[k, self.pos[k]] for k in sorted(self.pos)],
+                "neg": [[k, self.neg[k]] for k in sorted(self.neg)]}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "DDSketch":
+        s = cls(float(d.get("relative_accuracy", 0.01)), int(d.get("max_bins", 2048)))
+        s.pos = {int(k): int(c) for k, c in d.get("pos", [])}
+        s.neg = {int(k): int(c) for k, c in d.get("neg", [])}
+        s.zero = int(d.get("zero", 0))
+        s.count = int(d.get("count", 0))
+        s.sum = float(d.get("sum", 0.0))
+        s.sumsq = float(d.get("sumsq", 0.0))
+        if s.count:
+            s.min, s.max = float(d["min"]), float(d["max"])
+        return s
+
+class SketchSet:
+    """DDSketch per (framework, stage); thread-safe, JSON-serializable, mergeable across runs / sites."""
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        self.relative_accuracy = float(relative_accuracy)
+        self.max_bins = int(max_bins)
+        self.sketches: Dict[Tuple[str, str], DDSketch] = {}
+        self.runs: List[str] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "SketchSet":
+        return cls(float(cfg.get("relative_accuracy", 0.01)), int(cfg.get("max_bins", 2048)))
+
+    def _get(self, framework: str, stage: str) -> DDSketch:
+        key = (framework, stage)
+        s = self.sketches.get(key)
+        if s is None:
+            s = self.sketches[key] = DDSketch(self.relative_accuracy, self.max_bins)
+        return s
+
+    def add(self, framework: str, stage: str, value: Optional[float], n: int = 1):
+        if value is None:
+            return
+        with self._lock:
+            self._get(framework, stage).add(value, n)
+
+    def add_many(self, framework: str, stage: str, values: Iterable[float]):
+        with self._lock:
+            self._get(framework, stage).add_many(values)
+
+    def merge(self, other: "SketchSet"):
+        with self._lock:
+            for (fw, stage), s in other.sketches.items():
+                self._get(fw, stage).merge(s)
+            self.runs += [r for r in other.runs if r not in self.runs]
+
+    def get(self, framework: str, stage: str) -> Optional[DDSketch]:
+        return self.sketches.get((framework, stage))
+
+    def frameworks(self) -> List[str]:
+        return sorted({fw for fw, _ in self.sketches})
+
+    def __len__(self) -> int:
+        return sum(s.count for s in self.sketches.values())
+
+    def summary(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{"framework": fw, "stage": stage, **s.summary()}
+                    for (fw, stage), s in sorted(self.sketches.items())]
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"relative_accuracy": self.relative_accuracy, "max_bins": self.max_bins, "runs": list(self.runs),
+                    "sketches": [{"framework": fw, "stage": stage, **s.to_dict()}
+                                 for (fw, stage), s in sorted(self.sketches.items())]}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "SketchSet":
+        out = cls(float(d.get("relative_accuracy", 0.01)), int(d.get("max_bins", 2048)))
+        out.runs = list(d.get("runs", []))
+        for s in d.get("sketches", []):
+            out.sketches[(s["framework"], s["stage"])] = DDSketch.from_dict(s)
+        return out
+
+    def save(self, path: str) -> str:
+        """Atomic write (tmp + replace): a reader never sees a half-written file."""
+        p = Path(path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(p.name + ".tmp")
+        tmp.write_text(json.dumps(self.to_dict(), separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, p)
+        return str(p)
+
+    @classmethod
+    def load(cls, path: str) -> "SketchSet":
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+def merge_files(paths: Iterable[str]) -> Optional[SketchSet]:
+    """Merge sketch files of many runs / sites; None when there are none."""
+    merged: Optional[SketchSet] = None
+    for path in paths:
+        s = SketchSet.load(path)
+        if merged is None:
+            merged = s
+        else:
+            merged.merge(s)
+    return merged
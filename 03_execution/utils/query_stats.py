@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/query_stats.py
+
+Neo4jHelper 的 statement 層級量測（timing span）與 PROFILE 擷取：
+- 每次 query()、run_batch() 內的每個 statement、merge_nodes / merge_rels 的每個 batch 都是一個 span：
+  client latency（送出到結果全部取回，perf_counter）、server result_available_after / result_consumed_after
+  （ms，取自 ResultSummary）、回傳列數、counters（nodes / relationships created 等）
+- 依 statement fingerprint 彙總：空白正規化、字串 / 數字常值換成 ?，再取 sha1 前 12 碼；同一 fingerprint 的
+  calls / errors / rows / counters 累加，client latency 保留最近 window 筆算 p50 / p95
+- PROFILE（opt-in，neo4j.profile_slow_ms）：某 fingerprint 的 span 超過門檻後，「下一次」執行時加上 PROFILE
+  前綴（就是那次執行本身，不會為了 profile 重跑寫入），擷取 plan（operator / rows / dbHits）；每個 fingerprint
+  一份，最多 profile_max_plans 份。schema 指令（CREATE / DROP INDEX、CONSTRAINT，SHOW …）不 profile
+- report_query_stats()：依總 client 時間排序，前 query_stats_top 個 fingerprint 記為 QUERY_STATS 事件，
+  全部寫入 <output_dir>/query_stats_<component>_<run_id>.csv
+"""
+from __future__ import annotations
+
+import csv
+import hashlib
+import json
+import re
+import threading
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+COUNTER_FIELDS = ("nodes_created", "nodes_deleted", "relationships_created", "relationships_deleted",
+                  "properties_set", "labels_added", "labels_removed", "indexes_added", "constraints_added")
+
+_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b")
+_WS = re.compile(r"\s+")
+_NO_PROFILE = re.compile(r"^\s*(PROFILE|EXPLAIN|SHOW|USING|CREATE\s+(INDEX|CONSTRAINT|DATABASE)|DROP)\b", re.I)
+
+@lru_cache(maxsize=4096)
+def fingerprint(cypher: str) -> Tuple[str, str]:
+    """(fingerprint id, normalized statement text)."""
+    text = _WS.sub(" ", _LITERAL.sub("?", cypher)).strip()
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12], text
+
+def counters_of(summary: Any) -> Dict[str, int]:
+    c = getattr(summary, "counters", None)
+    if c is None:
+        return {}
+    return {k: int(getattr(c, k, 0) or 0) for k in COUNTER_FIELDS}
+
+def compact_plan(plan: Any) -> Dict[str, Any]:
+    """Operator tree of a PROFILE plan (driver dict or memory backend dict) with rows / dbHits only."""
+    if not plan:
+        return {}
+    args = plan.get("args", {}) or {}
+    out: Dict[str, Any] = {"operator": plan.get("operatorType"),
+                           "rows": plan.get("rows", args.get("Rows", args.get("rows"))),
+                           "db_hits": plan.get("dbHits", args.get("DbHits"))}
+    details = args.get("Details") or args.get("handler")
+    if details:
+        out["details"] = details
+    children = [compact_plan(c) for c in plan.get("children", []) or []]
+    if children:
+        out["children"] = children
+    return out
+
+def _pct(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    v = sorted(values)
+    return round(v[min(int(p * len(v)), len(v) - 1)], 3)
+
+class QueryStats:
+    def __init__(self, window: int = 1024, profile_slow_ms: Optional[float] = None, profile_max_plans: int = 10):
+        self.window = max(int(window), 1)
+        self.profile_slow_ms = None if profile_slow_ms is None else float(profile_slow_ms)
+        self.profile_max_plans = max(int(profile_max_plans), 0)
+        self.plans: Dict[str, Dict[str, Any]] = {}
+        self._aggs: Dict[str, Dict[str, Any]] = {}
+        self._lat: Dict[str, Deque[float]] = {}
+        self._to_profile: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def prepare(self, cypher: str) -> Tuple[str, str, bool]:
+        """(fingerprint, statement to run, profiled): adds PROFILE when this fingerprint is due for a plan."""
+        fp, _ = fingerprint(cypher)
+        if fp in self._to_profile:
+            with self._lock:
+                if fp in self._to_profile:
+                    self._to_profile.discard(fp)
+                    return fp, "PROFILE " + cypher.lstrip(), True
+        return fp, cypher, False
+
+    def record(self, fp: str, cypher: str, op: str, client_s: float, rows: int, summary: Any = None,
+               error: Optional[BaseException] = None, profiled: bool = False):
+        client_ms = client_s * 1000.0
+        counters = counters_of(summary)
+        available = getattr(summary, "result_available_after", None)
+        consumed = getattr(summary, "result_consumed_after", None)
+        with self._lock:
+            agg = self._aggs.get(fp)
+            if agg is None:
+                agg = self._aggs[fp] = {"fingerprint": fp, "op": op, "statement": fingerprint(cypher)[1],
+                                        "calls": 0, "errors": 0, "rows": 0, "client_ms_total": 0.0,
+                                        "client_ms_max": 0.0, "server_available_ms_total": 0,
+                                        "server_consumed_ms_total": 0, **{k: 0 for k in COUNTER_FIELDS}}
+                self._lat[fp] = deque(maxlen=self.window)
+            agg["calls"] += 1
+            agg["rows"] += rows
+            agg["client_ms_total"] += client_ms
+            agg["client_ms_max"] = max(agg["client_ms_max"], client_ms)
+            self._lat[fp].append(client_ms)
+            if error is not None:
+                agg["errors"] += 1
+                agg["last_error"] = repr(error)[:300]
+            agg["server_available_ms_total"] += int(available or 0)
+            agg["server_consumed_ms_total"] += int(consumed or 0)
+            for k, v in counters.items():
+                agg[k] += v
+            if profiled:
+                self.plans[fp] = {"client_ms": round(client_ms, 3),
+                                  "plan": compact_plan(getattr(summary, "profile", None))}
+            elif (self.profile_slow_ms is not None and error is None and client_ms >= self.profile_slow_ms
+                  and fp not in self.plans and fp not in self._to_profile
+                  and len(self.plans) + len(self._to_profile) < self.profile_max_plans
+                  and not _NO_PROFILE.match(cypher)):
+                self._to_profile.add(fp)
+
+    def summary(self, top: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Per-fingerprint aggregates, slowest (total client time) first."""
+        with self._lock:
+            out = []
+            for fp, agg in self._aggs.items():
+                lat = list(self._lat[fp])
+                row = dict(agg)
+                row["client_ms_total"] = round(agg["client_ms_total"], 3)
+                row["client_ms_max"] = round(agg["client_ms_max"], 3)
+                row["client_ms_mean"] = round(agg["client_ms_total"] / agg["calls"], 3) if agg["calls"] else None
+                row["client_ms_p50"] = _pct(lat, 0.50)
+                row["client_ms_p95"] = _pct(lat, 0.95)
+                if fp in self.plans:
+                    row["plan"] = self.plans[fp]
+                out.append(row)
+        out.sort(key=lambda r: -r["client_ms_total"])
+        return out[:top] if top is not None else out
+
+COLUMNS = ["fingerprint", "op", "calls", "errors", "rows", "client_ms_total", "client_ms_mean", "client_ms_p50",
+           "client_ms_p95", "client_ms_max", "server_available_ms_total", "server_consumed_ms_total",
+           *COUNTER_FIELDS, "statement", "last_error", "plan"]
+
+def report_query_stats(neo: Any, logger: Any) -> Optional[str]:
+    """Log the top fingerprints as QUERY_STATS events and write the full table next to the run log."""
+    stats: Optional[QueryStats] = getattr(neo, "query_stats", None)
+    if stats is None or not getattr(neo, "instrument", True):
+        return None
+    rows = stats.summary()
+    if not rows:
+        return None
+    for rank, r in enumerate(rows[:int(getattr(neo, "query_stats_top", 20))], start=1):
+        logger.log_event("QUERY_STATS", details={"rank": rank, **r})
+    path = Path(logger.out_dir) / f"query_stats_{logger.component}_{logger.run_id}.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8-sig", newline="") as fh:
+        w = csv.DictWriter(fh, fieldnames=COLUMNS, extrasaction="ignore", lineterminator="\n")
+        w.writeheader()
+        for r in rows:
+            w.writerow({**r, "plan": json.dumps(r["plan"], ensure_ascii=False) if "plan" in r else ""})
+    logger.log_event("QUERY_STATS_SUMMARY", details={
+        "fingerprints": len(rows), "calls": sum(r["calls"] for r in rows),
+        "client_ms_total": round(sum(r["client_ms_total"] for r in rows), 3),
+        "plans": len(stats.plans), "path": str(path)})
+    return str(path)
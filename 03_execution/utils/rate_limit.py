@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/rate_limit.py
+
+Token bucket 限流（thread-safe）：
+- rate_per_s：長期平均速率；burst：可瞬間送出的上限（桶容量）
+- acquire() 在沒有 token 時阻塞到下一個 token 產生為止（不 busy-wait）
+- RateLimiters：依 key（例如 workflow endpoint）各自一個 bucket，未設定速率的 key 不限流
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+class TokenBucket:
+    def __init__(self, rate_per_s: float, burst: Optional[float] = None):
+        if rate_per_s <= 0:
+            raise ValueError("rate_per_s must be > 0")
+        self.rate = float(rate_per_s)
+        self.capacity = float(burst if burst is not None else max(rate_per_s, 1.0))
+        self._tokens = self.capacity
+        self._t = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    def acquire(self, n: float = 1.0) -> float:
+        """Take n tokens, sleeping as needed; returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return waited
+                wait = (n - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+class RateLimiters:
+    """
+    One TokenBucket per key. cfg: {"rate_per_s": .., "burst": .., "per_key": {key: {"rate_per_s": .., "burst": ..}}};
+    keys without a rate are not limited.
+    """
+
+    def __init__(self, cfg: Optional[Dict[str, Any]] = None):
+        cfg = cfg or {}
+        self._default = cfg.get("rate_per_s")
+        self._default_burst = cfg.get("burst")
+        self._per_key: Dict[str, Dict[str, Any]] = dict(cfg.get("per_key", {}))
+        self._buckets: Dict[str, Optional[TokenBucket]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[TokenBucket]:
+        with self._lock:
+            if key not in self._buckets:
+                spec = self._per_key.get(key, {})
+                rate = spec.get("rate_per_s", self._default)
+                burst = spec.get("burst", self._default_burst)
+                self._buckets[key] = TokenBucket(float(rate), None if burst is None else float(burst)) if rate else None
+            return self._buckets[key]
+
+    def acquire(self, key: str) -> float:
+        bucket = self.get(key)
+        return bucket.acquire() if bucket is not None else 0.0
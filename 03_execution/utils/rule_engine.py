@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/rule_engine.py
+
+閾值規則引擎：將 config `anomaly_rules` 編譯成陣列，一次向量化比對「每條規則 × 每筆讀值」。
+
+規則格式（list，或 {"rules": [...]}）：
+    anomaly_rules:
+      - id: temp_high
+        metric: temperature
+        upper: 30.0
+        severity: HIGH
+      - id: temp_high_ahu            # 指定 component_type 的規則覆寫同 metric 的通用規則
+        metric: temperature
+        component_type: AHU
+        upper: 27.5
+      - id: pressure_low
+        metric: pressure
+        lower: 80
+        severity: MEDIUM
+        version: 2
+
+相容舊格式：{default_metric, upper, lower} 視為單一規則（id = threshold_<metric>）。
+metric: null（含舊格式 default_metric: null）為萬用規則，套用到所有 metric 的讀值（id = threshold_all）；
+此時 RuleEngine.metrics 含 ANY_METRIC（"*"），讀值查詢不再依 metric 過濾。
+
+比對方式：
+- metric / component_type 不分大小寫、忽略前後空白
+- 讀值允許帶單位的字串（"25.14 C" → 25.14）；無法解析者不觸發任何規則
+- 命中矩陣為 n × R 的布林陣列（numpy broadcasting），不逐列迴圈
+- 未指定 severity 時沿用原本行為：超過 upper → HIGH，低於 lower → MEDIUM
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+ANY_METRIC = "*"      # in a metric list: every metric is read (a rule with metric: null)
+
+_NUM_RE = r"^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)"
+
+@dataclass(frozen=True)
+class Rule:
+    rule_id: str
+    metric: Optional[str]          # None = every metric
+    upper: Optional[float] = None
+    lower: Optional[float] = None
+    component_type: Optional[str] = None
+    severity: Optional[str] = None
+    version: str = "1"
+
+def _norm(v: Any) -> str:
+    return "" if v is None else str(v).strip().lower()
+
+def metric_selected(metric: Any, metrics: Any) -> bool:
+    """Whether a reading's metric is in a detector metric list / set (ANY_METRIC selects every metric)."""
+    return ANY_METRIC in metrics or _norm(metric) in metrics
+
+def parse_numeric(values: Sequence[Any]) -> np.ndarray:
+    """Leading number of each value as float ("25.14 C" -> 25.14); NaN when absent."""
+    s = pd.Series(list(values), dtype=object)
+    num = pd.to_numeric(s, errors="coerce")
+    todo = num.isna() & s.notna()
+    if todo.any():
+        num[todo] = pd.to_numeric(s[todo].astype(str).str.extract(_NUM_RE, expand=False), errors="coerce")
+    return num.to_numpy(dtype=float)
+
+def parse_rules(cfg_rules: Any) -> List[Rule]:
+    if not cfg_rules:
+        cfg_rules = {"default_metric": "temperature", "upper": 30.0, "lower": None}
+    if isinstance(cfg_rules, dict) and "rules" in cfg_rules:
+        cfg_rules = cfg_rules["rules"]
+    if isinstance(cfg_rules, dict):
+        metric = cfg_rules.get("default_metric", "temperature")
+        cfg_rules = [{"id": f"threshold_{'all' if metric is None else metric}", "metric": metric,
+                      "upper": cfg_rules.get("upper"), "lower": cfg_rules.get("lower")}]
+    rules = []
+    for i, r in enumerate(cfg_rules):
+        if r.get("upper") is None and r.get("lower") is None:
+            raise ValueError(f"anomaly rule {r.get('id', i)!r} needs an upper and/or lower bound")
+        if "metric" not in r:
+            raise ValueError(f"anomaly rule {r.get('id', i)!r} needs a metric (null = every metric)")
+        rules.append(Rule(
+            rule_id=str(r.get("id", f"rule_{i}")),
+            metric=None if r["metric"] is None else str(r["metric"]),
+            upper=None if r.get("upper") is None else float(r["upper"]),
+            lower=None if r.get("lower") is None else float(r["lower"]),
+            component_type=r.get("component_type"),
+            severity=r.get("severity"),
+            version=str(r.get("version", "1")),
+        ))
+    ids = [r.rule_id for r in rules]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"duplicate anomaly rule ids: {sorted({i for i in ids if ids.count(i) > 1})}")
+    return rules
+
+class RuleEngine:
+    """Rules compiled to parallel arrays; evaluate() checks all of them against a batch in one pass."""
+
+    def __init__(self, rules: Sequence[Rule]):
+        self.rules = list(rules)
+        named = sorted({_norm(r.metric) for r in self.rules if r.metric is not None})
+        self.metrics = named + ([ANY_METRIC] if any(r.metric is None for r in self.rules) else [])
+        self._metric_code = {m: i for i, m in enumerate(named)}
+        # wildcard rules get code -2 (an unknown reading metric is -1) and match every reading
+        self._r_metric = np.array([-2 if r.metric is None else self._metric_code[_norm(r.metric)]
+                                   for r in self.rules], dtype=np.int64)
+        self._r_any = self._r_metric == -2
+        self._r_ctype = np.array([_norm(r.component_type) for r in self.rules], dtype=object)
+        self._r_typed = self._r_ctype != ""
+        self._r_upper = np.array([np.nan if r.upper is None else r.upper for r in self.rules], dtype=float)
+        self._r_lower = np.array([np.nan if r.lower is None else r.lower for r in self.rules], dtype=float)
+        # same_metric[i, j]: rules i and j watch the same metric (used for type-specific overrides)
+        self._same_metric = self._r_metric[:, None] == self._r_metric[None, :]
+
+    @classmethod
+    def from_config(cls, cfg_rules: Any) -> "RuleEngine":
+        return cls(parse_rules(cfg_rules))
+
+    def evaluate(self, readings: Sequence[Dict[str, Any]]) -> List[Tuple[int, Rule, str, float]]:
+        """
+        Returns (reading index, rule, direction, parsed value) per hit; direction is "upper" or "lower".
+        readings need metric / value and optionally component_type.
+        """
+        if not readings or not self.rules:
+            return []
+        values = parse_numeric([r.get("value") for r in readings])
+        metric = np.array([self._metric_code.get(_norm(r.get("metric")), -1) for r in readings], dtype=np.int64)
+        ctype = np.array([_norm(r.get("component_type")) for r in readings], dtype=object)
+
+        applies = (metric[:, None] == self._r_metric[None, :]) | self._r_any[None, :]      # n x R
+        type_ok = ~self._r_typed[None, :] | (ctype[:, None] == self._r_ctype[None, :])
+        applies &= type_ok
+        # A matching component-type rule replaces the generic rules of the same metric
+        typed_hit = applies & self._r_typed[None, :]
+        covered = (typed_hit.astype(np.int32) @ self._same_metric.astype(np.int32)) > 0
+        applies &= ~(covered & ~self._r_typed[None, :])
+
+        v = values[:, None]
+        with np.errstate(invalid="ignore"):
+            over = applies & (v > self._r_upper[None, :])
+            under = applies & (v < self._r_lower[None, :])
+
+        hits: List[Tuple[int, Rule, str, float]] = []
+        for direction, mask in (("upper", over), ("lower", under)):
+            rows, cols = np.nonzero(mask)
+            hits += [(int(i), self.rules[j], direction, float(values[i])) for i, j in zip(rows, cols)]
+        hits.sort(key=lambda h: h[0])
+        return hits
+
+def severity_of(rule: Rule, direction: str) -> str:
+    if rule.severity:
+        return str(rule.severity)
+    return "HIGH" if direction == "upper" else "MEDIUM"
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/shape_validation.py
+
+SHACL-like shape 檢查引擎（shacl_validation.py 使用）：依 label 分組，每個 label 只掃描一次。
+- Shape 種類：
+  - property：節點必須有某屬性（sh:minCount 1）→ 違規條件 x.prop IS NULL
+  - relationship：節點必須有某類型關係連到某 label（direction out / in，target 可省略）
+    → 違規條件 NOT EXISTS { (x)-[:TYPE]->(:Target) }
+- 同一 label 的所有 shape 編譯成一個 statement：MATCH (x:Label) 一次，每個節點算出各 shape 的違規布林
+  list，再一起彙總違規數；不再是每個檢查各自全 label 掃描一次
+- sample：每個 label 最多再一次有上限的掃描，只含有違規的 k 個 shape：
+  `... WITH x, [<違規條件>...] AS v WHERE any(b IN v WHERE b) RETURN id, v LIMIT $limit`（$limit = sample_size × k），
+  client 端依 v 分給各 shape（各取前 sample_size 筆）；違規節點集中在某個 shape 時，其他 shape 的 sample 可能少於
+  sample_size。不在彙總時 collect 全部違規 id（大圖上會在 server 端建出整個 list）
+- 各 label 的 statement 以 thread pool 並行（shacl.concurrency，預設 4）
+- 每個 shape 回傳違規數與最多 sample_size 個違規節點 id（label 的 id 屬性，缺少時用 elementId）
+- label / 屬性 / 關係名稱一律以反引號跳脫後才組進 Cypher
+- 內建記憶體後端：handler 從 statement 本身解析 label、違規條件與 id 屬性後走訪節點（不另外傳參數），
+  sample 取走訪順序的前 $limit 筆
+
+Config（shacl，皆可省略；shapes 省略時使用 DEFAULT_SHAPES）：
+    shacl:
+      sample_size: 10
+      concurrency: 4
+      id_properties: {BuildingComponent: component_id}
+      shapes:
+        - {name: "PerformanceData has value", label: PerformanceData, property: value}
+        - {name: "Component maps sensor data", label: BuildingComponent, rel_type: MAPS_SENSOR_DATA,
+           target: SensorData}
+"""
+from __future__ import annotations
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from utils.graph_memory import register_statement
+
+DEFAULT_SHAPES: List[Dict[str, Any]] = [
+    {"name": "BuildingComponent has component_id", "label": "BuildingComponent", "property": "component_id"},
+    {"name": "SensorData has sensor_data_id", "label": "SensorData", "property": "sensor_data_id"},
+    {"name": "PerformanceData has performance_id", "label": "PerformanceData", "property": "performance_id"},
+    {"name": "PerformanceData has value", "label": "PerformanceData", "property": "value"},
+    {"name": "Component maps sensor data", "label": "BuildingComponent", "rel_type": "MAPS_SENSOR_DATA",
+     "target": "SensorData"},
+]
+
+DEFAULT_ID_PROPERTIES: Dict[str, str] = {
+    "BuildingComponent": "component_id",
+    "SensorData": "sensor_data_id",
+    "PerformanceData": "performance_id",
+    "Anomaly": "anomaly_id",
+    "MaintenanceTask": "task_id",
+    "WorkOrder": "workorder_id",
+}
+
+def _q(name: str) -> str:
+    """Backtick-quote a label / property / relationship type for Cypher."""
+    return "`" + str(name).replace("`", "``") + "`"
+
+@dataclass(frozen=True)
+class Shape:
+    name: str
+    label: str
+    property: Optional[str] = None
+    rel_type: Optional[str] = None
+    target: Optional[str] = None
+    direction: str = "out"
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Shape":
+        if not d.get("label") or not (d.get("property") or d.get("rel_type")):
+            raise ValueError(f"shape needs a label and a property or rel_type: {d}")
+        direction = str(d.get("direction", "out")).lower()
+        if direction not in ("out", "in"):
+            raise ValueError(f"shape direction must be out or in: {d}")
+        name = d.get("name") or (f"{d['label']} has {d['property']}" if d.get("property")
+                                 else f"{d['label']} {d['rel_type']} {d.get('target') or ''}".strip())
+        return cls(name=name, label=d["label"], property=d.get("property"), rel_type=d.get("rel_type"),
+                   target=d.get("target"), direction=direction)
+
+    def predicate(self, var: str = "x") -> str:
+        """Cypher expression that is true when the node violates the shape."""
+        if self.property:
+            return f"{var}.{_q(self.property)} IS NULL"
+        target = f"(:{_q(self.target)})" if self.target else "()"
+        arrow = f"-[:{_q(self.rel_type)}]->" if self.direction == "out" else f"<-[:{_q(self.rel_type)}]-"
+        return f"NOT EXISTS {{ ({var}){arrow}{target} }}"
+
+
+def _node_id(id_property: Optional[str]) -> str:
+    return f"coalesce(toString(x.{_q(id_property)}), elementId(x))" if id_property else "elementId(x)"
+
+def label_statement(label: str, shapes: Sequence[Shape]) -> str:
+    """One scan of :label evaluating every shape; returns scanned and n<i> (violations of shape i)."""
+    flags = ", ".join(s.predicate("x") for s in shapes)
+    aggs = ", ".join(f"sum(CASE WHEN v[{i}] THEN 1 ELSE 0 END) AS n{i}" for i in range(len(shapes)))
+    return f"MATCH (x:{_q(label)}) WITH x, [{flags}] AS v RETURN count(x) AS scanned, {aggs}"
+
+def sample_statement(label: str, shapes: Sequence[Shape], id_property: Optional[str]) -> str:
+    """
+    Offending ids of several shapes in one scan that stops after $limit rows; v[i] tells which shapes each
+    node violates.
+    """
+    flags = ", ".join(s.predicate("x") for s in shapes)
+    return (f"MATCH (x:{_q(label)}) WITH x, [{flags}] AS v WHERE any(b IN v WHERE b) "
+            f"RETURN {_node_id(id_property)} AS id, v LIMIT $limit")
+
+# Embedded backend: the same statements, evaluated from the predicates in the statement text
+_NAME = r"`((?:[^`]|``)+)`"
+_PREDICATE = re.compile(rf"x\.{_NAME} IS NULL"
+                        rf"|NOT EXISTS \{{ \(x\)(?:-\[:{_NAME}\]->|<-\[:{_NAME}\]-)\((?::{_NAME})?\) \}}")
+
+def _name(quoted: Optional[str]) -> Optional[str]:
+    return None if quoted is None else quoted.replace("``", "`")
+
+def _predicates(flags: str) -> List[Dict[str, Any]]:
+    """Parse the `[<predicate>, ...]` list of label_statement / sample_statement."""
+    out = []
+    for p in _PREDICATE.finditer(flags):
+        prop, rel_out, rel_in, target = p.groups()
+        out.append({"property": _name(prop), "rel_type": _name(rel_out or rel_in), "target": _name(target),
+                    "direction": "out" if rel_out else "in"})
+    return out
+
+def _violates(g, nid: int, s: Dict[str, Any]) -> bool:
+    if s["property"]:
+        return g.get(nid, s["property"]) is None
+    near = g.out(nid, s["rel_type"]) if s["direction"] == "out" else g.inc(nid, s["rel_type"])
+    return not any(s["target"] is None or g.has_label(t, s["target"]) for t in near)
+
+@register_statement(rf"MATCH \(x:{_NAME}\) WITH x, \[(.*)\] AS v RETURN count\(x\) AS scanned, .*", regex=True)
+def _q_label_shapes_mem(g, params, m):
+    shapes = _predicates(m.group(2))
+    counts = [0] * len(shapes)
+    scanned = 0
+    for nid in g.nodes(_name(m.group(1))):
+        scanned += 1
+        for i, s in enumerate(shapes):
+            if _violates(g, nid, s):
+                counts[i] += 1
+    row: Dict[str, Any] = {"scanned": scanned}
+    for i in range(len(shapes)):
+        row[f"n{i}"] = counts[i]
+    return [row]
+
+@register_statement(rf"MATCH \(x:{_NAME}\) WITH x, \[(.*)\] AS v WHERE any\(b IN v WHERE b\) "
+                    rf"RETURN (?:coalesce\(toString\(x\.{_NAME}\), elementId\(x\)\)|elementId\(x\)) AS id, v "
+                    rf"LIMIT \$limit", regex=True)
+def _q_shape_sample_mem(g, params, m):
+    shapes, id_prop, k, out = _predicates(m.group(2)), _name(m.group(3)), int(params["limit"]), []
+    for nid in g.nodes(_name(m.group(1))):
+        if len(out) >= k:
+            break
+        v = [_violates(g, nid, s) for s in shapes]
+        if any(v):
+            val = g.get(nid, id_prop) if id_prop else None
+            out.append({"id": str(val) if val is not None else str(nid), "v": v})
+    return out
+
+class ShapeValidator:
+    def __init__(self, shapes: Sequence[Shape], id_properties: Optional[Dict[str, str]] = None,
+                 sample_size: int = 10, concurrency: int = 4):
+        self.shapes = list(shapes)
+        self.id_properties = {**DEFAULT_ID_PROPERTIES, **(id_properties or {})}
+        self.sample_size = max(int(sample_size), 0)
+        self.concurrency = max(int(concurrency), 1)
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "ShapeValidator":
+        shapes = [Shape.from_dict(d) for d in cfg.get("shapes", DEFAULT_SHAPES)]
+        return cls(shapes, cfg.get("id_properties"), int(cfg.get("sample_size", 10)),
+                   int(cfg.get("concurrency", 4)))
+
+    def groups(self) -> Dict[str, List[Shape]]:
+        out: Dict[str, List[Shape]] = {}
+        for s in self.shapes:
+            out.setdefault(s.label, []).append(s)
+        return out
+
+    def validate_label(self, neo: Any, label: str, shapes: Sequence[Shape]) -> Dict[str, Any]:
+        id_prop = self.id_properties.get(label)
+        t0 = time.perf_counter()
+        rows = neo.query(label_statement(label, shapes), op=f"shacl:{label}")
+        row = rows[0] if rows else {}
+        violations = [int(row.get(f"n{i}") or 0) for i in range(len(shapes))]
+        samples: List[List[str]] = [[] for _ in shapes]
+        failing = [i for i, n in enumerate(violations) if n]
+        if failing and self.sample_size:
+            # One bounded pass for every failing shape, split per shape here
+            for r in neo.query(sample_statement(label, [shapes[i] for i in failing], id_prop),
+                               {"limit": self.sample_size * len(failing)}, op=f"shacl_sample:{label}"):
+                for i, hit in zip(failing, r["v"]):
+                    if hit and len(samples[i]) < self.sample_size:
+                        samples[i].append(r["id"])
+        results = [{"check": s.name, "label": label, "violations": violations[i], "sample": samples[i]}
+                   for i, s in enumerate(shapes)]
+        return {"label": label, "shapes": len(shapes), "scanned": int(row.get("scanned") or 0),
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 3), "results": results}
+
+    def validate(self, neo: Any) -> List[Dict[str, Any]]:
+        """Per-label reports (label, shapes, scanned, elapsed_ms, results), label groups run concurrently."""
+        groups = self.groups()
+        if not groups:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(groups)),
+                                thread_name_prefix="shacl") as pool:
+            futures = [pool.submit(self.validate_label, neo, label, shapes) for label, shapes in groups.items()]
+            return [f.result() for f in futures]
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/state_store.py
+
+跨執行保存的小型狀態檔（JSON）：
+- 原子寫入（先寫暫存檔再 os.replace），中途中斷不會留下半個檔案
+- 綁定匯入目標（Neo4jHelper.target）；目標不同時視為空狀態，避免把 A 資料庫的進度套用到 B
+
+用於：異常偵測 watermark、串流規則的 ring buffer checkpoint 等。
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+class JsonStateStore:
+    def __init__(self, path: str, target: str = ""):
+        self.path = Path(path)
+        self.target = target
+
+    def load(self) -> Dict[str, Any]:
+        if not self.path.exists():
+            return {}
+        data = json.loads(self.path.read_text(encoding="utf-8") or "{}")
+        if data.get("target", "") != self.target:
+            return {}
+        return dict(data.get("state", {}))
+
+    def save(self, state: Dict[str, Any]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"target": self.target, "state": state}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
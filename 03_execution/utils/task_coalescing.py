@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/task_coalescing.py
+
+Anomaly → MaintenanceTask 合併（對應 02_data/PdM_HVAC/tasks/MaintenanceTasks_Generated.csv 的形式：
+一張 task 涵蓋同一 GlobalId 的多筆 anomaly，例如 T0002 → 156;159;162;165）。
+- 分組 key：(component, severity class, 時間視窗)；時間視窗為 window_s 秒的固定對齊視窗
+  （floor(ts / window_s)），同一視窗內同一 component、同一嚴重度等級的 anomaly 合併為一張 task
+- component：anomaly 的 component_id；沒有時（例如 PdM 的 Sensor_Data / Performance_Data 只有 sensor_id，
+  或 mapping 沒有對映 component 欄位）改用 sensor_id——一個 sensor 只屬於一個 component，不會跨 component 合併
+- 時間：anomaly 帶 ts_ms（ETL 解析出的 epoch ms）時直接使用，否則以與 ETL 相同的 map_epoch_ms 解析 ts
+  （ISO、"2/1/2025 12:35"、"2/27/2025" 等皆可）
+- severity class：severity_classes 把 severity 對映到等級（例如 CRITICAL/HIGH → urgent），
+  未列出的 severity 以自身（大寫）為等級；不同等級不合併，避免低優先度 task 拖慢緊急處理
+- max_group_size：單一 task 的 anomaly 上限，超過則依時間順序切成多張
+- component_id 與 sensor_id 都沒有的 anomaly 各自成為一張 task；時間無法解析時以 fallback 時間（派發時間）分窗
+- task_id 由成員 anomaly_id 決定（sha1），同一組 anomaly 重跑得到同一張 task
+- 跨呼叫合併（add / flush，pipeline_daemon 每批偵測結果呼叫一次）：各組保持開啟，直到 (1) 滿 max_group_size、
+  (2) 已見到的最新事件時間越過該組視窗的結束時間、或 (3) 開啟超過 max_hold_s 秒（wall clock，
+  限制合併帶來的派發延遲）才釋出成 task；flush() 釋出全部（結束時）。group() 仍是單次、無狀態的分組
+
+Config（workflow.coalesce，皆可省略）：
+    window_s: 3600          # 0 = 不合併（一筆 anomaly 一張 task）
+    max_group_size: 50
+    max_hold_s: 5.0         # 跨呼叫保持開啟的上限；0 = 每次呼叫即釋出（不跨呼叫合併）
+    severity_classes: {CRITICAL: urgent, HIGH: urgent, MEDIUM: routine, LOW: routine}
+"""
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from utils.column_mapping import map_epoch_ms
+
+SEVERITY_RANK = {"CRITICAL": 4, "HIGH": 3, "MEDIUM": 2, "LOW": 1}
+
+def anomaly_epoch_s(anomalies: Sequence[Dict[str, Any]]) -> List[Optional[float]]:
+    """
+    Epoch seconds per anomaly: ts_ms when present, else ts parsed like the ETL's ts_ms (map_epoch_ms,
+    naive = UTC); None when missing/invalid.
+    """
+    ms: List[Any] = [a.get("ts_ms") for a in anomalies]
+    todo = [i for i, v in enumerate(ms) if v is None]
+    if todo:
+        parsed = map_epoch_ms(pd.Series([anomalies[i].get("ts") for i in todo], dtype=object))
+        for i, v in zip(todo, parsed):
+            ms[i] = v
+    return [None if v is None else int(v) / 1000.0 for v in ms]
+
+def task_id_for(anomaly_ids: Sequence[str]) -> str:
+    h = hashlib.sha1(";".join(sorted(anomaly_ids)).encode("utf-8")).hexdigest()
+    return "task_" + h[:16]
+
+@dataclass
+class TaskGroup:
+    task_id: str
+    component_id: Optional[str]
+    severity_class: str
+    severity: str
+    window_start: Optional[str]
+    anomalies: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def anomaly_ids(self) -> List[str]:
+        return [a["anomaly_id"] for a in self.anomalies]
+
+    @property
+    def lead(self) -> Dict[str, Any]:
+        """The most severe (then earliest) member; its type decides the workflow route."""
+        return self.anomalies[0]
+
+GroupKey = Tuple[Any, ...]
+Member = Tuple[float, Dict[str, Any]]
+
+class TaskCoalescer:
+    def __init__(self, window_s: float = 3600.0, max_group_size: int = 50,
+                 severity_classes: Optional[Dict[str, str]] = None, max_hold_s: float = 5.0):
+        self.window_s = max(float(window_s), 0.0)
+        self.max_group_size = max(int(max_group_size), 1)
+        self.severity_classes = {str(k).upper(): str(v) for k, v in (severity_classes or {}).items()}
+        self.max_hold_s = max(float(max_hold_s), 0.0)
+        # Open groups (add / flush): members and the time.monotonic() the group was opened
+        self._open: Dict[GroupKey, List[Member]] = {}
+        self._opened: Dict[GroupKey, float] = {}
+        self._event_s: Optional[float] = None         # newest event time seen by add()
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "TaskCoalescer":
+        return cls(
+            window_s=float(cfg.get("window_s", 3600.0)),
+            max_group_size=int(cfg.get("max_group_size", 50)),
+            severity_classes=cfg.get("severity_classes",
+                                     {"CRITICAL": "urgent", "HIGH": "urgent", "MEDIUM": "routine", "LOW": "routine"}),
+            max_hold_s=float(cfg.get("max_hold_s", 5.0)),
+        )
+
+    def severity_class(self, severity: Any) -> str:
+        s = str(severity or "UNKNOWN").upper()
+        return self.severity_classes.get(s, s)
+
+    def _key(self, a: Dict[str, Any], ts: float) -> GroupKey:
+        comp = a.get("component_id") or (f"sensor:{a['sensor_id']}" if a.get("sensor_id") else None)
+        if self.window_s <= 0 or not comp:
+            return ("single", a["anomaly_id"])
+        return (comp, self.severity_class(a.get("severity")), int(ts // self.window_s))
+
+    def _build(self, key: GroupKey, members: List[Member]) -> List[TaskGroup]:
+        members.sort(key=lambda m: (m[0], str(m[1]["anomaly_id"])))
+        groups = []
+        for i in range(0, len(members), self.max_group_size):
+            chunk = members[i:i + self.max_group_size]
+            ordered = sorted((a for _, a in chunk),
+                             key=lambda a: -SEVERITY_RANK.get(str(a.get("severity") or "").upper(), 0))
+            lead = ordered[0]
+            w0 = chunk[0][0] if key[0] == "single" else key[2] * self.window_s
+            groups.append(TaskGroup(
+                task_id=task_id_for([a["anomaly_id"] for a in ordered]),
+                component_id=lead.get("component_id"),
+                severity_class=self.severity_class(lead.get("severity")),
+                severity=str(lead.get("severity") or ""),
+                window_start=datetime.fromtimestamp(w0, timezone.utc).isoformat(),
+                anomalies=ordered,
+            ))
+        return groups
+
+    def group(self, anomalies: Sequence[Dict[str, Any]], fallback_ts: float) -> List[TaskGroup]:
+        """anomalies need anomaly_id, severity, ts (or ts_ms) and (optionally) component_id / sensor_id."""
+        buckets: Dict[GroupKey, List[Member]] = {}
+        for a, ts in zip(anomalies, anomaly_epoch_s(anomalies)):
+            ts = fallback_ts if ts is None else ts
+            buckets.setdefault(self._key(a, ts), []).append((ts, a))
+        return [g for key, members in buckets.items() for g in self._build(key, members)]
+
+    # -----------------------------
+    # Open groups across calls
+    # -----------------------------
+    @property
+    def held(self) -> int:
+        """Anomalies in open groups (not released as a task yet)."""
+        return sum(len(m) for m in self._open.values())
+
+    def add(self, anomalies: Sequence[Dict[str, Any]], fallback_ts: float, now: float) -> List[TaskGroup]:
+        """
+        Put anomalies into their open groups and return the groups that are complete: full (max_group_size),
+        past their window (by the newest event time seen), or open for max_hold_s (now: time.monotonic()).
+        An empty call only releases what became due.
+        """
+        for a, ts in zip(anomalies, anomaly_epoch_s(anomalies)):
+            if ts is not None:
+                self._event_s = ts if self._event_s is None else max(self._event_s, ts)
+            ts = fallback_ts if ts is None else ts
+            key = self._key(a, ts)
+            if key not in self._open:
+                self._open[key], self._opened[key] = [], now
+            self._open[key].append((ts, a))
+
+        groups = []
+        for key in list(self._open):
+            members = self._open[key]
+            closed = (self.max_hold_s <= 0 or key[0] == "single" or now - self._opened[key] >= self.max_hold_s
+                      or (self._event_s is not None and self._event_s >= (key[2] + 1) * self.window_s))
+            if closed:
+                groups += self._build(key, self._open.pop(key))
+                del self._opened[key]
+            elif len(members) >= self.max_group_size:
+                # Release the full tasks, keep the remainder open
+                n = len(members) // self.max_group_size * self.max_group_size
+                members.sort(key=lambda m: (m[0], str(m[1]["anomaly_id"])))
+                groups += self._build(key, members[:n])
+                del members[:n]
+                if not members:
+                    del self._open[key], self._opened[key]
+        return groups
+
+    def flush(self) -> List[TaskGroup]:
+        """Release every open group (end of a run / shutdown)."""
+        groups = [g for key, members in self._open.items() for g in self._build(key, members)]
+        self._open.clear()
+        self._opened.clear()
+        return groups
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/window_rules.py
+
+串流視窗規則（對應 01_ontology_schema/cypher/reasoning_examples.cypher 的 5、6 兩條推理）：
+- rate_of_change  ：Rapid_Temperature_Rise —— 最近 window(3) 筆讀值中最新減最舊 > min_rise(3.0)，
+                    且最新值高於該 sensor 的長期平均（對應 c.avg_temp）
+- moving_average  ：Energy_Efficiency_Degradation —— 最新值 > 最近 window(7) 筆移動平均 × factor(1.2)
+
+原 Cypher 每次都對每個 sensor 的全部歷史 ORDER BY timestamp + collect()；這裡改為每個 sensor
+一個固定大小的 ring buffer（含 running sum）與累計平均，每筆新讀值 O(1) 更新與判斷。
+buffer 狀態可序列化（to_state / load_state），由偵測腳本與 watermark 一起存檔，
+因此每次執行只處理新資料，成本不隨歷史長度增加。
+
+Config（anomaly_window_rules，省略時使用上述兩條預設規則；設為 [] 可關閉）：
+    anomaly_window_rules:
+      - id: rapid_temperature_rise
+        kind: rate_of_change
+        metric: temperature
+        window: 3
+        min_rise: 3.0
+      - id: energy_efficiency_degradation
+        kind: moving_average
+        metric: energy
+        window: 7
+        factor: 1.2
+
+規則參數變更時（signature 不同）該規則的 buffer 會重新累積；ts_ms 早於 buffer 最新讀值的遲到資料
+不進入視窗（計入 late）。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.rule_engine import parse_numeric
+
+DEFAULT_WINDOW_RULES: List[Dict[str, Any]] = [
+    {"id": "rapid_temperature_rise", "kind": "rate_of_change", "metric": "temperature", "window": 3, "min_rise": 3.0},
+    {"id": "energy_efficiency_degradation", "kind": "moving_average", "metric": "energy", "window": 7, "factor": 1.2},
+]
+
+_ANOMALY_TYPE = {"rate_of_change": "Rapid_Temperature_Rise", "moving_average": "Energy_Efficiency_Degradation"}
+
+class RingBuffer:
+    """Fixed-capacity FIFO of floats with an O(1) running sum."""
+    __slots__ = ("cap", "buf", "start", "size", "total")
+
+    def __init__(self, cap: int):
+        self.cap = int(cap)
+        self.buf = [0.0] * self.cap
+        self.start = 0
+        self.size = 0
+        self.total = 0.0
+
+    def push(self, v: float):
+        if self.size == self.cap:
+            self.total -= self.buf[self.start]
+            self.buf[self.start] = v
+            self.start = (self.start + 1) % self.cap
+        else:
+            self.buf[(self.start + self.size) % self.cap] = v
+            self.size += 1
+        self.total += v
+
+    @property
+    def full(self) -> bool:
+        return self.size == self.cap
+
+    def oldest(self) -> float:
+        return self.buf[self.start]
+
+    def newest(self) -> float:
+        return self.buf[(self.start + self.size - 1) % self.cap]
+
+    def mean(self) -> float:
+        return self.total / self.size if self.size else 0.0
+
+    def to_list(self) -> List[float]:
+        return [self.buf[(self.start + i) % self.cap] for i in range(self.size)]
+
+    @classmethod
+    def from_list(cls, cap: int, values: Sequence[float]) -> "RingBuffer":
+        rb = cls(cap)
+        for v in list(values)[-rb.cap:]:
+            rb.push(float(v))     # re-summed on load, so checkpoints never carry float drift
+        return rb
+
+class _Series:
+    """Per-sensor window state: ring buffer + cumulative mean (baseline) + last event time."""
+    __slots__ = ("ring", "count", "mean", "last_ts")
+
+    def __init__(self, cap: int):
+        self.ring = RingBuffer(cap)
+        self.count = 0
+        self.mean = 0.0
+        self.last_ts: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"v": self.ring.to_list(), "n": self.count, "mean": self.mean, "ts": self.last_ts}
+
+    @classmethod
+    def from_dict(cls, cap: int, d: Dict[str, Any]) -> "_Series":
+        s = cls(cap)
+        s.ring = RingBuffer.from_list(cap, d.get("v", []))
+        s.count = int(d.get("n", 0))
+        s.mean = float(d.get("mean", 0.0))
+        s.last_ts = d.get("ts")
+        return s
+
+@dataclass(frozen=True)
+class WindowRule:
+    rule_id: str
+    kind: str                   # rate_of_change / moving_average
+    metric: str
+    window: int
+    threshold: float            # min_rise or factor
+    severity: str = "HIGH"
+    version: str = "1"
+
+    @property
+    def anomaly_type(self) -> str:
+        return _ANOMALY_TYPE[self.kind]
+
+    def signature(self) -> str:
+        return f"{self.kind}|{self.metric}|{self.window}|{self.threshold}|{self.version}"
+
+    def update(self, st: _Series, v: float) -> Optional[Tuple[float, float]]:
+        """Push v; returns (score, threshold value) when the rule fires."""
+        baseline = st.mean if st.count else None
+        st.ring.push(v)
+        st.count += 1
+        st.mean += (v - st.mean) / st.count
+        if not st.ring.full:
+            return None
+        if self.kind == "rate_of_change":
+            if baseline is not None and st.ring.newest() - st.ring.oldest() > self.threshold and v > baseline:
+                return v - baseline, baseline
+            return None
+        ma = st.ring.mean()
+        if v > ma * self.threshold:
+            return v - ma, ma * self.threshold
+        return None
+
+def parse_window_rules(cfg_rules: Any) -> List[WindowRule]:
+    if cfg_rules is None:
+        cfg_rules = DEFAULT_WINDOW_RULES
+    rules = []
+    for i, r in enumerate(cfg_rules):
+        kind = r.get("kind", "rate_of_change")
+        if kind not in _ANOMALY_TYPE:
+            raise ValueError(f"unknown window rule kind {kind!r} (expected one of {sorted(_ANOMALY_TYPE)})")
+        default_window = 3 if kind == "rate_of_change" else 7
+        threshold = r.get("min_rise", 3.0) if kind == "rate_of_change" else r.get("factor", 1.2)
+        rules.append(WindowRule(
+            rule_id=str(r.get("id", f"window_{i}")),
+            kind=kind,
+            metric=str(r["metric"]).strip().lower(),
+            window=max(int(r.get("window", default_window)), 2),
+            threshold=float(threshold),
+            severity=str(r.get("severity", "HIGH")),
+            version=str(r.get("version", "1")),
+        ))
+    return rules
+
+class WindowDetector:
+    """Runs every window rule over readings in arrival order, keyed by sensor (fallback: component)."""
+
+    def __init__(self, rules: Sequence[WindowRule]):
+        self.rules = list(rules)
+        self.metrics = sorted({r.metric for r in self.rules})
+        self._series: Dict[str, Dict[str, _Series]] = {r.rule_id: {} for r in self.rules}
+        self.late = 0
+
+    @classmethod
+    def from_config(cls, cfg_rules: Any) -> "WindowDetector":
+        return cls(parse_window_rules(cfg_rules))
+
+    def process(self, readings: Sequence[Dict[str, Any]]) -> List[Tuple[int, WindowRule, float, float, float]]:
+        """Returns (reading index, rule, value, score, threshold value) per hit."""
+        if not readings or not self.rules:
+            return []
+        values = parse_numeric([r.get("value") for r in readings])
+        by_metric: Dict[str, List[WindowRule]] = {}
+        for rule in self.rules:
+            by_metric.setdefault(rule.metric, []).append(rule)
+        hits = []
+        for i, r in enumerate(readings):
+            rules = by_metric.get(str(r.get("metric", "")).strip().lower())
+            v = values[i]
+            if not rules or v != v:          # no rule for this metric / unparseable value
+                continue
+            key = str(r.get("sensor_id") or r.get("component_id") or "")
+            ts = r.get("ts_ms")
+            for rule in rules:
+                series = self._series[rule.rule_id]
+                st = series.get(key)
+                if st is None:
+                    st = series[key] = _Series(rule.window)
+                if ts is not None and st.last_ts is not None and ts < st.last_ts:
+                    self.late += 1
+                    continue
+                if ts is not None:
+                    st.last_ts = ts
+                fired = rule.update(st, float(v))
+                if fired is not None:
+                    hits.append((i, rule, float(v), fired[0], fired[1]))
+        return hits
+
+    # ---- checkpoint
+    def to_state(self) -> Dict[str, Any]:
+        return {r.rule_id: {"sig": r.signature(), "series": {k: s.to_dict() for k, s in self._series[r.rule_id].items()}}
+                for r in self.rules}
+
+    def load_state(self, state: Dict[str, Any]):
+        for r in self.rules:
+            saved = state.get(r.rule_id)
+            if not saved or saved.get("sig") != r.signature():
+                continue
+            self._series[r.rule_id] = {k: _Series.from_dict(r.window, d) for k, d in saved.get("series", {}).items()}
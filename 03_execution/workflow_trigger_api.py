@@ -7,11 +7,58 @@ workflow_trigger_api.py — PdM Execution (Workflow Trigger + Log Timestamps)
 本版本包含「workflow mock」功能：當未提供 endpoint 或 mock 啟用時，會以本地模擬回應，
 同時產生可用於 TTA / latency 計算的時間戳（t_task_created / t_action_start / t_action_end）。
 
+並行派發：最多 workflow.concurrency（預設 8）個 anomaly 同時處理（thread pool；每筆仍依序
+建立 WorkOrder → 呼叫工作流 → 更新狀態，時間戳不變）。workflow.rate_limit 以 token bucket 對每個
+endpoint 限流：
+    workflow:
+      concurrency: 8
+      routes: {Rapid_Temperature_Rise: https://...}     # 可選：依 anomaly type 指定 endpoint
+      rate_limit:
+        rate_per_s: 20          # 預設每個 endpoint 的速率（省略 = 不限流）
+        burst: 5
+        per_key: {"https://...": {rate_per_s: 2, burst: 1}}
+
+實際派發（workflow.mock=false）透過 utils/http_dispatch.py：每個 endpoint 一個 keep-alive 連線池，
+429/5xx 依 Retry-After 或 jitter 退避重試，錯誤率過高時 circuit breaker 暫停該 endpoint（其餘照常），
+結束時每個 endpoint 記錄一筆 HTTP_ENDPOINT_STATS（成功/失敗/重試/拒絕數與延遲百分位；設定見 workflow.http）。
+
+MaintenanceTask / WorkOrder 的建立與狀態更新不再逐筆查詢：兩者各自緩衝，以 UNWIND 批次寫入（workflow.write_buffer.max_rows，
+預設 2000 筆；或最舊一筆超過 max_delay_s=0.5 秒），狀態更新 flush 前一定先 flush 建立批次，結束時做最後一次 flush。
+
+Anomaly → MaintenanceTask 合併（utils/task_coalescing.py）：未派發的 Anomaly 依 (component, 時間視窗,
+severity class) 分組，每組一張 MaintenanceTask + 一張 WorkOrder、一次 webhook 呼叫（payload 帶全部成員）：
+    (Anomaly)-[:TRIGGERS]->(MaintenanceTask)-[:EXECUTES]->(WorkOrder)-[:CREATED_FROM|DISPATCHED_FOR]->(Anomaly)
+    workflow:
+      coalesce: {window_s: 3600, max_group_size: 50, severity_classes: {CRITICAL: urgent, HIGH: urgent}}
+window_s: 0 時不合併（一筆 anomaly 一張 task）。本腳本每次執行結束前釋出全部群組；pipeline_daemon 則讓群組
+跨批次保持開啟，直到視窗結束、滿 max_group_size 或開啟超過 coalesce.max_hold_s（預設 5 秒）。
+
+Durable outbox（utils/outbox.py，SQLite）：at-least-once delivery。
+- 合併後的 task 寫入 outbox（同時配發 workorder_id 與 t_task_created，並記錄成員 anomaly），之後只從 outbox
+  取件派發；工作流回應成功才 ack，成員 Anomaly 也只在成功時標記 dispatched
+- 哪些 Anomaly 已排入以 outbox 為準（Outbox.held 對帳，不依賴圖譜旗標）：outbox 檔案遺失時，
+  未派發的 Anomaly 會在下次執行時重新排入
+- 失敗 → nack：指數退避後重送，同一 task 沿用同一張 WorkOrder（status = RETRY_SCHEDULED）；
+  達 max_attempts 次即 dead-letter（WorkOrder status = DEAD_LETTER，記錄 DEAD_LETTER 事件）
+- circuit breaker 拒絕（未實際送出）只延後、不計次；行程中斷時 inflight 的項目於 lease 到期後自動重送
+- --compensate：補償模式，持續重送到期的失敗項目直到全部成功或 dead-letter（上限 compensate_timeout_s）
+- --requeue-dead：讓 dead-letter 項目重新取得完整重試次數
+
+延遲 sketch：每次成功派發時，task 的每個成員 Anomaly 以其 t_trigger / t_detected（由 payload 帶著）與
+t_task_created / t_action_start / t_action_end 算出 L1–L4 與 TTA，更新 RunLogger 的 DDSketch
+（utils/quantile_sketch.py），寫入 logs/latency_sketch_<component>_<run_id>.json，可跨 run 合併。
+    workflow:
+      outbox: {path: logs/workflow_outbox.sqlite, max_attempts: 5, retry_base_s: 5, retry_max_s: 300,
+               lease_s: 60, compensate_timeout_s: 600}
+
 Usage:
     python 03_execution/workflow_trigger_api.py --config config/pdm_demo.yaml --demo ahu12
+    python 03_execution/workflow_trigger_api.py --config config/pdm_demo.yaml --compensate
 
 Outputs:
 - logs/workflow_events.csv (by RunLogger)
+- logs/workflow_outbox.sqlite (durable outbox; workflow.outbox.path)
+- logs/latency_sketch_workflow_trigger_<run_id>.json (L1–L4 / TTA sketches)
 - optional: 04_validation/workflow_logs/sample_workflow_log.csv (if configured)
 """
 from __future__ import annotations
@@ -20,30 +67,474 @@ import argparse
 import json
 import time
 import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
 from datetime import datetime, timezone
-from typing import Dict, Any, List, Optional
-
-try:
-    import requests
-except Exception:
-    requests = None  # allow running without requests
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional
 
+from utils.buffered_writer import BufferedWriter
 from utils.config_loader import load_config
+from utils.graph_memory import register_statement
+from utils.http_dispatch import DispatchClient
 from utils.logger import RunLogger
-from utils.neo4j_helper import Neo4jHelper, neo4j_available
+from utils.neo4j_helper import Neo4jHelper, backend_available
+from utils.outbox import Outbox, OutboxEntry, member_ids
+from utils.query_stats import report_query_stats
+from utils.rate_limit import RateLimiters
+from utils.task_coalescing import TaskCoalescer, TaskGroup
 
 
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
+Q_PENDING_ANOMALIES = """
+MATCH (a:Anomaly)
+WHERE coalesce(a.dispatched,false) = false
+  AND a.anomaly_id > $after
+WITH a ORDER BY a.anomaly_id LIMIT $limit
+OPTIONAL MATCH (c:BuildingComponent)-[:HAS_ANOMALY]->(a)
+WITH a, head(collect(c.component_id)) AS cid
+RETURN a.anomaly_id AS anomaly_id,
+       a.type AS type,
+       a.severity AS severity,
+       a.metric AS metric,
+       a.value AS value,
+       a.timestamp AS ts,
+       a.ts_ms AS ts_ms,
+       a.sensor_id AS sensor_id,
+       a.t_trigger AS t_trigger,
+       a.t_detected AS t_detected,
+       coalesce(cid, a.component_id) AS component_id
+ORDER BY anomaly_id
+"""
+
+# Task / WorkOrder writes are buffered and sent as UNWIND batches (utils/buffered_writer.py).
+# One MaintenanceTask + WorkOrder per coalesced group: (Anomaly)-[:TRIGGERS]->(MaintenanceTask)-[:EXECUTES]->(WorkOrder)
+Q_TASK_CREATE = """
+UNWIND $rows AS row
+MERGE (t:MaintenanceTask {task_id:row.task_id})
+SET t.type=row.type,
+    t.priority=row.severity_class,
+    t.severity=row.severity,
+    t.component_id=row.component_id,
+    t.window_start=row.window_start,
+    t.anomaly_count=size(row.aids),
+    t.status=coalesce(t.status,'OPEN'),
+    t.created_at=row.t_task_created
+MERGE (wo:WorkOrder {workorder_id:row.woid})
+SET wo.mode=row.mode,
+    wo.status=coalesce(wo.status,'CREATED'),
+    wo.task_id=row.task_id,
+    wo.t_trigger=coalesce(wo.t_trigger,row.t_trigger),
+    wo.t_task_created=row.t_task_created
+MERGE (t)-[:EXECUTES]->(wo)
+WITH t, wo, row
+UNWIND row.aids AS aid
+MATCH (a:Anomaly {anomaly_id:aid})
+MERGE (a)-[:TRIGGERS]->(t)
+MERGE (wo)-[:CREATED_FROM]->(a)
+"""
+
+# MERGEs the task / WorkOrder as well: a crash after the outbox commit but before the buffered create
+# leaves claimed entries with no graph nodes, and a MATCH here would silently update nothing
+Q_WORKORDER_DISPATCHED = """
+UNWIND $rows AS row
+MERGE (t:MaintenanceTask {task_id:row.task_id})
+ON CREATE SET t.type=row.type,
+    t.priority=row.severity_class,
+    t.severity=row.severity,
+    t.component_id=row.component_id,
+    t.window_start=row.window_start,
+    t.anomaly_count=size(row.aids),
+    t.created_at=row.t_task_created
+MERGE (wo:WorkOrder {workorder_id:row.woid})
+ON CREATE SET wo.mode=row.mode,
+    wo.task_id=row.task_id,
+    wo.t_task_created=row.t_task_created
+MERGE (t)-[:EXECUTES]->(wo)
+SET t.status=row.status,
+    wo.status=row.status,
+    wo.attempts=row.attempts,
+    wo.t_action_start=row.t_action_start,
+    wo.t_action_end=row.t_action_end,
+    wo.response_ok=row.resp_ok
+WITH t, wo, row
+UNWIND row.aids AS aid
+MATCH (a:Anomaly {anomaly_id:aid})
+MERGE (a)-[:TRIGGERS]->(t)
+MERGE (wo)-[:CREATED_FROM]->(a)
+FOREACH (_ IN CASE WHEN row.resp_ok THEN [1] ELSE [] END |
+    SET a.dispatched=true, a.dispatched_at=row.t_action_start
+    MERGE (wo)-[:DISPATCHED_FOR]->(a)
+)
+"""
+
+@register_statement(Q_PENDING_ANOMALIES)
+def _q_pending_mem(g, params, m):
+    out = []
+    ids = sorted(aid for aid in (g.get(n, "anomaly_id") for n in g.nodes("Anomaly"))
+                 if isinstance(aid, str) and aid > params["after"])
+    for aid in ids:
+        nid = g.find_one("Anomaly", "anomaly_id", aid)
+        p = g.props(nid)
+        if p.get("dispatched", False):
+            continue
+        comps = [g.get(c, "component_id") for c in g.inc(nid, "HAS_ANOMALY") if g.has_label(c, "BuildingComponent")]
+        out.append({"anomaly_id": p.get("anomaly_id"), "type": p.get("type"), "severity": p.get("severity"),
+                    "metric": p.get("metric"), "value": p.get("value"), "ts": p.get("timestamp"),
+                    "ts_ms": p.get("ts_ms"), "sensor_id": p.get("sensor_id"),
+                    "t_trigger": p.get("t_trigger"), "t_detected": p.get("t_detected"),
+                    "component_id": comps[0] if comps else p.get("component_id")})
+        if len(out) >= int(params["limit"]):
+            break
+    return out
+
+@register_statement(Q_TASK_CREATE)
+def _q_task_create_mem(g, params, m):
+    for row in params["rows"]:
+        t = g.merge_node("MaintenanceTask", "task_id", row["task_id"])
+        g.set_props(t, {"type": row["type"], "priority": row["severity_class"], "severity": row["severity"],
+                        "component_id": row["component_id"], "window_start": row["window_start"],
+                        "anomaly_count": len(row["aids"]), "status": g.get(t, "status") or "OPEN",
+                        "created_at": row["t_task_created"]})
+        wo = g.merge_node("WorkOrder", "workorder_id", row["woid"])
+        g.set_props(wo, {"mode": row["mode"], "status": g.get(wo, "status") or "CREATED", "task_id": row["task_id"],
+                         "t_trigger": g.get(wo, "t_trigger") or row["t_trigger"],
+                         "t_task_created": row["t_task_created"]})
+        g.merge_rel(t, "EXECUTES", wo)
+        for aid in row["aids"]:
+            for a in g.find("Anomaly", "anomaly_id", aid):
+                g.merge_rel(a, "TRIGGERS", t)
+                g.merge_rel(wo, "CREATED_FROM", a)
+    return []
+
+@register_statement(Q_WORKORDER_DISPATCHED)
+def _q_wo_dispatched_mem(g, params, m):
+    for row in params["rows"]:
+        t = g.find_one("MaintenanceTask", "task_id", row["task_id"])
+        if t is None:
+            t = g.merge_node("MaintenanceTask", "task_id", row["task_id"])
+            g.set_props(t, {"type": row["type"], "priority": row["severity_class"], "severity": row["severity"],
+                            "component_id": row["component_id"], "window_start": row["window_start"],
+                            "anomaly_count": len(row["aids"]), "created_at": row["t_task_created"]})
+        wo = g.find_one("WorkOrder", "workorder_id", row["woid"])
+        if wo is None:
+            wo = g.merge_node("WorkOrder", "workorder_id", row["woid"])
+            g.set_props(wo, {"mode": row["mode"], "task_id": row["task_id"], "t_task_created": row["t_task_created"]})
+        g.merge_rel(t, "EXECUTES", wo)
+        g.set_props(t, {"status": row["status"]})
+        g.set_props(wo, {"status": row["status"], "attempts": row["attempts"],
+                         "t_action_start": row["t_action_start"], "t_action_end": row["t_action_end"],
+                         "response_ok": row["resp_ok"]})
+        for aid in row["aids"]:
+            for a in g.find("Anomaly", "anomaly_id", aid):
+                g.merge_rel(a, "TRIGGERS", t)
+                g.merge_rel(wo, "CREATED_FROM", a)
+                if row["resp_ok"]:
+                    g.set_props(a, {"dispatched": True, "dispatched_at": row["t_action_start"]})
+                    g.merge_rel(wo, "DISPATCHED_FOR", a)
+    return []
+
 def mock_workflow(payload: Dict[str, Any], sleep_ms: int = 120) -> Dict[str, Any]:
     time.sleep(max(sleep_ms, 0) / 1000.0)
-    return {"status": "OK", "message": "mocked", "echo": {"anomaly_id": payload.get("anomaly_id")}}
+    return {"status": "OK", "message": "mocked",
+            "echo": {"task_id": payload.get("task_id"), "anomaly_id": payload.get("anomaly_id")}}
+
+def route_endpoint(wf: Dict[str, Any], anomaly: Dict[str, Any]) -> str:
+    """workflow.routes maps an anomaly type to its own webhook; everything else uses workflow.endpoint."""
+    return wf.get("routes", {}).get(anomaly.get("type"), wf.get("endpoint", ""))
+
+def build_payload(group: TaskGroup, workorder_id: str, scenario: str, mode: str) -> Dict[str, Any]:
+    """One webhook call per task; the top-level anomaly fields describe the most severe member."""
+    a = group.lead
+    return {
+        "workorder_id": workorder_id,
+        "task_id": group.task_id,
+        "component_id": group.component_id,
+        "severity_class": group.severity_class,
+        "window_start": group.window_start,
+        "anomaly_id": a.get("anomaly_id"),
+        "type": a.get("type"),
+        "severity": a.get("severity"),
+        "metric": a.get("metric"),
+        "value": a.get("value"),
+        "timestamp": a.get("ts"),
+        "anomaly_count": len(group.anomalies),
+        "anomalies": [{"anomaly_id": m.get("anomaly_id"), "type": m.get("type"), "severity": m.get("severity"),
+                       "metric": m.get("metric"), "value": m.get("value"), "timestamp": m.get("ts"),
+                       "t_trigger": m.get("t_trigger"), "t_detected": m.get("t_detected")}
+                      for m in group.anomalies],
+        "scenario": scenario,
+        "mode": mode,
+    }
+
+def dispatch_one(limiters: RateLimiters, client: Optional[DispatchClient], entry: OutboxEntry,
+                 wf: Dict[str, Any]) -> Dict[str, Any]:
+    """Call the workflow for one outbox entry; returns the outcome (ack/nack is up to the caller)."""
+    payload = entry.payload
+    endpoint = route_endpoint(wf, payload)
+    use_mock = bool(wf.get("mock", True)) or not endpoint
+    mock_sleep_ms = int(wf.get("mock_sleep_ms", 120))
+
+    # (1) Task created: the MaintenanceTask / WorkOrder were created when the task entered the outbox
+    # (enqueue_pending), so every retry reuses them and TTA counts from the first attempt
+
+    # Rate limit per endpoint (time spent waiting for a token is part of the task -> action gap)
+    throttled_s = limiters.acquire("mock" if use_mock else endpoint)
+
+    # (2) Action start (dispatch)
+    t_action_start = utc_now_iso()
+    resp_ok = False
+    rejected = False
+    retry_in_s = 0.0
+    resp_body: Dict[str, Any] = {}
+    http: Dict[str, Any] = {}
+    try:
+        if use_mock:
+            resp_body = mock_workflow(payload, sleep_ms=mock_sleep_ms)
+            resp_ok = True
+        else:
+            if client is None:
+                raise RuntimeError("requests not installed; set workflow.mock=true or pip install requests")
+            res = client.post(endpoint, payload)
+            resp_ok, rejected, resp_body = res.ok, res.rejected, res.body or {"error": res.error}
+            retry_in_s = res.retry_in_s
+            http = {"status_code": res.status_code, "attempts": res.attempts, "rejected": res.rejected,
+                    "latency_ms": round(res.latency_s * 1000, 3)}
+    except Exception as e:
+        resp_ok = False
+        resp_body = {"error": str(e)}
+
+    # (3) Action end
+    t_action_end = utc_now_iso()
+    return {
+        "ok": resp_ok,
+        "rejected": rejected,
+        "retry_in_s": retry_in_s,
+        "error": None if resp_ok else str(resp_body.get("error") or http.get("status_code") or "failed"),
+        "t_action_start": t_action_start,
+        "t_action_end": t_action_end,
+        "response": resp_body,
+        "mock": use_mock,
+        "endpoint": "mock" if use_mock else endpoint,
+        "throttled_s": round(throttled_s, 6),
+        "http": http,
+    }
+
+def _ms_between(later: Optional[str], earlier: Optional[str]) -> Optional[float]:
+    if not later or not earlier:
+        return None
+    try:
+        return (datetime.fromisoformat(later) - datetime.fromisoformat(earlier)).total_seconds() * 1000.0
+    except (TypeError, ValueError):
+        return None
+
+def observe_latency(logger: RunLogger, entry: OutboxEntry, outcome: Dict[str, Any]):
+    """
+    L1–L4 / TTA of every detected member anomaly of a dispatched task into the run's latency sketches
+    (members without t_detected, e.g. imported by the ETL, are skipped, as in compute_metrics.py).
+    """
+    if logger.sketches is None:
+        return
+    members = [m for m in entry.payload.get("anomalies") or [entry.payload] if m.get("t_detected")]
+    if not members:
+        return
+    logger.observe("L3_dispatch_ms", _ms_between(outcome["t_action_start"], entry.t_task_created), len(members))
+    logger.observe("L4_execute_ms", _ms_between(outcome["t_action_end"], outcome["t_action_start"]), len(members))
+    for m in members:
+        logger.observe("L1_detect_ms", _ms_between(m.get("t_detected"), m.get("t_trigger")))
+        logger.observe("L2_reason_ms", _ms_between(entry.t_task_created, m.get("t_detected")))
+        logger.observe("tta_ms", _ms_between(outcome["t_action_start"], m.get("t_trigger")))
+
+def settle(outbox: Outbox, updated: BufferedWriter, logger: RunLogger, entry: OutboxEntry,
+           outcome: Dict[str, Any]) -> str:
+    """ack on success, otherwise nack (retry with backoff / dead-letter); records the WorkOrder status."""
+    if outcome["rejected"]:
+        # Never sent (circuit open): no attempt used, retry once the breaker lets a probe through
+        outbox.nack(entry.task_id, outcome["error"], count_attempt=False,
+                    delay_s=max(outcome["retry_in_s"], outbox.retry_base_s))
+        return "deferred"
+    if outcome["ok"]:
+        outbox.ack(entry.task_id)
+        observe_latency(logger, entry, outcome)
+        state = "done"
+    else:
+        state = outbox.nack(entry.task_id, outcome["error"])
+    attempt = entry.attempts + 1
+    status = {"done": "DISPATCHED", "pending": "RETRY_SCHEDULED", "dead": "DEAD_LETTER"}[state]
+
+    # Update task + WorkOrder; member anomalies are marked dispatched only on success
+    # (buffered; carries the task fields so the nodes are re-created if the create never reached the graph)
+    p = entry.payload
+    aids = member_ids(p)
+    updated.add({
+        "woid": entry.workorder_id,
+        "task_id": entry.task_id,
+        "aids": aids,
+        "type": p.get("type"),
+        "severity": p.get("severity"),
+        "severity_class": p.get("severity_class"),
+        "component_id": p.get("component_id"),
+        "window_start": p.get("window_start"),
+        "mode": p.get("mode"),
+        "t_task_created": entry.t_task_created,
+        "status": status,
+        "attempts": attempt,
+        "t_action_start": outcome["t_action_start"],
+        "t_action_end": outcome["t_action_end"],
+        "resp_ok": bool(outcome["ok"]),
+    })
+
+    # Log (for compute_metrics.py or audit)
+    logger.log_event(
+        "WORKFLOW_DISPATCH",
+        level="INFO" if outcome["ok"] else "WARN",
+        details={
+            "workorder_id": entry.workorder_id,
+            "task_id": entry.task_id,
+            "anomaly_id": entry.payload.get("anomaly_id"),
+            "anomaly_ids": aids,
+            "anomaly_count": len(aids),
+            "t_task_created": entry.t_task_created,
+            "t_action_start": outcome["t_action_start"],
+            "t_action_end": outcome["t_action_end"],
+            "response_ok": outcome["ok"],
+            "response": outcome["response"],
+            "mock": outcome["mock"],
+            "endpoint": outcome["endpoint"],
+            "throttled_s": outcome["throttled_s"],
+            "attempt": attempt,
+            "outbox_status": state,
+            **outcome["http"],
+        }
+    )
+    if state == "dead":
+        logger.log_event("DEAD_LETTER", level="ERROR", details={
+            "workorder_id": entry.workorder_id, "task_id": entry.task_id, "anomaly_ids": aids,
+            "attempts": attempt, "error": outcome["error"]})
+    return state
+
+def enqueue_anomalies(neo: Neo4jHelper, outbox: Outbox, created: BufferedWriter, coalescer: TaskCoalescer,
+                      anomalies: List[Dict[str, Any]], scenario: str, mode: str, flush: bool = True) -> Dict[str, Any]:
+    """
+    Coalesce anomalies (anomaly_id, type, severity, metric, value, ts, component_id) into tasks, move the
+    completed tasks into the outbox and create one MaintenanceTask + WorkOrder per newly queued task.
+    flush=False keeps unfinished groups open in the coalescer for later calls (pipeline_daemon); they stay
+    undispatched in the graph and out of the outbox until released, so a crash only means enqueue_pending
+    offers them again.
+    """
+    t_created = utc_now_iso()
+    groups = coalescer.add(anomalies, fallback_ts=time.time(), now=time.monotonic())
+    if flush:
+        groups += coalescer.flush()
+    items = []
+    for grp in groups:
+        woid = f"wo_{uuid.uuid4().hex[:10]}"
+        items.append((grp.task_id, build_payload(grp, woid, scenario, mode), woid, grp))
+    new = set(outbox.enqueue((tid, p, woid, t_created) for tid, p, woid, _ in items))
+    for tid, _, woid, grp in items:
+        if tid in new:
+            # Persist MaintenanceTask + WorkOrder nodes to support downstream metrics if desired (buffered)
+            created.add({
+                "task_id": tid,
+                "woid": woid,
+                "aids": grp.anomaly_ids,
+                "type": grp.lead.get("type"),
+                "severity": grp.severity,
+                "severity_class": grp.severity_class,
+                "component_id": grp.component_id,
+                "window_start": grp.window_start,
+                "mode": mode,
+                "t_trigger": t_created,  # if you don't have a separate trigger stream timestamp
+                "t_task_created": t_created,
+            })
+    members = sum(len(g.anomalies) for g in groups)
+    return {"candidates": len(anomalies), "tasks": len(groups), "enqueued": len(new), "held": coalescer.held,
+            "coalescing_factor": round(members / len(groups), 3) if groups else 0.0}
+
+def enqueue_pending(neo: Neo4jHelper, outbox: Outbox, created: BufferedWriter, coalescer: TaskCoalescer,
+                    limit: int, scenario: str, mode: str) -> Dict[str, Any]:
+    """
+    Hand up to `limit` undispatched anomalies that no outbox task holds yet to the outbox (enqueue_anomalies).
+    The outbox is the record of what was queued: if its file is lost, every undispatched anomaly is offered
+    again. Pages through the graph by anomaly_id until enough candidates are found.
+    """
+    anomalies: List[Dict[str, Any]] = []
+    after = ""
+    while len(anomalies) < limit:
+        page = neo.query(Q_PENDING_ANOMALIES, {"after": after, "limit": limit})
+        if not page:
+            break
+        after = page[-1]["anomaly_id"]
+        held = outbox.held(a["anomaly_id"] for a in page)
+        anomalies += [a for a in page if a["anomaly_id"] not in held]
+    return enqueue_anomalies(neo, outbox, created, coalescer, anomalies[:limit], scenario, mode)
+
+def write_error_logger(logger: RunLogger) -> Callable[[str, BaseException], None]:
+    """on_error for the BufferedWriters: the failed rows stay buffered and are retried by the next flush."""
+    def on_error(writer: str, e: BaseException):
+        logger.log_event("WRITE_BUFFER_ERROR", level="WARN", details={"writer": writer, "error": repr(e)})
+    return on_error
+
+def build_client(wf: Dict[str, Any], concurrency: int, logger: RunLogger) -> Optional[DispatchClient]:
+    """Pooled HTTP client for real dispatch (workflow.mock=false); None in mock mode or without requests."""
+    if bool(wf.get("mock", True)):
+        return None
+    http_cfg = dict(wf.get("http", {}))
+    http_cfg.setdefault("timeout_s", wf.get("timeout_s", 5.0))
+    try:
+        return DispatchClient.from_config(http_cfg, default_pool_size=concurrency)
+    except RuntimeError as e:
+        logger.log_event("HTTP_CLIENT_UNAVAILABLE", level="WARN", details={"error": str(e)})
+        return None
+
+def drain_outbox(outbox: Outbox, pool: ThreadPoolExecutor, concurrency: int, limiters: RateLimiters,
+                 client: Optional[DispatchClient], wf: Dict[str, Any], updated: BufferedWriter, logger: RunLogger,
+                 settled: Dict[str, int], compensate: bool = False, deadline: Optional[float] = None,
+                 observer: Optional[Callable[[OutboxEntry, Dict[str, Any], str], None]] = None):
+    """
+    Dispatch every due outbox entry, up to `concurrency` calls in flight; ack/nack happen in the calling
+    thread. Returns once nothing is due and nothing is in flight, or - with compensate - once every entry
+    is delivered or dead-lettered (or the next retry would fall after `deadline`, a perf_counter value).
+    observer(entry, outcome, state) is called after each settle (e.g. replay_benchmark.py timing).
+    """
+    in_flight: Dict[Any, OutboxEntry] = {}
+    while True:
+        room = 2 * concurrency - len(in_flight)
+        if room > 0:
+            for e in outbox.claim(room):
+                in_flight[pool.submit(dispatch_one, limiters, client, e, wf)] = e
+        if not in_flight:
+            # Nothing due right now: stop, or (compensation) sleep until the next retry is due
+            due_in = outbox.next_due_in()
+            if not compensate or due_in is None or (deadline is not None and time.perf_counter() + due_in > deadline):
+                return
+            time.sleep(max(due_in, 0.01))
+            continue
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for f in done:
+            e = in_flight.pop(f)
+            try:
+                outcome = f.result()
+            except Exception as ex:
+                now = utc_now_iso()
+                outcome = {"ok": False, "rejected": False, "retry_in_s": 0.0, "error": str(ex),
+                           "t_action_start": now, "t_action_end": now, "response": {"error": str(ex)},
+                           "mock": bool(wf.get("mock", True)), "endpoint": "", "throttled_s": 0.0, "http": {}}
+            state = settle(outbox, updated, logger, e, outcome)
+            settled[state] += 1
+            if observer is not None:
+                observer(e, outcome, state)
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True)
     ap.add_argument("--demo", default="ahu12")
+    ap.add_argument("--compensate", action="store_true",
+                    help="keep replaying failed outbox entries (with backoff) until all are delivered or dead-lettered")
+    ap.add_argument("--requeue-dead", action="store_true",
+                    help="give dead-lettered outbox entries a fresh retry budget before draining")
     args = ap.parse_args()
 
     cfg = load_config(args.config)
@@ -51,9 +542,10 @@ def main():
     mode = cfg.get("mode", "sam")
 
     out_dir = cfg.get("output_dir", "./logs")
-    logger = RunLogger(out_dir=out_dir, scenario=scenario, mode=mode, component="workflow_trigger")
+    logger = RunLogger.from_config(cfg.get("logging", {}), out_dir=out_dir, scenario=scenario, mode=mode,
+                                   component="workflow_trigger")
 
-    if not neo4j_available():
+    if not backend_available(cfg.get("neo4j", {})):
         logger.log_event("NEO4J_NOT_AVAILABLE", level="WARN")
         logger.write_csv()
         print("Neo4j driver not available. Dry-run only.")
@@ -63,129 +555,66 @@ def main():
 
     # Workflow config
     wf = cfg.get("workflow", {})
-    endpoint = wf.get("endpoint", "")  # webhook URL
-    use_mock = bool(wf.get("mock", True)) or not endpoint
-    timeout_s = float(wf.get("timeout_s", 5.0))
-    mock_sleep_ms = int(wf.get("mock_sleep_ms", 120))
+    use_mock = bool(wf.get("mock", True)) or not wf.get("endpoint", "")
+    concurrency = max(int(wf.get("concurrency", 8)), 1)
+    limiters = RateLimiters(wf.get("rate_limit"))
+    client = build_client(wf, concurrency, logger)
 
-    # Query anomalies that are not yet dispatched (simple heuristic)
-    q = """
-    MATCH (a:Anomaly)
-    WHERE coalesce(a.dispatched,false) = false
-    RETURN a.anomaly_id AS anomaly_id,
-           a.type AS type,
-           a.severity AS severity,
-           a.metric AS metric,
-           a.value AS value,
-           a.timestamp AS ts
-    LIMIT $limit
-    """
-    limit = int(cfg.get("workflow_query_limit", 200))
-    anomalies = neo.query(q, {"limit": limit})
+    ob_cfg = wf.get("outbox", {})
+    outbox = Outbox.from_config(ob_cfg, default_path=str(Path(out_dir) / "workflow_outbox.sqlite"), target=neo.target)
+    compensate_timeout_s = float(ob_cfg.get("compensate_timeout_s", 600.0))
+    coalescer = TaskCoalescer.from_config(wf.get("coalesce", {}))
+    if args.requeue_dead:
+        logger.log_event("OUTBOX_REQUEUE_DEAD", details={"requeued": outbox.requeue_dead()})
 
-    logger.log_event("START", details={"demo": args.demo, "candidates": len(anomalies), "mock": use_mock})
+    wb = wf.get("write_buffer", {})
+    max_rows = int(wb.get("max_rows", 2000))
+    max_delay_s = float(wb.get("max_delay_s", 0.5))
+    on_write_error = write_error_logger(logger)
+    created = BufferedWriter(neo, Q_TASK_CREATE, "task_create", max_rows, max_delay_s, on_error=on_write_error)
+    updated = BufferedWriter(neo, Q_WORKORDER_DISPATCHED, "workorder_dispatched", max_rows, max_delay_s,
+                             depends_on=created, on_error=on_write_error)
+    t0 = time.perf_counter()
+    settled = {"done": 0, "pending": 0, "dead": 0, "deferred": 0}
+    # Every close runs even if an earlier one raises (ExitStack unwinds in reverse order of registration)
+    with ExitStack() as resources:
+        resources.callback(logger.close)
+        resources.callback(outbox.close)
+        with ExitStack() as graph:
+            # Final flush (creates first, then status updates) before the driver goes away
+            if client is not None:
+                graph.callback(client.close)
+            graph.callback(neo.close)
+            graph.callback(report_query_stats, neo, logger)
+            graph.callback(created.close)
+            graph.callback(updated.close)
 
-    # Create tasks + trigger workflow per anomaly
-    for a in anomalies:
-        anomaly_id = a.get("anomaly_id")
-        if not anomaly_id:
-            continue
+            # Query anomalies that are not yet dispatched (simple heuristic) and hand them to the outbox
+            limit = int(cfg.get("workflow_query_limit", 200))
+            enq = enqueue_pending(neo, outbox, created, coalescer, limit, scenario, mode)
+            logger.log_event("START", details={"demo": args.demo, **enq, "mock": use_mock, "concurrency": concurrency,
+                                               "compensate": args.compensate, "outbox": outbox.counts()})
 
-        # (1) Task created
-        task_id = f"wo_{uuid.uuid4().hex[:10]}"
-        t_task_created = utc_now_iso()
-
-        # Persist a WorkOrder node to support downstream metrics if desired
-        neo.query("""
-            MERGE (wo:WorkOrder {workorder_id:$woid})
-            SET wo.mode=$mode,
-                wo.status='CREATED',
-                wo.t_trigger=coalesce(wo.t_trigger,$t_trigger),
-                wo.t_task_created=$t_task_created
-            WITH wo
-            MATCH (a:Anomaly {anomaly_id:$aid})
-            MERGE (wo)-[:CREATED_FROM]->(a)
-        """, {
-            "woid": task_id,
-            "aid": anomaly_id,
-            "mode": mode,
-            "t_trigger": t_task_created,  # if you don't have a separate trigger stream timestamp
-            "t_task_created": t_task_created,
-        })
-
-        payload = {
-            "workorder_id": task_id,
-            "anomaly_id": anomaly_id,
-            "type": a.get("type"),
-            "severity": a.get("severity"),
-            "metric": a.get("metric"),
-            "value": a.get("value"),
-            "timestamp": a.get("ts"),
-            "scenario": scenario,
-            "mode": mode,
-        }
-
-        # (2) Action start (dispatch)
-        t_action_start = utc_now_iso()
-        resp_ok = False
-        resp_body: Dict[str, Any] = {}
-        try:
-            if use_mock:
-                resp_body = mock_workflow(payload, sleep_ms=mock_sleep_ms)
-                resp_ok = True
-            else:
-                if requests is None:
-                    raise RuntimeError("requests not installed; set workflow.mock=true or pip install requests")
-                r = requests.post(endpoint, json=payload, timeout=timeout_s)
-                resp_ok = (200 <= r.status_code < 300)
-                try:
-                    resp_body = r.json()
-                except Exception:
-                    resp_body = {"text": r.text[:500], "status_code": r.status_code}
-        except Exception as e:
-            resp_ok = False
-            resp_body = {"error": str(e)}
-
-        # (3) Action end
-        t_action_end = utc_now_iso()
-
-        # Update WorkOrder + mark anomaly dispatched
-        neo.query("""
-            MATCH (wo:WorkOrder {workorder_id:$woid})
-            SET wo.status=$status,
-                wo.t_action_start=$t_action_start,
-                wo.t_action_end=$t_action_end,
-                wo.response_ok=$resp_ok
-            WITH wo
-            MATCH (a:Anomaly {anomaly_id:$aid})
-            SET a.dispatched=true, a.dispatched_at=$t_action_start
-            MERGE (wo)-[:DISPATCHED_FOR]->(a)
-        """, {
-            "woid": task_id,
-            "aid": anomaly_id,
-            "status": "DISPATCHED" if resp_ok else "EXCEPTION",
-            "t_action_start": t_action_start,
-            "t_action_end": t_action_end,
-            "resp_ok": bool(resp_ok),
-        })
-
-        # Log (for compute_metrics.py or audit)
-        logger.log_event(
-            "WORKFLOW_DISPATCH",
-            details={
-                "workorder_id": task_id,
-                "anomaly_id": anomaly_id,
-                "t_task_created": t_task_created,
-                "t_action_start": t_action_start,
-                "t_action_end": t_action_end,
-                "response_ok": resp_ok,
-                "response": resp_body,
-                "mock": use_mock,
-            }
-        )
-
-    logger.log_event("DONE")
-    logger.write_csv()
+            # Drain the outbox, up to `concurrency` calls in flight; ack/nack happen here in the main thread
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="dispatch") as pool:
+                drain_outbox(outbox, pool, concurrency, limiters, client, wf, updated, logger, settled,
+                             compensate=args.compensate, deadline=t0 + compensate_timeout_s)
+        wall_s = time.perf_counter() - t0
+        calls = settled["done"] + settled["pending"] + settled["dead"]
+        logger.log_event("DISPATCH_SUMMARY", details={"dispatched": settled["done"], "retry_scheduled": settled["pending"],
+                                                      "dead_lettered": settled["dead"],
+                                                      "deferred_circuit_open": settled["deferred"],
+                                                      "concurrency": concurrency, "wall_s": round(wall_s, 6),
+                                                      "per_s": round(calls / wall_s, 2) if wall_s > 0 else 0.0,
+                                                      "writes": [created.stats(), updated.stats()]})
+        if client is not None:
+            for ep, st in client.stats().items():
+                logger.log_event("HTTP_ENDPOINT_STATS", details={"endpoint": ep, **st})
+        logger.log_event("OUTBOX_SUMMARY", details={"path": outbox.path, "counts": outbox.counts(),
+                                                    "next_retry_in_s": outbox.next_due_in(),
+                                                    "dead_letters": outbox.dead_letters(limit=20)})
+        logger.log_event("DONE")
+        logger.write_csv()
     print("Workflow triggering complete. Logs:", logger.default_csv_name())
 
 if __name__ == "__main__":
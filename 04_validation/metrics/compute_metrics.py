@@ -8,17 +8,91 @@ Unified evaluation metrics for SAM–STRIDE testbed
 supporting both PdM and Carbon_SIDCM scenarios.
 
 Scenarios:
-- PdM_HVAC        : event-driven (TTA, Latency, Funnel, Portability)
+- PdM_HVAC        : event-driven (TTA, Latency L1–L4, Throughput, Loss, Portability)
 - Carbon_SIDCM    : data-integration-driven (Portability only)
 
+Event metrics are computed from the run logs written by 03_execution
+(RunLogger CSV: run_id, scenario, mode, component, event, level, timestamp,
+t_mono_ns, details), rotated segments included:
+
+- DETECTION_ANOMALY : anomaly_id, t_trigger, t_detected
+                      (anomaly_detection_logic.py / pipeline_daemon.py)
+- WORKFLOW_DISPATCH : anomaly_ids, task_id, t_task_created, t_action_start,
+                      t_action_end, response_ok
+                      (workflow_trigger_api.py / pipeline_daemon.py)
+
+Detection and dispatch of one anomaly usually sit in different files (and
+runs), so they are joined by anomaly_id in two passes within a memory budget:
+
+1. scan : every log file is read in chunks (--chunk-rows, by default sized
+          from --memory-mb and the average row length); only the two
+          events above are kept, their details parsed and timestamps turned
+          into int64 ns. Records are hash-partitioned on anomaly_id into spill
+          files; the partition count is derived from the input size and
+          --memory-mb so that one partition fits the budget.
+2. join : partitions are loaded one at a time; each detection is matched to
+          the first successful action created at or after it (merge_asof by
+          anomaly_id), L1–L4 and TTA are computed as column differences and
+          per-event rows are appended to the raw tables.
+
+Percentiles (p50 / p95 / p99, median) come from mergeable DDSketches per
+framework and stage (03_execution/utils/quantile_sketch.py; relative error
+<= --relative-accuracy); count / mean / std / min / max are exact. Nothing
+per event is kept across partitions, so memory does not grow with the logs.
+
+The loggers of 03_execution also keep such sketches online and write
+latency_sketch_<component>_<run_id>.json next to the run logs. --sketches
+merges those files across runs / sites into latency_sketch_summary.csv and
+latency_sketch_merged.json without reading any raw log row.
+
+Throughput counts successful WORKFLOW_DISPATCH events (one per completed
+task) in tumbling --window-min windows of t_action_end and is aggregated
+during the scan. Loss rate = detected anomalies without a successful action
+/ detected anomalies.
+
 Author: SAM–STRIDE Replication Package
 """
 
 import argparse
+import glob
+import json
+import math
 import os
+import shutil
 import sys
+import tempfile
+from collections import Counter, defaultdict
+
+import numpy as np
 import pandas as pd
 
+# utils/ lives in 03_execution (its scripts import it as a top-level package)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "03_execution"))
+from utils.quantile_sketch import LATENCY_STAGES, SketchSet, merge_files  # noqa: E402
+
+
+LOG_COLUMNS = ["run_id", "mode", "event", "details"]
+DETECT_EVENT = "DETECTION_ANOMALY"
+DISPATCH_EVENT = "WORKFLOW_DISPATCH"
+FRAMEWORKS = {"sam": "SAM", "baseline": "Baseline"}
+
+DETECT_FIELDS = ["anomaly_id", "t_trigger", "t_detected"]
+ACTION_FIELDS = ["anomaly_id", "anomaly_ids", "task_id", "t_task_created", "t_action_start",
+                 "t_action_end", "response_ok"]
+NS_FIELDS = ["t_trigger", "t_detected", "t_task_created", "t_action_start", "t_action_end"]
+
+LAYERS = [
+    ("L1_detect_ms", "L1_Detection"),
+    ("L2_reason_ms", "L2_SemanticReasoning"),
+    ("L3_dispatch_ms", "L3_WorkflowDispatch"),
+    ("L4_execute_ms", "L4_ExecutionStart"),
+]
+PERCENTILES = (50, 95, 99)
+
+# Rough in-memory size relative to on-disk bytes, used to size partitions / chunks from --memory-mb
+_SPILL_RATIO = 2.0
+_CHUNK_RATIO = 10.0
+
 
 # ---------------------------------------------------------------------------
 # Utility
@@ -32,6 +106,374 @@ def _ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
 
+def _framework(mode: pd.Series) -> pd.Series:
+    return mode.map(lambda m: FRAMEWORKS.get(str(m).lower(), str(m)))
+
+
+def _to_ns(values: pd.Series) -> pd.Series:
+    """ISO-8601 strings -> nullable Int64 ns since epoch (unparsable -> <NA>)."""
+    ts = pd.to_datetime(values, utc=True, format="ISO8601", errors="coerce")
+    ns = ts.to_numpy(dtype="datetime64[ns]").view("int64")
+    return pd.Series(pd.array(ns, dtype="Int64"), index=values.index).mask(ts.isna())
+
+
+def _ns_to_iso(ns: pd.Series) -> np.ndarray:
+    nat = np.iinfo("int64").min
+    us = ns.to_numpy(dtype="int64", na_value=nat).view("datetime64[ns]").astype("datetime64[us]")
+    return np.char.add(np.datetime_as_string(us, unit="us"), "+00:00")
+
+
+def _ms(a: pd.Series, b: pd.Series) -> np.ndarray:
+    """(a - b) in ms; missing on either side -> NaN."""
+    return ((a - b).astype("Float64") / 1e6).to_numpy(dtype="float64", na_value=np.nan)
+
+
+def _iter_log_files(specs):
+    """Run-log CSVs under the given files / directories / globs (other CSVs are skipped)."""
+    seen = set()
+    for spec in specs:
+        if os.path.isdir(spec):
+            paths = glob.glob(os.path.join(spec, "**", "*.csv"), recursive=True)
+        else:
+            paths = glob.glob(spec, recursive=True)
+        for path in sorted(paths):
+            if path in seen:
+                continue
+            seen.add(path)
+            try:
+                header = pd.read_csv(path, nrows=0, encoding="utf-8-sig").columns
+            except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError):
+                continue
+            if set(LOG_COLUMNS) <= set(header):
+                yield path
+
+
+def _row_bytes(path: str, sample: int = 1000) -> float:
+    with open(path, "rb") as fh:
+        lines = [len(line) for _, line in zip(range(sample + 1), fh)][1:]
+    return sum(lines) / len(lines) if lines else 1.0
+
+
+def _details(col: pd.Series, fields) -> pd.DataFrame:
+    records = [json.loads(d) if isinstance(d, str) else {} for d in col]
+    return pd.DataFrame.from_records(records, columns=fields, index=col.index)
+
+
+# ---------------------------------------------------------------------------
+# Event metrics: scan (stream + partition)
+# ---------------------------------------------------------------------------
+
+class _Spill:
+    """Append-only partition files for detection / action records, keyed by hash(anomaly_id)."""
+
+    def __init__(self, root: str, partitions: int):
+        self.root = root
+        self.partitions = partitions
+        self.rows = Counter()
+
+    def path(self, kind: str, k: int) -> str:
+        return os.path.join(self.root, f"{kind}_{k:04d}.csv")
+
+    def write(self, kind: str, df: pd.DataFrame):
+        if df.empty:
+            return
+        part = pd.util.hash_pandas_object(df["anomaly_id"], index=False).to_numpy() % self.partitions
+        for k, g in df.groupby(part, sort=False):
+            path = self.path(kind, int(k))
+            g.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+            self.rows[kind, int(k)] += len(g)
+
+    def read(self, kind: str, k: int) -> pd.DataFrame:
+        path = self.path(kind, k)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        dtype = {f: "Int64" for f in NS_FIELDS}
+        dtype.update({"anomaly_id": str, "framework": str, "run_id": str, "task_id": str})
+        return pd.read_csv(path, dtype=dtype)
+
+
+def scan_logs(files, spill: _Spill, chunk_rows: int, window_ns: int):
+    """
+    Stream the run logs into the spill partitions.
+
+    Returns (rows scanned, per-window completed-task counts, per-framework
+    first / last t_action_end) — throughput needs no join, so it is
+    aggregated here.
+    """
+    scanned = 0
+    windows = Counter()
+    span = {}
+    wanted = [DETECT_EVENT, DISPATCH_EVENT]
+    for path in files:
+        reader = pd.read_csv(path, usecols=LOG_COLUMNS, dtype=str, encoding="utf-8-sig", chunksize=chunk_rows)
+        for chunk in reader:
+            scanned += len(chunk)
+            chunk = chunk[chunk["event"].isin(wanted)]
+            if chunk.empty:
+                continue
+            framework = _framework(chunk["mode"])
+
+            det = chunk[chunk["event"] == DETECT_EVENT]
+            if not det.empty:
+                d = _details(det["details"], DETECT_FIELDS)
+                d["t_trigger"] = _to_ns(d["t_trigger"])
+                d["t_detected"] = _to_ns(d["t_detected"])
+                d.insert(1, "framework", framework[det.index])
+                d.insert(2, "run_id", det["run_id"])
+                spill.write("det", d.dropna(subset=["anomaly_id"]))
+
+            act = chunk[chunk["event"] == DISPATCH_EVENT]
+            if not act.empty:
+                a = _details(act["details"], ACTION_FIELDS)
+                a["ok"] = a["response_ok"].map(lambda v: v is True or str(v).lower() == "true")
+                for f in ("t_task_created", "t_action_start", "t_action_end"):
+                    a[f] = _to_ns(a[f])
+                a.insert(0, "framework", framework[act.index])
+                a.insert(1, "run_id", act["run_id"])
+
+                done = a[a["ok"] & a["t_action_end"].notna()]
+                if not done.empty:
+                    end = done["t_action_end"].astype("int64")
+                    keys = pd.DataFrame({"framework": done["framework"], "window": end // window_ns})
+                    for (fw, w), n in keys.value_counts().items():
+                        windows[fw, int(w)] += int(n)
+                    for fw, g in end.groupby(done["framework"]):
+                        lo, hi = span.get(fw, (g.min(), g.max()))
+                        span[fw] = (min(lo, g.min()), max(hi, g.max()))
+
+                # One record per covered anomaly (coalesced tasks list all of them)
+                a["anomaly_id"] = [ids if isinstance(ids, list) and ids else [lead]
+                                   for ids, lead in zip(a["anomaly_ids"], a["anomaly_id"])]
+                a = a.drop(columns=["anomaly_ids", "response_ok"]).explode("anomaly_id")
+                spill.write("act", a.dropna(subset=["anomaly_id"]))
+    return scanned, windows, span
+
+
+# ---------------------------------------------------------------------------
+# Event metrics: join (per partition)
+# ---------------------------------------------------------------------------
+
+def join_partition(det: pd.DataFrame, act: pd.DataFrame) -> pd.DataFrame:
+    """
+    Detections (one per anomaly and run) joined to the first successful action
+    created at or after detection, with L1–L4 / TTA in ms.
+
+    anomaly_id is deterministic, so logs of several runs over the same readings
+    repeat ids; matching forward in time keeps an earlier run's action from
+    being credited to a later detection.
+    """
+    det = det.sort_values("t_detected", na_position="last").drop_duplicates(["anomaly_id", "run_id"])
+    cols = ["anomaly_id", "task_id", *NS_FIELDS[2:]]
+    if not act.empty:
+        act = act[act["ok"].astype(bool) & act["t_task_created"].notna()]
+    keyed = det[det["t_detected"].notna()].astype({"t_detected": "int64"}).sort_values("t_detected")
+    if act.empty or keyed.empty:
+        m = det.assign(**{c: pd.NA for c in cols[1:]})
+    else:
+        act = act[cols].astype({"t_task_created": "int64"}).sort_values("t_task_created")
+        m = pd.merge_asof(keyed, act, left_on="t_detected", right_on="t_task_created", by="anomaly_id",
+                          direction="forward")
+        m = pd.concat([m, det[det["t_detected"].isna()]], ignore_index=True)
+    for c in NS_FIELDS:
+        m[c] = m[c].astype("Int64")
+    m["executed"] = m["t_action_start"].notna()
+    m["L1_detect_ms"] = _ms(m["t_detected"], m["t_trigger"])
+    m["L2_reason_ms"] = _ms(m["t_task_created"], m["t_detected"])
+    m["L3_dispatch_ms"] = _ms(m["t_action_start"], m["t_task_created"])
+    m["L4_execute_ms"] = _ms(m["t_action_end"], m["t_action_start"])
+    m["tta_ms"] = _ms(m["t_action_start"], m["t_trigger"])
+    return m
+
+
+def _append_csv(df: pd.DataFrame, path: str, first: bool):
+    df.to_csv(path, mode="w" if first else "a", header=first, index=False)
+
+
+def compute_event_metrics(
+    log_specs,
+    output_dir: str,
+    window_min: float = 10.0,
+    chunk_rows: int = None,
+    memory_mb: float = 256.0,
+    spill_dir: str = None,
+    relative_accuracy: float = 0.005,
+):
+    """
+    TTA / L1–L4 / loss rate / throughput from run logs.
+
+    Output (in output_dir):
+        - tta_distribution.csv        : experiment_id, framework, event_id, trigger_emit_time,
+                                        action_start_time, tta_ms
+        - tta_summary_stats.csv       : framework, count, mean, median, std, min, max, p50, p95, p99
+        - latency_l1_l4_raw.csv       : framework, event_id, L1_detect_ms, L2_reason_ms,
+                                        L3_dispatch_ms, L4_execute_ms
+        - latency_l1_l4_summary.csv   : framework + mean of each layer
+        - latency_l1_l4_percentiles.csv : framework, layer, count, mean, p50, p95, p99
+        - latency_l1_l4_final.csv     : framework, layer, latency_ms (mean)
+        - loss_rate.csv               : framework, events_detected, actions_executed, lost_events, loss_rate
+        - throughput_windows.csv      : framework, window_start, time_window_min, completed_tasks,
+                                        throughput_tasks_per_min
+        - throughput_final.csv        : framework, time_window_min, completed_tasks, throughput_tasks_per_min
+    """
+    files = list(_iter_log_files(log_specs))
+    if not files:
+        _log("No run logs found. Skipping event metrics.")
+        return None
+    input_bytes = sum(os.path.getsize(f) for f in files)
+    budget = max(memory_mb, 1.0) * 1024 * 1024
+    partitions = max(1, min(4096, math.ceil(input_bytes * _SPILL_RATIO / budget)))
+    if not chunk_rows:
+        row_bytes = max(_row_bytes(f) for f in files)
+        chunk_rows = int(max(1_000, min(1_000_000, budget / (row_bytes * _CHUNK_RATIO))))
+    window_ns = int(window_min * 60 * 1e9)
+    _log(f"[Events] {len(files)} log files, {input_bytes / 1e6:.1f} MB, {partitions} partitions, "
+         f"{chunk_rows} rows per chunk")
+
+    root = tempfile.mkdtemp(prefix="metrics_spill_", dir=spill_dir)
+    try:
+        spill = _Spill(root, partitions)
+        scanned, windows, span = scan_logs(files, spill, chunk_rows, window_ns)
+        _log(f"[Events] scanned {scanned} rows, spilled {sum(spill.rows.values())} records")
+
+        tta_path = os.path.join(output_dir, "tta_distribution.csv")
+        raw_path = os.path.join(output_dir, "latency_l1_l4_raw.csv")
+        layer_cols = [c for c, _ in LAYERS]
+        sketches = SketchSet(relative_accuracy)
+        loss = defaultdict(Counter)
+        first, unmatched = True, 0
+        for k in range(partitions):
+            det, act = spill.read("det", k), spill.read("act", k)
+            if det.empty:
+                unmatched += int(act["ok"].astype(bool).sum()) if not act.empty else 0
+                continue
+            m = join_partition(det, act)
+            if not act.empty:
+                ok_ids = act.loc[act["ok"].astype(bool), "anomaly_id"]
+                unmatched += int((~ok_ids.drop_duplicates().isin(det["anomaly_id"])).sum())
+            for fw, g in m.groupby("framework"):
+                loss[fw]["detected"] += len(g)
+                loss[fw]["executed"] += int(g["executed"].sum())
+                for c in [*layer_cols, "tta_ms"]:
+                    sketches.add_many(fw, c, g.loc[g["executed"], c].to_numpy())
+
+            done = m[m["executed"]]
+            if done.empty:
+                continue
+            _append_csv(pd.DataFrame({
+                "experiment_id": done["run_id"],
+                "framework": done["framework"],
+                "event_id": done["anomaly_id"],
+                "trigger_emit_time": _ns_to_iso(done["t_trigger"]),
+                "action_start_time": _ns_to_iso(done["t_action_start"]),
+                "tta_ms": done["tta_ms"].round(3),
+            }), tta_path, first)
+            _append_csv(done[["framework", "anomaly_id", *layer_cols]].rename(columns={"anomaly_id": "event_id"})
+                        .round(3), raw_path, first)
+            first = False
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if unmatched:
+        _log(f"[Events] {unmatched} dispatched anomalies have no DETECTION_ANOMALY in the given logs")
+
+    frameworks = sorted(set(loss) | {fw for fw, _ in windows})
+
+    def stats(fw, stage):
+        s = sketches.get(fw, stage)
+        return s.summary() if s is not None else {"count": 0}
+
+    # TTA
+    tta = [{"framework": fw, **stats(fw, "tta_ms")} for fw in frameworks]
+    pd.DataFrame(tta).round(3).to_csv(os.path.join(output_dir, "tta_summary_stats.csv"), index=False)
+    _log(f"[TTA] Written to {tta_path} and tta_summary_stats.csv")
+
+    # L1–L4
+    pct_rows, summary_rows, final_rows = [], [], []
+    for fw in frameworks:
+        means = {}
+        for col, layer in LAYERS:
+            s = stats(fw, col)
+            means[col] = s.get("mean")
+            pct_rows.append({"framework": fw, "layer": layer, "count": s["count"], "mean": s.get("mean"),
+                             **{f"p{p}": s.get(f"p{p}") for p in PERCENTILES}})
+            final_rows.append({"framework": fw, "layer": layer, "latency_ms": s.get("mean")})
+        summary_rows.append({"framework": fw, **means})
+    pd.DataFrame(summary_rows).round(3).to_csv(os.path.join(output_dir, "latency_l1_l4_summary.csv"), index=False)
+    pd.DataFrame(pct_rows).round(3).to_csv(os.path.join(output_dir, "latency_l1_l4_percentiles.csv"), index=False)
+    pd.DataFrame(final_rows).round(3).to_csv(os.path.join(output_dir, "latency_l1_l4_final.csv"), index=False)
+    _log(f"[Latency] Written to {raw_path} and latency_l1_l4_{{summary,percentiles,final}}.csv")
+
+    # Loss rate
+    loss_df = pd.DataFrame([{
+        "framework": fw,
+        "events_detected": loss[fw]["detected"],
+        "actions_executed": loss[fw]["executed"],
+        "lost_events": loss[fw]["detected"] - loss[fw]["executed"],
+        "loss_rate": round((loss[fw]["detected"] - loss[fw]["executed"]) / loss[fw]["detected"], 4)
+        if loss[fw]["detected"] else None,
+    } for fw in frameworks])
+    loss_df.to_csv(os.path.join(output_dir, "loss_rate.csv"), index=False)
+    _log("[Loss] Written to loss_rate.csv")
+
+    # Throughput
+    win_df = pd.DataFrame([{"framework": fw, "window": w, "completed_tasks": n} for (fw, w), n in windows.items()],
+                          columns=["framework", "window", "completed_tasks"]).sort_values(["framework", "window"])
+    win_df.insert(1, "window_start", _ns_to_iso(win_df.pop("window") * window_ns))
+    win_df.insert(2, "time_window_min", window_min)
+    win_df["throughput_tasks_per_min"] = (win_df["completed_tasks"] / window_min).round(4)
+    win_df.to_csv(os.path.join(output_dir, "throughput_windows.csv"), index=False)
+    final = []
+    for fw in frameworks:
+        if fw not in span:
+            final.append({"framework": fw, "time_window_min": 0, "completed_tasks": 0,
+                          "throughput_tasks_per_min": None})
+            continue
+        lo, hi = (int(v) // window_ns for v in span[fw])
+        minutes = (hi - lo + 1) * window_min
+        done = int(win_df.loc[win_df["framework"] == fw, "completed_tasks"].sum())
+        final.append({"framework": fw, "time_window_min": minutes, "completed_tasks": done,
+                      "throughput_tasks_per_min": round(done / minutes, 4)})
+    pd.DataFrame(final).to_csv(os.path.join(output_dir, "throughput_final.csv"), index=False)
+    _log("[Throughput] Written to throughput_windows.csv and throughput_final.csv")
+
+    return {"tta": tta, "loss": loss_df, "latency": pct_rows, "throughput": final, "sketches": sketches}
+
+
+# ---------------------------------------------------------------------------
+# Online latency sketches (merged across runs / sites)
+# ---------------------------------------------------------------------------
+
+def compute_sketch_metrics(
+    sketch_specs,
+    output_dir: str,
+):
+    """
+    Merge the latency_sketch_*.json files written by the 03_execution loggers.
+
+    Output (in output_dir):
+        - latency_sketch_summary.csv : framework, stage, count, mean, median, std, min, max,
+                                       p50, p95, p99, runs
+        - latency_sketch_merged.json : the merged sketches (input for a further merge)
+    """
+    paths = []
+    for spec in sketch_specs:
+        pattern = os.path.join(spec, "**", "latency_sketch_*.json") if os.path.isdir(spec) else spec
+        paths += [p for p in sorted(glob.glob(pattern, recursive=True)) if p not in paths]
+    merged = merge_files(paths)
+    if merged is None or not len(merged):
+        _log("No latency sketches found. Skipping sketch summary.")
+        return None
+    order = {stage: i for i, stage in enumerate(LATENCY_STAGES)}
+    rows = sorted(merged.summary(), key=lambda r: (r["framework"], order.get(r["stage"], len(order))))
+    df = pd.DataFrame(rows)
+    df["framework"] = _framework(df["framework"])
+    df["runs"] = len(merged.runs)
+    df.round(3).to_csv(os.path.join(output_dir, "latency_sketch_summary.csv"), index=False)
+    merged.save(os.path.join(output_dir, "latency_sketch_merged.json"))
+    _log(f"[Sketch] Merged {len(paths)} files ({len(merged.runs)} runs) into latency_sketch_summary.csv")
+    return df
+
+
 # ---------------------------------------------------------------------------
 # Portability (PdM + Carbon 共用)
 # ---------------------------------------------------------------------------
@@ -79,6 +521,47 @@ def main():
         default="../../data/portability/portability_input.csv",
         help="CSV defining setup effort for PdM and Carbon scenarios",
     )
+    parser.add_argument(
+        "--logs",
+        nargs="*",
+        default=["../../03_execution/logs"],
+        help="Run-log CSVs: files, directories (searched recursively) or globs",
+    )
+    parser.add_argument(
+        "--sketches",
+        nargs="*",
+        default=None,
+        help="latency_sketch_*.json files / directories / globs to merge (default: same as --logs)",
+    )
+    parser.add_argument(
+        "--relative-accuracy",
+        type=float,
+        default=0.005,
+        help="Relative error of the percentiles computed from the logs (DDSketch)",
+    )
+    parser.add_argument(
+        "--window-min",
+        type=float,
+        default=10.0,
+        help="Tumbling window (minutes) for throughput",
+    )
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=None,
+        help="Log rows read per chunk (default: derived from --memory-mb)",
+    )
+    parser.add_argument(
+        "--memory-mb",
+        type=float,
+        default=256.0,
+        help="Memory budget for one scan chunk / join partition (sets chunk size and partition count)",
+    )
+    parser.add_argument(
+        "--spill-dir",
+        default=None,
+        help="Directory for temporary partition files (default: system temp)",
+    )
     parser.add_argument(
         "--output-dir",
         default="../../artifacts/tables",
@@ -88,6 +571,27 @@ def main():
 
     _ensure_dir(args.output_dir)
 
+    # ------------------------------------------------------------
+    # TTA / Latency L1–L4 / Loss / Throughput (PdM, from run logs)
+    # ------------------------------------------------------------
+    compute_event_metrics(
+        args.logs,
+        args.output_dir,
+        window_min=args.window_min,
+        chunk_rows=args.chunk_rows,
+        memory_mb=args.memory_mb,
+        spill_dir=args.spill_dir,
+        relative_accuracy=args.relative_accuracy,
+    )
+
+    # ------------------------------------------------------------
+    # Online latency sketches (PdM, merged across runs)
+    # ------------------------------------------------------------
+    compute_sketch_metrics(
+        args.sketches if args.sketches is not None else args.logs,
+        args.output_dir,
+    )
+
     # ------------------------------------------------------------
     # Portability (shared)
     # ------------------------------------------------------------